@@ -0,0 +1,423 @@
+"""
+DuckDB による分析用のクエリ
+
+export_parquet.py で書き出した Parquet ファイル (または DB のテーブル) を DuckDB のビューとして登録し、
+企業横断の集計 (上位の大株主・政策保有株式の相互保有・前年からの変化など) を手元のマシンで実行する。
+取り込み処理が使う SQL Server に重いクエリを発行しないようにするためのもの。
+
+ソース:
+    'parquet'  exports/<テーブル名>/ の Parquet ファイルをビューとして登録する (既定)。
+    'db'       DBのテーブルを読み込んで登録する。Parquet を書き出していない小さなDB (SQLite など) 向け。
+               列の型は export_parquet.compact_dtypes で Parquet と同じ型にそろえ (SQLite の日付の文字列など)、
+               Parquet のパーティションの列 (fiscalYear, month など) も同じ値で追加する。
+               TextBlock の列は Parquet と同様に contentHash を本文に展開する (text_blocks.expand_text_blocks)。
+
+QUERIES には sql/check_*.sql のクエリを現在のテーブル定義に合わせて移植したものと、企業横断の集計のクエリを定義する。
+クエリのパラメーターは $name の形式で指定する。
+
+使い方:
+    with analytics.AnalyticsSession() as session:
+        df = session.run('top_major_shareholders', limit=20)
+        table = session.arrow('SELECT * FROM MajorShareholders WHERE SecuritiesCode = $code', {'code': '72030'})
+
+    python analytics.py --list
+    python analytics.py top_major_shareholders --param limit=20
+    python analytics.py --sql "SELECT COUNT(*) FROM DocumentMetadata"
+    python analytics.py --check                     # すべてのクエリを両方のソースで実行し、結果を比較する
+"""
+import argparse
+import glob
+import logging
+import os
+
+import duckdb
+import pandas as pd
+from sqlalchemy import inspect
+
+import database_manager
+import text_blocks
+from export_parquet import EXPORT_DIR, EXPORT_TABLES, compact_dtypes
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- クエリの定義 ---
+# name -> {'description': 説明, 'sql': DuckDB の SQL, 'params': パラメーターの既定値, 'tables': 参照するテーブル}
+QUERIES = {
+    # sql/check_大量保有報告書.sql
+    'large_volume_holding_documents': {
+        'description': '大量保有報告書の提出書類一覧 (提出者名・発行者の edinetCode で絞り込み)',
+        'sql': """
+            SELECT s.dateFile, s.seqNumber, s.docID, s.edinetCode, s.secCode, s.filerName, s.fundCode,
+                   s.ordinanceCode, m.ordinanceName, s.formCode, m.formName, s.docTypeCode, s.docDescription,
+                   s.issuerEdinetCode, s.subjectEdinetCode, s.parentDocID, s.xbrlFlag, s.pdfFlag, s.csvFlag, s.legalStatus
+            FROM DocumentMetadata AS s
+                LEFT JOIN DocumentFormMaster AS m
+                    ON m.ordinanceCode = s.ordinanceCode AND m.formCode = s.formCode
+            WHERE m.docType LIKE '%大量保有%'
+              AND ($filer_name IS NULL OR s.filerName LIKE '%' || $filer_name || '%')
+              AND ($issuer_edinet_code IS NULL OR s.issuerEdinetCode = $issuer_edinet_code)
+            ORDER BY s.dateFile DESC, s.seqNumber
+        """,
+        'params': {'filer_name': None, 'issuer_edinet_code': None},
+        'tables': ['DocumentMetadata', 'DocumentFormMaster'],
+    },
+    # sql/check_有価証券報告書.sql
+    'annual_report_documents': {
+        'description': '有価証券報告書の提出書類一覧 (提出者名・証券コードで絞り込み)',
+        'sql': """
+            SELECT s.dateFile, s.seqNumber, s.docID, s.edinetCode, s.secCode, s.filerName, s.fundCode,
+                   s.ordinanceCode, m.ordinanceName, s.formCode, m.formName, s.docTypeCode, s.docDescription,
+                   s.parentDocID, s.xbrlFlag, s.pdfFlag, s.csvFlag, s.legalStatus
+            FROM DocumentMetadata AS s
+                LEFT JOIN DocumentFormMaster AS m
+                    ON m.ordinanceCode = s.ordinanceCode AND m.formCode = s.formCode
+            WHERE s.ordinanceCode = '010' AND s.formCode IN ('030000', '030001')
+              AND ($filer_name IS NULL OR s.filerName LIKE '%' || $filer_name || '%')
+              AND ($sec_code IS NULL OR s.secCode = $sec_code)
+            ORDER BY s.dateFile DESC, s.seqNumber
+        """,
+        'params': {'filer_name': None, 'sec_code': None},
+        'tables': ['DocumentMetadata', 'DocumentFormMaster'],
+    },
+    # sql/check_自己株式取得.sql
+    'documents_by_sec_code': {
+        'description': '証券コードを指定した提出書類一覧 (提出日時の新しい順)',
+        'sql': """
+            SELECT * FROM DocumentMetadata
+            WHERE secCode = $sec_code
+            ORDER BY submitDateTime DESC
+        """,
+        'params': {'sec_code': '82330'},
+        'tables': ['DocumentMetadata'],
+    },
+    # sql/check_特定投資有価証券.sql (一時テーブル #UNIV を CTE に置き換えたもの)
+    'specified_investment_coverage': {
+        'description': '有価証券報告書のうち、特定投資株式を抽出できた書類数 (提出年月別・保有主体別)',
+        'sql': """
+            WITH univ AS (
+                SELECT s.docID,
+                       YEAR(s.dateFile) * 100 + MONTH(s.dateFile) AS fYearMonth,
+                       COUNT(si.docId) AS n,
+                       COUNT(*) FILTER (WHERE si.HoldingEntity = 'ReportingCompany') AS nReporting,
+                       COUNT(*) FILTER (WHERE si.HoldingEntity = 'LargestHoldingCompany') AS nLargest,
+                       COUNT(*) FILTER (WHERE si.HoldingEntity = 'LargestHoldingCompany' AND si.HoldingEntityName IS NOT NULL) AS nLargestName,
+                       COUNT(*) FILTER (WHERE si.HoldingEntity = 'SecondLargestHoldingCompany') AS nSecond,
+                       COUNT(*) FILTER (WHERE si.HoldingEntity = 'SecondLargestHoldingCompany' AND si.HoldingEntityName IS NOT NULL) AS nSecondName
+                FROM DocumentMetadata AS s
+                    LEFT JOIN SpecifiedInvestment AS si ON si.docId = s.docID
+                WHERE s.formCode IN ('030000', '030001') AND s.ordinanceCode = '010'
+                GROUP BY s.dateFile, s.docID
+            )
+            SELECT fYearMonth,
+                   COUNT(*) AS nDoc,
+                   COUNT(*) FILTER (WHERE n > 0) AS nDocSI,
+                   COUNT(*) FILTER (WHERE nReporting > 0) AS nDocSIReporting,
+                   COUNT(*) FILTER (WHERE nLargest > 0) AS nDocSILargest,
+                   COUNT(*) FILTER (WHERE nLargestName > 0) AS nDocSILargestName,
+                   COUNT(*) FILTER (WHERE nSecond > 0) AS nDocSISecond,
+                   COUNT(*) FILTER (WHERE nSecondName > 0) AS nDocSISecondName
+            FROM univ
+            GROUP BY fYearMonth
+            ORDER BY fYearMonth
+        """,
+        'params': {},
+        'tables': ['DocumentMetadata', 'SpecifiedInvestment'],
+    },
+    # 企業横断の集計
+    'top_major_shareholders': {
+        'description': '各社の最新の大株主の状況で、大株主となっている会社数が多い株主',
+        'sql': """
+            WITH latest AS (
+                SELECT *
+                FROM MajorShareholders
+                QUALIFY FiscalPeriodEnd = MAX(FiscalPeriodEnd) OVER (PARTITION BY SecuritiesCode)
+            )
+            SELECT MajorShareholderName,
+                   COUNT(DISTINCT SecuritiesCode) AS issuers,
+                   SUM(NumberOfSharesHeld) AS totalSharesHeld,
+                   AVG(VotingRightsRatio) AS avgVotingRightsRatio,
+                   MAX(VotingRightsRatio) AS maxVotingRightsRatio
+            FROM latest
+            GROUP BY MajorShareholderName
+            ORDER BY issuers DESC, totalSharesHeld DESC
+            LIMIT $limit
+        """,
+        'params': {'limit': 50},
+        'tables': ['MajorShareholders'],
+    },
+    'major_shareholder_changes': {
+        'description': '大株主ごとの議決権比率の前期からの変化 (変化の大きい順)',
+        'sql': """
+            WITH latest_filing AS (
+                -- 同じ期の書類が複数ある場合 (訂正報告書など) は最後に提出されたものを使う
+                SELECT *
+                FROM MajorShareholders
+                QUALIFY SubmissionDate = MAX(SubmissionDate) OVER (PARTITION BY SecuritiesCode, FiscalPeriodEnd)
+            ),
+            by_period AS (
+                SELECT SecuritiesCode, MajorShareholderName, FiscalPeriodEnd, SUM(VotingRightsRatio) AS VotingRightsRatio
+                FROM latest_filing
+                GROUP BY SecuritiesCode, MajorShareholderName, FiscalPeriodEnd
+            ),
+            history AS (
+                SELECT *,
+                       LAG(VotingRightsRatio) OVER w AS previousVotingRightsRatio,
+                       LAG(FiscalPeriodEnd) OVER w AS previousFiscalPeriodEnd
+                FROM by_period
+                WINDOW w AS (PARTITION BY SecuritiesCode, MajorShareholderName ORDER BY FiscalPeriodEnd)
+            )
+            SELECT *, VotingRightsRatio - previousVotingRightsRatio AS change
+            FROM history
+            WHERE previousVotingRightsRatio IS NOT NULL
+              AND ($sec_code IS NULL OR SecuritiesCode = $sec_code)
+            ORDER BY ABS(change) DESC, SecuritiesCode, MajorShareholderName
+            LIMIT $limit
+        """,
+        'params': {'sec_code': None, 'limit': 100},
+        'tables': ['MajorShareholders'],
+    },
+    'cross_shareholding_pairs': {
+        'description': '特定投資株式を互いに保有している会社の組み合わせ (名寄せ後の証券コードによる)',
+        'sql': """
+            WITH holdings AS (
+                SELECT DISTINCT SecuritiesCode AS holder, matchedSecCode AS issuer
+                FROM EnrichedSpecifiedInvestment
+                WHERE HoldingEntity = 'ReportingCompany' AND matchedSecCode IS NOT NULL
+                  AND SecuritiesCode <> matchedSecCode
+                  AND YEAR(SubmissionDate) >= $since_year
+            )
+            SELECT a.holder AS companyA, a.issuer AS companyB
+            FROM holdings AS a
+                JOIN holdings AS b ON b.holder = a.issuer AND b.issuer = a.holder
+            WHERE a.holder < a.issuer
+            ORDER BY companyA, companyB
+        """,
+        'params': {'since_year': 2000},
+        'tables': ['EnrichedSpecifiedInvestment'],
+    },
+    'buyback_progress': {
+        'description': '自己株式の取得の決議ごとの、最新の報告時点の累計取得株式数・金額と上限に対する進捗',
+        'sql': """
+            WITH latest AS (
+                SELECT *
+                FROM BuybackAcquisitionDetail
+                WHERE section = 'acquisition' AND resolutionDate IS NOT NULL
+                  AND ($sec_code IS NULL OR secCode = $sec_code)
+                QUALIFY dateFile = MAX(dateFile) OVER (PARTITION BY secCode, resolutionBody, resolutionDate)
+            )
+            SELECT secCode, resolutionBody, resolutionDate,
+                   MAX(periodStart) AS periodStart,
+                   MAX(periodEnd) AS periodEnd,
+                   MAX(CASE WHEN rowType = 'resolution' THEN shares END) AS limitShares,
+                   MAX(CASE WHEN rowType = 'resolution' THEN amount END) AS limitAmount,
+                   MAX(CASE WHEN rowType = 'cumulative' THEN shares END) AS cumulativeShares,
+                   MAX(CASE WHEN rowType = 'cumulative' THEN amount END) AS cumulativeAmount,
+                   cumulativeShares / NULLIF(limitShares, 0) AS sharesProgress,
+                   cumulativeAmount / NULLIF(limitAmount, 0) AS amountProgress,
+                   MAX(dateFile) AS lastReported
+            FROM latest
+            GROUP BY secCode, resolutionBody, resolutionDate
+            ORDER BY lastReported DESC, secCode, resolutionDate
+        """,
+        'params': {'sec_code': None},
+        'tables': ['BuybackAcquisitionDetail'],
+    },
+}
+
+
+class AnalyticsSession:
+    """DuckDB の接続と、登録したビューを保持する。with 文で使うと終了時に接続を閉じる。"""
+
+    def __init__(self, source: str = 'parquet', export_dir: str = EXPORT_DIR, database: str = ':memory:',
+                 tables: list[str] | None = None):
+        """
+        Args:
+            source (str): 'parquet' または 'db'。
+            export_dir (str): source='parquet' の場合の、export_parquet.py の出力先。
+            database (str): DuckDB のデータベースファイル (省略時はメモリー上)。
+            tables (list[str], optional): 登録するテーブル (省略時は EXPORT_TABLES のうち存在するものすべて)。
+        """
+        self.connection = duckdb.connect(database)
+        self.tables = []
+        for table_name in tables or EXPORT_TABLES:
+            if source == 'parquet':
+                registered = self._register_parquet(table_name, export_dir)
+            elif source == 'db':
+                registered = self._register_db_table(table_name)
+            else:
+                raise ValueError(f"Unknown source: {source}")
+            if registered:
+                self.tables.append(table_name)
+        logger.info("Registered %s tables from %s: %s", len(self.tables), source, ', '.join(self.tables))
+
+    def _register_parquet(self, table_name: str, export_dir: str) -> bool:
+        pattern = os.path.join(export_dir, table_name, '**', '*.parquet')
+        if not glob.glob(pattern, recursive=True):
+            return False
+        # パーティション (fiscalYear=2024 など) はディレクトリ名から列として復元する
+        self.connection.execute(
+            f'CREATE OR REPLACE VIEW "{table_name}" AS '
+            f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)"
+        )
+        return True
+
+    @staticmethod
+    def _add_partition_column(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+        """Parquet のビューと同じ列になるよう、export_parquet.py のパーティションの列を追加する。"""
+        partition = EXPORT_TABLES[table_name]["partition"] if table_name in EXPORT_TABLES else None
+        if partition is None or partition[1] not in df.columns:
+            return df
+        name, date_column, granularity = partition
+        dates = pd.to_datetime(df[date_column], errors='coerce')
+        if granularity == 'year':
+            return df.assign(**{name: dates.dt.year.astype('Int64')})
+        return df.assign(**{name: dates.dt.strftime('%Y-%m')})
+
+    def _register_db_table(self, table_name: str) -> bool:
+        with database_manager.engine.connect() as connection:
+            if not inspect(connection).has_table(table_name):
+                return False
+            column_types = {c['name']: c['type'] for c in inspect(connection).get_columns(table_name)}
+            df = pd.read_sql_table(table_name, connection)
+        # Parquet と同じ値・型にそろえる (TextBlock の contentHash、SQLite では日付が文字列、
+        # DECIMAL が Python のオブジェクトとして返るため)
+        df = text_blocks.expand_text_blocks(df, table_name)
+        df = self._add_partition_column(compact_dtypes(df, column_types), table_name)
+        # DataFrame をそのままテーブルとして登録する (以降のクエリはDBに接続しない)
+        self.connection.register(f'_{table_name}_df', df)
+        self.connection.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM "_{table_name}_df"')
+        self.connection.unregister(f'_{table_name}_df')
+        return True
+
+    def _execute(self, query: str, params: dict | None = None):
+        return self.connection.execute(query, params or {})
+
+    def sql(self, query: str, params: dict | None = None) -> pd.DataFrame:
+        """SQL を実行し、結果を DataFrame で返す。"""
+        return self._execute(query, params).df()
+
+    def arrow(self, query: str, params: dict | None = None):
+        """SQL を実行し、結果を pyarrow.Table で返す。"""
+        return self._execute(query, params).fetch_arrow_table()
+
+    def _query_params(self, name: str, params: dict) -> tuple[str, dict]:
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}. Available queries: {', '.join(QUERIES)}")
+        definition = QUERIES[name]
+        unknown = set(params) - set(definition['params'])
+        if unknown:
+            raise TypeError(f"Unknown parameters for {name}: {', '.join(sorted(unknown))}")
+        missing = [t for t in definition['tables'] if t not in self.tables]
+        if missing:
+            raise LookupError(f"Query {name} requires tables that are not registered: {', '.join(missing)}. "
+                              "Export them with export_parquet.py first.")
+        return definition['sql'], {**definition['params'], **params}
+
+    def run(self, name: str, **params) -> pd.DataFrame:
+        """QUERIES に定義したクエリを実行し、結果を DataFrame で返す。"""
+        return self.sql(*self._query_params(name, params))
+
+    def run_arrow(self, name: str, **params):
+        """QUERIES に定義したクエリを実行し、結果を pyarrow.Table で返す。"""
+        return self.arrow(*self._query_params(name, params))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _normalize_result(df: pd.DataFrame) -> pd.DataFrame:
+    """ソースによる行の順序・型の違いを除くため、列の値を文字列にして並べ替える。"""
+    df = df.astype(object).where(df.notna(), None).astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def check_queries(export_dir: str = EXPORT_DIR) -> list[str]:
+    """
+    QUERIES のすべてのクエリを、既定のパラメーターで Parquet と DB の両方のソースで実行し、結果を比較する。
+    失敗したクエリ・結果が一致しないクエリの説明のリストを返す (参照するテーブルがないソースでは実行しない)。
+    """
+    problems = []
+    with AnalyticsSession('parquet', export_dir=export_dir) as parquet, AnalyticsSession('db') as db:
+        for name, definition in QUERIES.items():
+            results = {}
+            for session in (parquet, db):
+                source = 'parquet' if session is parquet else 'db'
+                if not set(definition['tables']) <= set(session.tables):
+                    logger.info("%s: skipped on %s (tables not registered).", name, source)
+                    continue
+                try:
+                    results[source] = session.run(name)
+                except duckdb.Error as e:
+                    problems.append(f"{name} ({source}): {e}")
+            if len(results) == 2:
+                parquet_df, db_df = (_normalize_result(results[source]) for source in ('parquet', 'db'))
+                if list(parquet_df.columns) != list(db_df.columns) or not parquet_df.equals(db_df):
+                    problems.append(f"{name}: results differ (parquet {results['parquet'].shape}, db {results['db'].shape})")
+            logger.info("%s: %s", name, ', '.join(f"{source} {len(df)} rows" for source, df in results.items()) or 'skipped')
+    return problems
+
+
+def _parse_param(value: str, defaults: dict) -> tuple[str, object]:
+    """
+    'name=value' を (name, value) に変換する。既定値が int のパラメーター (limit, since_year など) のみ int にし、
+    それ以外は文字列のまま渡す (証券コードは '130A0' のように英字を含むため、'82330' も文字列として比較する)。
+    """
+    name, _, raw = value.partition('=')
+    if raw.lower() in ('', 'null', 'none'):
+        return name, None
+    default = defaults.get(name)
+    if isinstance(default, int) and not isinstance(default, bool):
+        return name, int(raw)
+    return name, raw
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Run analytical queries with DuckDB over exported Parquet files.')
+    arg_parser.add_argument('query', nargs='?', help='QUERIES に定義したクエリ名')
+    arg_parser.add_argument('--param', action='append', default=[], help='クエリのパラメーター (name=value)')
+    arg_parser.add_argument('--sql', help='任意のSQLを実行する')
+    arg_parser.add_argument('--list', action='store_true', help='定義済みのクエリの一覧を表示する')
+    arg_parser.add_argument('--source', choices=['parquet', 'db'], default='parquet', help='テーブルの読み込み元')
+    arg_parser.add_argument('--export-dir', default=EXPORT_DIR, help='Parquet ファイルのディレクトリ')
+    arg_parser.add_argument('--output', help='結果を保存するCSVファイルのパス')
+    arg_parser.add_argument('--check', action='store_true',
+                            help='すべてのクエリを Parquet と DB の両方で実行し、結果が一致するか確認する')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    if args.check:
+        problems = check_queries(args.export_dir)
+        if problems:
+            print("Query check failed:")
+            for problem in problems:
+                print(f"  - {problem}")
+            raise SystemExit(1)
+        print("All queries returned the same results from Parquet and the DB.")
+        raise SystemExit(0)
+
+    if args.list or not (args.query or args.sql):
+        for name, definition in QUERIES.items():
+            params = ', '.join(f"{k}={v}" for k, v in definition['params'].items())
+            print(f"{name:35s} {definition['description']}" + (f" [{params}]" if params else ''))
+        raise SystemExit(0)
+
+    with AnalyticsSession(source=args.source, export_dir=args.export_dir) as session:
+        if args.sql:
+            result = session.sql(args.sql)
+        else:
+            defaults = QUERIES[args.query]['params'] if args.query in QUERIES else {}
+            result = session.run(args.query, **dict(_parse_param(p, defaults) for p in args.param))
+    if args.output:
+        result.to_csv(args.output, index=False, encoding='utf-8-sig')
+        logger.info("Saved %s rows to %s", len(result), args.output)
+    else:
+        with pd.option_context('display.max_rows', 100, 'display.max_columns', None, 'display.width', 200):
+            print(result)
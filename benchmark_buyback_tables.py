@@ -0,0 +1,184 @@
+"""
+自己株券買付状況報告書の TextBlock の表の抽出 (buyback_tables.py) のベンチマーク
+
+synthetic_data.generate_buyback_report_df で取得状況の表の大きさが異なる合成の報告書を多数生成し、
+取得状況・処理状況・保有状況の TextBlock から型付きの行を抽出する処理時間を計測する。
+文字列の解析のキャッシュを消去した状態 (cold) と、同じ報告書を続けて処理した状態 (warm) を計測し、
+比較のために pandas.read_html で表を DataFrame に変換するだけの処理時間も計測する。
+
+抽出結果は、決議ごとの取得の行の合計が「計」の行と一致するか、処理状況の合計が「計」の行と一致するか、
+保有状況の2行がそろっているかを確認し、一致しない報告書がある場合は終了コード1を返す。
+
+使い方:
+    python benchmark_buyback_tables.py
+    python benchmark_buyback_tables.py --reports 5000 --sizes small medium large
+    python benchmark_buyback_tables.py --baseline bench_results/buyback_tables_abc1234.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import lxml
+import pandas as pd
+
+import buyback_tables
+import synthetic_data
+from benchmark_parsers import _git_revision, DEFAULT_OUTPUT_DIR
+
+# --- 定数定義 ---
+DEFAULT_REPORTS = 3000
+DEFAULT_SIZES = ['small', 'medium', 'large']
+DEFAULT_MAX_SLOWDOWN = 0.3
+FILING_DATE = '2025-06-13'
+# 合成データの TextBlock の要素ID (府令コード crp)
+_PREFIX = 'jpcrp-sbr_cor'
+SECTION_ELEMENTS = {
+    'acquisition': f'{_PREFIX}:AcquisitionsByResolutionOfBoardOfDirectorsMeetingTextBlock',
+    'disposal': f'{_PREFIX}:DisposalsOfTreasurySharesTextBlock',
+    'holding': f'{_PREFIX}:HoldingOfTreasurySharesTextBlock',
+}
+
+
+def generate_reports(n_reports: int, sizes: list[str]) -> list[dict[str, str]]:
+    """合成の報告書の TextBlock ({section: HTML}) を n_reports 件生成する。取得状況の大きさは sizes を順に使う。"""
+    reports = []
+    for i in range(n_reports):
+        preset = synthetic_data.SIZE_PRESETS[sizes[i % len(sizes)]]['buyback']
+        df = synthetic_data.generate_buyback_report_df(**preset, sec_code=f'{1300 + i % 8000}0', seed=i)
+        values = dict(zip(df['要素ID'], df['値']))
+        reports.append({section: values.get(element_id) for section, element_id in SECTION_ELEMENTS.items()})
+    return reports
+
+
+def _extract_all(reports: list[dict]) -> list[pd.DataFrame]:
+    return [buyback_tables.extract_buyback_details(report, FILING_DATE) for report in reports]
+
+
+def _read_html_all(reports: list[dict]) -> int:
+    """比較用: pandas.read_html で TextBlock の表を DataFrame に変換する (行の種類の判定・型の変換は行わない)。"""
+    n_tables = 0
+    for report in reports:
+        for html in report.values():
+            if html and '<table' in html:
+                n_tables += len(pd.read_html(io.StringIO(html)))
+    return n_tables
+
+
+def check_report(detail: pd.DataFrame) -> list[str]:
+    """抽出結果の整合性を確認し、一致しない項目のリストを返す。"""
+    problems = []
+    acquisition = detail[detail['section'] == 'acquisition']
+    # 同じ日付の決議が複数ある場合があるため、決議状況の行から次の決議状況の行までを1つの決議とする
+    resolution_ids = acquisition['rowType'].eq('resolution').cumsum()
+    for (_, resolution_date), rows in acquisition.groupby([resolution_ids, 'resolutionDate'], dropna=False):
+        totals = rows.loc[rows['rowType'] == 'total', 'shares']
+        if len(totals) != 1 or rows.loc[rows['rowType'] == 'acquisition', 'shares'].sum() != totals.iloc[0]:
+            problems.append(f'acquisition total ({resolution_date})')
+        if (rows['rowType'] == 'cumulative').sum() != 1:
+            problems.append(f'cumulative ({resolution_date})')
+    if acquisition.empty:
+        problems.append('no acquisition rows')
+    disposal = detail[detail['section'] == 'disposal']
+    if disposal['rowType'].eq('disposal').any():
+        totals = disposal.loc[disposal['rowType'] == 'total', 'shares']
+        if len(totals) != 1 or disposal.loc[disposal['rowType'] == 'disposal', 'shares'].sum() != totals.iloc[0]:
+            problems.append('disposal total')
+    holding = set(detail.loc[detail['section'] == 'holding', 'rowType'])
+    if holding != {'issued_shares', 'treasury_shares'}:
+        problems.append('holding rows')
+    return problems
+
+
+def _timed(stages: dict, name: str, func, n_reports: int):
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    stages[name] = {'seconds': seconds, 'reports_per_s': n_reports / seconds if seconds else None}
+    return result
+
+
+def run(n_reports: int, sizes: list[str]) -> dict:
+    reports = generate_reports(n_reports, sizes)
+    html_bytes = sum(len(html.encode('utf-8')) for report in reports for html in report.values() if html)
+    stages = {}
+    buyback_tables.clear_caches()
+    details = _timed(stages, 'extract_cold', lambda: _extract_all(reports), n_reports)
+    _timed(stages, 'extract_warm', lambda: _extract_all(reports), n_reports)
+    n_tables = _timed(stages, 'pandas_read_html', lambda: _read_html_all(reports), n_reports)
+
+    n_rows = sum(len(detail) for detail in details)
+    for name in ('extract_cold', 'extract_warm'):
+        stages[name]['rows_per_s'] = n_rows / stages[name]['seconds'] if stages[name]['seconds'] else None
+    failures = [(i, problem) for i, detail in enumerate(details) for problem in check_report(detail)]
+    return {
+        'reports': n_reports,
+        'sizes': sizes,
+        'html_mb': html_bytes / 1024 / 1024,
+        'tables': n_tables,
+        'rows': n_rows,
+        'rows_by_type': pd.concat(details)['rowType'].value_counts().to_dict(),
+        'check_failures': len(failures),
+        'check_failure_examples': [f'report {i}: {problem}' for i, problem in failures[:10]],
+        'cache': {func.__name__: func.cache_info()._asdict() for func in
+                  (buyback_tables.normalize_text, buyback_tables.classify_label, buyback_tables.parse_dates)},
+        'stages': stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark structured extraction from buyback status report TextBlocks.')
+    parser.add_argument('--reports', type=int, default=DEFAULT_REPORTS, help='生成する報告書の数')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, choices=list(synthetic_data.SIZE_PRESETS))
+    parser.add_argument('--output', help='結果のJSONファイルパス (省略時は bench_results/buyback_tables_<commit>.json)')
+    parser.add_argument('--baseline', help='比較対象となるベースラインのJSONファイルパス')
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_MAX_SLOWDOWN)
+    args = parser.parse_args()
+
+    revision = _git_revision()
+    print(f"--- Running buyback table extraction benchmark (commit: {revision}, reports: {args.reports:,}, "
+          f"sizes: {', '.join(args.sizes)}) ---")
+    result = run(args.reports, args.sizes)
+    print(f"\n[{result['reports']:,} reports / {result['html_mb']:.1f} MB of HTML: {result['tables']:,} tables, "
+          f"{result['rows']:,} rows]")
+    for name, stage in result['stages'].items():
+        rows_per_s = f"{stage['rows_per_s']:12,.0f} rows/s" if stage.get('rows_per_s') else ''
+        print(f"  {name:<20} {stage['seconds']:9.3f} s {stage['reports_per_s']:10,.0f} reports/s {rows_per_s}")
+
+    output_path = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'buyback_tables_{revision}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    report = {
+        'benchmark': 'buyback_tables',
+        'commit': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'lxml': lxml.__version__,
+        'pandas': pd.__version__,
+        'result': result,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nSaved results to: {os.path.abspath(output_path)}")
+
+    failures = list(result['check_failure_examples'])
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['result']
+        for name, stage in result['stages'].items():
+            base = baseline['stages'].get(name)
+            if base and stage['seconds'] / result['reports'] > base['seconds'] / baseline['reports'] * (1 + args.max_slowdown):
+                failures.append(f"{name}: {base['seconds'] / baseline['reports'] * 1000:.3f} ms/report -> "
+                                f"{stage['seconds'] / result['reports'] * 1000:.3f} ms/report")
+    if failures:
+        print("\nBenchmark gates failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nAll benchmark gates passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+政策保有株式の保有関係のグラフ (cross_shareholding.py) のベンチマーク
+
+synthetic_data.generate_cross_shareholdings で上場会社全体の規模 (約3,900社 × 5年度) の合成データを生成し、
+グラフの作成・書類単位の差分更新・相互保有の組み合わせ・相互保有額・循環の検出の処理時間を計測する。
+相互保有の組み合わせと相互保有額は、pandas の自己結合による計算と結果・処理時間を比較する。
+
+使い方:
+    python benchmark_cross_shareholding.py
+    python benchmark_cross_shareholding.py --companies 3900 --mean-holdings 40 --update-filings 500
+    python benchmark_cross_shareholding.py --baseline bench_results/cross_shareholding_abc1234.json
+    DATABASE_URL=sqlite:// python benchmark_cross_shareholding.py --check-refresh   # DB からの差分の読み込みを確認する
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, column, delete, inspect, or_, select, table, text, update
+
+import cross_shareholding
+import database_manager
+import synthetic_data
+from benchmark_parsers import _git_revision, DEFAULT_OUTPUT_DIR
+
+# --- 定数定義 ---
+DEFAULT_COMPANIES = 3900
+DEFAULT_MEAN_HOLDINGS = 30
+DEFAULT_YEARS = 5
+DEFAULT_UPDATE_FILINGS = 200
+DEFAULT_MAX_SLOWDOWN = 0.3
+CHECK_TABLE_NAME = 'EnrichedSpecifiedInvestment'
+
+
+def _timed(stages: dict, name: str, func):
+    start = time.perf_counter()
+    result = func()
+    stages[name] = {'seconds': time.perf_counter() - start}
+    return result
+
+
+def _pandas_reciprocal_pairs(edges: pd.DataFrame) -> pd.DataFrame:
+    """比較用: pandas の自己結合による相互保有の組み合わせ。"""
+    edges = edges.groupby(['SecuritiesCode', 'matchedSecCode'], as_index=False)['BookValueCurrentYear'].sum()
+    merged = edges.merge(edges, left_on=['SecuritiesCode', 'matchedSecCode'], right_on=['matchedSecCode', 'SecuritiesCode'],
+                         suffixes=('', '_reverse'))
+    return merged[merged['SecuritiesCode'] < merged['matchedSecCode']]
+
+
+def run(n_companies: int, mean_holdings: int, n_years: int, update_filings: int, seed: int) -> dict:
+    rows = synthetic_data.generate_cross_shareholdings(n_companies, mean_holdings, n_years, seed=seed)
+    last_year = int(cross_shareholding.fiscal_years(rows['SubmissionDate']).max())
+    stages = {}
+
+    network = cross_shareholding.CrossShareholdingNetwork()
+    _timed(stages, 'load', lambda: network.update(rows))
+    graph = network.graph(last_year)
+    _timed(stages, 'build_csr', lambda: graph.n_edges)
+
+    # 差分更新: 最新年度の一部の会社が訂正報告書を提出し、保有銘柄の一部が変わったものとする
+    latest = rows[cross_shareholding.fiscal_years(rows['SubmissionDate']) == last_year]
+    amended_holders = latest['SecuritiesCode'].drop_duplicates().sample(
+        min(update_filings, latest['SecuritiesCode'].nunique()), random_state=seed)
+    amendments = latest[latest['SecuritiesCode'].isin(amended_holders)].sample(frac=0.9, random_state=seed).assign(
+        SubmissionDate=f'{last_year + 1}-09-30')
+    _timed(stages, 'incremental_update', lambda: (network.update(amendments), graph.n_edges))
+
+    pairs = _timed(stages, 'reciprocal_pairs', graph.reciprocal_pairs)
+    values = _timed(stages, 'cross_held_value', graph.cross_held_value)
+    cycles = _timed(stages, 'cycles_length3', lambda: graph.cycles(max_length=3))
+
+    # pandas の自己結合との比較 (同じ最新年度の辺)
+    edges = graph.to_frame().rename(columns={'holderSecCode': 'SecuritiesCode', 'investeeSecCode': 'matchedSecCode',
+                                             'bookValue': 'BookValueCurrentYear'})
+    pandas_pairs = _timed(stages, 'pandas_reciprocal_pairs', lambda: _pandas_reciprocal_pairs(edges))
+    return {
+        'companies': n_companies,
+        'rows': len(rows),
+        'fiscal_year': last_year,
+        'edges': graph.n_edges,
+        'amended_filings': len(amended_holders),
+        'reciprocal_pairs': len(pairs),
+        'pandas_reciprocal_pairs': len(pandas_pairs),
+        'cross_held_value_total': float(values['crossHeldValue'].sum()),
+        'cycles_length3': len(cycles),
+        'stages': stages,
+    }
+
+
+def _graph_frames(network: cross_shareholding.CrossShareholdingNetwork) -> dict[int, pd.DataFrame]:
+    frames = {year: graph.to_frame().sort_values(['holderSecCode', 'investeeSecCode']).reset_index(drop=True)
+              for year, graph in network.graphs.items()}
+    return {year: frame for year, frame in frames.items() if not frame.empty}
+
+
+def check_refresh(n_companies: int = 300, mean_holdings: int = 10, seed: int = 0) -> list[str]:
+    """
+    CrossShareholdingNetwork.refresh() が DB の行の書き換え・追加・名寄せの解除を検出し、全件を読み込み直した結果と
+    一致するかを確認する。失敗した確認の内容のリストを返す。
+    EnrichedSpecifiedInvestment に合成データを書き込むため、テーブルがまだないDB (DATABASE_URL=sqlite:// など) でのみ実行する。
+    """
+    engine = database_manager.engine
+    with engine.connect() as connection:
+        if inspect(connection).has_table(CHECK_TABLE_NAME):
+            raise RuntimeError(f"{CHECK_TABLE_NAME} already exists. Run the check against an empty database.")
+    rows = synthetic_data.generate_cross_shareholdings(n_companies, mean_holdings, 2, seed=seed)
+    rows.to_sql(CHECK_TABLE_NAME, engine, index=False)
+    network = cross_shareholding.CrossShareholdingNetwork()
+    network.refresh()
+
+    def rewrite_last_rows(connection):
+        # 再名寄せ: save_data と同じく末尾の行を削除して挿入し直す (行数は変わらず、SQLite では同じ rowid が再利用される)
+        last = rows.tail(3)
+        condition = or_(*[and_(column('SubmissionDate') == date, column('SecuritiesCode') == code, column('rowId') == row_id)
+                          for date, code, row_id in zip(last['SubmissionDate'], last['SecuritiesCode'], last['rowId'])])
+        connection.execute(delete(table(CHECK_TABLE_NAME)).where(condition))
+        last.assign(matchedSecCode=rows['SecuritiesCode'].iloc[0]).to_sql(
+            CHECK_TABLE_NAME, connection, index=False, if_exists='append')
+
+    def backfill(connection):
+        # 新しい提出会社の過去の書類を後から保存する
+        rows.head(10).assign(SecuritiesCode='99990', SubmissionDate=rows['SubmissionDate'].min()).to_sql(
+            CHECK_TABLE_NAME, connection, index=False, if_exists='append')
+
+    def unmatch(connection):
+        # 名寄せの解除: 提出会社の保有銘柄の1行が投資先不明になる
+        first = rows.iloc[0]
+        connection.execute(update(table(CHECK_TABLE_NAME, column('matchedSecCode'))).where(and_(
+            column('SubmissionDate') == first['SubmissionDate'], column('SecuritiesCode') == first['SecuritiesCode'],
+            column('rowId') == int(first['rowId']))).values(matchedSecCode=None))
+
+    failures = []
+    for name, change in [('rewrite_last_rows', rewrite_last_rows), ('backfill', backfill), ('unmatch', unmatch)]:
+        with engine.begin() as connection:
+            change(connection)
+        replaced = network.refresh()
+        fresh = cross_shareholding.CrossShareholdingNetwork()
+        fresh.refresh()
+        actual, expected = _graph_frames(network), _graph_frames(fresh)
+        if not replaced:
+            failures.append(f"{name}: refresh() did not detect the change")
+        elif actual.keys() != expected.keys() or any(not actual[year].equals(expected[year]) for year in expected):
+            failures.append(f"{name}: refreshed graphs differ from a full reload")
+        else:
+            print(f"  {name:<24} ok ({replaced} company-years replaced)")
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE {CHECK_TABLE_NAME}'))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cross-shareholding graph on a synthetic market.')
+    parser.add_argument('--companies', type=int, default=DEFAULT_COMPANIES)
+    parser.add_argument('--mean-holdings', type=int, default=DEFAULT_MEAN_HOLDINGS)
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--update-filings', type=int, default=DEFAULT_UPDATE_FILINGS, help='差分更新で反映する書類数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='結果のJSONファイルパス (省略時は bench_results/cross_shareholding_<commit>.json)')
+    parser.add_argument('--baseline', help='比較対象となるベースラインのJSONファイルパス')
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_MAX_SLOWDOWN)
+    parser.add_argument('--check-refresh', action='store_true',
+                        help='DB からの差分の読み込み (refresh) が変更を反映するかを確認する (空のDBで実行する)')
+    args = parser.parse_args()
+
+    if args.check_refresh:
+        print("--- Checking CrossShareholdingNetwork.refresh() against full reloads ---")
+        failures = check_refresh(seed=args.seed)
+        if failures:
+            print("\nRefresh check failed:")
+            for failure in failures:
+                print(f"  - {failure}")
+            sys.exit(1)
+        print("\nAll refresh checks passed.")
+        return
+
+    revision = _git_revision()
+    print(f"--- Running cross-shareholding benchmark (commit: {revision}, companies: {args.companies:,}, "
+          f"years: {args.years}) ---")
+    result = run(args.companies, args.mean_holdings, args.years, args.update_filings, args.seed)
+    print(f"\n[{result['rows']:,} rows / fiscal year {result['fiscal_year']}: {result['edges']:,} holdings, "
+          f"{result['reciprocal_pairs']:,} reciprocal pairs, {result['cycles_length3']:,} cycles of length 3]")
+    for name, stage in result['stages'].items():
+        print(f"  {name:<24} {stage['seconds']:9.3f} s")
+
+    output_path = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'cross_shareholding_{revision}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    report = {
+        'benchmark': 'cross_shareholding',
+        'commit': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'result': result,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to: {os.path.abspath(output_path)}")
+
+    failures = []
+    if result['reciprocal_pairs'] != result['pandas_reciprocal_pairs']:
+        failures.append(f"reciprocal pairs differ from pandas: {result['reciprocal_pairs']} != {result['pandas_reciprocal_pairs']}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['result']
+        for name, stage in result['stages'].items():
+            base = baseline['stages'].get(name)
+            if base and stage['seconds'] > base['seconds'] * (1 + args.max_slowdown):
+                failures.append(f"{name}: {base['seconds']:.3f} s -> {stage['seconds']:.3f} s")
+    if failures:
+        print("\nBenchmark gates failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nAll benchmark gates passed.")
+
+
+if __name__ == "__main__":
+    main()
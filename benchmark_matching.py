@@ -0,0 +1,197 @@
+"""
+名寄せ処理のスケーラビリティ・ベンチマーク
+
+synthetic_data.py で生成した合成の会社名マスターと大株主名・投資先名を使い、
+_normalize_name / build_name_code_master / match_names の各ステージ (正規化, 完全一致, ホールディングス, あいまい検索)
+の処理時間とピークメモリを、名称数 10k / 100k / 1M の規模で計測する。
+
+処理速度とマッチ率をベースラインと比較し、基準を満たさない場合は終了コード1を返す。
+
+使い方:
+    python benchmark_matching.py                                        # 10k / 100k / 1M を計測
+    python benchmark_matching.py --scales 10000 100000 --master-size 20000
+    python benchmark_matching.py --baseline bench_results/matching_abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+import matching
+import synthetic_data
+from benchmark_parsers import _git_revision, DEFAULT_OUTPUT_DIR
+
+# --- 定数定義 ---
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+DEFAULT_MASTER_SIZE = 50_000
+# あいまい検索は1件ごとにマスター全体を走査するため、計測はサンプルに限定して全体の処理時間を推定する
+DEFAULT_FUZZY_SAMPLE = 2_000
+# ベースラインとの比較で許容するマッチ率の差 (絶対値) と処理速度の低下率
+DEFAULT_RATE_TOLERANCE = 0.005
+DEFAULT_MAX_SLOWDOWN = 0.3
+
+
+def _run_stage(stages: dict, name: str, func, track_memory: bool):
+    """1ステージを実行し、処理時間 (とピークメモリ) を stages に記録して戻り値を返す。"""
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    stage = {'seconds': elapsed}
+    if track_memory:
+        stage['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    stages[name] = stage
+    return result
+
+
+def run_scale(n_records: int, master_raw_df: pd.DataFrame, fuzzy_sample: int, track_memory: bool,
+              score_cutoff: int = 85, seed: int = 0) -> dict:
+    """指定したレコード数で名寄せの各ステージを計測する。"""
+    names_df = synthetic_data.generate_shareholder_names(master_raw_df, n_records, seed=seed)
+    names = names_df['name']
+    stages = {}
+
+    master = _run_stage(stages, 'build_master', lambda: matching.build_name_code_master(master_raw_df), track_memory)
+    process_df = _run_stage(stages, 'normalize', lambda: matching._prepare_lookup_keys(names, {}), track_memory)
+    unique_lookup_keys = process_df['lookupKey'].unique()
+    results_df = _run_stage(stages, 'exact', lambda: matching._match_exact(unique_lookup_keys, master), track_memory)
+    exact_matched = int(results_df['matchedEdinetCode'].notna().sum())
+    holdings_matched = _run_stage(stages, 'holdings', lambda: matching._match_holdings(results_df, master), track_memory)
+
+    # あいまい検索はサンプルで計測し、未マッチ件数全体での処理時間を推定する
+    fuzzy_candidates = int(results_df['matchedEdinetCode'].isna().sum())
+    fuzzy_sampled = min(fuzzy_candidates, fuzzy_sample)
+    # サンプル外のキーを計測後のマッチ率計算から除外するため、計測前の状態を保持する
+    before_fuzzy = results_df['matchedEdinetCode'].copy()
+    fuzzy_matched = _run_stage(stages, 'fuzzy', lambda: matching._match_fuzzy(results_df, master, score_cutoff, limit=fuzzy_sample), track_memory)
+    if fuzzy_sampled:
+        stages['fuzzy']['sampled_keys'] = fuzzy_sampled
+        stages['fuzzy']['projected_seconds'] = stages['fuzzy']['seconds'] * fuzzy_candidates / fuzzy_sampled
+
+    # 完全一致+ホールディングスまでの結果で、レコード単位のマッチ率・正解率を算出する
+    key_to_code = dict(zip(results_df['lookupKey'], before_fuzzy))
+    matched_codes = process_df.set_index('originalName')['lookupKey'].map(key_to_code)
+    predicted = names.map(matched_codes)
+    expected = names_df['expectedEdinetCode']
+    match_rate = float(predicted.notna().mean())
+    precision = float((predicted[predicted.notna()] == expected[predicted.notna()]).mean()) if predicted.notna().any() else 0.0
+
+    deterministic_seconds = sum(stages[s]['seconds'] for s in ('normalize', 'exact', 'holdings'))
+    return {
+        'records': n_records,
+        'distinct_names': len(process_df),
+        'unique_lookup_keys': len(unique_lookup_keys),
+        'master_size': len(master),
+        'stages': stages,
+        'exact_matched_keys': exact_matched,
+        'holdings_matched_keys': holdings_matched,
+        'fuzzy_candidate_keys': fuzzy_candidates,
+        'fuzzy_hit_rate_sample': fuzzy_matched / fuzzy_sampled if fuzzy_sampled else None,
+        'match_rate_exact_holdings': match_rate,
+        'precision_exact_holdings': precision,
+        'throughput_records_per_s': n_records / deterministic_seconds if deterministic_seconds else None,
+    }
+
+
+def check_gates(results: list[dict], baseline: list[dict] | None, min_throughput: float | None,
+                rate_tolerance: float, max_slowdown: float) -> list[str]:
+    """処理速度とマッチ率の基準を確認し、違反内容のリストを返す。"""
+    failures = []
+    baseline_map = {r['records']: r for r in baseline or []}
+    for r in results:
+        throughput = r['throughput_records_per_s'] or 0
+        if min_throughput is not None and throughput < min_throughput:
+            failures.append(f"{r['records']} records: throughput {throughput:,.0f}/s is below {min_throughput:,.0f}/s")
+        base = baseline_map.get(r['records'])
+        if not base:
+            continue
+        for key in ('match_rate_exact_holdings', 'precision_exact_holdings'):
+            if abs(r[key] - base[key]) > rate_tolerance:
+                failures.append(f"{r['records']} records: {key} changed from {base[key]:.4f} to {r[key]:.4f}")
+        base_hit, hit = base.get('fuzzy_hit_rate_sample'), r.get('fuzzy_hit_rate_sample')
+        if base_hit is not None and hit is not None and abs(hit - base_hit) > rate_tolerance:
+            failures.append(f"{r['records']} records: fuzzy_hit_rate_sample changed from {base_hit:.4f} to {hit:.4f}")
+        base_throughput = base.get('throughput_records_per_s') or 0
+        if base_throughput and throughput < base_throughput * (1 - max_slowdown):
+            failures.append(f"{r['records']} records: throughput dropped from {base_throughput:,.0f}/s to {throughput:,.0f}/s")
+    return failures
+
+
+def _print_result(r: dict):
+    """1規模分の計測結果を表示する。"""
+    print(f"\n[{r['records']:,} records / {r['distinct_names']:,} distinct names / master {r['master_size']:,}]")
+    for name, stage in r['stages'].items():
+        line = f"  {name:<13} {stage['seconds']:9.3f} s"
+        if 'peak_mb' in stage:
+            line += f"  peak {stage['peak_mb']:8.1f} MB"
+        if 'projected_seconds' in stage:
+            line += f"  (sampled {stage['sampled_keys']:,} keys, projected {stage['projected_seconds']:,.1f} s for {r['fuzzy_candidate_keys']:,} keys)"
+        print(line)
+    print(f"  match rate (exact+holdings): {r['match_rate_exact_holdings']:.4f}, precision: {r['precision_exact_holdings']:.4f}")
+    if r['fuzzy_hit_rate_sample'] is not None:
+        print(f"  fuzzy hit rate (sample):     {r['fuzzy_hit_rate_sample']:.4f}")
+    print(f"  throughput (exact+holdings): {r['throughput_records_per_s']:,.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark name matching on synthetic Japanese company names.')
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES)
+    parser.add_argument('--master-size', type=int, default=DEFAULT_MASTER_SIZE)
+    parser.add_argument('--fuzzy-sample', type=int, default=DEFAULT_FUZZY_SAMPLE)
+    parser.add_argument('--no-memory', action='store_true', help='tracemallocによるピークメモリ計測を行わない')
+    parser.add_argument('--output', help='結果のJSONファイルパス (省略時は bench_results/matching_<commit>.json)')
+    parser.add_argument('--baseline', help='比較対象となるベースラインのJSONファイルパス')
+    parser.add_argument('--min-throughput', type=float, help='許容する最低処理速度 (records/s, 完全一致+ホールディングスまで)')
+    parser.add_argument('--rate-tolerance', type=float, default=DEFAULT_RATE_TOLERANCE)
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_MAX_SLOWDOWN)
+    args = parser.parse_args()
+
+    revision = _git_revision()
+    track_memory = not args.no_memory
+    print(f"--- Running matching benchmarks (commit: {revision}, scales: {args.scales}, master: {args.master_size:,}) ---")
+    if track_memory:
+        print("Note: tracemalloc is enabled, so stage timings include its overhead. Use --no-memory for pure timings.")
+
+    master_raw_df = synthetic_data.generate_master_names(args.master_size)
+    results = []
+    for n_records in args.scales:
+        result = run_scale(n_records, master_raw_df, args.fuzzy_sample, track_memory)
+        _print_result(result)
+        results.append(result)
+
+    output_path = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'matching_{revision}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    report = {
+        'benchmark': 'matching',
+        'commit': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'track_memory': track_memory,
+        'results': results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to: {os.path.abspath(output_path)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    failures = check_gates(results, baseline, args.min_throughput, args.rate_tolerance, args.max_slowdown)
+    if failures:
+        print("\nBenchmark gates failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\nAll benchmark gates passed.")
+
+
+if __name__ == "__main__":
+    main()
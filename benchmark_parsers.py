@@ -0,0 +1,228 @@
+"""
+パーサーのマイクロベンチマーク
+
+synthetic_data.py で生成した合成XBRL CSVを使い、DOC_TYPE_PARSERS に登録された全パーサーと
+parse_document_file の処理時間をサイズ別に計測する。結果はJSONで保存し、コミット間で比較できる。
+
+使い方:
+    python benchmark_parsers.py                                   # 全サイズを計測して bench_results/ に保存
+    python benchmark_parsers.py --sizes small medium --repeat 5
+    python benchmark_parsers.py --compare bench_results/parsers_abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+import document_processor
+import extraction
+import synthetic_data
+
+# --- 定数定義 ---
+# サイズごとの合成データの生成パラメータ (モックサーバーと共通)
+SIZE_PRESETS = synthetic_data.SIZE_PRESETS
+
+# 書類種別ごとの、合成データ生成関数・代表的な(form_code, ordinance_code, ordinance_code_short)・CSVファイル名
+DOC_TYPE_FIXTURES = {
+    'AnnualSecuritiesReport': {
+        'generator': synthetic_data.generate_annual_report_df,
+        'preset_key': 'annual',
+        'codes': ('030000', '010', 'crp'),
+        'filename': 'jpcrp030000-asr-001_E00001-000_2025-03-31_01_2025-06-20.csv',
+    },
+    'LargeVolumeHoldingReport': {
+        'generator': synthetic_data.generate_large_volume_report_df,
+        'preset_key': 'large_volume',
+        'codes': ('010002', '060', 'lvh'),
+        'filename': 'jplvh010002-lvh-001_E10001-000_2025-06-20_01_2025-06-20.csv',
+    },
+    'BuybackStatusReport': {
+        'generator': synthetic_data.generate_buyback_report_df,
+        'preset_key': 'buyback',
+        'codes': ('170000', '010', 'crp'),
+        'filename': 'jpcrp-sbr170000-sbr-001_E00001-000_2025-06-13_01_2025-06-13.csv',
+    },
+}
+
+DEFAULT_OUTPUT_DIR = 'bench_results'
+# 比較時に回帰とみなす処理時間の増加率
+DEFAULT_REGRESSION_THRESHOLD = 0.2
+
+
+def _git_revision() -> str:
+    """現在のコミットハッシュ (短縮形) を返す。取得できない場合は 'unknown'。"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def _time_call(func, make_args, repeat: int) -> tuple[list[float], object]:
+    """func(*make_args()) を repeat 回実行し、各回の処理時間と最後の戻り値を返す。引数の準備は計測に含めない。"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        args = make_args()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def _peak_memory_mb(func, args) -> float:
+    """func(*args) の実行中に確保されたメモリのピーク (MB) を tracemalloc で計測する。"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def _result_entry(target: str, doc_type: str, size: str, input_rows: int, output_rows: int, timings: list[float]) -> dict:
+    """計測結果の1レコードを作成する。"""
+    return {
+        'target': target,
+        'doc_type': doc_type,
+        'size': size,
+        'input_rows': input_rows,
+        'output_rows': output_rows,
+        'repeat': len(timings),
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'mean_s': statistics.fmean(timings),
+    }
+
+
+def _call_parser(data_type_name: str, parser_func, df: pd.DataFrame, ordinance_code_short: str) -> pd.DataFrame:
+    """parse_document_file と同じ引数の渡し方でパーサーを呼び出す。"""
+    if parser_func.__name__ in ('parse_buyback_status_report', 'parse_buyback_acquisition_detail'):
+        return parser_func(df, ordinance_code=ordinance_code_short)
+    if parser_func.__name__ == 'parse_large_shareholding_report':
+        return parser_func(df, doc_id='BENCH001')
+    return parser_func(df)
+
+
+def run_benchmarks(sizes: list[str], repeat: int = 3) -> list[dict]:
+    """指定したサイズについて、全パーサーと parse_document_file の処理時間を計測する。"""
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='edinet_bench_')
+    original_cwd = os.getcwd()
+    try:
+        # parse_document_file は "data/<docID>/<file>.csv" の相対パスから docID を取得するため、作業ディレクトリを移動する
+        os.chdir(work_dir)
+        for size in sizes:
+            preset = SIZE_PRESETS[size]
+            for doc_type, fixture in DOC_TYPE_FIXTURES.items():
+                parsers_list = document_processor.DOC_TYPE_PARSERS.get(doc_type, [])
+                if not parsers_list:
+                    continue
+                df = fixture['generator'](**preset[fixture['preset_key']])
+                form_code, ordinance_code, ordinance_code_short = fixture['codes']
+
+                # 1. 各パーサー単体
+                for data_type_name, parser_func in parsers_list:
+                    timings, result = _time_call(
+                        lambda d: _call_parser(data_type_name, parser_func, d, ordinance_code_short),
+                        lambda: (df.copy(),), repeat
+                    )
+                    results.append(_result_entry(f'{parser_func.__name__}[{data_type_name}]', doc_type, size,
+                                                 len(df), 0 if result is None else len(result), timings))
+                    print(f"  {size:<6} {doc_type:<26} {parser_func.__name__:<40} median {results[-1]['median_s'] * 1000:9.2f} ms")
+
+                # 2. ファイル読み込みを含む parse_document_file
+                csv_path = os.path.join('data', 'BENCH001', fixture['filename'])
+                synthetic_data.write_xbrl_csv(df, csv_path)
+                timings, result = _time_call(
+                    document_processor.parse_document_file,
+                    lambda: (csv_path, form_code, ordinance_code, ordinance_code_short), repeat
+                )
+                output_rows = sum(len(v) for v in result.values()) if result else 0
+                results.append(_result_entry('parse_document_file', doc_type, size, len(df), output_rows, timings))
+                results[-1]['peak_mb'] = _peak_memory_mb(document_processor.parse_document_file,
+                                                         (csv_path, form_code, ordinance_code, ordinance_code_short))
+                print(f"  {size:<6} {doc_type:<26} {'parse_document_file':<40} median {results[-1]['median_s'] * 1000:9.2f} ms"
+                      f"  peak {results[-1]['peak_mb']:7.1f} MB")
+
+                # 3. 1つのプロダクトのみを対象とした parse_document_file (要素IDのフィルタ付きの読み込み)
+                for data_type_name, _ in parsers_list:
+                    if data_type_name not in extraction.PRODUCT_SPECS:
+                        continue
+                    args = (csv_path, form_code, ordinance_code, ordinance_code_short, False, [data_type_name])
+                    timings, result = _time_call(document_processor.parse_document_file, lambda: args, repeat)
+                    target = f'parse_document_file[{data_type_name}]'
+                    output_rows = sum(len(v) for v in result.values()) if result else 0
+                    results.append(_result_entry(target, doc_type, size, len(df), output_rows, timings))
+                    results[-1]['peak_mb'] = _peak_memory_mb(document_processor.parse_document_file, args)
+                    print(f"  {size:<6} {doc_type:<26} {target:<40} median {results[-1]['median_s'] * 1000:9.2f} ms"
+                          f"  peak {results[-1]['peak_mb']:7.1f} MB")
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare_results(current: list[dict], baseline: list[dict], threshold: float) -> list[dict]:
+    """ベースラインと比較し、処理時間の中央値が threshold を超えて増加した計測対象を返す。"""
+    baseline_map = {(r['target'], r['doc_type'], r['size']): r for r in baseline}
+    regressions = []
+    print(f"\n{'size':<6} {'doc_type':<26} {'target':<55} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for r in current:
+        base = baseline_map.get((r['target'], r['doc_type'], r['size']))
+        if not base or base['median_s'] <= 0:
+            continue
+        ratio = r['median_s'] / base['median_s']
+        flag = ' <-- regression' if ratio > 1 + threshold else ''
+        print(f"{r['size']:<6} {r['doc_type']:<26} {r['target']:<55} {base['median_s'] * 1000:8.2f}ms {r['median_s'] * 1000:8.2f}ms {ratio:7.2f}{flag}")
+        if flag:
+            regressions.append({**r, 'baseline_median_s': base['median_s'], 'ratio': ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EDINET XBRL-CSV parsers on synthetic documents.')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZE_PRESETS.keys()), default=list(SIZE_PRESETS.keys()))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='結果のJSONファイルパス (省略時は bench_results/parsers_<commit>.json)')
+    parser.add_argument('--compare', help='比較対象となるベースラインのJSONファイルパス')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    revision = _git_revision()
+    print(f"--- Running parser benchmarks (commit: {revision}, sizes: {', '.join(args.sizes)}, repeat: {args.repeat}) ---")
+    results = run_benchmarks(args.sizes, repeat=args.repeat)
+
+    output_path = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'parsers_{revision}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    report = {
+        'benchmark': 'parsers',
+        'commit': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved results to: {os.path.abspath(output_path)}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions detected (threshold: +{args.threshold:.0%}).")
+            sys.exit(1)
+        print("\nNo regressions detected.")
+
+
+if __name__ == "__main__":
+    main()
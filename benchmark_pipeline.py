@@ -0,0 +1,246 @@
+"""
+パイプライン全体 (書類一覧の取得 → 書類のダウンロード・解析・保存) のエンドツーエンド・ベンチマーク
+
+mock_edinet_server.py をサブプロセスで起動し、EDINET_API_BASE_URL と DATABASE_URL を差し替えた上で
+collect_submission_data.main と process_documents.process_documents を実行し、
+それぞれの処理件数/秒 (documents per second) を計測する。DBはデフォルトで一時ディレクトリのSQLiteを使う。
+
+使い方:
+    python benchmark_pipeline.py                                     # 5日分 x 40件/日 (small) を計測
+    python benchmark_pipeline.py --days 10 --docs-per-day 100 --size medium
+    python benchmark_pipeline.py --latency-ms 50 --error-rate 0.01 --rate-limit-rate 0.02
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+import requests
+
+# config は import 時に環境変数を読むため、パイプラインのモジュール (benchmark_parsers 経由のものを含む) は
+# EDINET_API_BASE_URL / DATABASE_URL を差し替えた後に関数内で import する
+
+# --- 定数定義 ---
+DEFAULT_DAYS = 5
+DEFAULT_START_DATE = datetime.date(2025, 6, 16)
+# 計測対象のデータプロダクト (モックサーバーが生成する書類種別から得られるもの)
+DEFAULT_PRODUCTS = [
+    'MajorShareholders', 'ShareholderComposition', 'Officer', 'SpecifiedInvestment', 'VotingRights',
+    'LargeVolumeHoldingReport', 'BuybackStatusReport', 'BuybackAcquisitionDetail',
+]
+SERVER_STARTUP_TIMEOUT = 120
+
+
+def _free_port() -> int:
+    """空いているローカルのTCPポート番号を返す。"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_mock_server(args, port: int) -> subprocess.Popen:
+    """モックサーバーをサブプロセスで起動し、応答可能になるまで待機する。"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_edinet_server.py')
+    cmd = [
+        sys.executable, script, '--port', str(port), '--start-date', args.start_date.isoformat(),
+        '--days', str(args.days), '--docs-per-day', str(args.docs_per_day), '--size', args.size,
+        '--latency-ms', str(args.latency_ms), '--latency-jitter-ms', str(args.latency_jitter_ms),
+        '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate), '--seed', str(args.seed),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + SERVER_STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Mock server exited with code {proc.returncode}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/_stats', timeout=1)
+            return proc
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Mock server did not start in time")
+
+
+def _server_stats(port: int, reset: bool = False) -> dict:
+    params = {'reset': '1'} if reset else None
+    return requests.get(f'http://127.0.0.1:{port}/_stats', params=params, timeout=5).json()
+
+
+def _seed_document_form_master(engine):
+    """書類の検索に必要な DocumentFormMaster を、モックサーバーが生成する様式分だけ作成する (未作成の場合のみ)。"""
+    from mock_edinet_server import DOCUMENT_KINDS
+
+    with engine.connect() as connection:
+        if engine.dialect.has_table(connection, 'DocumentFormMaster'):
+            return
+    master_df = pd.DataFrame([
+        {'ordinanceCode': spec['ordinanceCode'], 'ordinanceCodeShort': spec['ordinanceCodeShort'],
+         'formCode': spec['formCode'], 'docTypeCode': spec['docTypeCode']}
+        for spec in DOCUMENT_KINDS.values()
+    ])
+    master_df.to_sql('DocumentFormMaster', con=engine, if_exists='append', index=False)
+
+
+def _count_rows(engine, table_name: str) -> int:
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, table_name):
+            return 0
+        return int(pd.read_sql(f'SELECT COUNT(*) AS n FROM {table_name}', connection)['n'].iloc[0])
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    """パイプラインの進捗出力を抑制する。"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def run_pipeline_benchmark(args, port: int, work_dir: str) -> dict:
+    """モックサーバーに対してパイプラインを実行し、各段階の処理時間と処理件数/秒を返す。"""
+    original_cwd = os.getcwd()
+    print(f"Starting mock EDINET server on port {port} (building synthetic documents)...")
+    server = start_mock_server(args, port)
+    try:
+        import collect_submission_data
+        import database_manager
+        import metrics
+        import process_documents
+        from config import SUBMISSION_TABLE_NAME
+
+        engine = database_manager.engine
+        # 各段階の内訳 (HTTP, 展開, 解析, DB保存) を結果に含めるため、メトリクスを有効化する
+        metrics.enable()
+        _seed_document_form_master(engine)
+        # process_documents は作業ディレクトリ直下の data/ に書類を展開するため、一時ディレクトリに移動する
+        os.chdir(work_dir)
+        end_date = args.start_date + datetime.timedelta(days=args.days - 1)
+        stages = {}
+
+        # 1. 書類一覧の取得・保存
+        _server_stats(port, reset=True)
+        metrics.reset()
+        before = _count_rows(engine, SUBMISSION_TABLE_NAME)
+        start = time.perf_counter()
+        with _quiet(not args.verbose):
+            collect_submission_data.main(start_date=args.start_date, end_date=end_date, sleep_seconds=args.sleep_seconds)
+        elapsed = time.perf_counter() - start
+        collected = _count_rows(engine, SUBMISSION_TABLE_NAME) - before
+        stages['collect_submission_data'] = {
+            'seconds': elapsed, 'dates': args.days, 'documents': collected,
+            'documents_per_s': collected / elapsed if elapsed else None, 'server': _server_stats(port),
+            'metrics': metrics.snapshot(),
+        }
+
+        # 2. 書類のダウンロード・解析・保存
+        tables = {p: database_manager.TABLE_NAME_MAP.get(p, p) for p in args.products}
+        rows_before = {p: _count_rows(engine, t) for p, t in tables.items()}
+        _server_stats(port, reset=True)
+        metrics.reset()
+        start = time.perf_counter()
+        with _quiet(not args.verbose):
+            process_documents.process_documents(args.products)
+        elapsed = time.perf_counter() - start
+        server_stats = _server_stats(port)
+        # ダウンロードに成功した (200を返した) 書類の数を処理件数とする
+        processed = server_stats['status_200']
+        stages['process_documents'] = {
+            'seconds': elapsed, 'documents': processed,
+            'documents_per_s': processed / elapsed if elapsed else None,
+            'rows_written': {p: _count_rows(engine, t) - rows_before[p] for p, t in tables.items()},
+            'server': server_stats,
+            'metrics': metrics.snapshot(),
+        }
+        return stages
+    finally:
+        os.chdir(original_cwd)
+        server.terminate()
+        server.wait()
+
+
+def _print_stages(stages: dict):
+    for name, stage in stages.items():
+        server = stage['server']
+        print(f"\n[{name}]")
+        print(f"  {stage['documents']:,} documents in {stage['seconds']:.2f} s -> {stage['documents_per_s'] or 0:,.1f} docs/s")
+        print(f"  server: {server['requests']:,} requests, {server['bytes_sent'] / 1024 / 1024:.1f} MB sent, "
+              f"429: {server['status_429']}, 500: {server['status_500']}, 404: {server['status_404']}")
+        for product, rows in stage.get('rows_written', {}).items():
+            print(f"  {product:<26} {rows:>8,} rows")
+        # 合計時間の大きいステージ上位を表示する (処理時間ではない待ち時間 schedule_wait は除く)
+        timings = sorted((t for t in stage['metrics']['timings'] if t['stage'] != 'schedule_wait'),
+                         key=lambda t: t['total_s'], reverse=True)[:8]
+        for t in timings:
+            labels = ', '.join(f'{k}={v}' for k, v in t['labels'].items())
+            print(f"    {t['stage']:<20} {labels:<50} {t['count']:>6,} calls {t['total_s']:8.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end pipeline benchmark against a local mock EDINET API.')
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat, default=DEFAULT_START_DATE)
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    parser.add_argument('--docs-per-day', type=int, default=40)
+    parser.add_argument('--size', choices=['small', 'medium', 'large'], default='small')
+    parser.add_argument('--products', nargs='+', default=DEFAULT_PRODUCTS)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--sleep-seconds', type=float, default=0.0, help='collect_submission_data の日付ごとの待機秒数')
+    parser.add_argument('--database-url', help='使用するDBの接続URL (省略時は一時ディレクトリのSQLite)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='パイプラインの進捗出力を表示する')
+    parser.add_argument('--output', help='結果のJSONファイルパス (省略時は bench_results/pipeline_<commit>.json)')
+    args = parser.parse_args()
+
+    port = _free_port()
+    work_dir = tempfile.mkdtemp(prefix='edinet_pipeline_bench_')
+    os.environ['EDINET_API_BASE_URL'] = f'http://127.0.0.1:{port}/api/v2'
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(work_dir, 'pipeline.db')}"
+    from benchmark_parsers import _git_revision, DEFAULT_OUTPUT_DIR
+    if args.verbose:
+        from logging_config import setup_logging
+        setup_logging()
+
+    revision = _git_revision()
+    print(f"--- Running pipeline benchmark (commit: {revision}, {args.days} days x {args.docs_per_day} docs/day, size: {args.size}) ---")
+    try:
+        stages = run_pipeline_benchmark(args, port, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    _print_stages(stages)
+
+    output_path = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f'pipeline_{revision}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    report = {
+        'benchmark': 'pipeline',
+        'commit': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'parameters': {
+            'start_date': args.start_date.isoformat(), 'days': args.days, 'docs_per_day': args.docs_per_day,
+            'size': args.size, 'products': args.products, 'latency_ms': args.latency_ms,
+            'latency_jitter_ms': args.latency_jitter_ms, 'error_rate': args.error_rate,
+            'rate_limit_rate': args.rate_limit_rate, 'sleep_seconds': args.sleep_seconds,
+        },
+        'stages': stages,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to: {os.path.abspath(output_path)}")
+
+
+if __name__ == "__main__":
+    main()
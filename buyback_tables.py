@@ -0,0 +1,362 @@
+"""
+自己株券買付状況報告書の TextBlock の表の抽出
+
+取得状況 (AcquisitionsByResolutionOfBoardOfDirectorsMeetingTextBlock など)・処理状況・保有状況の TextBlock は HTML の表であり、
+株式数・価額の総額・取得日などは表のセルにしか含まれない。このモジュールは表を lxml で解析し、行ごとに型付きの値
+(決議日・取得期間・取得日・株式数・価額の総額・累計・進捗状況) に変換する。
+
+- rowspan / colspan は展開し、各行の先頭の列 (区分) で行の種類 (rowType) を判定する。
+- 報告月における取得・計・累計・進捗状況の行には、直前の決議状況の行の決議機関・決議日を付ける (累計は決議ごとの値)。
+- 年のない日付 (「5月1日」) は、提出日の年 (提出日の月より後の月の場合は前年) とする。
+- 全角数字・和暦 (令和・平成) の日付に対応する。値が「－」のセルは NULL とする。
+- 区分の判定・日付の解析・セルの文字列の正規化は、同じ文字列が多くの報告書で繰り返し現れるため結果をキャッシュする。
+
+BuybackStatusReport の TextBlock は保存時に contentHash に置き換えられる (text_blocks.py) ため、
+抽出は解析時 (parsers.parse_buyback_acquisition_detail) に行い、BuybackAcquisitionDetail に保存する。
+
+使い方:
+    python buyback_tables.py --rebuild             # 保存済みの BuybackStatusReport から BuybackAcquisitionDetail を作成し直す
+
+    rows = buyback_tables.extract_rows(html, 'acquisition', filing_date=datetime.date(2025, 6, 13))
+    detail = buyback_tables.extract_buyback_details({'acquisition': ..., 'disposal': ..., 'holding': ...}, filing_date)
+"""
+import argparse
+import datetime
+import functools
+import logging
+import re
+import unicodedata
+
+import pandas as pd
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+# TextBlock の種類 (section) と BuybackStatusReport の列
+SECTION_COLUMNS = {
+    'acquisition': 'acquisitionStatus',
+    'disposal': 'disposalStatus',
+    'holding': 'holdingStatus',
+}
+DETAIL_COLUMNS = [
+    'section', 'rowNumber', 'rowType', 'label', 'resolutionBody', 'resolutionDate', 'periodStart', 'periodEnd',
+    'transactionDate', 'shares', 'amount', 'sharesRatio', 'amountRatio',
+]
+DATE_COLUMNS = ['resolutionDate', 'periodStart', 'periodEnd', 'transactionDate']
+NUMERIC_COLUMNS = ['shares', 'amount', 'sharesRatio', 'amountRatio']
+# 決議状況の行の情報を引き継ぐ行の種類
+RESOLUTION_ROW_TYPES = {'acquisition', 'total', 'cumulative', 'progress'}
+# 値がないことを表すセル (NFKC 正規化後)
+NULL_CELLS = {'', '-', '―', '—', '‐', '−', 'ー', '該当事項はありません。', '該当事項はありません'}
+# 和暦の元年の前年
+ERA_OFFSETS = {'令和': 2018, '平成': 1988}
+CACHE_SIZE = 65536
+SOURCE_TABLE_NAME = 'BuybackStatusReport'
+DETAIL_TABLE_NAME = 'BuybackAcquisitionDetail'
+REBUILD_CHUNK_SIZE = 500
+
+# lxml の HTML パーサー・XPath は事前に作成して使い回す (lxml.html の要素クラスの判定を避けるため etree で解析する)
+_HTML_PARSER = etree.HTMLParser(remove_comments=True)
+_TABLES = etree.XPath('.//table')
+_ROWS = etree.XPath('.//tr')
+_CELLS = etree.XPath('./th|./td')
+
+_DATE_PATTERN = re.compile(
+    r'(?:(令和|平成)(元|\d{1,2})|(\d{4}))年(\d{1,2})月(\d{1,2})日'
+    r'|(\d{4})/(\d{1,2})/(\d{1,2})'
+    r'|(?<![\d年/])(\d{1,2})月(\d{1,2})日'
+)
+_NUMBER_PATTERN = re.compile(r'^([△▲-])?(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?$')
+# 末尾の単位。千株・千円・百万円は値に倍率を掛ける
+_NUMBER_UNIT_PATTERN = re.compile(r'(千|百万)?[株円]$|%$')
+_UNIT_SCALES = {'千': 1_000, '百万': 1_000_000}
+_RESOLUTION_BODY_PATTERN = re.compile(r'(取締役会|株主総会)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+# --- 文字列の解析 (キャッシュ付き) ---
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize_text(text: str) -> str:
+    """全角英数字・記号を NFKC で半角にし、連続する空白を1つにする。"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def classify_label(label: str, section: str) -> str | None:
+    """区分の列の文字列から行の種類を判定する。見出しの行・判定できない行は None を返す。"""
+    key = label.replace(' ', '')
+    if not key or key == '区分':
+        return None
+    if section == 'holding':
+        if '発行済株式' in key:
+            return 'issued_shares'
+        if '自己株式' in key:
+            return 'treasury_shares'
+        return None
+    if '決議状況' in key:
+        return 'resolution'
+    if '累計' in key:
+        return 'cumulative'
+    if '未行使割合' in key or '進捗状況' in key:
+        return 'progress'
+    if key in ('計', '合計'):
+        return 'total'
+    if '報告月における取得' in key:
+        return 'acquisition'
+    if section == 'disposal':
+        return 'disposal'
+    return None
+
+
+def _to_date(year: int, month: int, day: int) -> datetime.date | None:
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_dates(text: str, filing_date: datetime.date | None = None) -> tuple[datetime.date, ...]:
+    """
+    正規化した文字列に含まれる日付を順に返す。年のない日付は filing_date を基準に年を補う
+    (filing_date の月より後の月の場合は前年とする)。filing_date がない場合、年のない日付は無視する。
+    """
+    dates = []
+    for m in _DATE_PATTERN.finditer(text):
+        if m.group(4):
+            year = (ERA_OFFSETS[m.group(1)] + (1 if m.group(2) == '元' else int(m.group(2)))) if m.group(1) else int(m.group(3))
+            date = _to_date(year, int(m.group(4)), int(m.group(5)))
+        elif m.group(6):
+            date = _to_date(int(m.group(6)), int(m.group(7)), int(m.group(8)))
+        elif filing_date is not None:
+            month, day = int(m.group(9)), int(m.group(10))
+            date = _to_date(filing_date.year - (1 if month > filing_date.month else 0), month, day)
+        else:
+            date = None
+        if date is not None:
+            dates.append(date)
+    return tuple(dates)
+
+
+def parse_number(text: str) -> float | None:
+    """
+    正規化したセルの文字列を数値に変換する (「1,234株」「△100」など)。数値でない場合は None を返す。
+    千株・千円・百万円の単位は倍率を掛けて株数・円に換算する (「1,000千円」は 1,000,000)。
+    """
+    unit = _NUMBER_UNIT_PATTERN.search(text)
+    scale = _UNIT_SCALES.get(unit.group(1), 1) if unit else 1
+    m = _NUMBER_PATTERN.match((text[:unit.start()] if unit else text).strip())
+    if m is None:
+        return None
+    value = float(m.group(2).replace(',', '') + (m.group(3) or '')) * scale
+    return -value if m.group(1) else value
+
+
+# --- 表の解析 ---
+def _cell_text(cell) -> str:
+    # 子要素のないセル・<p> 1つだけのセル (大半のセル) は itertext を使わずに文字列を取得する
+    if len(cell) == 0:
+        return normalize_text(cell.text or '')
+    if len(cell) == 1:
+        child = cell[0]
+        if len(child) == 0 and not (cell.text or '').strip() and not (child.tail or '').strip():
+            return normalize_text(child.text or '')
+    return normalize_text(' '.join(cell.itertext()))
+
+
+def _span(cell, name: str) -> int:
+    value = cell.get(name)
+    if value is None:
+        return 1
+    try:
+        return max(int(value), 1)
+    except ValueError:
+        return 1
+
+
+def table_grid(table) -> list[list[str]]:
+    """表の要素を、rowspan / colspan を展開したセルの文字列の2次元リストに変換する。"""
+    grid = []
+    pending = {}     # 列番号 -> (残りの行数, 文字列): 上の行の rowspan で埋まる列
+    for tr in _ROWS(table):
+        row = []
+        col = 0
+        cells = iter(_CELLS(tr))
+        cell = next(cells, None)
+        while cell is not None or any(c >= col for c in pending):
+            if col in pending:
+                remaining, text = pending[col]
+                row.append(text)
+                if remaining > 1:
+                    pending[col] = (remaining - 1, text)
+                else:
+                    del pending[col]
+                col += 1
+                continue
+            if cell is None:
+                # 行のセルが尽きた後に rowspan の列が残っている場合は、その列まで空のセルで埋める
+                next_col = min(c for c in pending if c >= col)
+                row.extend([''] * (next_col - col))
+                col = next_col
+                continue
+            text = _cell_text(cell)
+            rowspan, colspan = _span(cell, 'rowspan'), _span(cell, 'colspan')
+            for offset in range(colspan):
+                row.append(text)
+                if rowspan > 1:
+                    pending[col + offset] = (rowspan - 1, text)
+            col += colspan
+            cell = next(cells, None)
+        grid.append(row)
+    return grid
+
+
+def parse_tables(html: str) -> list[list[list[str]]]:
+    """TextBlock の HTML に含まれる表を、table_grid の形式のリストで返す。"""
+    if not isinstance(html, str) or '<table' not in html.lower():
+        return []
+    try:
+        root = etree.fromstring(html, _HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return []
+    if root is None:
+        return []
+    return [table_grid(table) for table in _TABLES(root)]
+
+
+def _row_values(row: list[str], label: str) -> list[str]:
+    """区分の列 (colspan で展開されたものを含む) を除いた値の列を返す。"""
+    values = row[1:]
+    while values and values[0] == label:
+        values = values[1:]
+    return values
+
+
+def extract_rows(html: str, section: str, filing_date: datetime.date | None = None) -> list[dict]:
+    """
+    TextBlock の表から型付きの行を抽出する。
+
+    Args:
+        html (str): TextBlock の HTML。
+        section (str): 'acquisition' (取得状況) / 'disposal' (処理状況) / 'holding' (保有状況)。
+        filing_date (datetime.date, optional): 提出日 (年のない日付の年を補うために使う)。
+
+    Returns:
+        list[dict]: DETAIL_COLUMNS をキーとする辞書のリスト。
+    """
+    rows = []
+    resolution = {}
+    previous_type = None
+    for grid in parse_tables(html):
+        for row in grid:
+            if not row:
+                continue
+            label = row[0]
+            row_type = classify_label(label, section)
+            if row_type is None and not label.replace(' ', '') and previous_type in ('acquisition', 'disposal'):
+                # rowspan を使わずに区分の列を空欄にした継続行
+                row_type = previous_type
+            if row_type is None:
+                continue
+            previous_type = row_type
+            values = [value for value in _row_values(row, label) if value not in NULL_CELLS]
+            numbers = [n for n in map(parse_number, values) if n is not None]
+            if row_type != 'resolution' and not numbers:
+                continue
+            record = dict.fromkeys(DETAIL_COLUMNS)
+            record.update(section=section, rowNumber=len(rows) + 1, rowType=row_type, label=label)
+            if row_type == 'resolution':
+                body = _RESOLUTION_BODY_PATTERN.search(label)
+                dates = parse_dates(label, filing_date) + (None, None, None)
+                resolution = {'resolutionBody': body.group(1) if body else None, 'resolutionDate': dates[0]}
+                record.update(resolution, periodStart=dates[1], periodEnd=dates[2])
+            elif row_type in ('acquisition', 'disposal'):
+                for value in values:
+                    dates = parse_dates(value, filing_date)
+                    if dates:
+                        record['transactionDate'] = dates[0]
+                        break
+            # 数値の列は 株式数, 価額の総額 の順 (進捗状況の行は それぞれの割合)
+            first, second = (numbers + [None, None])[:2]
+            if row_type == 'progress':
+                record.update(sharesRatio=first, amountRatio=second)
+            else:
+                record.update(shares=first, amount=second)
+            if section == 'acquisition' and row_type in RESOLUTION_ROW_TYPES:
+                record.update(resolution)
+            rows.append(record)
+    return rows
+
+
+def _to_filing_date(value) -> datetime.date | None:
+    if value is None or isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value[:10])
+        except ValueError:
+            pass
+    value = pd.to_datetime(value, errors='coerce')
+    return None if pd.isna(value) else value.date()
+
+
+def extract_buyback_details(text_blocks: dict[str, str | None], filing_date=None) -> pd.DataFrame:
+    """
+    取得状況・処理状況・保有状況の TextBlock ({section: HTML}) から、BuybackAcquisitionDetail の行を抽出する。
+    rowNumber は TextBlock ごとの連番とする。
+    """
+    filing_date = _to_filing_date(filing_date)
+    rows = []
+    for section in SECTION_COLUMNS:
+        rows.extend(extract_rows(text_blocks.get(section), section, filing_date))
+    return pd.DataFrame(rows, columns=DETAIL_COLUMNS)
+
+
+def clear_caches():
+    """文字列の解析結果のキャッシュを消去する (ベンチマークでキャッシュなしの処理時間を計測する場合など)。"""
+    for func in (normalize_text, classify_label, parse_dates):
+        func.cache_clear()
+
+
+def rebuild(chunk_size: int = REBUILD_CHUNK_SIZE) -> int:
+    """
+    保存済みの BuybackStatusReport の TextBlock (contentHash の場合は TextBlockStore の本文) から、
+    BuybackAcquisitionDetail を作成し直す。保存した行数を返す。
+    """
+    # parsers から読み込まれる解析処理は DB の設定に依存させないため、DB を使う処理のみここで読み込む
+    import database_manager
+    import text_blocks
+
+    reader = text_blocks.TextBlockReader()
+    saved = 0
+    for chunk in pd.read_sql_table(SOURCE_TABLE_NAME, database_manager.engine, chunksize=chunk_size):
+        chunk = text_blocks.expand_text_blocks(chunk, SOURCE_TABLE_NAME, reader)
+        doc_id_column = 'docID' if 'docID' in chunk.columns else 'docId'
+        frames = []
+        for report in chunk.to_dict('records'):
+            detail = extract_buyback_details(
+                {section: report.get(column) for section, column in SECTION_COLUMNS.items()}, report.get('dateFile'))
+            if not detail.empty:
+                frames.append(detail.assign(docId=report[doc_id_column], seqNumber=report.get('seqNumber'),
+                                            dateFile=report.get('dateFile'), secCode=report.get('secCode')))
+        if frames:
+            detail = pd.concat(frames, ignore_index=True)
+            detail['dateFile'] = pd.to_datetime(detail['dateFile'], errors='coerce').dt.date
+            database_manager.save_data(detail, DETAIL_TABLE_NAME, raise_errors=True)
+            saved += len(detail)
+    logger.info("Rebuilt %s rows of %s.", saved, DETAIL_TABLE_NAME)
+    return saved
+
+
+if __name__ == "__main__":
+    from logging_config import setup_logging
+
+    arg_parser = argparse.ArgumentParser(description='Extract typed rows from buyback status report TextBlocks.')
+    arg_parser.add_argument('--rebuild', action='store_true', help='保存済みの BuybackStatusReport から作成し直す')
+    arg_parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+    args = arg_parser.parse_args()
+    setup_logging()
+    if not args.rebuild:
+        arg_parser.error('--rebuild is required.')
+    rebuild(args.chunk_size)
@@ -1,4 +1,5 @@
 import datetime
+import logging
 import time
 import pandas as pd
 from tqdm import tqdm
@@ -6,23 +7,31 @@ from tqdm import tqdm
 # 分割・作成した新しいモジュールをインポート
 import edinet_api
 import database_manager
+import metrics
+from logging_config import setup_logging
 
+logger = logging.getLogger(__name__)
 
-def main():
+
+def main(start_date: datetime.date | None = None, end_date: datetime.date | None = None, sleep_seconds: float = 1.0):
     """
     指定した期間の提出書類一覧を取得し、データベースに保存するメイン処理。
+
+    Args:
+        start_date (date, optional): 取得開始日。省略時は end_date の100日前。
+        end_date (date, optional): 取得終了日。省略時は今日。
+        sleep_seconds (float): 各日付の取得後の待機秒数 (APIサーバーへの負荷対策)。
     """
-    # 取得対象の期間を指定 (今日から100日前まで)
-    end_date = datetime.date.today()
-    start_date = end_date - datetime.timedelta(days=100)
-    # 
+    # 取得対象の期間を指定 (デフォルトは今日から100日前まで)
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date - datetime.timedelta(days=100)
 
     date_range = pd.date_range(start_date, end_date)
-    print(f"Collecting submission lists from {start_date} to {end_date}...")
+    logger.info("Collecting submission lists from %s to %s...", start_date, end_date)
 
     # データベースから既存の日付を取得
     existing_dates = database_manager.get_existing_dates()
-    print(f"Found {len(existing_dates)} existing dates in the database.")
+    logger.info("Found %s existing dates in the database.", len(existing_dates))
 
     for date in tqdm(date_range, desc="Processing dates"):
         date_str = date.strftime('%Y-%m-%d')
@@ -39,20 +48,25 @@ def main():
 
             if not json_data or 'results' not in json_data or not json_data['results']:
                 # print(f"Info: No submission data found for {date_str}.")
-                time.sleep(1)
+                time.sleep(sleep_seconds)
                 continue
 
             # 2. JSONをDataFrameに整形
             df = _format_submission_data(json_data['results'], date_str)
+            metrics.inc('documents', len(df), stage='collect_submission_data')
 
             # 3. DB管理モジュールを使ってDBに保存
             database_manager.save_submission_list(df, date_str)
         
         except Exception as e:
-            print(f"An unexpected error occurred for date {date_str}: {e}")
+            logger.error("An unexpected error occurred for date %s: %s", date_str, e)
         finally:
             # APIサーバーへの負荷を考慮して待機
-            time.sleep(1)
+            time.sleep(sleep_seconds)
+
+    if metrics.is_enabled():
+        metrics.print_summary()
+        metrics.write_reports()
 
 def _format_submission_data(results: list, date_str: str) -> pd.DataFrame:
     """
@@ -97,4 +111,5 @@ def _format_submission_data(results: list, date_str: str) -> pd.DataFrame:
     return pd.DataFrame(structured_data)
 
 if __name__ == '__main__':
+    setup_logging()
     main()
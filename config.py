@@ -6,13 +6,29 @@ load_dotenv()
 
 # EDINET API v2 Key
 API_KEY = os.getenv("EDINET_API_KEY")
+# EDINET API v2 のベースURL (ローカルのモックサーバーなどに差し替える場合に指定)
+EDINET_API_BASE_URL = os.getenv("EDINET_API_BASE_URL", "https://disclosure.edinet-fsa.go.jp/api/v2")
 
 # Database Settings (MSSQL)
 SERVER_NAME = os.getenv("SERVER_NAME")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
-if not DATABASE_NAME:
+# SQLAlchemyの接続URL (ベンチマーク用のSQLiteなどに差し替える場合に指定)
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_NAME and not DATABASE_URL:
     raise ValueError("データベース名が設定されていません。.envファイルで 'DATABASE_NAME' を設定してください。")
 SUBMISSION_TABLE_NAME = 'DocumentMetadata'
+# 処理に失敗した書類の再試行キュー
+RETRY_QUEUE_TABLE_NAME = 'DocumentRetryQueue'
+# 複数ワーカーで書類の処理を分担するためのリーステーブル
+LEASE_TABLE_NAME = 'DocumentProcessingLease'
+# 適用済みのスキーマのバージョン (migrations.py)
+SCHEMA_VERSION_TABLE_NAME = 'SchemaVersion'
+# 大株主の前期からの変化 (shareholder_changes.py)
+SHAREHOLDER_CHANGES_TABLE_NAME = 'MajorShareholderChanges'
+# 発行者・保有者ごとの大量保有の推移 (large_holding_timeline.py)
+LARGE_HOLDING_TIMELINE_TABLE_NAME = 'LargeVolumeHoldingTimeline'
+# 重複を除いて圧縮した TextBlock の本文 (text_blocks.py)
+TEXT_BLOCK_TABLE_NAME = 'TextBlockStore'
 
 # DSN接続文字列を構築
-CONNECTION_STRING = f"mssql+pyodbc:///?odbc_connect=DSN=SQLServerDSN;TrustServerCertificate=Yes;DATABASE={DATABASE_NAME}"
\ No newline at end of file
+CONNECTION_STRING = DATABASE_URL or f"mssql+pyodbc:///?odbc_connect=DSN=SQLServerDSN;TrustServerCertificate=Yes;DATABASE={DATABASE_NAME}"
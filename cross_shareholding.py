@@ -0,0 +1,343 @@
+"""
+政策保有株式 (特定投資株式) の保有関係のグラフ
+
+EnrichedSpecifiedInvestment の提出会社 (SecuritiesCode) -> 名寄せ後の投資先 (matchedSecCode) を有向の辺とし、
+決算年度ごとに疎な隣接行列 (CSR形式の numpy 配列) を作成する。会社は証券コードを連番の ID に変換して保持する。
+相互保有の組み合わせ・保有関係の循環・会社ごとの相互保有額を、SQL の自己結合なしに計算する。
+
+- 提出会社自身の保有 (HoldingEntity = 'ReportingCompany') のみを対象とし、名寄せできなかった投資先は除く。
+- 有価証券報告書は決算日から3か月以内に提出されるため、提出日の3か月前の日付の年を決算年度とする。
+- 同じ年度に同じ会社の書類が複数ある場合 (訂正報告書など) は、最後に提出された書類の保有銘柄で置き換える。
+- 同じ投資先の行が複数ある場合 (普通株式と優先株式など) は、貸借対照表計上額を合計する。
+
+新しい名寄せの結果は update() (または DB から変更のあった会社の行を読み込む refresh()) で反映する。
+更新された会社の行のみを置き換え、CSR の配列は次のクエリの実行時にまとめて作り直す。
+refresh() は提出会社・提出日ごとの行数とチェックサムを前回の読み込み時と比較し、行が追加・書き換え・削除された会社
+(過去の書類のバックフィル、再名寄せによる matchedSecCode の更新を含む) の行をすべて読み込み直す。
+
+使い方:
+    network = cross_shareholding.CrossShareholdingNetwork.load()
+    graph = network.graph(2024)
+    pairs = graph.reciprocal_pairs()
+    values = graph.cross_held_value()
+    cycles = graph.cycles(max_length=3)
+
+    python cross_shareholding.py --year 2024 --output cross_shareholding_2024.csv
+"""
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+import database_manager
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+# 決算年度 = 提出日の FILING_LAG_MONTHS か月前の日付の年
+FILING_LAG_MONTHS = 3
+# CrossShareholdingStatus (当該株式の発行者による提出会社の株式の保有の有無) の値
+CROSS_STATUS_CODES = {'有': 1, '無': 0}
+DEFAULT_MAX_CYCLE_LENGTH = 3
+
+
+def fiscal_years(submission_dates: pd.Series) -> pd.Series:
+    """提出日から決算年度を求める。"""
+    return (pd.to_datetime(submission_dates) - pd.DateOffset(months=FILING_LAG_MONTHS)).dt.year
+
+
+def _cross_status(values: pd.Series) -> np.ndarray:
+    """CrossShareholdingStatus を 1 (有) / 0 (無) / -1 (不明) に変換する (「有（注）」などは先頭の文字で判定する)。"""
+    first = values.astype('string').str.strip().str[:1]
+    return first.map(CROSS_STATUS_CODES).fillna(-1).astype(np.int8).to_numpy()
+
+
+class CompanyIndex:
+    """証券コードと連番の会社 ID の対応。年度ごとのグラフで共有し、新しい会社には次の ID を割り当てる。"""
+
+    def __init__(self):
+        self._ids = {}
+        self._codes = []
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def ids(self, codes) -> np.ndarray:
+        """証券コードの配列を会社 ID の配列に変換する (未登録の証券コードは登録する)。"""
+        codes = pd.Series(codes, dtype=object)
+        for code in codes[~codes.isin(self._ids.keys())].unique():
+            self._ids[code] = len(self._codes)
+            self._codes.append(code)
+        return codes.map(self._ids).to_numpy(dtype=np.int32)
+
+    def codes(self, ids) -> np.ndarray:
+        return np.asarray(self._codes, dtype=object)[np.asarray(ids, dtype=np.int64)]
+
+
+class CrossShareholdingGraph:
+    """1年度分の保有関係。辺は保有会社 (行) -> 投資先 (列) の CSR 形式で保持する。"""
+
+    def __init__(self, companies: CompanyIndex):
+        self.companies = companies
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.book_values = np.zeros(0, dtype=np.float64)
+        self.cross_status = np.zeros(0, dtype=np.int8)
+        self._submission_dates = {}     # 会社 ID -> 反映済みの書類の提出日
+        self._pending = []              # 未反映の保有銘柄 (replace_holdings で追加した DataFrame)
+
+    # --- 更新 ---
+    def replace_holdings(self, holders: np.ndarray, investees: np.ndarray, book_values: np.ndarray,
+                         cross_status: np.ndarray, submission_dates: np.ndarray) -> int:
+        """
+        保有会社ごとに保有銘柄を置き換える。同じ保有会社の行が複数の提出日にまたがる場合は最後の提出日の行のみを使い、
+        反映済みの書類より前に提出された書類の行は無視する。置き換えた保有会社の数を返す。
+        """
+        rows = pd.DataFrame({'holder': holders, 'investee': investees, 'bookValue': book_values,
+                             'crossStatus': cross_status, 'submissionDate': pd.to_datetime(submission_dates)})
+        rows = rows[rows['submissionDate'] == rows.groupby('holder')['submissionDate'].transform('max')]
+        applied = pd.Series(self._submission_dates, dtype='datetime64[ns]').reindex(rows['holder']).to_numpy()
+        rows = rows[pd.isna(applied) | (rows['submissionDate'].to_numpy() >= applied)]
+        if rows.empty:
+            return 0
+        self._submission_dates.update(rows.groupby('holder')['submissionDate'].max().to_dict())
+        self._pending.append(rows.assign(batch=len(self._pending)))
+        return rows['holder'].nunique()
+
+    def clear_holders(self, holders: np.ndarray):
+        """保有会社の保有銘柄と反映済みの提出日を消去する (読み込み直す前に使う)。"""
+        holders = np.unique(np.asarray(holders, dtype=np.int32))
+        if not len(holders):
+            return
+        for holder in holders.tolist():
+            self._submission_dates.pop(holder, None)
+        # 自己保有の辺として追加し、_compact で保有銘柄を置き換えたうえで除く
+        self._pending.append(pd.DataFrame({
+            'holder': holders, 'investee': holders, 'bookValue': np.nan, 'crossStatus': np.int8(0),
+            'submissionDate': pd.NaT, 'batch': len(self._pending)}))
+
+    def _compact(self):
+        """未反映の保有銘柄を CSR の配列に反映する。"""
+        n = len(self.companies)
+        if not self._pending and len(self.indptr) == n + 1:
+            return
+        holders = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        investees, book_values, cross_status = self.indices, self.book_values, self.cross_status
+        if self._pending:
+            # 同じ保有会社が複数回更新された場合は最後の更新のみを使う
+            pending = pd.concat(self._pending, ignore_index=True)
+            pending = pending[pending['batch'] == pending.groupby('holder')['batch'].transform('max')]
+            keep = ~np.isin(holders, pending['holder'].unique())
+            holders = np.concatenate([holders[keep], pending['holder'].to_numpy(np.int32)])
+            investees = np.concatenate([investees[keep], pending['investee'].to_numpy(np.int32)])
+            book_values = np.concatenate([book_values[keep], pending['bookValue'].to_numpy(np.float64)])
+            cross_status = np.concatenate([cross_status[keep], pending['crossStatus'].to_numpy(np.int8)])
+            self._pending = []
+
+        # 自己保有を除き、(保有会社, 投資先) の順に並べて重複する辺の計上額を合計する
+        not_self = holders != investees
+        holders, investees = holders[not_self], investees[not_self]
+        book_values, cross_status = book_values[not_self], cross_status[not_self]
+        keys = holders.astype(np.int64) * n + investees
+        order = np.argsort(keys, kind='stable')
+        keys, book_values, cross_status = keys[order], np.nan_to_num(book_values[order]), cross_status[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        unique_keys = keys[starts]
+        self.book_values = np.add.reduceat(book_values, starts) if len(keys) else book_values
+        self.cross_status = np.maximum.reduceat(cross_status, starts) if len(keys) else cross_status
+        self.indices = (unique_keys % n).astype(np.int32)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(unique_keys // n, minlength=n), out=self.indptr[1:])
+
+    # --- クエリ ---
+    @property
+    def n_edges(self) -> int:
+        self._compact()
+        return len(self.indices)
+
+    def _edge_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(保有会社, 投資先, 辺のキー) の配列を返す。キーは (保有会社, 投資先) の昇順に並んでいる。"""
+        self._compact()
+        n = len(self.companies)
+        holders = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr))
+        return holders, self.indices.astype(np.int64), holders * n + self.indices
+
+    def _reverse_positions(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """各辺の逆向きの辺の位置を返す。(保有会社, 投資先, 逆向きの辺があるか, 逆向きの辺の位置)"""
+        holders, investees, keys = self._edge_arrays()
+        reverse_keys = investees * len(self.companies) + holders
+        positions = np.searchsorted(keys, reverse_keys)
+        found = positions < len(keys)
+        found[found] = keys[positions[found]] == reverse_keys[found]
+        return holders, investees, found, positions
+
+    def to_frame(self) -> pd.DataFrame:
+        """辺の一覧を DataFrame で返す。"""
+        holders, investees, _ = self._edge_arrays()
+        return pd.DataFrame({
+            'holderSecCode': self.companies.codes(holders), 'investeeSecCode': self.companies.codes(investees),
+            'bookValue': self.book_values, 'crossStatus': self.cross_status,
+        })
+
+    def reciprocal_pairs(self) -> pd.DataFrame:
+        """互いに株式を保有している会社の組み合わせと、それぞれの貸借対照表計上額を返す。"""
+        holders, investees, found, positions = self._reverse_positions()
+        pair = found & (holders < investees)
+        return pd.DataFrame({
+            'companyA': self.companies.codes(holders[pair]),
+            'companyB': self.companies.codes(investees[pair]),
+            'bookValueAtoB': self.book_values[pair],
+            'bookValueBtoA': self.book_values[positions[pair]],
+        }).sort_values(['companyA', 'companyB'], ignore_index=True)
+
+    def cross_held_value(self) -> pd.DataFrame:
+        """
+        会社ごとの保有額の集計を返す。
+        holdingsValue: 保有銘柄の計上額の合計 / crossHeldValue: うち相互保有先の計上額の合計 /
+        heldByOthersValue: 他社から保有されている計上額の合計
+        """
+        holders, investees, found, _ = self._reverse_positions()
+        n = len(self.companies)
+        result = pd.DataFrame({
+            'holdings': np.bincount(holders, minlength=n),
+            'reciprocalHoldings': np.bincount(holders[found], minlength=n),
+            'holdingsValue': np.bincount(holders, weights=self.book_values, minlength=n),
+            'crossHeldValue': np.bincount(holders[found], weights=self.book_values[found], minlength=n),
+            'heldByOthersValue': np.bincount(investees, weights=self.book_values, minlength=n),
+        }, index=pd.Index(self.companies.codes(np.arange(n)), name='secCode'))
+        active = (result['holdings'] > 0) | (result['heldByOthersValue'] > 0)
+        return result[active].sort_values('crossHeldValue', ascending=False)
+
+    def cycles(self, max_length: int = DEFAULT_MAX_CYCLE_LENGTH, limit: int | None = None) -> list[tuple[str, ...]]:
+        """
+        長さ3以上 max_length 以下の保有関係の循環 (A -> B -> C -> A など) を返す。長さ2の循環は reciprocal_pairs で取得する。
+        各循環は ID の最も小さい会社から始まる1通りのみを返す。経路を1辺ずつ配列のまま延ばし、
+        最後の会社から開始した会社への辺を辺のキーの二分探索で確認する。
+        """
+        holders, investees, keys = self._edge_arrays()
+        n = len(self.companies)
+        degrees = np.diff(self.indptr)
+        # 経路は会社 ID の配列のリストで保持する (paths[0] が開始した会社で、以降の会社はすべて開始した会社より ID が大きい)
+        forward = investees > holders
+        paths = [holders[forward], investees[forward]]
+        found = []
+        for _ in range(3, max_length + 1):
+            counts = degrees[paths[-1]]
+            origins = np.repeat(np.arange(len(counts)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            nodes = self.indices[self.indptr[paths[-1]][origins] + offsets].astype(np.int64)
+            paths = [path[origins] for path in paths]
+            keep = nodes > paths[0]
+            for path in paths[1:]:
+                keep &= nodes != path
+            paths = [path[keep] for path in paths] + [nodes[keep]]
+            closing = paths[-1] * n + paths[0]
+            positions = np.searchsorted(keys, closing)
+            closed = positions < len(keys)
+            closed[closed] = keys[positions[closed]] == closing[closed]
+            found.append(np.column_stack([path[closed] for path in paths]))
+            if limit is not None and sum(len(cycles) for cycles in found) >= limit:
+                break
+        result = [tuple(cycle) for cycles in found for cycle in self.companies.codes(cycles)]
+        return result if limit is None else result[:limit]
+
+
+class CrossShareholdingNetwork:
+    """決算年度ごとの CrossShareholdingGraph と、年度間で共有する CompanyIndex を保持する。"""
+
+    def __init__(self):
+        self.companies = CompanyIndex()
+        self.graphs = {}
+        self._fingerprints = {}  # (提出会社の証券コード, 提出日) -> (行数, チェックサム) (refresh で使用)
+
+    def graph(self, year: int) -> CrossShareholdingGraph:
+        if year not in self.graphs:
+            self.graphs[year] = CrossShareholdingGraph(self.companies)
+        return self.graphs[year]
+
+    def update(self, rows: pd.DataFrame) -> int:
+        """
+        EnrichedSpecifiedInvestment の行 (SubmissionDate, SecuritiesCode, HoldingEntity, matchedSecCode,
+        BookValueCurrentYear, CrossShareholdingStatus) を反映する。保有銘柄を置き換えた会社の数を返す。
+        """
+        rows = rows[(rows['HoldingEntity'] == 'ReportingCompany')
+                    & rows['SecuritiesCode'].notna() & rows['matchedSecCode'].notna()]
+        if rows.empty:
+            return 0
+        submission_dates = pd.to_datetime(rows['SubmissionDate'])
+        holders = self.companies.ids(rows['SecuritiesCode'].str.strip())
+        investees = self.companies.ids(rows['matchedSecCode'].str.strip())
+        book_values = pd.to_numeric(rows['BookValueCurrentYear'], errors='coerce').to_numpy(np.float64)
+        cross_status = _cross_status(rows['CrossShareholdingStatus'])
+        years = fiscal_years(submission_dates).to_numpy()
+        replaced = 0
+        for year in np.unique(years):
+            in_year = years == year
+            replaced += self.graph(int(year)).replace_holdings(
+                holders[in_year], investees[in_year], book_values[in_year], cross_status[in_year],
+                submission_dates.to_numpy()[in_year])
+        return replaced
+
+    def refresh(self) -> int:
+        """
+        DB から、前回の refresh 以降に行が追加・変更・削除された提出会社の行をすべて読み込み直して反映する。
+        提出日によらず検出するため、過去の書類のバックフィルや再名寄せによる書き換えも反映される。
+        """
+        fingerprints = database_manager.get_cross_shareholding_fingerprints()
+        current = {
+            (str(code), date): (int(n_rows), None if pd.isna(checksum) else int(checksum))
+            for code, date, n_rows, checksum in zip(
+                fingerprints['SecuritiesCode'], pd.to_datetime(fingerprints['SubmissionDate']).dt.strftime('%Y-%m-%d'),
+                fingerprints['rows'], fingerprints['checksum'])
+        }
+        changed = sorted({code for code, _ in current.keys() ^ self._fingerprints.keys()}
+                         | {key[0] for key, value in current.items() if self._fingerprints.get(key, value) != value})
+        if not changed:
+            logger.info("No changes to the cross-shareholding network.")
+            return 0
+
+        if self._fingerprints:
+            rows = database_manager.get_cross_shareholding_edges(holder_codes=changed)
+            holders = self.companies.ids(pd.Series(changed).str.strip())
+            for graph in self.graphs.values():
+                graph.clear_holders(holders)
+        else:
+            rows = database_manager.get_cross_shareholding_edges()
+        replaced = self.update(rows)
+        self._fingerprints = current
+        logger.info("Applied %s rows for %s changed companies (%s company-years replaced) to the cross-shareholding network.",
+                    len(rows), len(changed), replaced)
+        return replaced
+
+    @classmethod
+    def load(cls) -> 'CrossShareholdingNetwork':
+        """DB の EnrichedSpecifiedInvestment からネットワークを作成する。"""
+        network = cls()
+        network.refresh()
+        return network
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Analyze the cross-shareholding network from EnrichedSpecifiedInvestment.')
+    arg_parser.add_argument('--year', type=int, help='決算年度 (省略時は最新の年度)')
+    arg_parser.add_argument('--cycles', type=int, default=DEFAULT_MAX_CYCLE_LENGTH, help='検出する循環の最大の長さ')
+    arg_parser.add_argument('--output', help='会社ごとの相互保有額を保存するCSVファイルのパス')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    network = CrossShareholdingNetwork.load()
+    if not network.graphs:
+        raise SystemExit("No enriched specified investment rows were found.")
+    year = args.year or max(network.graphs)
+    graph = network.graph(year)
+    pairs = graph.reciprocal_pairs()
+    values = graph.cross_held_value()
+    cycles = graph.cycles(max_length=args.cycles)
+    print(f"Fiscal year {year}: {len(network.companies):,} companies, {graph.n_edges:,} holdings, "
+          f"{len(pairs):,} reciprocal pairs, {len(cycles):,} cycles (length <= {args.cycles})")
+    print(values.head(20).to_string())
+    if args.output:
+        values.to_csv(args.output, encoding='utf-8-sig')
+        logger.info("Saved cross-held values to %s", args.output)
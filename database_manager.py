@@ -1,28 +1,133 @@
+import datetime
+import hashlib
+import importlib
+import logging
 import re
+import threading
+import uuid
 import pandas as pd
-import traceback
-from sqlalchemy import create_engine, select, table, column, desc, or_, and_, Table, MetaData, text
-from config import CONNECTION_STRING, SUBMISSION_TABLE_NAME
+import metrics
+from sqlalchemy import (create_engine, select, table, column, desc, or_, and_, Table, MetaData, text, insert, update,
+                        Column, String, Integer, Date, DateTime, event, func, exc, exists, inspect, null, tuple_, values)
+from config import CONNECTION_STRING, SUBMISSION_TABLE_NAME, RETRY_QUEUE_TABLE_NAME, LEASE_TABLE_NAME
+
+logger = logging.getLogger(__name__)
 
 # アプリケーション全体で共有するデータベースエンジンを作成
 engine = create_engine(CONNECTION_STRING)
 
+
+class _ContentChecksum:
+    """
+    SQLite 用の集計関数 content_checksum(列, ...)。行ごとの値の SHA-256 の先頭8バイトを 2**63 を法として合計する
+    (行の順序によらず、同じ行の集合であれば同じ値となる)。
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, *values):
+        digest = hashlib.sha256(repr(values).encode('utf-8')).digest()
+        self.total = (self.total + int.from_bytes(digest[:8], 'big')) % (1 << 63)
+
+    def finalize(self):
+        return self.total
+
+
+if engine.dialect.name == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _register_sqlite_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_aggregate('content_checksum', -1, _ContentChecksum)
+
 # データタイプ名をテーブル名にマッピングする。異なる場合のみ定義。
 TABLE_NAME_MAP = {
     "Officer": "OfficerInformation"
 }
 
-def save_submission_list(df: pd.DataFrame, date_str: str):
-    """提出書類一覧のDataFrameをDBに保存する"""
+# 複数ワーカーで書類を分担するためのリーステーブル (sql/create_table_document_processing_lease.sql と同じ定義)
+# docID の主キーで重複登録を防ぐ必要があるため、to_sql による自動作成ではなくこの定義からテーブルを作成する
+_lease_metadata = MetaData()
+lease_table = Table(
+    LEASE_TABLE_NAME, _lease_metadata,
+    Column('docID', String(8), primary_key=True),
+    Column('dateFile', Date),
+    Column('seqNumber', Integer),
+    Column('formCode', String(6)),
+    Column('ordinanceCode', String(3)),
+    Column('ordinanceCodeShort', String(10)),
+    Column('status', String(10), nullable=False),  # 'pending', 'leased', 'done', 'failed'
+    Column('workerId', String(100)),
+    Column('leaseToken', String(32)),
+    Column('leaseExpiresAt', DateTime),
+    Column('heartbeatAt', DateTime),
+    Column('attempts', Integer, nullable=False),
+    Column('enqueuedAt', DateTime, nullable=False),
+    Column('finishedAt', DateTime),
+)
+# 他のワーカーとの取り合いで1件も確保できなかった場合に、候補を選び直す回数
+LEASE_CLAIM_ATTEMPTS = 5
+
+# 保存時フック: テーブル名 -> save_data の保存前・保存後に呼び出す関数のリスト
+# フックは保存と同じトランザクションの (connection, df) を受け取る。フックで例外が発生した場合は保存も取り消される。
+# 保存前フックは保存する DataFrame を返す (列の値を置き換える場合は、受け取った df を変更せずにコピーを返す)。
+# フックを登録するモジュールを SAVE_HOOK_MODULES に列挙すると、最初の save_data の呼び出し時に読み込まれる。
+SAVE_HOOK_MODULES = ('shareholder_changes', 'large_holding_timeline', 'text_blocks')
+_pre_save_hooks = {}
+_post_save_hooks = {}
+_save_hooks_lock = threading.Lock()
+_save_hook_modules_loaded = False
+
+def add_pre_save_hook(table_name: str, hook):
+    """table_name への保存前に呼び出すフックを登録する。"""
+    hooks = _pre_save_hooks.setdefault(table_name, [])
+    if hook not in hooks:
+        hooks.append(hook)
+
+def remove_pre_save_hook(table_name: str, hook):
+    hooks = _pre_save_hooks.get(table_name, [])
+    if hook in hooks:
+        hooks.remove(hook)
+
+def add_post_save_hook(table_name: str, hook):
+    """table_name への保存後に呼び出すフックを登録する。"""
+    hooks = _post_save_hooks.setdefault(table_name, [])
+    if hook not in hooks:
+        hooks.append(hook)
+
+def remove_post_save_hook(table_name: str, hook):
+    hooks = _post_save_hooks.get(table_name, [])
+    if hook in hooks:
+        hooks.remove(hook)
+
+def _load_save_hook_modules():
+    """SAVE_HOOK_MODULES のモジュールを読み込み、各モジュールのフックを登録させる (初回のみ)。"""
+    global _save_hook_modules_loaded
+    if _save_hook_modules_loaded:
+        return
+    with _save_hooks_lock:
+        if not _save_hook_modules_loaded:
+            for module_name in SAVE_HOOK_MODULES:
+                importlib.import_module(module_name)
+            _save_hook_modules_loaded = True
+
+def save_submission_list(df: pd.DataFrame, date_str: str, raise_errors: bool = False):
+    """
+    提出書類一覧のDataFrameをDBに保存する
+    raise_errors=True の場合、保存時の例外をログ出力後にそのまま送出する。
+    """
     if df.empty:
-        print(f"Info: No new records to upload for {date_str}.")
+        logger.info("No new records to upload for %s.", date_str)
         return
 
     try:
-        df.to_sql(SUBMISSION_TABLE_NAME, con=engine, if_exists='append', index=False)
-        print(f"Success: Uploaded {len(df)} records for {date_str}.")
+        with metrics.timer('db_save', product=SUBMISSION_TABLE_NAME):
+            df.to_sql(SUBMISSION_TABLE_NAME, con=engine, if_exists='append', index=False)
+        metrics.inc('rows', len(df), stage='db_save', product=SUBMISSION_TABLE_NAME)
+        logger.info("Uploaded %s records for %s.", len(df), date_str)
     except Exception as e:
-        print(f"Error: An unexpected error occurred during DB upload for {date_str}: {e}")
+        logger.error("An unexpected error occurred during DB upload for %s: %s", date_str, e)
+        if raise_errors:
+            raise
 
 def get_existing_dates() -> list[str]:
     """データベースに保存されている日付の一覧を取得する"""
@@ -35,7 +140,7 @@ def get_existing_dates() -> list[str]:
                 return pd.to_datetime(df['dateFile']).dt.strftime('%Y-%m-%d').tolist()
             return []
     except Exception as e:
-        print(f"Error: Failed to retrieve existing dates: {e}")
+        logger.error("Failed to retrieve existing dates: %s", e)
         return []
 
 def get_documents_by_date(target_date: str) -> list[tuple[str, str, str]]:
@@ -80,16 +185,143 @@ def get_documents_by_date(target_date: str) -> list[tuple[str, str, str]]:
                 return list(df.itertuples(index=False, name=None))
             return []
     except Exception as e:
-        print(f"Error: Failed to retrieve documents for date {target_date}: {e}")
+        logger.error("Failed to retrieve documents for date %s: %s", target_date, e)
         return []
 
-def get_documents_by_codes(codes: list[tuple[str, str]]) -> list[tuple[str, str, str, str, str, int]]:
+def _code_set_condition(code_columns: tuple, codes: list[tuple[str, str]]):
     """
-    指定された(formCode, ordinanceCode)のタプルリストに一致する書類のリストを取得する。
+    (formCode, ordinanceCode) が codes のいずれかに一致する条件を返す。
+    SQL Server は行値の IN をサポートしないため、VALUES で作成したコードの集合に対する EXISTS とする。
+    それ以外のDBでは (formCode, ordinanceCode) IN ((...), (...)) とする。
+    """
+    form_code_column, ordinance_code_column = code_columns
+    if engine.dialect.name == 'mssql':
+        code_set = values(
+            column('formCode', String), column('ordinanceCode', String), name='code_set'
+        ).data([tuple(code) for code in codes])
+        return exists().where(
+            (code_set.c.formCode == form_code_column) & (code_set.c.ordinanceCode == ordinance_code_column)
+        )
+    return tuple_(form_code_column, ordinance_code_column).in_([tuple(code) for code in codes])
+
+def iter_documents_by_codes(codes: list[tuple[str, str]], date_from=None, date_to=None,
+                            edinet_codes: list[str] | None = None, batch_size: int = 1000, raise_errors: bool = False):
+    """
+    指定された(formCode, ordinanceCode)のタプルリストに一致する書類を、日付が新しい順に batch_size 件ずつ取得して1件ずつ返す。
     (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber)
-    日付が新しい順にソートされる。
+
+    全件を一度に読み込まないため、取得した書類から順に処理を開始でき、数年分の書類一覧をメモリに保持しない。
+    各バッチは直前のバッチの最後の (dateFile, docID) より後の書類を取得する短いクエリとし (キーセット・ページネーション)、
+    処理中にDBの接続やカーソルを開いたままにしない (SQLiteでは読み込み中のカーソルが書き込みを妨げるため)。
+
+    Args:
+        date_from, date_to (optional): dateFile の範囲 (両端を含む)。
+        edinet_codes (list[str], optional): 提出者の edinetCode で絞り込む。
+        raise_errors (bool): True の場合、取得時の例外をログ出力後にそのまま送出する。False の場合は途中で取得を終えるため、
+            一覧の途中までしか返らないことがある (一覧がすべて揃っていることを前提とする処理では True を指定する)。
     """
     if not codes:
+        return
+    submission_table = table(
+        SUBMISSION_TABLE_NAME,
+        column('dateFile'),
+        column('docID'),
+        column('formCode'),
+        column('ordinanceCode'),
+        column('csvFlag'),
+        column('seqNumber'),
+        column('edinetCode'),
+    )
+    document_form_master_table = table(
+        'DocumentFormMaster',
+        column('formCode'),
+        column('ordinanceCode'),
+        column('ordinanceCodeShort'),
+    )
+
+    base_stmt = select(
+        submission_table.c.dateFile,
+        submission_table.c.docID,
+        submission_table.c.formCode,
+        submission_table.c.ordinanceCode,
+        document_form_master_table.c.ordinanceCodeShort,
+        submission_table.c.seqNumber,
+    ).join(
+        document_form_master_table,
+        (submission_table.c.formCode == document_form_master_table.c.formCode) &
+        (submission_table.c.ordinanceCode == document_form_master_table.c.ordinanceCode)
+    ).where(
+        _code_set_condition((submission_table.c.formCode, submission_table.c.ordinanceCode), codes)
+    ).where(
+        submission_table.c.csvFlag == 1
+    ).where(
+        submission_table.c.dateFile.is_not(None)
+    )
+    if date_from is not None:
+        base_stmt = base_stmt.where(submission_table.c.dateFile >= date_from)
+    if date_to is not None:
+        base_stmt = base_stmt.where(submission_table.c.dateFile <= date_to)
+    if edinet_codes:
+        base_stmt = base_stmt.where(submission_table.c.edinetCode.in_(list(edinet_codes)))
+    base_stmt = base_stmt.order_by(
+        desc(submission_table.c.dateFile), desc(submission_table.c.docID)
+    ).limit(batch_size)
+
+    last_key = None
+    n_documents = 0
+    while True:
+        stmt = base_stmt
+        if last_key is not None:
+            last_date, last_doc_id = last_key
+            stmt = stmt.where(or_(
+                submission_table.c.dateFile < last_date,
+                and_(submission_table.c.dateFile == last_date, submission_table.c.docID < last_doc_id),
+            ))
+        try:
+            with engine.connect() as connection:
+                rows = connection.execute(stmt).all()
+        except Exception as e:
+            logger.error("Failed to retrieve documents for codes %s: %s", codes, e)
+            if raise_errors:
+                raise
+            return
+        for row in rows:
+            yield tuple(row)
+        n_documents += len(rows)
+        if len(rows) < batch_size:
+            break
+        last_key = (rows[-1][0], rows[-1][1])
+    logger.debug("Retrieved %s documents for %s codes.", n_documents, len(codes))
+
+def get_documents_by_codes(codes: list[tuple[str, str]], date_from=None, date_to=None,
+                           edinet_codes: list[str] | None = None) -> list[tuple[str, str, str, str, str, int]]:
+    """
+    指定された(formCode, ordinanceCode)のタプルリストに一致する書類のリストを取得する。
+    (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber)
+    日付が新しい順にソートされる。書類数が多い場合は iter_documents_by_codes で順に取得する。
+    """
+    return list(iter_documents_by_codes(codes, date_from=date_from, date_to=date_to, edinet_codes=edinet_codes))
+
+def get_doc_ids_by_date(target_date: str) -> set[str]:
+    """指定された日付の提出書類一覧として保存済みの docID のセットを取得する。"""
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, SUBMISSION_TABLE_NAME):
+                return set()
+            submission_table = table(SUBMISSION_TABLE_NAME, column('docID'), column('dateFile'))
+            stmt = select(submission_table.c.docID).where(submission_table.c.dateFile == target_date)
+            return set(connection.execute(stmt).scalars())
+    except Exception as e:
+        logger.error("Failed to retrieve docIDs for date %s: %s", target_date, e)
+        return set()
+
+def get_documents_by_doc_ids(doc_ids: list[str], chunk_size: int = 1000) -> list[tuple[str, str, str, str, str, int]]:
+    """
+    指定されたdocIDの書類のうち、CSVを持つ書類のリストを get_documents_by_codes と同じ
+    (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber) の形式で取得する。
+    SQL Serverのパラメータ数上限を考慮し、chunk_size件ずつ分割して問い合わせる。
+    """
+    if not doc_ids:
         return []
     try:
         with engine.connect() as connection:
@@ -108,44 +340,73 @@ def get_documents_by_codes(codes: list[tuple[str, str]]) -> list[tuple[str, str,
                 column('ordinanceCode'),
                 column('ordinanceCodeShort'),
             )
-
-            # SQL Serverと互換性のあるWHERE句を構築
-            conditions = []
-            for form_code, ordinance_code in codes:
-                conditions.append(
-                    and_(
-                        submission_table.c.formCode == form_code,
-                        submission_table.c.ordinanceCode == ordinance_code
-                    )
+            documents = []
+            for i in range(0, len(doc_ids), chunk_size):
+                stmt = select(
+                    submission_table.c.dateFile,
+                    submission_table.c.docID,
+                    submission_table.c.formCode,
+                    submission_table.c.ordinanceCode,
+                    document_form_master_table.c.ordinanceCodeShort,
+                    submission_table.c.seqNumber,
+                ).join(
+                    document_form_master_table,
+                    (submission_table.c.formCode == document_form_master_table.c.formCode) &
+                    (submission_table.c.ordinanceCode == document_form_master_table.c.ordinanceCode)
+                ).where(
+                    submission_table.c.docID.in_(doc_ids[i:i + chunk_size])
+                ).where(
+                    submission_table.c.csvFlag == 1
                 )
+                documents.extend(tuple(row) for row in connection.execute(stmt))
+            return documents
+    except Exception as e:
+        logger.error("Failed to retrieve documents for %s docIDs: %s", len(doc_ids), e)
+        return []
 
+def get_supersession_records() -> pd.DataFrame:
+    """
+    書類の置き換え関係 (supersession.py) の作成に必要な書類を取得する。
+    親書類 (parentDocID) を持つ書類 (訂正報告書・取下書) と、取下げ・非開示となっている書類のみを対象とする。
+    (docID, parentDocID, formCode, ordinanceCode, csvFlag, withdrawalStatus, disclosureStatus, submitDateTime, dateFile, seqNumber)
+    """
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, SUBMISSION_TABLE_NAME):
+                return pd.DataFrame()
+            submission_table = table(
+                SUBMISSION_TABLE_NAME,
+                column('docID'),
+                column('parentDocID'),
+                column('formCode'),
+                column('ordinanceCode'),
+                column('csvFlag'),
+                column('withdrawalStatus'),
+                column('disclosureStatus'),
+                column('submitDateTime'),
+                column('dateFile'),
+                column('seqNumber'),
+            )
             stmt = select(
-                submission_table.c.dateFile,
                 submission_table.c.docID,
+                submission_table.c.parentDocID,
                 submission_table.c.formCode,
                 submission_table.c.ordinanceCode,
-                document_form_master_table.c.ordinanceCodeShort,
+                submission_table.c.csvFlag,
+                submission_table.c.withdrawalStatus,
+                submission_table.c.disclosureStatus,
+                submission_table.c.submitDateTime,
+                submission_table.c.dateFile,
                 submission_table.c.seqNumber,
-            ).join(
-                document_form_master_table,
-                (submission_table.c.formCode == document_form_master_table.c.formCode) &
-                (submission_table.c.ordinanceCode == document_form_master_table.c.ordinanceCode)
-            ).where(
-                or_(*conditions)  # (formCode = c1 AND ordinanceCode = o1) OR (...)
-            ).where(
-                submission_table.c.csvFlag == 1
-            ).order_by(
-                desc(submission_table.c.dateFile)
-            )
-
-            df = pd.read_sql(stmt, connection)
-
-            if not df.empty:
-                return list(df.itertuples(index=False, name=None))
-            return []
+            ).where(or_(
+                submission_table.c.parentDocID.is_not(None),
+                submission_table.c.withdrawalStatus.in_(['1', '2']),
+                submission_table.c.disclosureStatus == '1',
+            ))
+            return pd.read_sql(stmt, connection)
     except Exception as e:
-        print(f"Error: Failed to retrieve documents for codes {codes}: {e}")
-        return []
+        logger.error("Failed to retrieve supersession records: %s", e)
+        return pd.DataFrame()
 
 def get_documents_by_form_code(target_form_code: str) -> list[tuple[str, str, str, str, int]]:
     """
@@ -195,19 +456,29 @@ def get_documents_by_form_code(target_form_code: str) -> list[tuple[str, str, st
                 return list(df.itertuples(index=False, name=None))
             return []
     except Exception as e:
-        print(f"Error: Failed to retrieve documents for formCode {target_form_code}: {e}")
+        logger.error("Failed to retrieve documents for formCode %s: %s", target_form_code, e)
         return []
 
-def save_data(df: pd.DataFrame, data_type_name: str):
-    """共通のデータ保存ロジック。冪等性を担保する。"""
+def save_data(df: pd.DataFrame, data_type_name: str, raise_errors: bool = False):
+    """
+    共通のデータ保存ロジック。冪等性を担保する。
+    保存の前後に、同じトランザクションの中でテーブルに登録された保存時フック (add_pre_save_hook / add_post_save_hook) を呼び出す。
+    raise_errors=True の場合、保存時の例外をログ出力後にそのまま送出する。
+    """
     table_name = TABLE_NAME_MAP.get(data_type_name, data_type_name)
 
     if df.empty:
-        print(f"Info: No new records to upload for {table_name}.")
+        logger.info("No new records to upload for %s.", table_name)
         return
+    _load_save_hook_modules()
 
     try:
-        with engine.begin() as connection: # トランザクションを開始
+        with metrics.timer('db_save', product=data_type_name), engine.begin() as connection: # トランザクションを開始
+            # 保存する値の置き換え (TextBlock のハッシュ化など) を同じトランザクションで行う
+            for hook in _pre_save_hooks.get(table_name, []):
+                with metrics.timer('pre_save_hook', product=data_type_name, hook=hook.__name__):
+                    df = hook(connection, df)
+
             # テーブルが存在する場合のみ、既存レコードの削除を試みる
             if engine.dialect.has_table(connection, table_name):
                 meta = MetaData()
@@ -230,11 +501,18 @@ def save_data(df: pd.DataFrame, data_type_name: str):
             
             # DataFrameをDBに書き込み (if_exists='append' なので、テーブルがなければ作成される)
             df.to_sql(table_name, con=connection, if_exists='append', index=False)
-            print(f"Success: Upserted {len(df)} records to {table_name}.")
+
+            # 派生テーブルなどを同じトランザクションで更新する
+            for hook in _post_save_hooks.get(table_name, []):
+                with metrics.timer('post_save_hook', product=data_type_name, hook=hook.__name__):
+                    hook(connection, df)
+        metrics.inc('rows', len(df), stage='db_save', product=data_type_name)
+        logger.info("Upserted %s records to %s.", len(df), table_name)
 
     except Exception as e:
-        print(f"Error: An unexpected error occurred during DB upload to {table_name}: {e}")
-        traceback.print_exc()
+        logger.exception("An unexpected error occurred during DB upload to %s: %s", table_name, e)
+        if raise_errors:
+            raise
 
 
 def get_name_code_master_data() -> pd.DataFrame:
@@ -260,10 +538,10 @@ def get_name_code_master_data() -> pd.DataFrame:
             ).distinct()
 
             df = pd.read_sql(stmt, connection)
-            print(f"Successfully fetched {len(df)} records for name master.")
+            logger.info("Successfully fetched %s records for name master.", len(df))
             return df
     except Exception as e:
-        print(f"Error: Failed to retrieve name master data: {e}")
+        logger.error("Failed to retrieve name master data: %s", e)
         return pd.DataFrame()
 
 
@@ -276,10 +554,10 @@ def get_data_for_enrichment(table_name: str, column_name: str) -> pd.DataFrame:
             # テーブル名を直接埋め込むことで、カラムを自動認識させる
             query = f'SELECT * FROM "{table_name}"'
             df = pd.read_sql(query, connection)
-            print(f"Successfully fetched {len(df)} records from {table_name} for enrichment.")
+            logger.info("Successfully fetched %s records from %s for enrichment.", len(df), table_name)
             return df
     except Exception as e:
-        print(f"Error: Failed to retrieve data from {table_name}: {e}")
+        logger.error("Failed to retrieve data from %s: %s", table_name, e)
         return pd.DataFrame()
 
 def get_enriched_keys(table_name: str) -> set:
@@ -289,27 +567,434 @@ def get_enriched_keys(table_name: str) -> set:
         with engine.connect() as connection:
             # テーブルが存在しない場合を考慮
             if not engine.dialect.has_table(connection, table_name):
-                print(f"Info: Enriched table '{table_name}' does not exist yet. Returning empty set.")
+                logger.info("Enriched table '%s' does not exist yet. Returning empty set.", table_name)
                 return keys
 
             meta = MetaData()
             enriched_table = Table(table_name, meta, autoload_with=connection)
             primary_key_cols = [c.name for c in enriched_table.primary_key.columns]
             if not primary_key_cols:
-                print(f"Warning: No primary key found for {table_name}. Cannot check for existing records.")
+                logger.warning("No primary key found for %s. Cannot check for existing records.", table_name)
                 return keys
 
-            stmt = select(*[column(c) for c in primary_key_cols])
+            stmt = select(*[column(c) for c in primary_key_cols]).select_from(table(table_name))
             df = pd.read_sql(stmt, connection)
             
             if not df.empty:
                 keys = set(df.itertuples(index=False, name=None))
-            print(f"Found {len(keys)} existing keys in {table_name}.")
+            logger.info("Found %s existing keys in %s.", len(keys), table_name)
             return keys
     except Exception as e:
-        print(f"Error: Failed to retrieve existing keys from {table_name}: {e}")
+        logger.error("Failed to retrieve existing keys from %s: %s", table_name, e)
         return keys
 
+def get_distinct_enriched_names(table_name: str, name_column: str) -> pd.DataFrame:
+    """指定されたEnrichedテーブルから、ユニークな (名称, matchedEdinetCode) の組み合わせを取得する。"""
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, table_name):
+                logger.info("Enriched table '%s' does not exist yet.", table_name)
+                return pd.DataFrame(columns=[name_column, 'matchedEdinetCode'])
+
+            stmt = select(column(name_column), column('matchedEdinetCode')).select_from(table(table_name)).distinct()
+            df = pd.read_sql(stmt, connection)
+            logger.info("Found %s distinct names in %s.", len(df), table_name)
+            return df
+    except Exception as e:
+        logger.error("Failed to retrieve distinct names from %s: %s", table_name, e)
+        return pd.DataFrame(columns=[name_column, 'matchedEdinetCode'])
+
+def get_records_by_names(table_name: str, name_column: str, names: list, chunk_size: int = 1000) -> pd.DataFrame:
+    """
+    指定されたテーブルから、名称カラムが names のいずれかに一致するレコードを取得する。
+    SQL Serverのパラメータ数上限を考慮し、chunk_size件ずつ分割して問い合わせる。
+    """
+    if not names:
+        return pd.DataFrame()
+    try:
+        with engine.connect() as connection:
+            name_col = column(name_column)
+            chunks = []
+            for i in range(0, len(names), chunk_size):
+                stmt = select(text('*')).select_from(table(table_name)).where(name_col.in_(names[i:i + chunk_size]))
+                chunks.append(pd.read_sql(stmt, connection))
+            df = pd.concat(chunks, ignore_index=True)
+            logger.info("Successfully fetched %s records from %s for %s names.", len(df), table_name, len(names))
+            return df
+    except Exception as e:
+        logger.error("Failed to retrieve records by names from %s: %s", table_name, e)
+        return pd.DataFrame()
+
+def content_checksum(dialect_name: str, columns: list[str]):
+    """
+    集計対象の行の内容 (columns の値) のチェックサムを求める集計式を返す。キーが変わらずに値のみが書き換えられた場合
+    (再名寄せによる matchedSecCode の更新など) を検出するために使う。対応していないDBの場合は None を返す。
+    SQL Server では CHECKSUM_AGG(BINARY_CHECKSUM(*))、SQLite では接続時に登録する集計関数 content_checksum
+    (_ContentChecksum) とする。
+    """
+    if dialect_name == 'mssql':
+        return func.checksum_agg(func.binary_checksum(text('*')))
+    if dialect_name == 'sqlite':
+        return func.content_checksum(*[column(c) for c in columns])
+    return None
+
+def _cross_shareholding_condition():
+    return and_(column('HoldingEntity') == 'ReportingCompany', column('matchedSecCode').is_not(None))
+
+def get_cross_shareholding_edges(holder_codes: list[str] | None = None, chunk_size: int = 1000) -> pd.DataFrame:
+    """
+    EnrichedSpecifiedInvestment から、提出会社自身の保有で投資先を名寄せできた行を取得する (cross_shareholding.py で使用)。
+    holder_codes を指定した場合は、その提出会社 (SecuritiesCode) の行のみを chunk_size 件ずつ分割して取得する。
+    """
+    columns = ['SubmissionDate', 'SecuritiesCode', 'HoldingEntity', 'matchedSecCode', 'BookValueCurrentYear',
+               'CrossShareholdingStatus']
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, 'EnrichedSpecifiedInvestment'):
+                logger.info("Table EnrichedSpecifiedInvestment does not exist yet.")
+                return pd.DataFrame(columns=columns)
+            stmt = (select(*[column(c) for c in columns]).select_from(table('EnrichedSpecifiedInvestment'))
+                    .where(_cross_shareholding_condition()))
+            if holder_codes is None:
+                df = pd.read_sql(stmt, connection)
+            else:
+                chunks = [pd.read_sql(stmt.where(column('SecuritiesCode').in_(holder_codes[i:i + chunk_size])), connection)
+                          for i in range(0, len(holder_codes), chunk_size)]
+                df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+            logger.info("Fetched %s cross-shareholding rows%s.", len(df),
+                        f" for {len(holder_codes)} holders" if holder_codes is not None else '')
+            return df
+    except Exception as e:
+        logger.error("Failed to retrieve cross-shareholding rows: %s", e)
+        return pd.DataFrame(columns=columns)
+
+def get_cross_shareholding_fingerprints() -> pd.DataFrame:
+    """
+    get_cross_shareholding_edges の対象の行の、提出会社・提出日ごとの行数とチェックサム (content_checksum) を取得する。
+    cross_shareholding.py で、前回の読み込みから追加・変更・削除された提出会社を判定するために使う。
+    """
+    columns = ['SecuritiesCode', 'SubmissionDate', 'rows', 'checksum']
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, 'EnrichedSpecifiedInvestment'):
+                return pd.DataFrame(columns=columns)
+            columns = [c['name'] for c in inspect(connection).get_columns('EnrichedSpecifiedInvestment')]
+            checksum = content_checksum(engine.dialect.name, columns)
+            stmt = (select(column('SecuritiesCode'), column('SubmissionDate'), func.count().label('rows'),
+                           (checksum if checksum is not None else null()).label('checksum'))
+                    .select_from(table('EnrichedSpecifiedInvestment'))
+                    .where(_cross_shareholding_condition())
+                    .group_by(column('SecuritiesCode'), column('SubmissionDate')))
+            return pd.read_sql(stmt, connection)
+    except Exception as e:
+        logger.error("Failed to retrieve cross-shareholding fingerprints: %s", e)
+        return pd.DataFrame(columns=columns)
+
+def get_enrichment_snapshot(snapshot_table: str, target_name: str) -> pd.DataFrame:
+    """名寄せ時に使用したマスター・手動マッピングのスナップショットを取得する。"""
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, snapshot_table):
+                logger.info("Snapshot table '%s' does not exist yet.", snapshot_table)
+                return pd.DataFrame()
+
+            stmt = select(text('*')).select_from(table(snapshot_table)).where(column('targetName') == target_name)
+            df = pd.read_sql(stmt, connection)
+            return df.drop(columns=['targetName'])
+    except Exception as e:
+        logger.error("Failed to retrieve snapshot from %s: %s", snapshot_table, e)
+        return pd.DataFrame()
+
+def save_enrichment_snapshot(df: pd.DataFrame, snapshot_table: str, target_name: str):
+    """指定されたターゲットのスナップショットを丸ごと置き換える。"""
+    try:
+        with engine.begin() as connection:
+            if engine.dialect.has_table(connection, snapshot_table):
+                connection.execute(
+                    text(f'DELETE FROM [{snapshot_table}] WHERE [targetName] = :targetName'),
+                    {'targetName': target_name}
+                )
+            snapshot_df = df.copy()
+            snapshot_df.insert(0, 'targetName', target_name)
+            snapshot_df.to_sql(snapshot_table, con=connection, if_exists='append', index=False)
+            logger.info("Saved %s snapshot records to %s for %s.", len(snapshot_df), snapshot_table, target_name)
+    except Exception as e:
+        logger.exception("An unexpected error occurred while saving snapshot to %s: %s", snapshot_table, e)
+
+def get_retry_queue() -> pd.DataFrame:
+    """再試行キューの全エントリを取得する。テーブルが存在しない場合は空のDataFrameを返す。"""
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, RETRY_QUEUE_TABLE_NAME):
+                return pd.DataFrame()
+            stmt = select(text('*')).select_from(table(RETRY_QUEUE_TABLE_NAME))
+            return pd.read_sql(stmt, connection)
+    except Exception as e:
+        logger.error("Failed to retrieve retry queue from %s: %s", RETRY_QUEUE_TABLE_NAME, e)
+        return pd.DataFrame()
+
+def get_due_retry_documents(now, limit: int | None = None) -> list[tuple[str, str, str, str, str, int]]:
+    """
+    再試行時刻 (nextRetryAt) を過ぎた、隔離されていない書類のリストを再試行時刻の早い順に取得する。
+    get_documents_by_codes と同じ (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber) の形式で返す。
+    """
+    try:
+        with engine.connect() as connection:
+            if not engine.dialect.has_table(connection, RETRY_QUEUE_TABLE_NAME):
+                return []
+            queue_table = table(
+                RETRY_QUEUE_TABLE_NAME,
+                column('dateFile'),
+                column('docID'),
+                column('formCode'),
+                column('ordinanceCode'),
+                column('ordinanceCodeShort'),
+                column('seqNumber'),
+                column('status'),
+                column('nextRetryAt'),
+            )
+            stmt = select(
+                queue_table.c.dateFile,
+                queue_table.c.docID,
+                queue_table.c.formCode,
+                queue_table.c.ordinanceCode,
+                queue_table.c.ordinanceCodeShort,
+                queue_table.c.seqNumber,
+            ).where(
+                queue_table.c.status == 'pending'
+            ).where(
+                queue_table.c.nextRetryAt <= now
+            ).order_by(
+                queue_table.c.nextRetryAt
+            )
+            if limit:
+                stmt = stmt.limit(limit)
+
+            df = pd.read_sql(stmt, connection)
+            if not df.empty:
+                return list(df.itertuples(index=False, name=None))
+            return []
+    except Exception as e:
+        logger.error("Failed to retrieve due documents from %s: %s", RETRY_QUEUE_TABLE_NAME, e)
+        return []
+
+def save_retry_entry(entry: dict):
+    """再試行キューのエントリを1件保存する (同じdocIDのエントリは置き換える)。"""
+    try:
+        with engine.begin() as connection:
+            if engine.dialect.has_table(connection, RETRY_QUEUE_TABLE_NAME):
+                connection.execute(
+                    text(f'DELETE FROM [{RETRY_QUEUE_TABLE_NAME}] WHERE [docID] = :docID'),
+                    {'docID': entry['docID']}
+                )
+            pd.DataFrame([entry]).to_sql(RETRY_QUEUE_TABLE_NAME, con=connection, if_exists='append', index=False)
+    except Exception as e:
+        logger.exception("An unexpected error occurred while saving retry entry for %s: %s", entry.get('docID'), e)
+
+def delete_retry_entries(doc_ids: list[str]):
+    """処理に成功した書類を再試行キューから削除する。"""
+    if not doc_ids:
+        return
+    try:
+        with engine.begin() as connection:
+            if not engine.dialect.has_table(connection, RETRY_QUEUE_TABLE_NAME):
+                return
+            connection.execute(
+                text(f'DELETE FROM [{RETRY_QUEUE_TABLE_NAME}] WHERE [docID] = :docID'),
+                [{'docID': doc_id} for doc_id in doc_ids]
+            )
+        logger.info("Removed %s documents from %s.", len(doc_ids), RETRY_QUEUE_TABLE_NAME)
+    except Exception as e:
+        logger.error("Failed to delete entries from %s: %s", RETRY_QUEUE_TABLE_NAME, e)
+
+def ensure_lease_table():
+    """リーステーブルが存在しない場合は作成する。"""
+    _lease_metadata.create_all(engine, checkfirst=True)
+
+def _database_now(connection) -> datetime.datetime:
+    """
+    DBサーバーの現在時刻を返す。リースの期限はワーカーごとの時計ではなくこの時刻で設定・比較し、
+    時計が進んでいるマシンのワーカーが他のワーカーの有効なリースを期限切れとみなして確保し直すことを防ぐ。
+    """
+    return connection.execute(select(func.current_timestamp())).scalar_one()
+
+def _lease_code_condition(codes: list[tuple[str, str]] | None):
+    """リーステーブルを (formCode, ordinanceCode) で絞り込む条件を返す。"""
+    if not codes:
+        return None
+    return or_(*[
+        and_(lease_table.c.formCode == form_code, lease_table.c.ordinanceCode == ordinance_code)
+        for form_code, ordinance_code in codes
+    ])
+
+def enqueue_lease_documents(documents: list[tuple], chunk_size: int = 500) -> int:
+    """
+    書類をリーステーブルに 'pending' として登録し、新たに登録した件数を返す。既に登録済みの書類は変更しない。
+    documents は get_documents_by_codes と同じ (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber) の形式。
+    複数のワーカーが同時に登録した場合も、主キーの重複を無視するため二重に登録されることはない。
+    """
+    if not documents:
+        return 0
+    ensure_lease_table()
+    with engine.connect() as connection:
+        existing = set(connection.execute(select(lease_table.c.docID)).scalars())
+        now = _database_now(connection)
+
+    rows = [
+        {
+            'docID': doc_id,
+            'dateFile': pd.Timestamp(date_file).date() if date_file is not None else None,
+            'seqNumber': int(seq_number) if pd.notna(seq_number) else None,
+            'formCode': form_code,
+            'ordinanceCode': ordinance_code,
+            'ordinanceCodeShort': ordinance_code_short,
+            'status': 'pending',
+            'attempts': 0,
+            'enqueuedAt': now,
+        }
+        for date_file, doc_id, form_code, ordinance_code, ordinance_code_short, seq_number in documents
+        if doc_id not in existing
+    ]
+    inserted = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(lease_table), chunk)
+            inserted += len(chunk)
+        except exc.IntegrityError:
+            # 他のワーカーが先に登録した書類を含む場合は、1件ずつ登録して重複分を読み飛ばす
+            for row in chunk:
+                try:
+                    with engine.begin() as connection:
+                        connection.execute(insert(lease_table), row)
+                    inserted += 1
+                except exc.IntegrityError:
+                    continue
+    logger.info("Enqueued %s new documents to %s.", inserted, LEASE_TABLE_NAME)
+    return inserted
+
+def claim_lease_documents(worker_id: str, batch_size: int, lease_duration: datetime.timedelta,
+                          codes: list[tuple[str, str]] | None = None) -> tuple[str, list[tuple]]:
+    """
+    未処理 ('pending') または期限切れのリースの書類を最大 batch_size 件確保し、(リーストークン, 書類のリスト) を返す。
+    書類は get_documents_by_codes と同じ形式で、日付が新しい順に確保する。
+
+    確保は楽観的に行う。候補を選んだ後、確保可能な状態のままの行だけを条件付きの UPDATE で自分のトークンに書き換え、
+    書き換えられた行を読み直す。同じ候補を選んだ他のワーカーとは行ごとにどちらか一方だけが確保に成功する。
+    期限の設定・比較には DB サーバーの時刻 (_database_now) を使う。
+    """
+    ensure_lease_table()
+    token = uuid.uuid4().hex
+    code_condition = _lease_code_condition(codes)
+    for _ in range(LEASE_CLAIM_ATTEMPTS):
+        with engine.begin() as connection:
+            now = _database_now(connection)
+            claimable = or_(
+                lease_table.c.status == 'pending',
+                and_(lease_table.c.status == 'leased', lease_table.c.leaseExpiresAt < now),
+            )
+            stmt = select(lease_table.c.docID).where(claimable)
+            if code_condition is not None:
+                stmt = stmt.where(code_condition)
+            stmt = stmt.order_by(desc(lease_table.c.dateFile), lease_table.c.docID).limit(batch_size)
+            candidates = list(connection.execute(stmt).scalars())
+            if not candidates:
+                return token, []
+
+            connection.execute(
+                update(lease_table)
+                .where(lease_table.c.docID.in_(candidates))
+                .where(claimable)
+                .values(
+                    status='leased',
+                    workerId=worker_id,
+                    leaseToken=token,
+                    leaseExpiresAt=now + lease_duration,
+                    heartbeatAt=now,
+                    attempts=lease_table.c.attempts + 1,
+                )
+            )
+            claimed = connection.execute(
+                select(
+                    lease_table.c.dateFile,
+                    lease_table.c.docID,
+                    lease_table.c.formCode,
+                    lease_table.c.ordinanceCode,
+                    lease_table.c.ordinanceCodeShort,
+                    lease_table.c.seqNumber,
+                ).where(
+                    lease_table.c.leaseToken == token
+                ).order_by(
+                    desc(lease_table.c.dateFile), lease_table.c.docID
+                )
+            ).all()
+        if claimed:
+            metrics.inc('leases', len(claimed), status='claimed')
+            return token, [tuple(row) for row in claimed]
+    return token, []
+
+def renew_lease(token: str, lease_duration: datetime.timedelta) -> int:
+    """
+    リーストークンで確保中の書類のリース期限を延長し (ハートビート)、延長できた件数を返す。
+    期限切れで他のワーカーに確保し直された書類は延長されない。
+    """
+    try:
+        with engine.begin() as connection:
+            now = _database_now(connection)
+            result = connection.execute(
+                update(lease_table)
+                .where(lease_table.c.leaseToken == token)
+                .where(lease_table.c.status == 'leased')
+                .values(leaseExpiresAt=now + lease_duration, heartbeatAt=now)
+            )
+            return result.rowcount
+    except Exception as e:
+        logger.error("Failed to renew lease %s: %s", token, e)
+        return 0
+
+def finish_lease_documents(token: str, results: dict[str, str]):
+    """
+    確保した書類の処理結果を記録する。results は docID をキー、'done' または 'failed' を値とする辞書。
+    リースを失った (他のワーカーが確保し直した) 書類の状態は変更しない。
+    """
+    if not results:
+        return
+    with engine.begin() as connection:
+        now = _database_now(connection)
+        for status in set(results.values()):
+            doc_ids = [doc_id for doc_id, s in results.items() if s == status]
+            connection.execute(
+                update(lease_table)
+                .where(lease_table.c.docID.in_(doc_ids))
+                .where(lease_table.c.leaseToken == token)
+                .values(status=status, leaseExpiresAt=None, finishedAt=now)
+            )
+            metrics.inc('leases', len(doc_ids), status=status)
+
+def release_lease(token: str):
+    """確保したまま処理を終えられなかった書類を 'pending' に戻し、他のワーカーが確保できるようにする。"""
+    try:
+        with engine.begin() as connection:
+            connection.execute(
+                update(lease_table)
+                .where(lease_table.c.leaseToken == token)
+                .where(lease_table.c.status == 'leased')
+                .values(status='pending', workerId=None, leaseToken=None, leaseExpiresAt=None)
+            )
+    except Exception as e:
+        logger.error("Failed to release lease %s: %s", token, e)
+
+def get_lease_status_counts(codes: list[tuple[str, str]] | None = None) -> dict[str, int]:
+    """リーステーブルの状態ごとの書類数を返す。"""
+    ensure_lease_table()
+    stmt = select(lease_table.c.status, func.count()).group_by(lease_table.c.status)
+    code_condition = _lease_code_condition(codes)
+    if code_condition is not None:
+        stmt = stmt.where(code_condition)
+    with engine.connect() as connection:
+        return {status: count for status, count in connection.execute(stmt)}
+
 def get_document_details_by_id(doc_id: str) -> tuple | None:
     """
     doc_idに一致する書類の詳細情報をデータベースから取得する。
@@ -351,7 +1036,7 @@ def get_document_details_by_id(doc_id: str) -> tuple | None:
             return result if result else None
 
     except Exception as e:
-        print(f"Error: Failed to retrieve document details for docID {doc_id}: {e}")
+        logger.error("Failed to retrieve document details for docID %s: %s", doc_id, e)
         return None
 
 
@@ -44,5 +44,16 @@ DATA_PRODUCT_DEFINITIONS = {
     # 他の書類から取得
     'LargeVolumeHoldingReport': 'LargeVolumeHoldingReport',
     'BuybackStatusReport':      'BuybackStatusReport',
+    'BuybackAcquisitionDetail': 'BuybackStatusReport',
     'TenderOffer':              'TenderOfferDocuments',
 }
+
+# 3. 訂正書類の定義
+# 訂正報告書の(form_code, ordinance_code)。scheduler.py で、同じ時期の原本より後に処理するために使用する
+AMENDMENT_CODES = {
+    ('030001', '010'), # 訂正有価証券報告書
+    ('170001', '010'), # 訂正自己株券買付状況報告書
+    ('090001', '060'), # 訂正報告書（大量保有報告書・変更報告書）
+    ('020001', '040'), ('040001', '040'), ('060001', '040'), # 訂正公開買付届出書, 訂正意見表明報告書, 訂正公開買付報告書
+    ('020001', '050'), ('040001', '050'), # 訂正公開買付届出書, 訂正公開買付報告書
+}
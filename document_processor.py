@@ -1,11 +1,42 @@
+import logging
 import pandas as pd
 import edinet_api
 import io
 import os
 import zipfile
+import extraction
+import metrics
 import parsers
+import profiling
 from definitions import DOCUMENT_TYPE_DEFINITIONS
 
+logger = logging.getLogger(__name__)
+
+
+class DocumentProcessingError(Exception):
+    """
+    書類の処理に失敗したことを、失敗したステージとともに通知する例外。
+    raise_errors=True を指定した場合にのみ送出される (process_documents の再試行キューで使用)。
+
+    Attributes:
+        stage (str): 失敗したステージ ('fetch', 'unzip', 'read_csv', 'parse', 'db_save')。
+        error_class (str): 原因となった例外のクラス名、または失敗の種類を表す名前。
+        partial_results (dict): 'parse' で一部のパーサーのみ失敗した場合の、成功したパーサーの抽出結果。
+    """
+
+    def __init__(self, stage: str, message: str, error_class: str | None = None, partial_results: dict | None = None):
+        super().__init__(message)
+        self.stage = stage
+        self._error_class = error_class
+        self.partial_results = partial_results or {}
+
+    @property
+    def error_class(self) -> str:
+        if self._error_class:
+            return self._error_class
+        return type(self.__cause__).__name__ if self.__cause__ is not None else type(self).__name__
+
+
 # --- パーサーと書類種別のマッピング ---
 # どの「書類種別」がどのパーサー（群）を実行すべきかを定義する
 DOC_TYPE_PARSERS = {
@@ -21,6 +52,7 @@ DOC_TYPE_PARSERS = {
     ],
     'BuybackStatusReport': [
         ("BuybackStatusReport", parsers.parse_buyback_status_report),
+        ("BuybackAcquisitionDetail", parsers.parse_buyback_acquisition_detail),
     ]
 }
 
@@ -33,12 +65,18 @@ for doc_type, parsers_list in DOC_TYPE_PARSERS.items():
         PARSER_REGISTRY[code_tuple] = parsers_list
 
 
-def fetch_and_save_document(doc_id: str, ordinanceCodeShort: str) -> str | None:
+def fetch_and_save_document(doc_id: str, ordinanceCodeShort: str, raise_errors: bool = False) -> str | None:
     """
     指定されたdocIDの書類をAPIから取得し、CSVをファイルに保存してそのパスを返す。
+    raise_errors=True の場合、失敗時に None を返す代わりに DocumentProcessingError を送出する。
     """
-    zip_content = edinet_api.fetch_document(doc_id)
+    try:
+        zip_content = edinet_api.fetch_document(doc_id, raise_errors=raise_errors)
+    except Exception as e:
+        raise DocumentProcessingError('fetch', f"Failed to fetch document {doc_id}: {e}") from e
     if not zip_content:
+        if raise_errors:
+            raise DocumentProcessingError('fetch', f"Empty response for document {doc_id}", error_class='EmptyResponse')
         return None
 
     # APIから返されたコンテンツがzipファイルであるかを確認 (マジックナンバー 'PK' で判定)
@@ -46,13 +84,15 @@ def fetch_and_save_document(doc_id: str, ordinanceCodeShort: str) -> str | None:
         # zipでなければ、APIからのエラーメッセージである可能性が高い
         try:
             error_message = zip_content.decode('utf-8')
-            print(f"    Error: Content for docID {doc_id} is not a zip file. API response: {error_message}")
+            logger.error("Content for docID %s is not a zip file. API response: %s", doc_id, error_message)
         except UnicodeDecodeError:
-            print(f"    Error: Content for docID {doc_id} is not a zip file and could not be decoded.")
+            logger.error("Content for docID %s is not a zip file and could not be decoded.", doc_id)
+        if raise_errors:
+            raise DocumentProcessingError('fetch', f"Content for docID {doc_id} is not a zip file", error_class='NotZipContent')
         return None
 
     try:
-        with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
+        with metrics.timer('unzip'), zipfile.ZipFile(io.BytesIO(zip_content)) as z:
             # 書類内のCSVファイルを探す (XBRL_TO_CSVフォルダ以下にあるものを想定)
             target_csv_name = None
             num_target = 0
@@ -62,9 +102,11 @@ def fetch_and_save_document(doc_id: str, ordinanceCodeShort: str) -> str | None:
                     num_target += 1
             
             if num_target > 1:
-                print(f"    Warning: several files found in zip for docID {doc_id}")
+                logger.warning("Several files found in zip for docID %s", doc_id)
             if not target_csv_name:
-                print(f"    No CSV file found in XBRL_TO_CSV for docID: {doc_id}")
+                logger.warning("No CSV file found in XBRL_TO_CSV for docID: %s", doc_id)
+                if raise_errors:
+                    raise DocumentProcessingError('unzip', f"No CSV file found in XBRL_TO_CSV for docID {doc_id}", error_class='CsvNotFound')
                 return None
 
             # 保存先ディレクトリを作成
@@ -77,140 +119,236 @@ def fetch_and_save_document(doc_id: str, ordinanceCodeShort: str) -> str | None:
 
             with z.open(target_csv_name) as csv_file:
                 with open(csv_path, 'wb') as f:
-                    f.write(csv_file.read())
-            
+                    n_bytes = f.write(csv_file.read())
+            metrics.inc('bytes', n_bytes, stage='unzip')
+
             return csv_path
 
-    except zipfile.BadZipFile:
-        print(f"    Error: Content for docID {doc_id} is not a valid zip file.")
+    except DocumentProcessingError:
+        raise
+    except zipfile.BadZipFile as e:
+        logger.error("Content for docID %s is not a valid zip file.", doc_id)
+        if raise_errors:
+            raise DocumentProcessingError('unzip', f"Content for docID {doc_id} is not a valid zip file") from e
         return None
     except Exception as e:
-        print(f"    An error occurred while saving the file for {doc_id}: {e}")
+        logger.error("An error occurred while saving the file for %s: %s", doc_id, e)
+        if raise_errors:
+            raise DocumentProcessingError('unzip', f"Failed to save the file for {doc_id}: {e}") from e
         return None
 
 
-def parse_document_file(csv_path: str, form_code: str, ordinance_code: str, ordinance_code_short: str = None) -> dict:
+def _read_filtered_csv(csv_path: str, encoding: str, element_filter) -> pd.DataFrame:
+    """
+    XBRL CSVを行単位で走査し、element_filter が True を返す要素IDの行だけを残してDataFrameにする。
+    抽出に使わない行 (巨大なTextBlockなど) はフィールドに分解する前に捨てるため、メモリ使用量と処理時間を抑えられる。
+    値の解釈 (欠損値の扱いなど) を通常の読み込みと揃えるため、残した行は pandas で文字列として読み込む。
+    """
+    kept = []
+    with open(csv_path, encoding=encoding, newline='') as f:
+        header = f.readline().lstrip('\ufeff')
+        if header.split('\t', 1)[0].strip('"') != '要素ID':
+            raise ValueError(f"Unexpected header in {csv_path}")
+        kept.append(header)
+        keep = False
+        in_quotes = False
+        for line in f:
+            # 引用符で囲まれたフィールド内の改行 (TextBlockなど) は、前の行と同じレコードとして扱う
+            if not in_quotes:
+                keep = element_filter(line.split('\t', 1)[0].strip('"'))
+            if keep:
+                kept.append(line)
+            if line.count('"') % 2:
+                in_quotes = not in_quotes
+    return pd.read_csv(io.StringIO(''.join(kept)), sep='\t', dtype=str, engine='python', on_bad_lines='warn')
+
+
+def parse_document_file(csv_path: str, form_code: str, ordinance_code: str, ordinance_code_short: str = None,
+                        raise_errors: bool = False, products: list[str] | None = None) -> dict:
     """
     指定されたCSVファイルを、(form_code, ordinance_code)にもとづいて適切なパーサーで解析する。
+    raise_errors=True の場合、読み込みやパーサーの失敗時に DocumentProcessingError を送出する
+    (パーサーの失敗時は残りのパーサーも実行し、成功した分の結果を partial_results に格納する)。
+
+    products を指定した場合は、そのデータプロダクトのパーサーのみを実行する。さらに、すべてが
+    extraction.PRODUCT_SPECS で定義されたプロダクトであれば、必要な要素IDの行だけを読み込む。
     """
     if not os.path.exists(csv_path):
-        print(f"    File not found: {csv_path}")
+        logger.warning("File not found: %s", csv_path)
         return {}
 
     # (form_code, ordinance_code)のタプルをキーとしてパーサーを取得
     parsers_to_use = PARSER_REGISTRY.get((form_code, ordinance_code))
+    if products is not None and parsers_to_use:
+        parsers_to_use = [(name, func) for name, func in parsers_to_use if name in products]
     if not parsers_to_use:
         return {}
+    element_filter = extraction.element_filter([name for name, _ in parsers_to_use]) if products is not None else None
 
     # --- ファイル読み込み処理 ---
     df = None
     encodings_to_try = ['utf-16', 'utf-8', 'cp932']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(csv_path, encoding=encoding, sep='\t', engine='python', on_bad_lines='warn')
-            break
-        except Exception:
-            continue
-    
+    with metrics.timer('read_csv', formCode=form_code, filtered=element_filter is not None):
+        for encoding in encodings_to_try:
+            try:
+                if element_filter is not None:
+                    df = _read_filtered_csv(csv_path, encoding, element_filter)
+                else:
+                    df = pd.read_csv(csv_path, encoding=encoding, sep='\t', engine='python', on_bad_lines='warn')
+                break
+            except Exception:
+                continue
+
     if df is None:
-        print(f"    Failed to read file {csv_path} with any of the attempted encodings.")
+        metrics.inc('errors', stage='read_csv', formCode=form_code)
+        logger.error("Failed to read file %s with any of the attempted encodings.", csv_path)
+        if raise_errors:
+            raise DocumentProcessingError('read_csv', f"Failed to read file {csv_path}", error_class='UnreadableCsv')
         return {}
+    metrics.inc('bytes', os.path.getsize(csv_path), stage='read_csv', formCode=form_code)
+    metrics.inc('rows', len(df), stage='read_csv', formCode=form_code)
 
     # --- データ抽出処理 ---
+    # extraction.PRODUCT_SPECS で定義されたプロダクトは、書類ごとに1回だけ作成したファクトの索引から抽出する
+    fact_index = None
+    if any(data_type_name in extraction.PRODUCT_SPECS for data_type_name, _ in parsers_to_use):
+        try:
+            with metrics.timer('index_facts', formCode=form_code):
+                fact_index = extraction.FactIndex(df)
+        except Exception as e:
+            logger.error("Failed to index facts in %s: %s", csv_path, e)
+
     extracted_results = {}
+    first_error = None
     for data_type_name, parser_func in parsers_to_use:
         try:
-            # パーサーごとに追加の引数を渡す
-            if parser_func == parsers.parse_buyback_status_report and ordinance_code_short:
-                extracted_data = parser_func(df, ordinance_code=ordinance_code_short)
-            elif parser_func == parsers.parse_large_shareholding_report:
-                try:
-                    doc_id = os.path.normpath(csv_path).split(os.sep)[1]
-                    extracted_data = parser_func(df, doc_id=doc_id)
-                except IndexError:
-                    print(f"    Could not extract doc_id from path: {csv_path}")
-                    continue
-            else:
-                extracted_data = parser_func(df)
+            # パーサーごとに追加の引数を渡す (例外時のエラー数は timer が記録する)
+            with metrics.timer('parse', product=data_type_name, formCode=form_code):
+                if fact_index is not None and data_type_name in extraction.PRODUCT_SPECS:
+                    extracted_data = extraction.extract_product(fact_index, data_type_name)
+                elif parser_func in (parsers.parse_buyback_status_report, parsers.parse_buyback_acquisition_detail) and ordinance_code_short:
+                    extracted_data = parser_func(df, ordinance_code=ordinance_code_short)
+                elif parser_func == parsers.parse_large_shareholding_report:
+                    try:
+                        doc_id = os.path.normpath(csv_path).split(os.sep)[1]
+                        extracted_data = parser_func(df, doc_id=doc_id)
+                    except IndexError:
+                        logger.warning("Could not extract doc_id from path: %s", csv_path)
+                        continue
+                else:
+                    extracted_data = parser_func(df)
 
             if extracted_data is not None and not extracted_data.empty:
+                metrics.inc('rows', len(extracted_data), stage='parse', product=data_type_name, formCode=form_code)
                 extracted_results[data_type_name] = extracted_data
             else:
                 pass
         except Exception as e:
-            print(f"    Error extracting {data_type_name}: {e}")
-            
+            logger.error("Error extracting %s: %s", data_type_name, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            if first_error is None:
+                first_error = (data_type_name, e)
+
+    if raise_errors and first_error:
+        data_type_name, e = first_error
+        raise DocumentProcessingError('parse', f"Error extracting {data_type_name}: {e}",
+                                      partial_results=extracted_results) from e
     return extracted_results
 
 
-if __name__ == "__main__":
+@profiling.profiled_run('single_document')
+def process_single_document(doc_id: str, save: bool = False, keep_files: bool = True) -> dict:
+    """
+    1件の書類について、ダウンロードから解析 (と任意でDB保存) までを process_documents と同じステージ構成で実行する。
+    パーサーの動作確認や、実際の書類を使ったプロファイリングに使用する。
+
+    Args:
+        doc_id (str): 対象書類のdocID。DocumentMetadata に登録済みである必要がある。
+        save (bool): True の場合、抽出結果を database_manager.save_data で保存する。
+        keep_files (bool): True の場合、ダウンロードしたCSVを data/<docID>/ に残す。
+
+    Returns:
+        dict: データタイプ名をキー、抽出結果のDataFrameを値とする辞書。失敗時は空の辞書。
+    """
     import shutil
-    import os
     import database_manager
 
+    doc_details = database_manager.get_document_details_by_id(doc_id)
+    if not doc_details:
+        logger.error("Document details not found in the database for docID: %s", doc_id)
+        return {}
+    form_code, ordinance_code, ordinance_code_short = doc_details
+    logger.info("Found document details: form_code=%s, ordinance_code=%s, short=%s", form_code, ordinance_code, ordinance_code_short)
+
+    csv_path = None
+    with metrics.timer('document', formCode=form_code):
+        try:
+            with metrics.timer('fetch_and_save', formCode=form_code):
+                csv_path = fetch_and_save_document(doc_id, ordinance_code_short)
+            if not csv_path:
+                logger.error("Failed to download or save document for docID: %s", doc_id)
+                return {}
+            logger.info("Document saved to: %s", csv_path)
+
+            with metrics.timer('parse_document', formCode=form_code):
+                extracted_data_map = parse_document_file(
+                    csv_path,
+                    form_code=form_code,
+                    ordinance_code=ordinance_code,
+                    ordinance_code_short=ordinance_code_short
+                )
+
+            if save:
+                for data_type_name, df in extracted_data_map.items():
+                    if 'docId' not in df.columns:
+                        df['docId'] = doc_id
+                    database_manager.save_data(df, data_type_name)
+            return extracted_data_map
+        finally:
+            if csv_path and not keep_files:
+                doc_folder_path = os.path.dirname(csv_path)
+                if os.path.exists(doc_folder_path):
+                    shutil.rmtree(doc_folder_path)
+                    logger.debug("Cleaned up temporary folder: %s", doc_folder_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
     # pandasの表示オプションを設定
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', 200)
     pd.set_option('display.max_rows', 100)
 
-    # --- ここを編集して、テストしたい書類の情報を指定してください ---
-    doc_id = "S100TSLZ" # カクヤス
-    # doc_id = "S1007TAK"  # 例: MS&AD
-    # doc_id = "S100TRUQ" # アルフレッサ
-    
-    target_data_type = "SpecifiedInvestment" # ★解析したいデータタイプを指定
-    # ---------------------------------------------------------
+    # 例: S100TSLZ (カクヤス), S1007TAK (MS&AD), S100TRUQ (アルフレッサ)
+    arg_parser = argparse.ArgumentParser(description='Download and parse a single EDINET document.')
+    arg_parser.add_argument('doc_id', nargs='?', default='S100TSLZ')
+    arg_parser.add_argument('data_type', nargs='?', default='SpecifiedInvestment', help='結果を表示するデータタイプ')
+    arg_parser.add_argument('--save', action='store_true', help='抽出結果をDBに保存する')
+    arg_parser.add_argument('--clipboard', action='store_true', help='結果をクリップボードにコピーする')
+    arg_parser.add_argument('--cleanup', action='store_true', help='ダウンロードしたCSVを削除する')
+    arg_parser.add_argument('--profile', action='store_true', help='プロファイルを profiles/ に出力する')
+    arg_parser.add_argument('--profile-memory', action='store_true', help='プロファイルにメモリ使用量を含める')
+    args = arg_parser.parse_args()
 
-    print(f"--- Start processing for docID: {doc_id} ---")
+    if args.profile or args.profile_memory:
+        profiling.enable(memory=args.profile_memory)
 
-    # 1. doc_idから書類情報をDBより取得
-    doc_details = database_manager.get_document_details_by_id(doc_id)
-    if not doc_details:
-        print(f"Error: Document details not found in the database for docID: {doc_id}")
-    else:
-        form_code, ordinance_code, ordinance_code_short = doc_details
-        print(f"Found document details: form_code={form_code}, ordinance_code={ordinance_code}, short={ordinance_code_short}")
-
-        # 2. 書類をダウンロードしてCSVファイルのパスを取得
-        csv_path = fetch_and_save_document(doc_id, ordinance_code_short)
-
-        if not csv_path:
-            print(f"Failed to download or save document for docID: {doc_id}")
-        else:
-            print(f"Document saved to: {csv_path}")
-
-            # 3. CSVファイルをパース
-            extracted_data_map = parse_document_file(
-                csv_path,
-                form_code=form_code,
-                ordinance_code=ordinance_code,
-                ordinance_code_short=ordinance_code_short
-            )
-
-            # 4. 指定されたデータタイプの結果を取得してクリップボードにコピー
-            result_df = extracted_data_map.get(target_data_type)
-
-            if result_df is not None and not result_df.empty:
-                try:
-                    result_df.to_clipboard(index=False, excel=True)
-                    print(f"\n--- Success! ---")
-                    print(f"Copied the '{target_data_type}' data ({len(result_df)} rows) to the clipboard.")
-                    print("\n--- Data Preview (first 5 rows) ---")
-                    print(result_df.head().to_string())
-                except Exception as e:
-                    print(f"\n--- Error ---")
-                    print(f"Failed to copy data to clipboard: {e}")
-            else:
-                print(f"\n--- Data Not Found ---")
-                print(f"Could not find or extract data for '{target_data_type}'.")
-                if extracted_data_map:
-                    print(f"Available data types in this document are: {list(extracted_data_map.keys())}")
+    print(f"--- Start processing for docID: {args.doc_id} ---")
+    extracted_data_map = process_single_document(args.doc_id, save=args.save, keep_files=not args.cleanup)
+    result_df = extracted_data_map.get(args.data_type)
 
-            # 5. ダウンロードした一時ファイルをクリーンアップ
+    if result_df is not None and not result_df.empty:
+        print(f"\n--- Success! Extracted '{args.data_type}' ({len(result_df)} rows) ---")
+        print("\n--- Data Preview (first 5 rows) ---")
+        print(result_df.head().to_string())
+        if args.clipboard:
             try:
-                doc_folder_path = os.path.dirname(csv_path)
-                if os.path.exists(doc_folder_path):
-                    # shutil.rmtree(doc_folder_path)
-                    print(f"\n--- Cleaned up temporary folder: {doc_folder_path} ---")
+                result_df.to_clipboard(index=False, excel=True)
+                print(f"Copied the '{args.data_type}' data to the clipboard.")
             except Exception as e:
-                print(f"\nWarning: Failed to clean up temporary folder {os.path.dirname(csv_path)}: {e}")
+                print(f"Failed to copy data to clipboard: {e}")
+    else:
+        print(f"\n--- Data Not Found ---")
+        print(f"Could not find or extract data for '{args.data_type}'.")
+        if extracted_data_map:
+            print(f"Available data types in this document are: {list(extracted_data_map.keys())}")
@@ -1,7 +1,11 @@
+import logging
 import requests
-from config import API_KEY
+import metrics
+from config import API_KEY, EDINET_API_BASE_URL
 
-BASE_URL_V2 = "https://disclosure.edinet-fsa.go.jp/api/v2"
+logger = logging.getLogger(__name__)
+
+BASE_URL_V2 = EDINET_API_BASE_URL
 
 def fetch_submission_list(date_str: str) -> dict | None:
     """
@@ -15,23 +19,28 @@ def fetch_submission_list(date_str: str) -> dict | None:
     }
 
     try:
-        res = requests.get(url, params=params, timeout=30)
+        with metrics.timer('http_submission_list'):
+            res = requests.get(url, params=params, timeout=30)
+        metrics.inc('bytes', len(res.content), stage='http_submission_list')
         res.raise_for_status()  # 200番台以外のステータスコードで例外を発生
         return res.json()
     except requests.exceptions.HTTPError as http_err:
-        print(f"Error: HTTP error occurred while fetching data for {date_str}: {http_err} - {res.text}")
+        metrics.inc('errors', stage='http_submission_list', status=res.status_code)
+        logger.error("HTTP error occurred while fetching data for %s: %s - %s", date_str, http_err, res.text)
         return None
     except requests.exceptions.RequestException as req_err:
-        print(f"Error: Request failed for {date_str}: {req_err}")
+        metrics.inc('errors', stage='http_submission_list')
+        logger.error("Request failed for %s: %s", date_str, req_err)
         return None
     
     except requests.exceptions.RequestException as req_err:
-        print(f"Error: Request failed for {date_str}: {req_err}")
+        logger.error("Request failed for %s: %s", date_str, req_err)
         return None
 
-def fetch_document(doc_id: str) -> bytes | None:
+def fetch_document(doc_id: str, raise_errors: bool = False) -> bytes | None:
     """
     EDINET API v2から指定されたdocIDの書類をCSV形式で取得する。
+    raise_errors=True の場合、通信エラー時に None を返す代わりに requests の例外を送出する。
     """
     url = f"{BASE_URL_V2}/documents/{doc_id}"
     params = {
@@ -40,14 +49,22 @@ def fetch_document(doc_id: str) -> bytes | None:
     }
 
     try:
-        res = requests.get(url, params=params, timeout=60)
+        with metrics.timer('http_document'):
+            res = requests.get(url, params=params, timeout=60)
+        metrics.inc('bytes', len(res.content), stage='http_document')
         res.raise_for_status()
         return res.content
     except requests.exceptions.HTTPError as http_err:
-        print(f"Error: HTTP error occurred while fetching document {doc_id}: {http_err} - {res.text}")
+        metrics.inc('errors', stage='http_document', status=res.status_code)
+        logger.error("HTTP error occurred while fetching document %s: %s - %s", doc_id, http_err, res.text)
+        if raise_errors:
+            raise
         return None
     except requests.exceptions.RequestException as req_err:
-        print(f"Error: Request failed for document {doc_id}: {req_err}")
+        metrics.inc('errors', stage='http_document')
+        logger.error("Request failed for document %s: %s", doc_id, req_err)
+        if raise_errors:
+            raise
         return None
 
 if __name__ == '__main__':
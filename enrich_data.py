@@ -1,9 +1,14 @@
 """
 名寄せ処理を実行するメインスクリプト
 """
+import logging
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import database_manager
 import matching
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
 
 # --- 定数定義 ---
 # 処理対象の情報をここに定義する
@@ -22,6 +27,45 @@ ENRICHMENT_TARGETS = {
     },
 }
 
+# 名寄せに使用したマスター・手動マッピングを記録するスナップショットテーブル
+MASTER_SNAPSHOT_TABLE = "EnrichmentMasterSnapshot"
+MAPPING_SNAPSHOT_TABLE = "EnrichmentMappingSnapshot"
+
+def _save_snapshots(target_name: str, master_df: pd.DataFrame, correction_dict: dict):
+    """今回の名寄せに使用したマスターと手動マッピングをスナップショットとして保存する。"""
+    master_snapshot_df = master_df.reset_index()[['normalizedName', 'edinetCode', 'secCode']]
+    mapping_snapshot_df = pd.DataFrame(list(correction_dict.items()), columns=['normalized_name', 'correct_name'])
+    database_manager.save_enrichment_snapshot(master_snapshot_df, MASTER_SNAPSHOT_TABLE, target_name)
+    database_manager.save_enrichment_snapshot(mapping_snapshot_df, MAPPING_SNAPSHOT_TABLE, target_name)
+
+def _get_unprocessed_records(config: dict) -> pd.DataFrame:
+    """名寄せ対象の元データのうち、Enrichedテーブルに未登録のレコードを取得する。"""
+    source_table = config["source_table"]
+    primary_key = config["primary_key"]
+
+    source_df = database_manager.get_data_for_enrichment(source_table, config["name_column"])
+    if source_df.empty:
+        logger.info("No data found in %s to enrich.", source_table)
+        return source_df
+
+    # 処理済みのキーを取得して、未処理のデータに絞り込む
+    processed_keys = database_manager.get_enriched_keys(config["enriched_table"])
+    if processed_keys:
+        source_df["_key"] = list(source_df[primary_key].itertuples(index=False, name=None))
+        unprocessed_df = source_df[~source_df["_key"].isin(processed_keys)].copy()
+        unprocessed_df.drop(columns=["_key"], inplace=True)
+    else:
+        unprocessed_df = source_df
+    return unprocessed_df
+
+def _merge_match_results(unprocessed_df: pd.DataFrame, matched_results: pd.DataFrame, name_column: str) -> pd.DataFrame:
+    """名寄せ結果 (originalName -> matchedEdinetCode, matchedSecCode) を元のDataFrameにマージする。"""
+    # originalNameをキーにして結合するために、カラム名を一時的に変更
+    matched_results = matched_results.drop_duplicates(subset=['originalName']).rename(columns={'originalName': name_column})
+    enriched_df = pd.merge(unprocessed_df, matched_results, on=name_column, how='left')
+    enriched_df['matchMethod'] = 'exact' # 今回は完全一致のみ
+    return enriched_df
+
 def enrich_data(target_name: str, test_mode: bool = False):
     """
     指定されたターゲットの名寄せ処理を実行する汎用関数
@@ -33,80 +77,241 @@ def enrich_data(target_name: str, test_mode: bool = False):
     Returns:
         pd.DataFrame or None: test_modeがTrueの場合、名寄せ結果のDataFrameを返す
     """
-    print(f"\n--- Starting enrichment for {target_name} (Test Mode: {test_mode}) ---")
+    logger.info("--- Starting enrichment for %s (Test Mode: %s) ---", target_name, test_mode)
     
     # 0. 設定を取得
     config = ENRICHMENT_TARGETS.get(target_name)
     if not config:
-        print(f"Error: Target '{target_name}' not found in ENRICHMENT_TARGETS.")
+        logger.error("Target '%s' not found in ENRICHMENT_TARGETS.", target_name)
         return None
 
-    source_table = config["source_table"]
     enriched_table = config["enriched_table"]
     name_column = config["name_column"]
-    primary_key = config["primary_key"]
 
-    # 1. 名寄せマスターを準備
+    # 1. 名寄せマスターと手動マッピングを準備
     master_df = matching.create_name_code_master()
     if master_df.empty:
-        print("Error: Name master is empty. Aborting.")
+        logger.error("Name master is empty. Aborting.")
         return None
+    correction_dict = matching.load_manual_mapping()
 
-    # 2. 名寄せ対象の元データを取得
-    source_df = database_manager.get_data_for_enrichment(source_table, name_column)
-    if source_df.empty:
-        print(f"Info: No data found in {source_table} to enrich.")
-        return None
-
-    # 3. 処理済みのキーを取得して、未処理のデータに絞り込む
-    processed_keys = database_manager.get_enriched_keys(enriched_table)
-    if processed_keys:
-        source_df["_key"] = list(source_df[primary_key].itertuples(index=False, name=None))
-        unprocessed_df = source_df[~source_df["_key"].isin(processed_keys)].copy()
-        unprocessed_df.drop(columns=["_key"], inplace=True)
-    else:
-        unprocessed_df = source_df
-
+    # 2. 名寄せ対象のうち、未処理のデータを取得
+    unprocessed_df = _get_unprocessed_records(config)
     if unprocessed_df.empty:
-        print("Info: All records are already enriched. Nothing to do.")
+        logger.info("All records are already enriched. Nothing to do.")
         # test_modeでも空のDataFrameを返す
         return unprocessed_df if test_mode else None
     
-    print(f"Found {len(unprocessed_df)} new records to process.")
+    logger.info("Found %s new records to process.", len(unprocessed_df))
 
-    # 4. 名称リストに対して名寄せを実行
+    # 3. 名称リストに対して名寄せを実行
     names_to_match = unprocessed_df[name_column].dropna().unique()
-    matched_results = matching.match_names(pd.Series(names_to_match), master_df)
+    matched_results = matching.match_names(pd.Series(names_to_match), master_df, correction_dict=correction_dict)
     
-    # 5. 名寄せ結果を元のDataFrameにマージ
-    # originalNameをキーにして結合するために、カラム名を一時的に変更
-    matched_results.rename(columns={'originalName': name_column}, inplace=True)
-    enriched_df = pd.merge(unprocessed_df, matched_results, on=name_column, how='left')
-    enriched_df['matchMethod'] = 'exact' # 今回は完全一致のみ
+    # 4. 名寄せ結果を元のDataFrameにマージ
+    enriched_df = _merge_match_results(unprocessed_df, matched_results, name_column)
 
-    # 6. 結果を評価または保存
+    # 5. 結果を評価または保存
     if test_mode:
         # テストモード時はDataFrameを返す
         return enriched_df
     else:
         # 通常モード時は結果を新しいテーブルに保存
         database_manager.save_data(enriched_df, enriched_table)
-        print(f"--- Finished enrichment for {target_name} ---")
+        logger.info("--- Finished enrichment for %s ---", target_name)
+        return None
+
+
+def enrich_all_targets(target_names: list[str] | None = None, max_workers: int | None = None) -> dict:
+    """
+    複数のターゲットの名寄せを、マスター構築と手動マッピングの読み込みを1回だけ行って一括で実行する。
+
+    各ターゲットの未処理レコードを集め、名称をターゲット横断で重複排除してから1回で照合し、
+    結果を各Enrichedテーブルへ並行して書き込む。
+
+    Args:
+        target_names (list[str] | None): 処理するターゲット名。Noneの場合はENRICHMENT_TARGETSの全て
+        max_workers (int | None): 並行処理のワーカー数。Noneの場合はターゲット数
+
+    Returns:
+        dict: ターゲット名 -> 保存したレコード数 (保存に失敗したターゲットは含まない)
+    """
+    target_names = target_names or list(ENRICHMENT_TARGETS.keys())
+    unknown_targets = [name for name in target_names if name not in ENRICHMENT_TARGETS]
+    for name in unknown_targets:
+        logger.warning("Target '%s' not found in ENRICHMENT_TARGETS. Skipping.", name)
+    target_names = [name for name in target_names if name in ENRICHMENT_TARGETS]
+    if not target_names:
+        logger.info("No valid enrichment targets specified. Nothing to do.")
+        return {}
+
+    logger.info("--- Starting enrichment for %s ---", ', '.join(target_names))
+    max_workers = max_workers or len(target_names)
+
+    # 1. 名寄せマスターと手動マッピングを1回だけ準備
+    master_df = matching.create_name_code_master()
+    if master_df.empty:
+        logger.error("Name master is empty. Aborting.")
+        return {}
+    correction_dict = matching.load_manual_mapping()
+
+    # 2. 各ターゲットの未処理データを並行して取得
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(_get_unprocessed_records, ENRICHMENT_TARGETS[name]) for name in target_names}
+        unprocessed_map = {name: future.result() for name, future in futures.items()}
+    unprocessed_map = {name: df for name, df in unprocessed_map.items() if not df.empty}
+    if not unprocessed_map:
+        logger.info("All records are already enriched. Nothing to do.")
+        return {}
+
+    for name, df in unprocessed_map.items():
+        logger.info("Found %s new records to process for %s.", len(df), name)
+
+    # 3. ターゲット横断で名称を重複排除して1回で照合
+    all_names = pd.concat(
+        [df[ENRICHMENT_TARGETS[name]["name_column"]] for name, df in unprocessed_map.items()],
+        ignore_index=True
+    ).dropna().unique()
+    matched_results = matching.match_names(pd.Series(all_names), master_df, correction_dict=correction_dict)
+
+    # 4. 各ターゲットへ結果をマージして並行して保存
+    def _enrich_and_save(name: str, unprocessed_df: pd.DataFrame) -> int:
+        config = ENRICHMENT_TARGETS[name]
+        enriched_df = _merge_match_results(unprocessed_df, matched_results, config["name_column"])
+        # 保存に失敗したターゲットを保存件数に含めないよう、例外を送出させる
+        database_manager.save_data(enriched_df, config["enriched_table"], raise_errors=True)
+        return len(enriched_df)
+
+    saved_counts = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_enrich_and_save, name, df): name for name, df in unprocessed_map.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                saved_counts[name] = future.result()
+            except Exception as e:
+                logger.error("Enrichment failed for %s: %s", name, e)
+
+    logger.info("--- Finished enrichment for %s ---", ', '.join(saved_counts))
+    return saved_counts
+
+
+def reenrich_data(target_name: str, test_mode: bool = False):
+    """
+    マスターまたは手動マッピング(mapping.csv)の変更を検出し、影響を受ける名称のレコードのみ再名寄せする。
+
+    前回保存したスナップショットと現在のマスター・手動マッピングを比較し、
+    結果が変わりうる名称だけを再照合して、名寄せ結果が変化したレコードのみをアップサートする。
+    スナップショットがない初回は、名寄せ済みの全名称を現在のマスター・手動マッピングで再照合する
+    (スナップショットの作成前に行われたマスター・手動マッピングの修正も反映するため)。
+    スナップショットは保存に成功した場合に毎回更新する。
+
+    Args:
+        target_name (str): ENRICHMENT_TARGETSで定義されたターゲット名
+        test_mode (bool): Trueの場合、DB保存せず更新対象のDataFrameを返す
+
+    Returns:
+        pd.DataFrame or None: test_modeがTrueの場合、更新対象のDataFrameを返す
+    """
+    logger.info("--- Starting re-enrichment for %s (Test Mode: %s) ---", target_name, test_mode)
+
+    config = ENRICHMENT_TARGETS.get(target_name)
+    if not config:
+        logger.error("Target '%s' not found in ENRICHMENT_TARGETS.", target_name)
+        return None
+
+    enriched_table = config["enriched_table"]
+    name_column = config["name_column"]
+
+    # 1. 現在のマスターと手動マッピングを準備
+    master_df = matching.create_name_code_master()
+    if master_df.empty:
+        logger.error("Name master is empty. Aborting.")
+        return None
+    correction_dict = matching.load_manual_mapping()
+
+    # 2. 前回のスナップショットを取得
+    master_snapshot_df = database_manager.get_enrichment_snapshot(MASTER_SNAPSHOT_TABLE, target_name)
+    mapping_snapshot_df = database_manager.get_enrichment_snapshot(MAPPING_SNAPSHOT_TABLE, target_name)
+
+    # 3. 変更の影響を受ける名称を特定 (初回は名寄せ済みの全名称)
+    stored_names = database_manager.get_distinct_enriched_names(enriched_table, name_column)
+    if master_snapshot_df.empty:
+        logger.info("No snapshot found. Re-matching all %s stored names against the current master and mapping.",
+                    len(stored_names))
+        affected_names = stored_names[name_column].dropna().unique().tolist()
+    else:
+        old_master = master_snapshot_df.set_index('normalizedName')[['edinetCode', 'secCode']]
+        old_mapping = {} if mapping_snapshot_df.empty else pd.Series(
+            mapping_snapshot_df.correct_name.values, index=mapping_snapshot_df.normalized_name
+        ).to_dict()
+        affected_names = matching.find_affected_names(
+            stored_names, name_column, old_mapping, correction_dict, old_master, master_df
+        )
+    if not affected_names:
+        logger.info("No stored names are affected by the changes.")
+        if not test_mode:
+            _save_snapshots(target_name, master_df, correction_dict)
+        return pd.DataFrame() if test_mode else None
+
+    # 4. 影響を受ける名称のみ再照合
+    matched_results = matching.match_names(pd.Series(affected_names), master_df, correction_dict=correction_dict)
+    matched_results = matched_results.drop_duplicates(subset=['originalName'])
+    matched_results.rename(columns={'originalName': name_column}, inplace=True)
+
+    # 5. 該当レコードを取得し、名寄せ結果が変化したレコードのみを抽出
+    stored_df = database_manager.get_records_by_names(enriched_table, name_column, affected_names)
+    if stored_df.empty:
+        logger.info("No stored records found for the affected names.")
+        if not test_mode:
+            _save_snapshots(target_name, master_df, correction_dict)
+        return stored_df if test_mode else None
+
+    merged_df = pd.merge(stored_df, matched_results, on=name_column, how='left', suffixes=('', '_new'))
+    changed_mask = (
+        (merged_df['matchedEdinetCode'].fillna('') != merged_df['matchedEdinetCode_new'].fillna('')) |
+        (merged_df['matchedSecCode'].fillna('') != merged_df['matchedSecCode_new'].fillna(''))
+    )
+    updated_df = merged_df[changed_mask].copy()
+    updated_df['matchedEdinetCode'] = updated_df['matchedEdinetCode_new']
+    updated_df['matchedSecCode'] = updated_df['matchedSecCode_new']
+    updated_df.drop(columns=['matchedEdinetCode_new', 'matchedSecCode_new'], inplace=True)
+    logger.info("%s of %s affected records changed their match result.", len(updated_df), len(stored_df))
+
+    # 6. 結果を評価または保存
+    if test_mode:
+        return updated_df
+
+    try:
+        database_manager.save_data(updated_df, enriched_table, raise_errors=True)
+    except Exception:
+        # 保存に失敗した場合はスナップショットを更新せず、次回も同じ変更を再名寄せの対象とする
+        logger.error("Re-enrichment for %s was not saved. Keeping the previous snapshot.", target_name)
         return None
+    _save_snapshots(target_name, master_df, correction_dict)
+    logger.info("--- Finished re-enrichment for %s ---", target_name)
+    return None
 
 
 if __name__ == "__main__":
+    setup_logging()
     # --- モード設定 ---
     # Trueにすると、DBに保存せず、名寄せ結果のプレビューと統計情報を表示します
     TEST_MODE = False
+    # Trueにすると、マスター・手動マッピングの変更に影響を受けるレコードのみを再名寄せします
+    REENRICH_MODE = False
     TARGET_NAME = "SpecifiedInvestment" # テスト対象
 
-    if not TEST_MODE:
-        # 通常実行：指定されたターゲットのみを処理
-        TARGET_DATA_PRODUCTS = ["SpecifiedInvestment"]
-        print(f"--- Running in Normal Mode for: {', '.join(TARGET_DATA_PRODUCTS)} ---")
+    if REENRICH_MODE:
+        TARGET_DATA_PRODUCTS = ["MajorShareholders", "SpecifiedInvestment"]
+        print(f"--- Running in Re-enrichment Mode for: {', '.join(TARGET_DATA_PRODUCTS)} ---")
         for target in TARGET_DATA_PRODUCTS:
-            enrich_data(target, test_mode=False)
+            reenrich_data(target, test_mode=False)
+    elif not TEST_MODE:
+        # 通常実行：全ターゲットをマスター共有で一括処理
+        TARGET_DATA_PRODUCTS = list(ENRICHMENT_TARGETS.keys())
+        print(f"--- Running in Normal Mode for: {', '.join(TARGET_DATA_PRODUCTS)} ---")
+        enrich_all_targets(TARGET_DATA_PRODUCTS)
     else:
         # テスト実行
         print(f"--- Running in Test Mode for: {TARGET_NAME} ---")
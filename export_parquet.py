@@ -0,0 +1,309 @@
+"""
+データプロダクトのテーブルの Parquet エクスポート
+
+各データプロダクトのテーブル (と名寄せ後の Enriched* テーブル、DocumentMetadata、DocumentFormMaster) を、
+決算期の年または提出日の月で分割した Parquet ファイルとして exports/ に書き出す。分析ではDBに全件クエリを発行する代わりに、このファイルを読み込む。
+    exports/MajorShareholders/fiscalYear=2024/part-0.parquet
+    exports/LargeVolumeHoldingReport/month=2025-04/part-0.parquet
+pd.read_parquet('exports/MajorShareholders') や DuckDB (analytics.py) の read_parquet('exports/MajorShareholders/**/*.parquet', hive_partitioning=true) で読み込める。
+
+差分エクスポート:
+    各テーブルの _manifest.json に、前回のエクスポート時点のパーティションごとの行数・キーの種類数・最大値・最小値と
+    行の内容のチェックサム (ウォーターマーク) を記録する。次回は集計クエリ1回でこれらを取得し直し、値が変わったパーティション
+    (新しい書類が保存された・書類が削除された・再名寄せなどで行が書き換えられた) のみを書き出す。行が無くなったパーティションは削除する。
+    チェックサムは database_manager.content_checksum (SQL Server では CHECKSUM_AGG(BINARY_CHECKSUM(*))、SQLite では全列の値のハッシュの合計)。
+    チェックサムが衝突した場合などに備え、--full で全パーティションを書き出せる。
+
+列の型:
+    DBの列の型にもとづき、日付は datetime64、整数は列の型に合う nullable 型 (INT は Int32、SMALLINT は Int16 など)、
+    DECIMAL は float64 (小数部を持たないものは Int64) に変換して書き出す。DECIMAL が Python のオブジェクトのまま
+    書き出されることを防ぎ、すべてのパーティションで同じ型にそろえる。
+    TextBlock の列 (text_blocks.TEXT_BLOCK_COLUMNS) は、DB に保存された contentHash を TextBlockStore の本文に展開して書き出す。
+
+使い方:
+    python export_parquet.py                        # すべてのテーブルを差分エクスポート
+    python export_parquet.py MajorShareholders --full
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+
+import pandas as pd
+from sqlalchemy import and_, column, extract, func, inspect, select, table, text
+from sqlalchemy.sql import sqltypes
+
+import database_manager
+from config import SUBMISSION_TABLE_NAME
+import metrics
+import text_blocks
+from definitions import DATA_PRODUCT_DEFINITIONS
+from enrich_data import ENRICHMENT_TARGETS
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+EXPORT_DIR = "exports"
+MANIFEST_FILE = "_manifest.json"
+# 型がDBから分からない (SQLite の TEXT など) 列のうち、この名前のものは日付として扱う
+DATE_COLUMN_PATTERN = re.compile(r'(Date|date|PeriodEnd|PeriodStart|dateFile)$')
+NULL_PARTITION = 'unknown'
+# partition が None のテーブル (分割しないテーブル) のパーティション名
+UNPARTITIONED = 'all'
+
+# テーブルごとのエクスポートの設定
+#   partition: (パーティション名, 分割に使う日付の列, 'year' または 'month')。None の場合は分割しない
+#   key_column: ウォーターマークの集計に使うキーの列
+_ANNUAL_REPORT_EXPORT = {"partition": ("fiscalYear", "FiscalPeriodEnd", "year"), "key_column": "docId"}
+EXPORT_TABLES = {
+    "MajorShareholders": _ANNUAL_REPORT_EXPORT,
+    "ShareholderComposition": _ANNUAL_REPORT_EXPORT,
+    "OfficerInformation": _ANNUAL_REPORT_EXPORT,
+    "SpecifiedInvestment": _ANNUAL_REPORT_EXPORT,
+    "VotingRights": _ANNUAL_REPORT_EXPORT,
+    "LargeVolumeHoldingReport": {"partition": ("month", "dateFile", "month"), "key_column": "docId"},
+    "BuybackStatusReport": {"partition": ("month", "dateFile", "month"), "key_column": "docId"},
+    "BuybackAcquisitionDetail": {"partition": ("month", "dateFile", "month"), "key_column": "docId"},
+    "TenderOffer": {"partition": ("month", "dateFile", "month"), "key_column": "docId"},
+    # 名寄せ後のテーブルは docId・決算期を持たないため、提出日の年で分割する
+    "EnrichedMajorShareholders": {"partition": ("submissionYear", "SubmissionDate", "year"), "key_column": "SecuritiesCode"},
+    "EnrichedSpecifiedInvestment": {"partition": ("submissionYear", "SubmissionDate", "year"), "key_column": "SecuritiesCode"},
+    # 提出書類一覧と書類種別のマスター (analytics.py で書類の情報と結合するために使用する)
+    SUBMISSION_TABLE_NAME: {"partition": ("month", "dateFile", "month"), "key_column": "docID"},
+    "DocumentFormMaster": {"partition": None, "key_column": "formCode"},
+}
+# データプロダクト・名寄せの定義にあるテーブルは、すべてエクスポートの設定を持つこと
+assert {database_manager.TABLE_NAME_MAP.get(p, p) for p in DATA_PRODUCT_DEFINITIONS} <= EXPORT_TABLES.keys()
+assert {c["enriched_table"] for c in ENRICHMENT_TARGETS.values()} <= EXPORT_TABLES.keys()
+
+
+def _partition_label(year, month, granularity: str) -> str:
+    if pd.isna(year):
+        return NULL_PARTITION
+    return f"{int(year):04d}" if granularity == 'year' else f"{int(year):04d}-{int(month):02d}"
+
+
+def _partition_range(label: str, granularity: str) -> tuple[datetime.date, datetime.date]:
+    """パーティションに含まれる日付の範囲 [開始日, 終了日) を返す。"""
+    if granularity == 'year':
+        year = int(label)
+        return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+    year, month = map(int, label.split('-'))
+    return datetime.date(year, month, 1), datetime.date(year + month // 12, month % 12 + 1, 1)
+
+
+def get_partition_watermarks(table_name: str) -> dict[str, dict]:
+    """パーティションごとの行数・キーの種類数・最大値・最小値・チェックサムを、1回の集計クエリで取得する。"""
+    partition = EXPORT_TABLES[table_name]["partition"]
+    key_column = EXPORT_TABLES[table_name]["key_column"]
+    source = table(table_name, column(key_column))
+    aggregates = [
+        func.count().label('rows'),
+        func.count(source.c[key_column].distinct()).label('keys'),
+        func.min(source.c[key_column]).label('minKey'),
+        func.max(source.c[key_column]).label('maxKey'),
+    ]
+    with database_manager.engine.connect() as connection:
+        columns = [c['name'] for c in inspect(connection).get_columns(table_name)]
+    checksum = database_manager.content_checksum(database_manager.engine.dialect.name, columns)
+    if checksum is not None:
+        aggregates.append(checksum.label('checksum'))
+    if partition is None:
+        stmt = select(*aggregates).select_from(source).having(func.count() > 0)
+    else:
+        _, date_column, granularity = partition
+        date_col = column(date_column)
+        year = extract('year', date_col).label('year')
+        month = extract('month', date_col).label('month')
+        group_columns = [year] if granularity == 'year' else [year, month]
+        stmt = select(*group_columns, *aggregates).select_from(source).group_by(*(c.element for c in group_columns))
+    with database_manager.engine.connect() as connection:
+        df = pd.read_sql(stmt, connection)
+    watermarks = {}
+    for row in df.to_dict('records'):
+        label = UNPARTITIONED if partition is None else _partition_label(row['year'], row.get('month'), granularity)
+        watermarks[label] = {
+            'rows': int(row['rows']), 'keys': int(row['keys']),
+            'minKey': None if pd.isna(row['minKey']) else str(row['minKey']),
+            'maxKey': None if pd.isna(row['maxKey']) else str(row['maxKey']),
+            'checksum': None if pd.isna(row.get('checksum')) else int(row['checksum']),
+        }
+    return watermarks
+
+
+def _read_partition(table_name: str, label: str) -> pd.DataFrame:
+    """パーティションの行を読み込む。日付の範囲の条件で取得するため、日付の列の索引を使える。"""
+    source = table(table_name)
+    stmt = select(text('*')).select_from(source)
+    if EXPORT_TABLES[table_name]["partition"] is None:
+        with database_manager.engine.connect() as connection:
+            return pd.read_sql(stmt, connection)
+    _, date_column, granularity = EXPORT_TABLES[table_name]["partition"]
+    date_col = column(date_column)
+    if label == NULL_PARTITION:
+        condition = date_col.is_(None)
+    else:
+        start, end = _partition_range(label, granularity)
+        condition = and_(date_col >= start, date_col < end)
+    stmt = stmt.where(condition)
+    with database_manager.engine.connect() as connection:
+        return pd.read_sql(stmt, connection)
+
+
+def _target_dtype(name: str, col_type) -> str | None:
+    """
+    DBの列の型から、書き出す列の型を決める。パーティションごとに型が変わると Parquet のデータセットとして
+    読み込めないため、値ではなく列の型のみから決める。変換しない列は None を返す。
+    """
+    if isinstance(col_type, sqltypes.Boolean):
+        return 'boolean'
+    if isinstance(col_type, (sqltypes.Date, sqltypes.DateTime)):
+        return 'datetime64[ns]'
+    if isinstance(col_type, sqltypes.SmallInteger):
+        return 'Int16'
+    if isinstance(col_type, sqltypes.BigInteger):
+        return 'Int64'
+    if isinstance(col_type, sqltypes.Integer):
+        return 'Int32'
+    if isinstance(col_type, sqltypes.Numeric) and not isinstance(col_type, sqltypes.Float) and col_type.scale == 0:
+        return 'Int64'
+    if isinstance(col_type, (sqltypes.Numeric, sqltypes.Float)):
+        return 'float64'
+    if DATE_COLUMN_PATTERN.search(name):
+        # SQLite の TEXT 型などで保存された日付
+        return 'datetime64[ns]'
+    return None
+
+
+def compact_dtypes(df: pd.DataFrame, column_types: dict) -> pd.DataFrame:
+    """
+    DBの列の型 (column_types: 列名 -> SQLAlchemy の型) にもとづき、各列を変換する。
+    DECIMAL などの Python オブジェクトの列は数値に、日付の文字列は datetime64 に、整数は列の型に合う nullable 型にする。
+    文字列の列はそのまま書き出す (Parquet の辞書エンコーディングで圧縮される)。
+    """
+    df = df.copy()
+    for name in df.columns:
+        dtype = _target_dtype(name, column_types.get(name))
+        if dtype is None:
+            continue
+        values = df[name]
+        if dtype == 'datetime64[ns]':
+            converted = pd.to_datetime(values, errors='coerce')
+        elif dtype == 'boolean':
+            converted = values.map(lambda v: None if pd.isna(v) else bool(int(v))).astype('boolean')
+        else:
+            converted = pd.to_numeric(values, errors='coerce')
+            if dtype.startswith('Int'):
+                converted = converted.round()
+        n_lost = int(values.notna().sum() - converted.notna().sum())
+        if n_lost:
+            logger.warning("%s values in column %s could not be converted to %s and were set to null.", n_lost, name, dtype)
+        df[name] = converted.astype(dtype)
+    return df
+
+
+def _partition_dir(table_dir: str, table_name: str, label: str) -> str:
+    partition = EXPORT_TABLES[table_name]["partition"]
+    return table_dir if partition is None else os.path.join(table_dir, f"{partition[0]}={label}")
+
+
+def _load_manifest(table_dir: str) -> dict:
+    path = os.path.join(table_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(table_dir: str, manifest: dict):
+    path = os.path.join(table_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_table(table_name: str, export_dir: str = EXPORT_DIR, full: bool = False) -> dict:
+    """
+    テーブルを Parquet に差分エクスポートし、{'written': [...], 'deleted': [...], 'unchanged': n} を返す。
+    テーブルが存在しない場合は何もしない。
+    """
+    with database_manager.engine.connect() as connection:
+        if not database_manager.engine.dialect.has_table(connection, table_name):
+            logger.info("Table %s does not exist. Skipping.", table_name)
+            return {'written': [], 'deleted': [], 'unchanged': 0}
+        column_types = {c['name']: c['type'] for c in inspect(connection).get_columns(table_name)}
+
+    table_dir = os.path.join(export_dir, table_name)
+    os.makedirs(table_dir, exist_ok=True)
+    manifest = _load_manifest(table_dir)
+    previous = {} if full else manifest.get('partitions', {})
+    # パーティション間で同じ本文 (毎年の略歴など) を読み込み直さないよう、テーブルごとに1つの reader を使う
+    reader = text_blocks.TextBlockReader()
+
+    with metrics.timer('export_watermarks', product=table_name):
+        watermarks = get_partition_watermarks(table_name)
+    changed = [label for label, watermark in watermarks.items() if previous.get(label) != watermark]
+    removed = [label for label in manifest.get('partitions', {}) if label not in watermarks]
+
+    for label in sorted(changed):
+        with metrics.timer('export_partition', product=table_name):
+            df = text_blocks.expand_text_blocks(_read_partition(table_name, label), table_name, reader)
+            df = compact_dtypes(df, column_types)
+            partition_dir = _partition_dir(table_dir, table_name, label)
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, 'part-0.parquet')
+            # 書き込み中のファイルを読まれないよう、一時ファイルに書き出してから置き換える
+            df.to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+        metrics.inc('rows', len(df), stage='export', product=table_name)
+        logger.info("Exported %s rows to %s", len(df), path)
+    for label in removed:
+        partition_dir = _partition_dir(table_dir, table_name, label)
+        if partition_dir == table_dir:
+            if os.path.exists(os.path.join(table_dir, 'part-0.parquet')):
+                os.remove(os.path.join(table_dir, 'part-0.parquet'))
+        else:
+            shutil.rmtree(partition_dir, ignore_errors=True)
+        logger.info("Removed partition %s of %s (no rows left).", label, table_name)
+
+    _save_manifest(table_dir, {
+        'table': table_name,
+        'partitionBy': EXPORT_TABLES[table_name]["partition"],
+        'exportedAt': datetime.datetime.now().isoformat(timespec='seconds'),
+        'partitions': watermarks,
+    })
+    logger.info("%s: %s partitions written, %s removed, %s unchanged.",
+                table_name, len(changed), len(removed), len(watermarks) - len(changed))
+    return {'written': changed, 'deleted': removed, 'unchanged': len(watermarks) - len(changed)}
+
+
+def export_all(table_names: list[str] | None = None, export_dir: str = EXPORT_DIR, full: bool = False) -> dict:
+    """指定したテーブル (省略時は EXPORT_TABLES のすべて) をエクスポートする。"""
+    results = {}
+    for table_name in table_names or EXPORT_TABLES:
+        try:
+            results[table_name] = export_table(table_name, export_dir=export_dir, full=full)
+        except Exception as e:
+            logger.exception("Failed to export %s: %s", table_name, e)
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Export product tables to partitioned Parquet files.')
+    arg_parser.add_argument('tables', nargs='*', help=f"エクスポートするテーブル (省略時はすべて): {', '.join(EXPORT_TABLES)}")
+    arg_parser.add_argument('--full', action='store_true', help='ウォーターマークを無視して、すべてのパーティションを書き出す')
+    arg_parser.add_argument('--export-dir', default=EXPORT_DIR, help='出力先のディレクトリ')
+    args = arg_parser.parse_args()
+    unknown_tables = [name for name in args.tables if name not in EXPORT_TABLES]
+    if unknown_tables:
+        arg_parser.error(f"unknown tables: {', '.join(unknown_tables)}")
+    setup_logging()
+
+    export_all(args.tables, export_dir=args.export_dir, full=args.full)
+    if metrics.is_enabled():
+        metrics.print_summary()
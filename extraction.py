@@ -0,0 +1,485 @@
+"""
+宣言的な要素定義にもとづく、有価証券報告書のデータ抽出エンジン
+
+各データプロダクトが使う要素ID・コンテキストのパターン・カラムの型を PRODUCT_SPECS にデータとして定義する。
+書類のファクト (CSVの各行) は FactIndex で1回だけ走査して索引化し、要求された全プロダクトをその索引から抽出する。
+メタデータ (提出日, 決算期, 証券コード) の抽出も書類ごとに1回のみ行うため、
+プロダクトを追加しても書類あたりの追加コストはそのプロダクトの行の整形分だけで済む。
+
+抽出方式 (kind):
+    context_members   コンテキストIDのメンバー (例: No1MajorShareholdersMember) ごとに1行を作る
+    element_rows      要素IDの組を固定の行 (例: 株主の種類) に割り当てる
+    pivot             要素IDのパターンに一致するファクトを、コンテキストから得たキーと項目の種類でピボットする
+    context_columns   1つの要素IDの値を、コンテキストIDごとに別のカラムに割り当てて1行を作る
+
+使い方:
+    index = FactIndex(df)
+    results = extract_products(index, ['MajorShareholders', 'VotingRights'])
+"""
+import re
+import numpy as np
+import pandas as pd
+
+# --- 共通の定義 ---
+
+# 有価証券報告書のメタデータ。securities_code に指定したカラムは5桁の証券コードに整形する
+ANNUAL_METADATA = {
+    'elements': {
+        'jpcrp_cor:FilingDateCoverPage': 'SubmissionDate',
+        'jpdei_cor:CurrentPeriodEndDateDEI': 'FiscalPeriodEnd',
+        'jpdei_cor:SecurityCodeDEI': 'SecuritiesCode',
+    },
+    'securities_code': 'SecuritiesCode',
+}
+METADATA_COLUMNS = ['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode']
+
+# --- データプロダクトの定義 ---
+PRODUCT_SPECS = {
+    # 大株主の状況
+    'MajorShareholders': {
+        'kind': 'context_members',
+        'metadata': ANNUAL_METADATA,
+        'context_contains': 'MajorShareholdersMember',
+        'key': ('shareholderId', r'No(\d+)MajorShareholdersMember'),
+        'elements': {
+            'jpcrp_cor:NameMajorShareholders': 'MajorShareholderName',
+            'jpcrp_cor:ShareholdingRatio': 'VotingRightsRatio',
+            'jpcrp_cor:NumberOfSharesHeld': 'NumberOfSharesHeld',
+        },
+        'null_values': ['－'],
+        'required': 'MajorShareholderName',
+        'ordered_columns': METADATA_COLUMNS + ['shareholderId', 'MajorShareholderName', 'VotingRightsRatio', 'NumberOfSharesHeld'],
+        'numeric_cols': ['shareholderId', 'VotingRightsRatio', 'NumberOfSharesHeld'],
+    },
+    # 所有者別状況
+    'ShareholderComposition': {
+        'kind': 'element_rows',
+        'metadata': ANNUAL_METADATA,
+        'row_column': 'Category',
+        'rows': {
+            category: {
+                'NumberOfShareholders': f'jpcrp_cor:NumberOfShareholders{shareholders}',
+                'PercentageOfShareholdings': f'jpcrp_cor:PercentageOfShareholdings{percentage}' if percentage else None,
+                'NumberOfSharesHeldUnits': f'jpcrp_cor:NumberOfSharesHeldNumberOfUnits{units}',
+            }
+            for category, shareholders, percentage, units in [
+                ('NationalAndLocalGovernments', 'NationalAndLocalGovernments', 'NationalAndLocalGovernments', 'NationalAndLocalGovernments'),
+                ('FinancialInstitutions', 'FinancialInstitutions', 'FinancialInstitutions', 'FinancialInstitutions'),
+                ('FinancialServiceProviders', 'FinancialServiceProviders', 'FinancialServiceProviders', 'FinancialServiceProviders'),
+                ('OtherCorporations', 'OtherCorporations', 'OtherCorporations', 'OtherCorporations'),
+                ('ForeignInvestorsOtherThanIndividuals', 'ForeignInvestorsOtherThanIndividuals', 'ForeignersOtherThanIndividuals', 'ForeignInvestorsOtherThanIndividuals'),
+                ('ForeignIndividualInvestors', 'ForeignIndividualInvestors', 'ForeignIndividuals', 'ForeignIndividualInvestors'),
+                ('IndividualsAndOthers', 'IndividualsAndOthers', 'IndividualsAndOthers', 'IndividualsAndOthers'),
+                ('Total', 'Total', None, 'Total'),
+            ]
+        },
+        # 値がない場合の既定値 ({行: {カラム: 値}})
+        'defaults': {'Total': {'PercentageOfShareholdings': 1.0}},
+        'null_values': ['－', '-'],
+        'ordered_columns': METADATA_COLUMNS + ['Category', 'NumberOfShareholders', 'PercentageOfShareholdings', 'NumberOfSharesHeldUnits'],
+        'numeric_cols': ['NumberOfShareholders', 'PercentageOfShareholdings', 'NumberOfSharesHeldUnits'],
+    },
+    # 役員の状況
+    'Officer': {
+        'kind': 'pivot',
+        'metadata': ANNUAL_METADATA,
+        'element_pattern': r'(?:InformationAboutDirectorsAndCorporateAuditors|RemunerationEtcPaidByGroupToEachDirectorOrOtherOfficer)',
+        # 議案 (Proposal) の要素は、通常の要素と同じ項目として扱う
+        'element_normalize': ('Proposal', ''),
+        # 要素IDに含まれる文字列で、項目の種類を判定する (上から順に最初に一致したもの)
+        'classifiers': {
+            'item_type': ({
+                'NameInformationAboutDirectorsAndCorporateAuditors': 'Name',
+                'DateOfBirthInformationAboutDirectorsAndCorporateAuditors': 'DateOfBirth',
+                'OfficialTitleOrPositionInformationAboutDirectorsAndCorporateAuditors': 'Title',
+                'CareerSummaryInformationAboutDirectorsAndCorporateAuditorsTextBlock': 'CareerSummary',
+                'NumberOfSharesHeldOrdinarySharesInformationAboutDirectorsAndCorporateAuditors': 'NumberOfSharesHeld',
+                'TermOfOfficeInformationAboutDirectorsAndCorporateAuditors': 'TermOfOffice',
+                'TotalAmountOfRemunerationEtcPaidByGroupRemunerationEtcPaidByGroupToEachDirectorOrOtherOfficer': 'TotalRemuneration',
+            }, None),
+        },
+        # 要素IDに指定の文字列を含むファクトが1つでもあれば True とするフラグ
+        'flag': ('IsNewAppointment', 'Proposal'),
+        'context_keys': {'officerId': r'(jpcrp.*Member)'},
+        'index': ['officerId'],
+        'columns': ['item_type'],
+        'ordered_columns': METADATA_COLUMNS + ['officerId', 'Name', 'IsNewAppointment', 'DateOfBirth', 'Title', 'NumberOfSharesHeld', 'TotalRemuneration', 'TermOfOffice', 'CareerSummary'],
+        'numeric_cols': ['NumberOfSharesHeld', 'TotalRemuneration'],
+        'date_cols': ['DateOfBirth'],
+    },
+    # 特定投資株式
+    'SpecifiedInvestment': {
+        'kind': 'pivot',
+        'metadata': ANNUAL_METADATA,
+        'element_pattern': 'SpecifiedInvestment',
+        'classifiers': {
+            'HoldingEntity': ({
+                'SecondLargestHoldingCompany': 'SecondLargestHoldingCompany',
+                'LargestHoldingCompany': 'LargestHoldingCompany',
+            }, 'ReportingCompany'),
+            'item_type': ({
+                'NameOfSecurities': 'NameOfSecurities',
+                'NumberOfSharesHeld': 'NumberOfSharesHeld',
+                'BookValue': 'BookValue',
+                'PurposeOfShareholding': 'HoldingPurpose',
+                'WhetherIssuerOfAforementionedSharesHoldsReportingCompanysShares': 'CrossShareholdingStatus',
+            }, None),
+        },
+        'context_keys': {'rowId': r'_Row(\d+)'},
+        'index': ['HoldingEntity', 'rowId'],
+        'columns': ['item_type', '相対年度'],
+        # ピボット後のカラム (項目の種類_相対年度) と出力カラムの対応
+        'column_mapping': {
+            'rowId': 'rowId',
+            'HoldingEntity': 'HoldingEntity', 'NameOfSecurities_当期末': 'NameOfSecurities',
+            'NumberOfSharesHeld_当期末': 'NumberOfSharesHeldCurrentYear', 'BookValue_当期末': 'BookValueCurrentYear',
+            'NumberOfSharesHeld_前期末': 'NumberOfSharesHeldPriorYear', 'BookValue_前期末': 'BookValuePriorYear',
+            'HoldingPurpose_当期末': 'HoldingPurpose', 'CrossShareholdingStatus_当期末': 'CrossShareholdingStatus',
+        },
+        'required': 'NameOfSecurities',
+        # 保有主体の名称。最大保有会社の名称はTextBlockの文中から、提出会社の名称は表紙の要素から取得する
+        'entity_names': {
+            'column': 'HoldingEntityName',
+            'source': 'HoldingEntity',
+            'text_patterns': {
+                'LargestHoldingCompany': ('jpcrp_cor:ShareholdingsTextBlock', r'（最大保有会社）である(.+?)については'),
+                'SecondLargestHoldingCompany': None,
+            },
+            'default_element': 'jpcrp_cor:FilerNameInJapaneseCoverPage',
+            'null_values': ['－', '-'],
+        },
+        'ordered_columns': METADATA_COLUMNS + ['HoldingEntity', 'HoldingEntityName', 'rowId', 'NameOfSecurities', 'NumberOfSharesHeldCurrentYear', 'BookValueCurrentYear', 'NumberOfSharesHeldPriorYear', 'BookValuePriorYear', 'HoldingPurpose', 'CrossShareholdingStatus'],
+        'numeric_cols': ['rowId', 'NumberOfSharesHeldCurrentYear', 'BookValueCurrentYear', 'NumberOfSharesHeldPriorYear', 'BookValuePriorYear'],
+    },
+    # 議決権の状況 (株式数)
+    'VotingRights': {
+        'kind': 'context_columns',
+        'metadata': ANNUAL_METADATA,
+        'element': 'jpcrp_cor:NumberOfSharesIssuedSharesVotingRights',
+        'contexts': {
+            'CurrentYearInstant': 'TotalNumberOfIssuedShares',
+            'CurrentYearInstant_OrdinarySharesSharesWithFullVotingRightsOtherMember': 'NumberOfOtherSharesWithFullVotingRights',
+            'CurrentYearInstant_OrdinarySharesTreasurySharesSharesWithFullVotingRightsTreasurySharesEtcMember': 'NumberOfTreasurySharesWithFullVotingRights',
+            'CurrentYearInstant_OrdinarySharesSharesLessThanOneUnitMember': 'NumberOfSharesLessThanOneUnit',
+        },
+        'ordered_columns': METADATA_COLUMNS + ['TotalNumberOfIssuedShares', 'NumberOfOtherSharesWithFullVotingRights', 'NumberOfTreasurySharesWithFullVotingRights', 'NumberOfSharesLessThanOneUnit'],
+        'numeric_cols': ['TotalNumberOfIssuedShares', 'NumberOfOtherSharesWithFullVotingRights', 'NumberOfTreasurySharesWithFullVotingRights', 'NumberOfSharesLessThanOneUnit'],
+    },
+}
+
+
+# --- 共通ヘルパー関数 ---
+
+def _finalize_df(df: pd.DataFrame, metadata: dict, ordered_columns: list, numeric_cols: list = [], date_cols: list = []) -> pd.DataFrame:
+    """メタデータの付与、データ型変換、カラム順序の整理を行う共通関数"""
+    if df.empty:
+        return pd.DataFrame(columns=ordered_columns)
+
+    # メタデータを結合
+    for key, value in metadata.items():
+        df[key] = value
+
+    # データ型を変換
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(',', '', regex=False)
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    for col in date_cols:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
+
+    # カラムの順序を整える
+    final_ordered_columns = [col for col in ordered_columns if col in df.columns]
+    # 存在しないカラムも追加
+    for col in ordered_columns:
+        if col not in final_ordered_columns:
+            df[col] = None
+
+    return df[ordered_columns]
+
+
+def _clean_value(value, null_values: list, nan_to_none: bool = True):
+    """null_values に含まれる値 (前後の空白を除く) と、nan_to_none=True の場合は欠損値を None に変換する。"""
+    if value is None:
+        return None
+    if nan_to_none and pd.isna(value):
+        return None
+    if str(value).strip() in null_values:
+        return None
+    return value
+
+
+class FactIndex:
+    """
+    書類のファクト (要素ID, コンテキストID, 値) を1回の走査で索引化したもの。
+    各プロダクトの抽出は、DataFrame全体の再フィルタではなくこの索引の参照で行う。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._values = df['値'].tolist()
+        # 要素ID -> 出現位置のリスト / (要素ID, コンテキストID) -> 最初の値 / コンテキストID (出現順)
+        self._positions = {}
+        self._first_values = {}
+        self._contexts = {}
+        for position, (element_id, context_id, value) in enumerate(zip(df['要素ID'].tolist(), df['コンテキストID'].tolist(), self._values)):
+            positions = self._positions.get(element_id)
+            if positions is None:
+                self._positions[element_id] = [position]
+            else:
+                positions.append(position)
+            key = (element_id, context_id)
+            if key not in self._first_values:
+                self._first_values[key] = value
+            if context_id not in self._contexts:
+                self._contexts[context_id] = None
+        self._metadata_cache = {}
+
+    def first(self, element_id: str, context_id: str | None = None):
+        """要素ID (とコンテキストID) に一致する最初のファクトの値を返す。存在しない場合は None。"""
+        if context_id is not None:
+            return self._first_values.get((element_id, context_id))
+        positions = self._positions.get(element_id)
+        return self._values[positions[0]] if positions else None
+
+    def has(self, element_id: str) -> bool:
+        return element_id in self._positions
+
+    def contexts_containing(self, text: str) -> list:
+        """指定の文字列を含むコンテキストIDを、出現順に返す。"""
+        return [c for c in self._contexts if text in str(c)]
+
+    def element_ids_matching(self, pattern: str) -> list:
+        """正規表現に一致する要素IDのリストを返す。"""
+        regex = re.compile(pattern)
+        return [e for e in self._positions if isinstance(e, str) and regex.search(e)]
+
+    def rows(self, element_ids: list) -> pd.DataFrame:
+        """指定した要素IDのファクトを、元の出現順のまま DataFrame として返す。"""
+        positions = sorted(p for e in element_ids for p in self._positions[e])
+        return self.df.iloc[positions].copy()
+
+    def metadata(self, spec: dict) -> dict:
+        """メタデータの定義にもとづいて値を抽出する (書類ごとに1回のみ計算する)。"""
+        cache_key = id(spec)
+        if cache_key in self._metadata_cache:
+            return dict(self._metadata_cache[cache_key])
+        metadata = {column: self.first(element_id) for element_id, column in spec['elements'].items()}
+        code_column = spec.get('securities_code')
+        # 証券コードの整形
+        if code_column and metadata.get(code_column):
+            match = re.search(r'\d{5}', str(metadata[code_column]))
+            if match:
+                metadata[code_column] = match.group(0)
+        self._metadata_cache[cache_key] = metadata
+        return dict(metadata)
+
+
+# --- 抽出方式ごとの処理 ---
+
+def _extract_context_members(index: FactIndex, spec: dict) -> pd.DataFrame:
+    key_column, key_pattern = spec['key']
+    null_values = spec.get('null_values', [])
+    records = []
+    for context in index.contexts_containing(spec['context_contains']):
+        key_match = re.search(key_pattern, context)
+        key = int(key_match.group(1)) if key_match else None
+        values = {column: _clean_value(index.first(element_id, context), null_values, nan_to_none=False)
+                  for element_id, column in spec['elements'].items()}
+        if values[spec['required']] and key is not None:
+            records.append({key_column: key, **values})
+    return pd.DataFrame(records)
+
+
+def _extract_element_rows(index: FactIndex, spec: dict) -> pd.DataFrame:
+    null_values = spec.get('null_values', [])
+    defaults = spec.get('defaults', {})
+    records = []
+    for row_name, columns in spec['rows'].items():
+        record = {spec['row_column']: row_name}
+        for column, element_id in columns.items():
+            value = _clean_value(index.first(element_id), null_values) if element_id else None
+            if value is None:
+                value = defaults.get(row_name, {}).get(column)
+            record[column] = value
+        records.append(record)
+    return pd.DataFrame(records)
+
+
+def _classify(element_id: str, markers: dict, default):
+    """要素IDに含まれる文字列から、分類の値を返す (markers の上から順に最初に一致したもの)。"""
+    for marker, value in markers.items():
+        if marker in element_id:
+            return value
+    return default
+
+
+def _extract_pivot(index: FactIndex, spec: dict) -> pd.DataFrame:
+    element_ids = index.element_ids_matching(spec['element_pattern'])
+    if not element_ids:
+        return pd.DataFrame()
+    facts_df = index.rows(element_ids)
+
+    # 要素IDごとの分類は、ファクトごとではなくユニークな要素IDごとに1回だけ判定する
+    old, new = spec.get('element_normalize', ('', ''))
+    normalized = {e: e.replace(old, new) if old else e for e in element_ids}
+    for column, (markers, default) in spec['classifiers'].items():
+        mapping = {e: _classify(normalized[e], markers, default) for e in element_ids}
+        facts_df[column] = np.array([mapping[e] for e in facts_df['要素ID']], dtype=object)
+    flag = spec.get('flag')
+    if flag:
+        flag_column, flag_marker = flag
+        facts_df[flag_column] = facts_df['要素ID'].str.contains(flag_marker, na=False)
+    for column, pattern in spec['context_keys'].items():
+        facts_df[column] = facts_df['コンテキストID'].str.extract(pattern)
+    facts_df.dropna(subset=list(spec['context_keys']) + list(spec['classifiers']), inplace=True)
+    if facts_df.empty:
+        return pd.DataFrame()
+
+    pivot_df = facts_df.pivot_table(index=spec['index'], columns=spec['columns'], values='値', aggfunc='first')
+    if len(spec['columns']) > 1:
+        pivot_df.columns = ['_'.join(filter(None, col)).strip() for col in pivot_df.columns.values]
+    if flag:
+        flags = facts_df.groupby(spec['index'])[flag_column].any()
+        pivot_df = pivot_df.merge(flags, on=spec['index'], how='left')
+    pivot_df.reset_index(inplace=True)
+
+    column_mapping = spec.get('column_mapping')
+    if column_mapping:
+        pivot_df = pd.DataFrame({new: pivot_df.get(original) for original, new in column_mapping.items()})
+    if spec.get('required'):
+        pivot_df.dropna(subset=[spec['required']], inplace=True)
+
+    entity_names = spec.get('entity_names')
+    if entity_names:
+        null_values = entity_names['null_values']
+        source = pivot_df[entity_names['source']]
+        conditions, choices = [], []
+        for entity, text_pattern in entity_names['text_patterns'].items():
+            name = None
+            if text_pattern:
+                element_id, pattern = text_pattern
+                text = _clean_value(index.first(element_id), null_values)
+                match = re.search(pattern, text) if text else None
+                name = match.group(1) if match else None
+            conditions.append(source == entity)
+            choices.append(name)
+        default_name = _clean_value(index.first(entity_names['default_element']), null_values)
+        pivot_df[entity_names['column']] = np.select(conditions, choices, default=default_name)
+    return pivot_df
+
+
+def _extract_context_columns(index: FactIndex, spec: dict) -> pd.DataFrame:
+    if not index.has(spec['element']):
+        return pd.DataFrame()
+    record = {column: index.first(spec['element'], context_id) for context_id, column in spec['contexts'].items()}
+    return pd.DataFrame([record])
+
+
+_EXTRACTORS = {
+    'context_members': _extract_context_members,
+    'element_rows': _extract_element_rows,
+    'pivot': _extract_pivot,
+    'context_columns': _extract_context_columns,
+}
+
+
+# --- 読み込み時の要素IDフィルタ ---
+
+class ElementFilter:
+    """
+    抽出に必要な要素IDかどうかを判定する。完全一致する要素IDのセットと、正規表現のパターンで指定する。
+    判定結果は要素IDごとにキャッシュする。
+    """
+
+    def __init__(self, element_ids: set, patterns: list[str]):
+        self.element_ids = set(element_ids)
+        self.patterns = [re.compile(p) for p in patterns]
+        self._cache = {}
+
+    def __call__(self, element_id: str) -> bool:
+        result = self._cache.get(element_id)
+        if result is None:
+            result = element_id in self.element_ids or any(p.search(element_id) for p in self.patterns)
+            self._cache[element_id] = result
+        return result
+
+
+def _spec_elements(spec: dict) -> tuple[set, list]:
+    """1つのプロダクトの定義から、使用する要素IDのセットと要素IDのパターンを取り出す。"""
+    element_ids = set(spec['metadata']['elements'])
+    patterns = []
+    kind = spec['kind']
+    if kind == 'context_members':
+        element_ids.update(spec['elements'])
+    elif kind == 'element_rows':
+        element_ids.update(e for columns in spec['rows'].values() for e in columns.values() if e)
+    elif kind == 'pivot':
+        patterns.append(spec['element_pattern'])
+        entity_names = spec.get('entity_names')
+        if entity_names:
+            element_ids.add(entity_names['default_element'])
+            element_ids.update(p[0] for p in entity_names['text_patterns'].values() if p)
+    elif kind == 'context_columns':
+        element_ids.add(spec['element'])
+    return element_ids, patterns
+
+
+def element_filter(product_names: list[str]) -> ElementFilter | None:
+    """
+    指定したプロダクトの抽出に必要な要素IDだけを通す ElementFilter を返す。
+    PRODUCT_SPECS で定義されていないプロダクトが含まれる場合は、すべての要素が必要になるため None を返す。
+    """
+    if not product_names or any(name not in PRODUCT_SPECS for name in product_names):
+        return None
+    element_ids, patterns = set(), []
+    for name in product_names:
+        ids, pats = _spec_elements(PRODUCT_SPECS[name])
+        element_ids |= ids
+        patterns += [p for p in pats if p not in patterns]
+    return ElementFilter(element_ids, patterns)
+
+
+# --- 公開関数 ---
+
+def extract_product(source: pd.DataFrame | FactIndex, product_name: str) -> pd.DataFrame:
+    """
+    PRODUCT_SPECS の定義にもとづいて、1つのデータプロダクトを抽出・整形して返す。
+
+    Args:
+        source (pd.DataFrame | FactIndex): 書類のXBRL CSVのDataFrame、または作成済みの FactIndex。
+            複数のプロダクトを抽出する場合は、FactIndex を作成して使い回す。
+        product_name (str): データプロダクト名。
+
+    Returns:
+        pd.DataFrame: 抽出結果。対象のファクトが存在しない場合は空のDataFrame。
+    """
+    spec = PRODUCT_SPECS[product_name]
+    index = source if isinstance(source, FactIndex) else FactIndex(source)
+    result_df = _EXTRACTORS[spec['kind']](index, spec)
+    # 対象のファクトがない場合は、整形せずに空のDataFrameを返す
+    if result_df.empty and len(result_df.columns) == 0 and spec['kind'] in ('pivot', 'context_columns'):
+        return result_df
+    return _finalize_df(
+        result_df, index.metadata(spec['metadata']),
+        ordered_columns=spec['ordered_columns'],
+        numeric_cols=spec.get('numeric_cols', []),
+        date_cols=spec.get('date_cols', [])
+    )
+
+
+def extract_products(source: pd.DataFrame | FactIndex, product_names: list[str] | None = None) -> dict:
+    """
+    複数のデータプロダクトを、1つの FactIndex から抽出する。
+
+    Returns:
+        dict: データプロダクト名をキー、抽出結果のDataFrameを値とする辞書 (空の結果は含めない)。
+    """
+    index = source if isinstance(source, FactIndex) else FactIndex(source)
+    results = {}
+    for product_name in product_names or PRODUCT_SPECS:
+        result_df = extract_product(index, product_name)
+        if not result_df.empty:
+            results[product_name] = result_df
+    return results
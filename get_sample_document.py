@@ -1,126 +1,347 @@
-import sys
-import os
+"""
+サンプルデータセットの取得
+
+指定したデータプロダクトに関連する書類をダウンロードし、XBRL CSV を結合したデータセットを samples/ に保存する。
+
+- 書類は WORKERS 個のスレッドで並行して取得する。リクエストの開始間隔は REQUESTS_PER_SECOND で制限する。
+- 取得した書類は1件ずつ提出年・formCode ごとのパーティションに追記し、ROWS_PER_FILE 行ごとにファイルに書き出す。
+  全パーティションでためている行数が MAX_BUFFERED_ROWS を超えた場合は、行数の多いパーティションから書き出す。
+  全件をメモリに保持せず、パーティションの数によらずためる行数に上限があるため、数万件の書類でもメモリ使用量は一定になる。
+  pyarrow がインストールされている場合は Parquet、それ以外の場合は CSV (UTF-8 BOM付き) で保存する。
+      samples/<データプロダクト>_dataset/year=2024/formCode=030000/part-00000.parquet
+  実行ごとに新しい一時ディレクトリに書き出し、完了後に前回のデータセットのディレクトリと置き換える。
+  --limit・--stratify・--format を変えて実行し直しても、前回のパーティション・ファイルが混ざることはない。
+- --stratify を指定すると、提出年・formCode などの層ごとに同じ件数を無作為に抽出する (件数が足りない層の分は他の層に割り当てる)。
+  指定しない場合は、提出日の新しい順に --limit 件を取得する。
+
+使い方:
+    python get_sample_document.py MajorShareholders
+    python get_sample_document.py LargeVolumeHoldingReport --limit 10000 --stratify year formCode --workers 8 --rate 2
+"""
+import argparse
 import io
-import zipfile
+import itertools
+import logging
+import os
+import random
+import shutil
+import threading
 import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import pandas as pd
 from tqdm import tqdm
+
 import database_manager
 import edinet_api
 from definitions import DOCUMENT_TYPE_DEFINITIONS, DATA_PRODUCT_DEFINITIONS
+from logging_config import setup_logging
+
+try:
+    import pyarrow  # noqa: F401  (DataFrame.to_parquet が使用する)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+DEFAULT_LIMIT = 100
+SAVE_DIR = "samples"
+# 並行してダウンロードする書類数と、APIへのリクエストの開始間隔の上限 (APIサーバーへの負荷を考慮)
+WORKERS = 4
+REQUESTS_PER_SECOND = 1.0
+# パーティションごとに、この行数がたまったらファイルに書き出す
+ROWS_PER_FILE = 200_000
+# 全パーティションでためておく行数の上限 (超えた場合は行数の多いパーティションから書き出す)
+MAX_BUFFERED_ROWS = 500_000
+# --stratify で指定できる層
+STRATA_KEYS = {
+    'year': lambda document: str(pd.Timestamp(document[0]).year) if pd.notna(document[0]) else 'unknown',
+    'formCode': lambda document: document[2],
+    'ordinanceCode': lambda document: document[3],
+}
+ENCODINGS_TO_TRY = ['utf-16', 'utf-8', 'cp932']
+
 
-def find_target_documents(target_data_product: str, limit: int = 100):
+class RateLimiter:
+    """複数のスレッドから呼び出され、wait() が返る間隔を 1 / rate 秒以上にする。"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(self._next_time, now)
+            self._next_time = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+class SampleWriter:
     """
-    指定されたデータプロダクトに合致する最新の書類をDBから見つける。
+    書類ごとの DataFrame をパーティション (year=..., formCode=...) ごとにためておき、
+    ROWS_PER_FILE 行ごとに part-NNNNN.parquet (または .csv) として書き出す。
+    全パーティションの合計が max_buffered_rows を超えた場合は、行数の多いパーティションから書き出す。
+    Parquet のディレクトリは pd.read_parquet(output_dir) でパーティションの列を含めて読み込める。
     """
-    print(f"--- Searching for documents related to data product: '{target_data_product}' ---")
 
+    def __init__(self, output_dir: str, file_format: str = 'parquet', rows_per_file: int = ROWS_PER_FILE,
+                 max_buffered_rows: int = MAX_BUFFERED_ROWS):
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        self.n_rows = 0
+        self.n_files = 0
+        self._buffers = defaultdict(list)
+        self._buffered_rows = defaultdict(int)
+        self._file_counters = defaultdict(itertools.count)
+
+    def append(self, partition: tuple[tuple[str, str], ...], df: pd.DataFrame):
+        self._buffers[partition].append(df)
+        self._buffered_rows[partition] += len(df)
+        self.n_rows += len(df)
+        if self._buffered_rows[partition] >= self.rows_per_file:
+            self._flush(partition)
+        while self._buffered_rows and sum(self._buffered_rows.values()) > self.max_buffered_rows:
+            self._flush(max(self._buffered_rows, key=self._buffered_rows.get))
+
+    def _flush(self, partition):
+        dfs = self._buffers.pop(partition, None)
+        self._buffered_rows.pop(partition, None)
+        if not dfs:
+            return
+        partition_dir = os.path.join(self.output_dir, *(f"{key}={value}" for key, value in partition))
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, f"part-{next(self._file_counters[partition]):05d}.{self.file_format}")
+        df = pd.concat(dfs, ignore_index=True)
+        if self.file_format == 'parquet':
+            # パーティションの列はディレクトリ名から復元されるため (Hive形式)、ファイルには含めない
+            df.drop(columns=[key for key, _ in partition if key in df.columns]).to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False, encoding='utf-8-sig')
+        self.n_files += 1
+        logger.debug("Wrote %s rows to %s", len(df), path)
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+
+
+def _get_codes(target_data_product: str) -> list[tuple[str, str]]:
     doc_type = DATA_PRODUCT_DEFINITIONS.get(target_data_product)
     if not doc_type:
-        print(f"Error: Data product '{target_data_product}' is not defined in definitions.py.")
+        logger.error("Data product '%s' is not defined in definitions.py.", target_data_product)
         return []
-
     codes_to_fetch = DOCUMENT_TYPE_DEFINITIONS.get(doc_type)
     if not codes_to_fetch:
-        print(f"Error: Document type '{doc_type}' has no associated codes in definitions.py.")
+        logger.error("Document type '%s' has no associated codes in definitions.py.", doc_type)
         return []
+    logger.info("Found document type '%s'. Searching for documents with form/ordinance codes: %s", doc_type, codes_to_fetch)
+    return codes_to_fetch
 
-    print(f"Found document type '{doc_type}'. Searching for documents with form/ordinance codes: {codes_to_fetch}")
 
-    documents = database_manager.get_documents_by_codes(codes_to_fetch)
-    if not documents:
-        print("Error: No matching document with a CSV file found in the database.")
+def _allocate(sizes: dict, limit: int) -> dict:
+    """limit 件を各層にできるだけ均等に割り当てる。件数が足りない層の残りは、他の層に割り当てる。"""
+    allocation = {}
+    remaining = limit
+    keys = sorted(sizes, key=lambda key: sizes[key])
+    for i, key in enumerate(keys):
+        allocation[key] = min(sizes[key], remaining // (len(keys) - i))
+        remaining -= allocation[key]
+    return allocation
+
+
+def find_target_documents(target_data_product: str, limit: int = DEFAULT_LIMIT, stratify: list[str] | None = None,
+                          seed: int = 0):
+    """
+    指定されたデータプロダクトに合致する書類をDBから見つける。
+    stratify を指定しない場合は、最新の limit 件を返す。
+    stratify を指定した場合は、層ごとに最大 limit 件を無作為に保持し (リザーバーサンプリング)、
+    合計が limit 件になるように各層から抽出して、提出日の新しい順に返す。
+    """
+    logger.info("--- Searching for documents related to data product: '%s' ---", target_data_product)
+    codes_to_fetch = _get_codes(target_data_product)
+    if not codes_to_fetch:
         return []
 
-    # 上位limit件に絞る
-    return documents[:limit]
+    documents = database_manager.iter_documents_by_codes(codes_to_fetch, raise_errors=True)
+    if not stratify:
+        selected = list(itertools.islice(documents, limit))
+    else:
+        rng = random.Random(seed)
+        reservoirs = defaultdict(list)
+        seen = defaultdict(int)
+        for document in documents:
+            stratum = tuple(STRATA_KEYS[key](document) for key in stratify)
+            seen[stratum] += 1
+            reservoir = reservoirs[stratum]
+            if len(reservoir) < limit:
+                reservoir.append(document)
+            else:
+                j = rng.randrange(seen[stratum])
+                if j < limit:
+                    reservoir[j] = document
+        allocation = _allocate(seen, limit)
+        selected = []
+        for stratum, reservoir in reservoirs.items():
+            selected.extend(rng.sample(reservoir, allocation[stratum]))
+            logger.info("Stratum %s: sampled %s of %s documents.", dict(zip(stratify, stratum)), allocation[stratum], seen[stratum])
+        selected.sort(key=lambda document: (document[0], document[1]), reverse=True)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python get_sample_document.py <DataProductName>")
-        print("Example: python get_sample_document.py MajorShareholders")
-        print("\nAvailable data products:")
-        for product in DATA_PRODUCT_DEFINITIONS.keys():
-            print(f"- {product}")
-        sys.exit(1)
-    
-    target_data_product = sys.argv[1]
-
-    documents_to_process = find_target_documents(target_data_product, limit=100)
-    if not documents_to_process:
-        sys.exit(1)
-
-    print(f"\nFound {len(documents_to_process)} documents to process. Starting download and processing...")
-
-    all_dfs = []
-    for doc_info in tqdm(documents_to_process, desc="Processing Documents"):
-        date_file, doc_id, form_code, ordinance_code, ordinance_code_short, seq_number = doc_info
-        
-        zip_content = edinet_api.fetch_document(doc_id)
-        if not zip_content or not zip_content.startswith(b'PK'):
-            tqdm.write(f"Warning: Failed to fetch a valid zip file for docID: {doc_id}. Skipping.")
-            time.sleep(1)
-            continue
-        
+    if not selected:
+        logger.error("No matching document with a CSV file found in the database.")
+    return selected
+
+
+def _read_document_csv(zip_content: bytes) -> pd.DataFrame | None:
+    """書類のZIPから XBRL_TO_CSV/ の最初のCSVを読み込む。"""
+    with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
+        target_csv_name = next(
+            (name for name in z.namelist() if name.startswith('XBRL_TO_CSV/') and name.endswith('.csv')), None
+        )
+        if not target_csv_name:
+            return None
+        csv_content = z.read(target_csv_name)
+    for encoding in ENCODINGS_TO_TRY:
         try:
-            with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
-                target_csv_name = None
-                for filename in z.namelist():
-                    if filename.startswith('XBRL_TO_CSV/') and filename.endswith('.csv'):
-                        target_csv_name = filename
-                        break
-                
-                if not target_csv_name:
-                    tqdm.write(f"Warning: No CSV file found in zip for docID: {doc_id}. Skipping.")
-                    continue
-
-                with z.open(target_csv_name) as csv_file:
-                    # ファイルを読み込む際のエンコーディングを試す
-                    df = None
-                    encodings_to_try = ['utf-16', 'utf-8', 'cp932']
-                    # BytesIOを介してエンコーディングを指定
-                    csv_content = csv_file.read()
-                    for encoding in encodings_to_try:
-                        try:
-                            df = pd.read_csv(io.BytesIO(csv_content), encoding=encoding, sep='\t', engine='python', on_bad_lines='warn')
-                            break # 成功したらループを抜ける
-                        except Exception:
-                            # seek(0)はBytesIOには不要
-                            pass
-                    
-                    if df is None:
-                        tqdm.write(f"Warning: Failed to read CSV for docID {doc_id} with any encoding. Skipping.")
-                        continue
-
-                    # 必須カラムを追加
-                    df['docId'] = doc_id
-                    df['formCode'] = form_code
-                    df['ordinanceCode'] = ordinance_code
-                    all_dfs.append(df)
-
-        except Exception as e:
-            tqdm.write(f"An error occurred while processing docID {doc_id}: {e}")
-        finally:
-            # APIサーバーへの負荷を考慮
-            time.sleep(1)
-
-    if not all_dfs:
-        print("\nNo data was successfully processed. Exiting.")
-        sys.exit(1)
-
-    # すべてのDataFrameを結合
-    final_df = pd.concat(all_dfs, ignore_index=True)
-
-    # 保存
-    save_dir = "samples"
-    os.makedirs(save_dir, exist_ok=True)
-    output_filename = f"{target_data_product}_dataset_{len(documents_to_process)}docs.csv"
-    output_path = os.path.join(save_dir, output_filename)
-    
-    final_df.to_csv(output_path, index=False, encoding='utf-8-sig')
-    
-    print(f"\nSuccessfully created dataset with {len(final_df)} rows.")
-    print(f"Saved to: {os.path.abspath(output_path)}")
+            return pd.read_csv(io.BytesIO(csv_content), encoding=encoding, sep='\t', dtype=str,
+                               engine='python', on_bad_lines='warn')
+        except Exception:
+            pass
+    return None
+
+
+def _fetch_document_frame(document: tuple, rate_limiter: RateLimiter) -> pd.DataFrame | None:
+    """1件の書類をダウンロードしてCSVを読み込み、書類の情報の列を加えて返す。失敗した場合は None を返す。"""
+    date_file, doc_id, form_code, ordinance_code = document[:4]
+    rate_limiter.wait()
+    zip_content = edinet_api.fetch_document(doc_id)
+    if not zip_content or not zip_content.startswith(b'PK'):
+        tqdm.write(f"Warning: Failed to fetch a valid zip file for docID: {doc_id}. Skipping.")
+        return None
+    try:
+        df = _read_document_csv(zip_content)
+    except Exception as e:
+        tqdm.write(f"An error occurred while processing docID {doc_id}: {e}")
+        return None
+    if df is None:
+        tqdm.write(f"Warning: No readable CSV file found in zip for docID: {doc_id}. Skipping.")
+        return None
+
+    # 必須カラムを追加
+    df['docId'] = doc_id
+    df['dateFile'] = str(date_file)[:10] if pd.notna(date_file) else None
+    df['formCode'] = form_code
+    df['ordinanceCode'] = ordinance_code
+    return df
+
+
+def _download_documents(documents: list[tuple], writer: SampleWriter, workers: int, rate_limiter: RateLimiter) -> int:
+    """書類を並行して取得して writer に追記し、取得できた書類数を返す。"""
+    n_saved = 0
+    document_iter = iter(documents)
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(total=len(documents), desc="Processing Documents") as progress:
+        # 書き込みを待つ DataFrame がたまらないよう、実行中の書類数を workers の2倍までに制限する
+        in_flight = {}
+        for document in itertools.islice(document_iter, workers * 2):
+            in_flight[executor.submit(_fetch_document_frame, document, rate_limiter)] = document
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                document = in_flight.pop(future)
+                df = future.result()
+                if df is not None:
+                    partition = (('year', STRATA_KEYS['year'](document)), ('formCode', document[2]))
+                    writer.append(partition, df)
+                    n_saved += 1
+                progress.update(1)
+                next_document = next(document_iter, None)
+                if next_document is not None:
+                    in_flight[executor.submit(_fetch_document_frame, next_document, rate_limiter)] = next_document
+    writer.close()
+    return n_saved
+
+
+def build_sample_dataset(target_data_product: str, limit: int = DEFAULT_LIMIT, stratify: list[str] | None = None,
+                         workers: int = WORKERS, rate: float = REQUESTS_PER_SECOND, file_format: str | None = None,
+                         rows_per_file: int = ROWS_PER_FILE, max_buffered_rows: int = MAX_BUFFERED_ROWS,
+                         save_dir: str = SAVE_DIR, seed: int = 0) -> str | None:
+    """
+    サンプルデータセットを作成し、出力先のディレクトリを返す。書類を1件も取得できなかった場合は None を返す。
+
+    Args:
+        stratify (list[str], optional): 層の指定 (STRATA_KEYS のキー)。
+        workers (int): 並行してダウンロードする書類数。
+        rate (float): 1秒あたりのリクエスト数の上限。
+        file_format (str, optional): 'parquet' または 'csv'。省略時は pyarrow があれば 'parquet'。
+    """
+    documents = find_target_documents(target_data_product, limit=limit, stratify=stratify, seed=seed)
+    if not documents:
+        return None
+    file_format = file_format or ('parquet' if PARQUET_AVAILABLE else 'csv')
+    if file_format == 'parquet' and not PARQUET_AVAILABLE:
+        logger.warning("pyarrow is not installed. Saving the dataset as CSV instead.")
+        file_format = 'csv'
+
+    output_dir = os.path.join(save_dir, f"{target_data_product}_dataset")
+    # 前回の実行のファイルが混ざらないよう、新しい一時ディレクトリに書き出してから output_dir と置き換える
+    work_dir = f"{output_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    writer = SampleWriter(work_dir, file_format=file_format, rows_per_file=rows_per_file,
+                          max_buffered_rows=max_buffered_rows)
+    rate_limiter = RateLimiter(rate)
+    logger.info("Found %s documents to process. Starting download with %s workers (%.1f requests/s)...",
+                len(documents), workers, rate)
+
+    try:
+        n_saved = _download_documents(documents, writer, workers, rate_limiter)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    if n_saved == 0:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.info("No data was successfully processed.")
+        return None
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(work_dir, output_dir)
+    logger.info("Successfully created dataset with %s rows from %s documents (%s files).", writer.n_rows, n_saved, writer.n_files)
+    logger.info("Saved to: %s", os.path.abspath(output_dir))
+    return output_dir
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Build a sample XBRL CSV dataset for a data product.')
+    arg_parser.add_argument('data_product', choices=list(DATA_PRODUCT_DEFINITIONS.keys()), help='データプロダクト名')
+    arg_parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='取得する書類数')
+    arg_parser.add_argument('--stratify', nargs='+', choices=list(STRATA_KEYS.keys()),
+                            help='層ごとに均等に無作為抽出する (例: --stratify year formCode)')
+    arg_parser.add_argument('--workers', type=int, default=WORKERS, help='並行してダウンロードする書類数')
+    arg_parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help='1秒あたりのリクエスト数の上限')
+    arg_parser.add_argument('--format', choices=['parquet', 'csv'], help='出力形式 (省略時は pyarrow があれば parquet)')
+    arg_parser.add_argument('--rows-per-file', type=int, default=ROWS_PER_FILE, help='1ファイルあたりの最大行数')
+    arg_parser.add_argument('--max-buffered-rows', type=int, default=MAX_BUFFERED_ROWS,
+                            help='全パーティションでメモリにためる行数の上限')
+    arg_parser.add_argument('--output-dir', default=SAVE_DIR, help='保存先のディレクトリ')
+    arg_parser.add_argument('--seed', type=int, default=0, help='無作為抽出の乱数シード')
+    args = arg_parser.parse_args()
+
+    output_dir = build_sample_dataset(
+        args.data_product, limit=args.limit, stratify=args.stratify, workers=args.workers, rate=args.rate,
+        file_format=args.format, rows_per_file=args.rows_per_file, max_buffered_rows=args.max_buffered_rows,
+        save_dir=args.output_dir, seed=args.seed,
+    )
+    if output_dir is None:
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    setup_logging()
+    main()
@@ -0,0 +1,212 @@
+"""
+大量保有の推移 (LargeVolumeHoldingTimeline)
+
+LargeVolumeHoldingReport には大量保有報告書・変更報告書・訂正報告書の提出者 (member) ごとの保有割合が書類単位で保存されている。
+このモジュールは、発行者 (issuerSecurityCode) と保有者 (holderKey) の組み合わせごとに、報告義務発生日 (effectiveDate) 時点の
+保有割合を1行とし、次の報告の報告義務発生日 (validTo) までを有効期間とする推移を LargeVolumeHoldingTimeline に保持する。
+
+- 保有者は holderEdinetCode で識別し、EDINETコードのない保有者 (個人など) は名称で識別する (holderKey)。
+- 同じ発行者・保有者・報告義務発生日の報告が複数ある場合 (訂正報告書など) は、最後に提出されたもの
+  (dateFile, submissionCount, docId の順) を有効とする。
+- 最新の報告は validTo が NULL の行となる。5% を下回った変更報告書も最新の報告として残り、保有割合で除外する。
+
+LargeVolumeHoldingReport への保存時 (database_manager.save_data) に、保存された書類の発行者の推移のみを読み込んで更新する。
+「X社の現在の大量保有者」は (issuerSecurityCode, validTo) の索引による検索となる。
+
+使い方:
+    python large_holding_timeline.py --rebuild               # LargeVolumeHoldingReport の全件から作成し直す
+    python large_holding_timeline.py 72030                   # 現在の大量保有者を表示する
+    python large_holding_timeline.py 72030 --as-of 2024-03-31
+"""
+import argparse
+import datetime
+import logging
+
+import pandas as pd
+from sqlalchemy import (Boolean, Column, Date, Index, Integer, MetaData, Numeric, String, Table, Unicode, UnicodeText,
+                        bindparam, delete, insert, or_, select)
+
+import database_manager
+import metrics
+from config import LARGE_HOLDING_TIMELINE_TABLE_NAME
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+SOURCE_TABLE_NAME = 'LargeVolumeHoldingReport'
+# 大量保有報告書の提出が必要となる保有割合
+LARGE_HOLDING_THRESHOLD = 0.05
+# 推移の1行とする列 (LargeVolumeHoldingReport の列名)
+SOURCE_COLUMNS = [
+    'docId', 'member', 'dateFile', 'obligationDate', 'baseDate', 'isAmendment', 'submissionCount',
+    'issuerSecurityCode', 'issuerName', 'holderEdinetCode', 'holderName', 'holdingPurpose',
+    'totalOutstandingShares', 'totalSharesHeld', 'holdingRatio', 'previousHoldingRatio',
+]
+
+# sql/create_table_large_volume_holding_timeline.sql と同じ定義 (テーブルが存在しない場合はこの定義から作成する)
+_metadata = MetaData()
+timeline_table = Table(
+    LARGE_HOLDING_TIMELINE_TABLE_NAME, _metadata,
+    Column('issuerSecurityCode', String(5), primary_key=True),
+    Column('holderKey', Unicode(255), primary_key=True),
+    Column('effectiveDate', Date, primary_key=True),
+    Column('validTo', Date),
+    Column('holderEdinetCode', String(6)),
+    Column('holderName', UnicodeText),
+    Column('issuerName', UnicodeText),
+    Column('docId', String(8), nullable=False),
+    Column('member', Integer, nullable=False),
+    Column('dateFile', Date),
+    Column('submissionCount', Integer),
+    Column('isAmendment', Boolean),
+    Column('holdingRatio', Numeric(8, 5)),
+    Column('previousHoldingRatio', Numeric(8, 5)),
+    Column('totalSharesHeld', Numeric(20, 0)),
+    Column('totalOutstandingShares', Numeric(20, 0)),
+    Column('holdingPurpose', UnicodeText),
+    # 発行者の現在 (validTo IS NULL) または指定日時点の保有者、保有者ごとの保有銘柄の検索用
+    Index('IX_LargeVolumeHoldingTimeline_issuer_validTo', 'issuerSecurityCode', 'validTo'),
+    Index('IX_LargeVolumeHoldingTimeline_holderKey_validTo', 'holderKey', 'validTo'),
+)
+TIMELINE_COLUMNS = [c.name for c in timeline_table.columns]
+KEY_COLUMNS = ['issuerSecurityCode', 'holderKey', 'effectiveDate']
+
+
+# --- 推移の作成 ---
+def _to_date(series: pd.Series) -> pd.Series:
+    return pd.to_datetime(series, errors='coerce').dt.date
+
+
+def to_timeline_rows(reports: pd.DataFrame) -> pd.DataFrame:
+    """LargeVolumeHoldingReport の行を推移の形式に変換する (発行者の証券コードがない行は除く)。"""
+    rows = reports.reindex(columns=SOURCE_COLUMNS).copy()
+    rows['issuerSecurityCode'] = rows['issuerSecurityCode'].astype('string').str.strip()
+    rows = rows[rows['issuerSecurityCode'].fillna('') != '']
+    for col in ('dateFile', 'obligationDate', 'baseDate'):
+        rows[col] = _to_date(rows[col])
+    for col in ('holdingRatio', 'previousHoldingRatio', 'totalSharesHeld', 'totalOutstandingShares', 'submissionCount'):
+        rows[col] = pd.to_numeric(rows[col], errors='coerce')
+    # isAmendment は CSV の 'true' / 'false'、DBの 0 / 1 のいずれの場合もある
+    rows['isAmendment'] = rows['isAmendment'].map(
+        lambda v: None if v is None or pd.isna(v) else str(v).strip().lower() in ('true', '1', '1.0'))
+    holder_name = rows['holderName'].astype('string').str.strip()
+    holder_code = rows['holderEdinetCode'].astype('string').str.strip().replace('', pd.NA)
+    rows['holderKey'] = holder_code.fillna(holder_name).str.slice(0, 255)
+    rows['effectiveDate'] = rows['obligationDate'].fillna(rows['baseDate']).fillna(rows['dateFile'])
+    rows = rows.dropna(subset=['holderKey', 'effectiveDate'])
+    rows['holderEdinetCode'] = holder_code
+    rows['holderName'] = holder_name
+    rows['validTo'] = None
+    return rows[TIMELINE_COLUMNS]
+
+
+def resolve_timeline(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    推移の行から、同じ発行者・保有者・報告義務発生日の最後に提出された報告のみを残し、validTo を設定する。
+    既存の推移の行と新しく保存された報告の行をまとめて渡すと、保存の順序によらず同じ結果となる。
+    """
+    if rows.empty:
+        return rows
+    rows = rows.assign(_submissionCount=rows['submissionCount'].fillna(0), _dateFile=rows['dateFile'].fillna(datetime.date.min))
+    rows = (rows.sort_values(['_dateFile', '_submissionCount', 'docId', 'member'])
+            .drop_duplicates(KEY_COLUMNS, keep='last')
+            .sort_values(KEY_COLUMNS))
+    rows['validTo'] = rows.groupby(['issuerSecurityCode', 'holderKey'])['effectiveDate'].shift(-1)
+    return rows[TIMELINE_COLUMNS].reset_index(drop=True)
+
+
+def _to_records(rows: pd.DataFrame) -> list[dict]:
+    return rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+
+# --- DBの読み書き ---
+def _read_timeline(connection, issuer_codes) -> pd.DataFrame:
+    stmt = select(timeline_table).where(timeline_table.c.issuerSecurityCode.in_(sorted(issuer_codes)))
+    return pd.DataFrame(connection.execute(stmt).all(), columns=TIMELINE_COLUMNS)
+
+
+def update_timeline(connection, df: pd.DataFrame):
+    """
+    LargeVolumeHoldingReport の保存時フック。保存された報告の発行者・保有者の推移を更新する。
+    database_manager.save_data から、保存と同じトランザクションの中で呼び出される。
+    """
+    new_rows = to_timeline_rows(df)
+    if new_rows.empty:
+        return
+    timeline_table.create(connection, checkfirst=True)
+    pairs = new_rows[['issuerSecurityCode', 'holderKey']].drop_duplicates()
+    existing = _read_timeline(connection, pairs['issuerSecurityCode'].unique())
+    existing = existing.merge(pairs, on=['issuerSecurityCode', 'holderKey'])
+    frames = [frame for frame in (existing, new_rows) if not frame.empty]
+    resolved = resolve_timeline(pd.concat(frames, ignore_index=True))
+
+    connection.execute(
+        delete(timeline_table).where(timeline_table.c.issuerSecurityCode == bindparam('issuer'),
+                                     timeline_table.c.holderKey == bindparam('holder')),
+        [{'issuer': issuer, 'holder': holder} for issuer, holder in pairs.itertuples(index=False, name=None)],
+    )
+    connection.execute(insert(timeline_table), _to_records(resolved))
+    metrics.inc('rows', len(new_rows), stage='holding_timeline', product=SOURCE_TABLE_NAME)
+    logger.debug("Updated holding timeline for %s issuer/holder pairs.", len(pairs))
+
+
+database_manager.add_post_save_hook(SOURCE_TABLE_NAME, update_timeline)
+
+
+def rebuild() -> int:
+    """LargeVolumeHoldingReport の全件から推移を作成し直す。保存した件数を返す。"""
+    with database_manager.engine.begin() as connection:
+        timeline_table.create(connection, checkfirst=True)
+        reports = pd.read_sql_table(SOURCE_TABLE_NAME, connection, columns=SOURCE_COLUMNS)
+        resolved = resolve_timeline(to_timeline_rows(reports))
+        connection.execute(delete(timeline_table))
+        if not resolved.empty:
+            connection.execute(insert(timeline_table), _to_records(resolved))
+    logger.info("Rebuilt holding timeline: %s rows for %s issuers.", len(resolved),
+                resolved['issuerSecurityCode'].nunique() if not resolved.empty else 0)
+    return len(resolved)
+
+
+def get_holdings(sec_code: str, as_of: datetime.date | None = None,
+                 min_ratio: float | None = LARGE_HOLDING_THRESHOLD) -> pd.DataFrame:
+    """
+    発行者の大量保有者を保有割合の大きい順に返す。
+
+    Args:
+        sec_code (str): 発行者の証券コード (5桁)。
+        as_of (datetime.date, optional): この日時点の保有状況を返す (省略時は最新の報告)。
+        min_ratio (float, optional): この保有割合以上の保有者のみを返す (None の場合はすべて)。
+    """
+    stmt = select(timeline_table).where(timeline_table.c.issuerSecurityCode == sec_code)
+    if as_of is None:
+        stmt = stmt.where(timeline_table.c.validTo.is_(None))
+    else:
+        stmt = stmt.where(timeline_table.c.effectiveDate <= as_of,
+                          or_(timeline_table.c.validTo.is_(None), timeline_table.c.validTo > as_of))
+    if min_ratio is not None:
+        stmt = stmt.where(timeline_table.c.holdingRatio >= min_ratio)
+    stmt = stmt.order_by(timeline_table.c.holdingRatio.desc())
+    with database_manager.engine.connect() as connection:
+        if not database_manager.engine.dialect.has_table(connection, LARGE_HOLDING_TIMELINE_TABLE_NAME):
+            return pd.DataFrame(columns=TIMELINE_COLUMNS)
+        return pd.read_sql(stmt, connection)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Maintain and query the large volume holding timeline.')
+    arg_parser.add_argument('sec_code', nargs='?', help='発行者の証券コード (5桁)')
+    arg_parser.add_argument('--as-of', type=datetime.date.fromisoformat, help='この日時点の保有状況を表示する (YYYY-MM-DD)')
+    arg_parser.add_argument('--all', action='store_true', help='5%% 未満となった保有者も表示する')
+    arg_parser.add_argument('--rebuild', action='store_true', help='LargeVolumeHoldingReport から推移を作成し直す')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    if args.rebuild:
+        rebuild()
+    if args.sec_code:
+        result = get_holdings(args.sec_code, args.as_of, None if args.all else LARGE_HOLDING_THRESHOLD)
+        with pd.option_context('display.max_rows', 200, 'display.max_columns', None, 'display.width', 200):
+            print(result[['holderKey', 'holderName', 'holdingRatio', 'effectiveDate', 'validTo', 'docId', 'dateFile']])
+    elif not args.rebuild:
+        arg_parser.error('sec_code or --rebuild is required.')
@@ -0,0 +1,63 @@
+"""
+ログ出力の設定モジュール
+
+各モジュールは `logger = logging.getLogger(__name__)` でロガーを取得し、メッセージは
+`logger.info("Upserted %d records to %s.", n, table)` のように遅延フォーマットで渡す。
+実行スクリプトの起動時に setup_logging() を1回呼び出して、出力先とレベルを設定する。
+
+環境変数:
+    EDINET_LOG_LEVEL    全体のログレベル (デフォルト: INFO)
+    EDINET_LOG_LEVELS   モジュールごとのログレベル。例: "parsers=DEBUG,matching=WARNING"
+    EDINET_LOG_FILE     指定した場合、標準エラー出力に加えてファイルにも出力する
+"""
+import logging
+import os
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_LEVEL = 'INFO'
+
+
+def _parse_module_levels(spec: str) -> dict:
+    """"parsers=DEBUG,matching=WARNING" 形式の文字列を {モジュール名: レベル} の辞書に変換する。"""
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str | None = None, module_levels: dict | None = None, log_file: str | None = None):
+    """
+    ルートロガーにハンドラーを設定し、全体とモジュールごとのログレベルを適用する。
+    引数を省略した場合は環境変数の値を使う。複数回呼び出しても、ハンドラーは重複して追加されない。
+
+    Args:
+        level (str, optional): 全体のログレベル ('DEBUG', 'INFO' など)。
+        module_levels (dict, optional): {ロガー名: レベル} の辞書。環境変数の設定より優先する。
+        log_file (str, optional): ログを追記するファイルのパス。
+    """
+    level = (level or os.getenv('EDINET_LOG_LEVEL', DEFAULT_LEVEL)).upper()
+    levels = _parse_module_levels(os.getenv('EDINET_LOG_LEVELS', ''))
+    levels.update(module_levels or {})
+    log_file = log_file or os.getenv('EDINET_LOG_FILE')
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    if not any(getattr(h, '_edinet_handler', False) for h in root.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        handler._edinet_handler = True
+        root.addHandler(handler)
+        if log_file:
+            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            file_handler._edinet_handler = True
+            root.addHandler(file_handler)
+
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
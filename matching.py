@@ -1,14 +1,33 @@
 """
 名寄せの具体的なロジックを担うモジュール
 """
+import logging
 import pandas as pd
 import re
 import zenhan
 import html
 import database_manager # インポートを追加
+import metrics
 from rapidfuzz import process, fuzz
 from tqdm import tqdm
 
+logger = logging.getLogger(__name__)
+
+# 手動マッピング辞書のファイルパス
+MANUAL_MAPPING_PATH = 'mapping.csv'
+
+# ホールディングスの派生パターン
+HD_SUFFIXES = [
+    'ホールディングス',
+    'グループホールディングス',
+    'フィナンシャルホールディングス',
+    'グローバルホールディングス',
+    'hd',
+    'hds',
+    'ghd',
+    'fhd'
+]
+
 def _normalize_name(name: str) -> str:
     """企業名・株主名の表記揺れを吸収するための正規化処理"""
     if not isinstance(name, str):
@@ -64,22 +83,30 @@ def create_name_code_master() -> pd.DataFrame:
     """
     DocumentMetadataテーブルから、名寄せのマスターデータを作成する。
     """
-    print("Creating name-code master list...")
+    logger.info("Creating name-code master list...")
     
     # 1. DBから元データを取得
     raw_master_df = database_manager.get_name_code_master_data()
     if raw_master_df.empty:
-        print("Warning: Could not retrieve data for name master.")
+        logger.warning("Could not retrieve data for name master.")
         return pd.DataFrame()
 
-    # 2. edinetCodeがない、またはfilerNameが文字列でない行を除外
-    raw_master_df.dropna(subset=['edinetCode'], inplace=True)
-    raw_master_df = raw_master_df[raw_master_df['filerName'].apply(isinstance, args=(str,))]
+    master_map = build_name_code_master(raw_master_df)
+    logger.info("Finished creating name-code master list. %s unique names found.", len(master_map))
+    return master_map
+
+def build_name_code_master(raw_master_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    (filerName, edinetCode, secCode) の一覧から、名寄せマスター (normalizedName -> edinetCode, secCode) を構築する。
+    """
+    # 1. edinetCodeがない、またはfilerNameが文字列でない行を除外
+    raw_master_df = raw_master_df.dropna(subset=['edinetCode'])
+    raw_master_df = raw_master_df[raw_master_df['filerName'].apply(isinstance, args=(str,))].copy()
 
-    # 3. 正規化された名前カラムを追加
+    # 2. 正規化された名前カラムを追加
     raw_master_df['normalizedName'] = raw_master_df['filerName'].apply(_normalize_name)
 
-    # 4. 過去の名称も利用できるように、edinetCodeでの重複排除を緩める
+    # 3. 過去の名称も利用できるように、edinetCodeでの重複排除を緩める
     # まず、正規化名とedinetCodeの組み合わせで重複を削除
     master_df = raw_master_df.drop_duplicates(subset=['normalizedName', 'edinetCode']).copy()
 
@@ -87,134 +114,239 @@ def create_name_code_master() -> pd.DataFrame:
     master_df.sort_values(by='secCode', ascending=False, na_position='last', inplace=True)
     master_df.drop_duplicates(subset=['normalizedName'], keep='first', inplace=True)
 
-    # 5. 最終的なマスターを作成 (normalizedName -> edinetCode, secCode)
-    master_map = master_df.set_index('normalizedName')[['edinetCode', 'secCode']]
-    
-    print(f"Finished creating name-code master list. {len(master_map)} unique names found.")
-    return master_map
+    # 4. 最終的なマスターを作成 (normalizedName -> edinetCode, secCode)
+    return master_df.set_index('normalizedName')[['edinetCode', 'secCode']]
 
-def match_names(names_to_match: pd.Series, master: pd.DataFrame, score_cutoff: int = 85) -> pd.DataFrame:
-    """
-    与えられた名称のリストをマスターと照合し、EDINETコードなどを返す (最終ハイブリッド戦略)。
-    1. 全ての名称を正規化する。
-    2. 正規化後の名称をキーとして手動マッピング辞書を適用し、処理対象の名称を決定する。
-    3. 処理対象の名称に対して、完全一致・あいまい検索の自動処理を適用する。
-    """
-    print(f"--- Starting Hybrid Matching Process for {len(names_to_match)} total records ---")
-
-    # --- 1. 手動マッピング辞書の読み込み ---
+def load_manual_mapping(path: str = MANUAL_MAPPING_PATH) -> dict:
+    """手動マッピング辞書 (normalized_name -> correct_name) を読み込む。"""
     try:
-        manual_map_df = pd.read_csv('mapping.csv', dtype=str)
+        manual_map_df = pd.read_csv(path, dtype=str)
         # キーをnormalized_nameに変更
         correction_dict = pd.Series(manual_map_df.correct_name.values, index=manual_map_df.normalized_name).to_dict()
-        print(f"Loaded {len(correction_dict)} entries from manual mapping file.")
+        logger.info("Loaded %s entries from manual mapping file.", len(correction_dict))
     except FileNotFoundError:
         correction_dict = {}
-        print("Warning: mapping.csv not found. Proceeding without manual mapping.")
+        logger.warning("%s not found. Proceeding without manual mapping.", path)
+    return correction_dict
 
-    # --- 2. 名称の正規化と手動マッピングの適用 ---
+def _prepare_lookup_keys(names_to_match: pd.Series, correction_dict: dict) -> pd.DataFrame:
+    """ユニークな名称を正規化し、手動マッピングを適用したルックアップキーを付与する。"""
     # ユニークなオリジナル名で処理を進める
     process_df = pd.DataFrame({'originalName': names_to_match.dropna().unique()})
     # 全ての名称をまず正規化
     process_df['normalizedName'] = process_df['originalName'].apply(_normalize_name)
     # 正規化後の名称に手動マッピングを適用した結果を、そのままルックアップキーとして使用
     process_df['lookupKey'] = process_df['normalizedName'].map(correction_dict).fillna(process_df['normalizedName'])
+    return process_df
 
-    # --- 3. 自動マッチングの実行 ---
-    unique_lookup_keys = process_df['lookupKey'].unique()
-    print(f"Performing automatic matching for {len(unique_lookup_keys)} unique lookup keys...")
-
-    # 完全一致
+def _match_exact(unique_lookup_keys, master: pd.DataFrame) -> pd.DataFrame:
+    """ルックアップキーとマスターの完全一致で照合する。"""
     results_df = master.reindex(unique_lookup_keys)
     results_df.rename(columns={'edinetCode': 'matchedEdinetCode', 'secCode': 'matchedSecCode'}, inplace=True)
     results_df.index.name = 'lookupKey'
     results_df.reset_index(inplace=True)
+    return results_df
 
-    # --- 3-2. 「ホールディングス」サフィックス検索 ---
-    # 完全一致でマッチしなかったもののうち、ホールディングス系の略称である可能性を考慮
+def _match_holdings(results_df: pd.DataFrame, master: pd.DataFrame) -> int:
+    """
+    完全一致でマッチしなかったもののうち、ホールディングス系の略称である可能性を考慮して照合する。
+    results_df を直接更新し、マッチした件数を返す。
+    """
     unmatched_for_hd_check = results_df[results_df['matchedEdinetCode'].isnull()]
-    if not unmatched_for_hd_check.empty:
-        print(f"Performing Holdings suffix check for {len(unmatched_for_hd_check)} unmatched records...")
-        
-        master_keys = master.index
-        
-        # ホールディングスの派生パターンを定義
-        hd_suffixes = [
-            'ホールディングス',
-            'グループホールディングス',
-            'フィナンシャルホールディングス',
-            'グローバルホールディングス',
-            'hd',
-            'hds',
-            'ghd',
-            'fhd'
-        ]
-        
-        # 見つかったマッチを一時的に保存する辞書
-        hd_matches = {}
-
-        # マッチしなかったlookupKeyごとにループ
-        for index, row in unmatched_for_hd_check.iterrows():
-            lookup_key = row['lookupKey']
-            if not lookup_key or not isinstance(lookup_key, str):
-                continue
+    if unmatched_for_hd_check.empty:
+        return 0
 
-            # 派生パターンを試す
-            potential_matches = []
-            for suffix in hd_suffixes:
-                potential_key = lookup_key + suffix
-                if potential_key in master_keys:
-                    potential_matches.append(potential_key)
-            
-            # ユニークなマッチが1件だけ見つかった場合のみ採用
-            if len(potential_matches) == 1:
-                matched_key = potential_matches[0]
-                matched_codes = master.loc[matched_key]
-                hd_matches[index] = {
-                    'matchedEdinetCode': matched_codes['edinetCode'],
-                    'matchedSecCode': matched_codes['secCode']
-                }
-
-        # 見つかったマッチをresults_dfに反映
-        if hd_matches:
-            print(f"Found {len(hd_matches)} matches via Holdings suffix check.")
-            for idx, match_data in hd_matches.items():
-                results_df.loc[idx, ['matchedEdinetCode', 'matchedSecCode']] = match_data.values()
+    logger.info("Performing Holdings suffix check for %s unmatched records...", len(unmatched_for_hd_check))
+    master_keys = master.index
 
-    # あいまい検索 (ホールディングス検索後)
-    unmatched_df = results_df[results_df['matchedEdinetCode'].isnull()] # 再度未マッチを取得
-    if not unmatched_df.empty:
-        print(f"{len(unmatched_df)} names still unmatched. Applying fuzzy matching...")
-        master_choices = master.index.tolist()
-        fuzzy_matches = {}
-        for index, row in tqdm(unmatched_df.iterrows(), total=unmatched_df.shape[0], desc="Fuzzy Matching"):
-            lookup_key = row['lookupKey']
-            if not lookup_key: continue
-            
-            best_candidate = process.extractOne(lookup_key, master_choices, scorer=fuzz.token_set_ratio)
-            if best_candidate and best_candidate[1] >= score_cutoff:
-                candidate_name = best_candidate[0]
-                matched_codes = master.loc[candidate_name]
-                fuzzy_matches[index] = {
-                    'matchedEdinetCode': matched_codes['edinetCode'],
-                    'matchedSecCode': matched_codes['secCode']
-                }
-        
-        for idx, match_data in fuzzy_matches.items():
+    # 見つかったマッチを一時的に保存する辞書
+    hd_matches = {}
+
+    # マッチしなかったlookupKeyごとにループ
+    for index, row in unmatched_for_hd_check.iterrows():
+        lookup_key = row['lookupKey']
+        if not lookup_key or not isinstance(lookup_key, str):
+            continue
+
+        # 派生パターンを試す
+        potential_matches = []
+        for suffix in HD_SUFFIXES:
+            potential_key = lookup_key + suffix
+            if potential_key in master_keys:
+                potential_matches.append(potential_key)
+
+        # ユニークなマッチが1件だけ見つかった場合のみ採用
+        if len(potential_matches) == 1:
+            matched_key = potential_matches[0]
+            matched_codes = master.loc[matched_key]
+            hd_matches[index] = {
+                'matchedEdinetCode': matched_codes['edinetCode'],
+                'matchedSecCode': matched_codes['secCode']
+            }
+
+    # 見つかったマッチをresults_dfに反映
+    if hd_matches:
+        logger.info("Found %s matches via Holdings suffix check.", len(hd_matches))
+        for idx, match_data in hd_matches.items():
             results_df.loc[idx, ['matchedEdinetCode', 'matchedSecCode']] = match_data.values()
+    return len(hd_matches)
+
+def _match_fuzzy(results_df: pd.DataFrame, master: pd.DataFrame, score_cutoff: int, limit: int | None = None) -> int:
+    """
+    未マッチの名称に対してあいまい検索を行う。results_df を直接更新し、マッチした件数を返す。
+    limitを指定した場合は、未マッチの先頭limit件のみを対象とする (ベンチマーク用)。
+    """
+    unmatched_df = results_df[results_df['matchedEdinetCode'].isnull()] # 再度未マッチを取得
+    if unmatched_df.empty:
+        return 0
+    if limit is not None:
+        unmatched_df = unmatched_df.head(limit)
+
+    logger.info("%s names still unmatched. Applying fuzzy matching...", len(unmatched_df))
+    master_choices = master.index.tolist()
+    fuzzy_matches = {}
+    for index, row in tqdm(unmatched_df.iterrows(), total=unmatched_df.shape[0], desc="Fuzzy Matching"):
+        lookup_key = row['lookupKey']
+        if not lookup_key: continue
+
+        best_candidate = process.extractOne(lookup_key, master_choices, scorer=fuzz.token_set_ratio)
+        if best_candidate and best_candidate[1] >= score_cutoff:
+            candidate_name = best_candidate[0]
+            matched_codes = master.loc[candidate_name]
+            fuzzy_matches[index] = {
+                'matchedEdinetCode': matched_codes['edinetCode'],
+                'matchedSecCode': matched_codes['secCode']
+            }
+
+    for idx, match_data in fuzzy_matches.items():
+        results_df.loc[idx, ['matchedEdinetCode', 'matchedSecCode']] = match_data.values()
+    return len(fuzzy_matches)
+
+def match_names(names_to_match: pd.Series, master: pd.DataFrame, score_cutoff: int = 85, correction_dict: dict | None = None) -> pd.DataFrame:
+    """
+    与えられた名称のリストをマスターと照合し、EDINETコードなどを返す (最終ハイブリッド戦略)。
+    1. 全ての名称を正規化する。
+    2. 正規化後の名称をキーとして手動マッピング辞書を適用し、処理対象の名称を決定する。
+    3. 処理対象の名称に対して、完全一致・あいまい検索の自動処理を適用する。
+
+    correction_dictを省略した場合は、mapping.csvから手動マッピング辞書を読み込む。
+    """
+    logger.info("--- Starting Hybrid Matching Process for %s total records ---", len(names_to_match))
+
+    # --- 1. 手動マッピング辞書の読み込み ---
+    if correction_dict is None:
+        correction_dict = load_manual_mapping()
+
+    # --- 2. 名称の正規化と手動マッピングの適用 ---
+    with metrics.timer('match_normalize'):
+        process_df = _prepare_lookup_keys(names_to_match, correction_dict)
+
+    # --- 3. 自動マッチングの実行 ---
+    unique_lookup_keys = process_df['lookupKey'].unique()
+    logger.info("Performing automatic matching for %s unique lookup keys...", len(unique_lookup_keys))
+
+    # 完全一致
+    with metrics.timer('match_exact'):
+        results_df = _match_exact(unique_lookup_keys, master)
+
+    # 「ホールディングス」サフィックス検索
+    with metrics.timer('match_holdings'):
+        _match_holdings(results_df, master)
+
+    # あいまい検索 (ホールディングス検索後)
+    with metrics.timer('match_fuzzy'):
+        _match_fuzzy(results_df, master, score_cutoff)
 
     # --- 4. 結果の結合 ---
     # process_df (originalName <-> lookupKey) に自動マッチング結果を結合
     final_process_df = pd.merge(process_df, results_df[['lookupKey', 'matchedEdinetCode', 'matchedSecCode']], on='lookupKey', how='left')
 
-    print("--- Debug: final_process_df for '㈱高島屋' ---")
-    print(final_process_df[final_process_df['originalName'] == '㈱高島屋'])
-    print("-------------------------------------------------")
-
     # 最終的に、元の（重複ありの）リストに結果をマージして返す
     final_df = pd.merge(names_to_match.to_frame('originalName'), final_process_df, on='originalName', how='left')
 
     matched_count = final_df['matchedEdinetCode'].notna().sum()
-    print(f"--- Finished Matching. Total matched: {matched_count} of {len(names_to_match)} records. ---")
+    metrics.inc('rows', len(names_to_match), stage='match')
+    metrics.inc('matched', int(matched_count), stage='match')
+    logger.info("--- Finished Matching. Total matched: %s of %s records. ---", matched_count, len(names_to_match))
     
     return final_df[['originalName', 'matchedEdinetCode', 'matchedSecCode']]
+
+def diff_manual_mapping(old_mapping: dict, new_mapping: dict) -> set:
+    """新旧の手動マッピング辞書を比較し、追加・削除・変更された normalized_name のセットを返す。"""
+    all_keys = set(old_mapping) | set(new_mapping)
+    return {key for key in all_keys if old_mapping.get(key) != new_mapping.get(key)}
+
+def diff_master(old_master: pd.DataFrame, new_master: pd.DataFrame) -> tuple[set, set, list]:
+    """
+    新旧の名寄せマスター (normalizedName -> edinetCode, secCode) を比較する。
+
+    Returns:
+        tuple: (変更されたキーのセット, 変更前に紐づいていたedinetCodeのセット, 追加されたキーのリスト)
+    """
+    merged = old_master[['edinetCode', 'secCode']].join(
+        new_master[['edinetCode', 'secCode']], how='outer', lsuffix='_old', rsuffix='_new'
+    )
+    changed_mask = (
+        (merged['edinetCode_old'].fillna('') != merged['edinetCode_new'].fillna('')) |
+        (merged['secCode_old'].fillna('') != merged['secCode_new'].fillna(''))
+    )
+    changed_keys = set(merged.index[changed_mask])
+    changed_codes = set(merged.loc[changed_mask, 'edinetCode_old'].dropna())
+    added_keys = [key for key in merged.index[changed_mask] if key not in old_master.index]
+    return changed_keys, changed_codes, added_keys
+
+def find_affected_names(stored_names: pd.DataFrame, name_column: str,
+                        old_mapping: dict, new_mapping: dict,
+                        old_master: pd.DataFrame, new_master: pd.DataFrame,
+                        score_cutoff: int = 85) -> list:
+    """
+    既に名寄せ済みの名称のうち、手動マッピングまたはマスターの変更によって結果が変わりうるものを抽出する。
+
+    Args:
+        stored_names (pd.DataFrame): 名寄せ済みテーブルのユニークな (name_column, matchedEdinetCode)
+        name_column (str): 名称カラム名
+        old_mapping, new_mapping (dict): 前回・今回の手動マッピング辞書
+        old_master, new_master (pd.DataFrame): 前回・今回の名寄せマスター
+        score_cutoff (int): あいまい検索のスコア閾値
+
+    Returns:
+        list: 再名寄せが必要な名称のリスト
+    """
+    changed_mapping_keys = diff_manual_mapping(old_mapping, new_mapping)
+    changed_master_keys, changed_codes, added_keys = diff_master(old_master, new_master)
+    logger.info("Detected %s changed mapping entries and %s changed master entries.", len(changed_mapping_keys), len(changed_master_keys))
+
+    if not changed_mapping_keys and not changed_master_keys:
+        return []
+
+    names_df = stored_names.dropna(subset=[name_column]).drop_duplicates(subset=[name_column]).copy()
+    names_df['normalizedName'] = names_df[name_column].apply(_normalize_name)
+    names_df['oldLookupKey'] = names_df['normalizedName'].map(old_mapping).fillna(names_df['normalizedName'])
+    names_df['newLookupKey'] = names_df['normalizedName'].map(new_mapping).fillna(names_df['normalizedName'])
+
+    affected_mask = (
+        names_df['normalizedName'].isin(changed_mapping_keys) |
+        names_df['oldLookupKey'].isin(changed_master_keys) |
+        names_df['newLookupKey'].isin(changed_master_keys) |
+        names_df['matchedEdinetCode'].isin(changed_codes)
+    )
+
+    # 未マッチの名称と、ホールディングス検索・あいまい検索でマッチした名称 (前回のマスターに完全一致するキーがない名称) は、
+    # 新しく追加されたマスターのキー (新規上場の会社など) にのみ照合して再評価の要否を判定する。
+    # 完全一致のキー・より近い候補・2件目のホールディングスの候補が追加された場合に結果が変わりうるため。
+    # Enriched テーブルの matchMethod は常に 'exact' で保存されているため、前回のマスターから判定する
+    if added_keys:
+        added_key_set = set(added_keys)
+        matched_by_search = names_df['matchedEdinetCode'].notna() & ~names_df['oldLookupKey'].isin(old_master.index)
+        candidates = names_df[~affected_mask & (names_df['matchedEdinetCode'].isna() | matched_by_search)]
+        for index, lookup_key in candidates['newLookupKey'].items():
+            if not lookup_key:
+                continue
+            if lookup_key in added_key_set or any(lookup_key + suffix in added_key_set for suffix in HD_SUFFIXES):
+                affected_mask.loc[index] = True
+            elif process.extractOne(lookup_key, added_keys, scorer=fuzz.token_set_ratio, score_cutoff=score_cutoff):
+                affected_mask.loc[index] = True
+
+    affected_names = names_df.loc[affected_mask, name_column].tolist()
+    logger.info("Found %s names affected by the changes (out of %s stored names).", len(affected_names), len(names_df))
+    return affected_names
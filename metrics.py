@@ -0,0 +1,246 @@
+"""
+パイプラインの計測 (メトリクス) モジュール
+
+ステージ (HTTP取得, ZIP展開, CSV読み込み, 各パーサー, DB保存 など) ごとの処理時間と、
+バイト数・行数・エラー数のカウンターを、データプロダクトや formCode などのラベル付きで記録する。
+記録した値は実行サマリー (表形式 / JSON) と Prometheus のテキスト形式で出力できる。
+
+計測は環境変数 EDINET_METRICS=1 または enable() で有効になる。無効時の timer() は共有の
+nullcontext を返すだけなので、呼び出し側のオーバーヘッドは無視できる程度に抑えられる。
+add_stage_hook() で登録したフック (profiling.py など) は、計測の有効/無効に関わらずステージの開始・終了時に呼ばれる。
+
+使い方:
+    import metrics
+
+    with metrics.timer('parse', product='MajorShareholders', formCode='030000'):
+        df = parser_func(raw_df)
+    metrics.inc('rows', len(df), stage='parse', product='MajorShareholders')
+
+    metrics.print_summary()
+    metrics.write_reports('metrics')   # metrics/run_<timestamp>.json と .prom を出力
+"""
+import contextlib
+import datetime
+import json
+import logging
+import math
+import numbers
+import os
+import threading
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+METRIC_PREFIX = 'edinet'
+DEFAULT_OUTPUT_DIR = os.getenv('EDINET_METRICS_DIR', 'metrics')
+
+_enabled = os.getenv('EDINET_METRICS', '').lower() in ('1', 'true', 'yes', 'on')
+_lock = threading.Lock()
+# (stage, labels) -> [count, total_seconds, max_seconds]
+_timings = {}
+# (name, labels) -> value
+_counters = {}
+_NULL_CONTEXT = contextlib.nullcontext()
+# ステージの開始・終了を通知するフック (on_stage_enter(stage, labels) / on_stage_exit(stage, labels, seconds, failed) を持つオブジェクト)
+_stage_hooks = []
+
+
+def enable(flag: bool = True):
+    """計測の有効/無効を切り替える。"""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def add_stage_hook(hook):
+    """ステージの開始・終了時に呼び出すフックを登録する。"""
+    if hook not in _stage_hooks:
+        _stage_hooks.append(hook)
+
+
+def remove_stage_hook(hook):
+    if hook in _stage_hooks:
+        _stage_hooks.remove(hook)
+
+
+def _label_key(labels: dict) -> tuple:
+    """ラベルの辞書を、集計キーとして使えるソート済みタプルに変換する (値が None のラベルは除外)。"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def observe(stage: str, seconds: float, **labels):
+    """ステージの処理時間を1件記録する。"""
+    if not _enabled:
+        return
+    key = (stage, _label_key(labels))
+    with _lock:
+        entry = _timings.get(key)
+        if entry is None:
+            _timings[key] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+def inc(name: str, value: float = 1, **labels):
+    """カウンター (bytes, rows, errors など) を加算する。"""
+    if not _enabled:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _StageTimer:
+    """timer() が返すコンテキストマネージャー。例外で抜けた場合はエラー数も加算する。"""
+    __slots__ = ('stage', 'labels', 'start')
+
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        for hook in _stage_hooks:
+            hook.on_stage_enter(self.stage, self.labels)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        observe(self.stage, seconds, **self.labels)
+        if exc_type is not None:
+            inc('errors', stage=self.stage, **self.labels)
+        for hook in reversed(_stage_hooks):
+            hook.on_stage_exit(self.stage, self.labels, seconds, exc_type is not None)
+        return False
+
+
+def timer(stage: str, **labels):
+    """
+    with 文で囲んだ処理の時間を、ステージ名とラベルをキーに記録する。
+    計測が無効でフックも登録されていない場合は、何もしないコンテキストマネージャーを返す。
+    """
+    if not _enabled and not _stage_hooks:
+        return _NULL_CONTEXT
+    return _StageTimer(stage, labels)
+
+
+def reset():
+    """記録済みの値をすべて消去する。"""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def snapshot() -> dict:
+    """記録済みの値を、JSONに変換可能な辞書として返す。"""
+    with _lock:
+        timings = [
+            {'stage': stage, 'labels': dict(labels), 'count': count, 'total_s': total,
+             'mean_s': total / count if count else 0.0, 'max_s': max_s}
+            for (stage, labels), (count, total, max_s) in _timings.items()
+        ]
+        counters = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in _counters.items()
+        ]
+    return {'timings': timings, 'counters': counters}
+
+
+def summary_df() -> pd.DataFrame:
+    """ステージごとの処理時間を、合計時間の降順に並べたDataFrameとして返す。"""
+    timings = snapshot()['timings']
+    if not timings:
+        return pd.DataFrame(columns=['stage', 'labels', 'count', 'total_s', 'mean_s', 'max_s'])
+    df = pd.DataFrame(timings)
+    df['labels'] = df['labels'].map(lambda d: ', '.join(f'{k}={v}' for k, v in d.items()))
+    return df.sort_values('total_s', ascending=False).reset_index(drop=True)
+
+
+def print_summary():
+    """実行サマリーを表形式で表示する。"""
+    data = snapshot()
+    if not data['timings'] and not data['counters']:
+        logger.info("No metrics were recorded.")
+        return
+    print("\n--- Stage timings ---")
+    print(summary_df().to_string(index=False, float_format=lambda v: f'{v:.4f}'))
+    if data['counters']:
+        counters_df = pd.DataFrame(data['counters'])
+        counters_df['labels'] = counters_df['labels'].map(lambda d: ', '.join(f'{k}={v}' for k, v in d.items()))
+        print("\n--- Counters ---")
+        print(counters_df.sort_values(['name', 'labels']).to_string(index=False))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value) -> str:
+    """カウンターの値を、桁を丸めずに Prometheus の数値の形式にする (整数は整数のまま、小数は repr)。"""
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def to_prometheus() -> str:
+    """記録済みの値を Prometheus のテキスト形式 (exposition format) で返す。"""
+    with _lock:
+        timings = sorted(_timings.items())
+        counters = sorted(_counters.items())
+
+    name = f'{METRIC_PREFIX}_stage_duration_seconds'
+    lines = [f'# HELP {name} Time spent in each pipeline stage.', f'# TYPE {name} summary']
+    for (stage, labels), (count, total, _) in timings:
+        label_str = _format_labels((('stage', stage),) + labels)
+        lines.append(f'{name}_sum{label_str} {total:.6f}')
+        lines.append(f'{name}_count{label_str} {count}')
+    lines += [f'# HELP {name}_max Longest single observation of each pipeline stage.', f'# TYPE {name}_max gauge']
+    for (stage, labels), (_, _, max_s) in timings:
+        lines.append(f'{name}_max{_format_labels((("stage", stage),) + labels)} {max_s:.6f}')
+
+    for counter_name in sorted({n for (n, _), _ in counters}):
+        metric = f'{METRIC_PREFIX}_{counter_name}_total'
+        lines += [f'# HELP {metric} Total {counter_name} recorded by the pipeline.', f'# TYPE {metric} counter']
+        for (n, labels), value in counters:
+            if n == counter_name:
+                lines.append(f'{metric}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_reports(output_dir: str = DEFAULT_OUTPUT_DIR, run_id: str | None = None) -> tuple[str, str] | None:
+    """
+    実行サマリーのJSONと Prometheus テキストを output_dir に書き出し、それぞれのパスを返す。
+    計測が無効の場合は何もしない。
+    """
+    if not _enabled:
+        return None
+    run_id = run_id or datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, f'run_{run_id}.json')
+    prom_path = os.path.join(output_dir, f'run_{run_id}.prom')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'run_id': run_id, **snapshot()}, f, ensure_ascii=False, indent=2)
+    with open(prom_path, 'w', encoding='utf-8') as f:
+        f.write(to_prometheus())
+    logger.info("Metrics written to %s and %s", json_path, prom_path)
+    return json_path, prom_path
@@ -0,0 +1,401 @@
+"""
+DBスキーマのバージョン管理 (マイグレーション)
+
+sql/create_table_*.sql の内容を元にテーブルを作成し、検索で頻繁に使うクエリ向けの索引を追加する。
+適用済みのバージョンは SchemaVersion テーブルに記録し、未適用のマイグレーションのみを順に実行する。
+各マイグレーションは既存のテーブル・索引を確認してから作成するため、手動でSQLを実行済みのDBにも適用できる。
+
+マイグレーション:
+    1  baseline                 sql/create_table_*.sql のテーブル (主キー付き) を作成し、DocumentFormMaster の初期データを登録する
+    2  document_query_indexes   DocumentMetadata の検索 (書類種別・docID・edinetCode) 向けのカバリング索引を作成する
+    3  major_shareholder_changes  大株主の変化 (MajorShareholderChanges) のテーブルと MajorShareholders の索引を作成する
+    4  large_holding_timeline   大量保有の推移 (LargeVolumeHoldingTimeline) のテーブルを作成する
+    5  text_block_store         TextBlock の本文を重複を除いて圧縮保存する TextBlockStore のテーブルを作成する
+    6  buyback_acquisition_detail  自己株券買付状況報告書の表の行 (BuybackAcquisitionDetail) のテーブルを作成する
+
+--report を指定すると、database_manager の主な検索関数の処理時間と実行計画を出力する。
+--upgrade と併用した場合は、マイグレーションの適用前後の結果を比較する。
+
+使い方:
+    python migrations.py                      # 現在のバージョンを表示
+    python migrations.py --upgrade            # 最新のバージョンまで適用
+    python migrations.py --upgrade --report --output migration_report.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import re
+import statistics
+import time
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, column, event, inspect, select, table, text
+
+import database_manager
+from config import SCHEMA_VERSION_TABLE_NAME, SUBMISSION_TABLE_NAME
+from definitions import DOCUMENT_TYPE_DEFINITIONS
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql')
+REPORT_REPEAT = 3
+
+_metadata = MetaData()
+schema_version_table = Table(
+    SCHEMA_VERSION_TABLE_NAME, _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('appliedAt', DateTime, nullable=False),
+)
+
+# DocumentMetadata の検索向けのカバリング索引: (索引名, キー列, 付加列)
+# SQL Server では付加列を INCLUDE とし、それ以外のDBではキー列の後ろに加える
+DOCUMENT_METADATA_INDEXES = [
+    # iter_documents_by_codes / get_documents_by_form_code: 書類種別と csvFlag で絞り込み、提出日・docID の順に取得する
+    ('IX_DocumentMetadata_formCode_ordinanceCode',
+     ['formCode', 'ordinanceCode', 'csvFlag', 'dateFile', 'docID'], ['seqNumber', 'edinetCode']),
+    # get_document_details_by_id / get_documents_by_doc_ids: docID による検索
+    ('IX_DocumentMetadata_docID_covering',
+     ['docID'], ['formCode', 'ordinanceCode', 'csvFlag', 'dateFile', 'seqNumber']),
+    # get_name_code_master_data: edinetCode が NULL でない提出者の一覧
+    ('IX_DocumentMetadata_edinetCode_covering',
+     ['edinetCode'], ['filerName', 'secCode']),
+]
+# 上記の索引で置き換える、sql/create_table_document_metadata.sql の索引
+REPLACED_DOCUMENT_METADATA_INDEXES = ['IX_DocumentMetadata_docID', 'IX_DocumentMetadata_edinetCode']
+
+# shareholder_changes.py が保存時に発行者の直前・直後の決算期を検索するための MajorShareholders の索引
+MAJOR_SHAREHOLDERS_INDEX = (
+    'IX_MajorShareholders_SecuritiesCode_FiscalPeriodEnd', ['SecuritiesCode', 'FiscalPeriodEnd'], ['SubmissionDate', 'docId']
+)
+
+
+# --- SQLファイルからのテーブル作成 ---
+def _read_sql_file(path: str) -> str:
+    """SQLファイルを読み込む (UTF-8 で読めない場合は cp932 とみなす)。"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('cp932', errors='replace')
+
+
+def _create_table_statements(sql: str, dialect_name: str) -> dict[str, str]:
+    """
+    SQLファイルの内容から CREATE TABLE 文を取り出し、テーブル名をキーとする辞書で返す。
+    - EDINET.dbo. などのデータベース・スキーマ名は接続先のDBに合わせて取り除く。
+    - 後から ALTER TABLE ... ADD CONSTRAINT ... PRIMARY KEY で追加している主キーは CREATE TABLE 文に含める
+      (主キーの列に NULL が指定されている場合は NOT NULL にする)。
+    - SQL Server 以外のDBでは、NVARCHAR(MAX) などの (MAX) を取り除く。
+    """
+    statements = {}
+    for table_name, body in re.findall(r'CREATE TABLE\s+(?:\w+\.\w+\.)?(\w+)\s*\((.*?)\n\s*\);', sql, re.S | re.I):
+        primary_key = re.search(
+            rf'^\s*ALTER TABLE\s+(?:\w+\.\w+\.)?{table_name}\s+ADD CONSTRAINT\s+(\w+)\s+PRIMARY KEY\s*\(([^)]*)\)',
+            sql, re.M | re.I
+        )
+        body = body.rstrip().rstrip(',')
+        if primary_key:
+            for key_column in (c.strip() for c in primary_key.group(2).split(',')):
+                body = re.sub(rf'^(\s*{key_column}\s+[\w()]+(?:\s*\(\d+\))?)\s+NULL\b', r'\1 NOT NULL', body, flags=re.M)
+            body += f',\n  CONSTRAINT {primary_key.group(1)} PRIMARY KEY ({primary_key.group(2).strip()})'
+        if dialect_name != 'mssql':
+            body = re.sub(r'\(\s*MAX\s*\)', '', body, flags=re.I)
+        statements[table_name] = f'CREATE TABLE [{table_name}] (\n{body}\n)'
+    return statements
+
+
+def _insert_statements(sql: str, table_name: str, dialect_name: str) -> list[str]:
+    """SQLファイルの内容から、指定したテーブルへの INSERT 文を取り出す。"""
+    statements = re.findall(
+        rf'^INSERT INTO\s+(?:\w+\.\w+\.)?{table_name}\s*\(.*?\)\s*VALUES\s*.*?(?=;\s*$|\n\s*\n|\Z)', sql, re.S | re.M | re.I
+    )
+    statements = [re.sub(rf'^INSERT INTO\s+(?:\w+\.\w+\.)?{table_name}', f'INSERT INTO [{table_name}]', s, flags=re.I).rstrip()
+                  for s in statements]
+    if dialect_name != 'mssql':
+        # Unicode文字列リテラルの N'...' は SQL Server 以外では '...' とする
+        statements = [re.sub(r"(?<![\w'])N'", "'", s) for s in statements]
+    return statements
+
+
+def _create_index_statements(sql: str, table_name: str) -> list[str]:
+    """SQLファイルの内容から、指定したテーブルの CREATE INDEX 文 (コメントアウトされていないもの) を取り出す。"""
+    statements = []
+    for kind, index_name, columns in re.findall(
+            rf'^\s*CREATE\s+((?:NONCLUSTERED\s+|UNIQUE\s+)*)INDEX\s+(\w+)\s+ON\s+(?:\w+\.\w+\.)?{table_name}\s*\(([^)]*)\)',
+            sql, re.M | re.I):
+        unique = 'UNIQUE ' if 'UNIQUE' in kind.upper() else ''
+        statements.append(f'CREATE {unique}INDEX [{index_name}] ON [{table_name}] ({columns.strip()})')
+    return statements
+
+
+def _create_tables_from_file(connection, path: str, existing_tables: set[str]):
+    """SQLファイルのテーブルのうち存在しないものを作成し、同じファイルの索引と初期データ (INSERT 文) も登録する。"""
+    dialect_name = connection.dialect.name
+    sql = _read_sql_file(path)
+    for table_name, statement in _create_table_statements(sql, dialect_name).items():
+        if table_name in existing_tables:
+            logger.info("Table %s already exists. Skipping.", table_name)
+            continue
+        connection.execute(text(statement))
+        logger.info("Created table %s (%s).", table_name, os.path.basename(path))
+        for index_statement in _create_index_statements(sql, table_name):
+            connection.execute(text(index_statement))
+        for insert_statement in _insert_statements(sql, table_name, dialect_name):
+            connection.execute(text(insert_statement))
+            logger.info("Inserted initial data into %s.", table_name)
+
+
+def _migrate_baseline(connection):
+    """
+    sql/create_table_*.sql のテーブルのうち、存在しないものを作成する。
+    作成したテーブルには、同じファイルの索引と初期データ (INSERT 文) も登録する。
+    既存のテーブル (to_sql で作成されたものを含む) は変更しない。
+    """
+    existing_tables = set(inspect(connection).get_table_names())
+    for path in sorted(glob.glob(os.path.join(SQL_DIR, 'create_table_*.sql'))):
+        _create_tables_from_file(connection, path, existing_tables)
+
+
+# --- 索引の作成 ---
+def _index_names(connection, table_name: str) -> set[str]:
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+
+def _create_index(connection, table_name: str, index_name: str, key_columns: list[str], include_columns: list[str]):
+    """カバリング索引を作成する。SQL Server では付加列を INCLUDE とし、それ以外ではキー列に加える。"""
+    if connection.dialect.name == 'mssql':
+        statement = (f'CREATE NONCLUSTERED INDEX [{index_name}] ON [{table_name}] '
+                     f'({", ".join(f"[{c}]" for c in key_columns)})')
+        if include_columns:
+            statement += f' INCLUDE ({", ".join(f"[{c}]" for c in include_columns)})'
+    else:
+        statement = (f'CREATE INDEX [{index_name}] ON [{table_name}] '
+                     f'({", ".join(f"[{c}]" for c in key_columns + include_columns)})')
+    connection.execute(text(statement))
+    logger.info("Created index %s on %s.", index_name, table_name)
+
+
+def _drop_index(connection, table_name: str, index_name: str):
+    if connection.dialect.name == 'mssql':
+        connection.execute(text(f'DROP INDEX [{index_name}] ON [{table_name}]'))
+    else:
+        connection.execute(text(f'DROP INDEX [{index_name}]'))
+    logger.info("Dropped index %s on %s.", index_name, table_name)
+
+
+def _migrate_document_query_indexes(connection):
+    if not inspect(connection).has_table(SUBMISSION_TABLE_NAME):
+        raise RuntimeError(f"Table {SUBMISSION_TABLE_NAME} does not exist. Apply the baseline migration first.")
+    existing_indexes = _index_names(connection, SUBMISSION_TABLE_NAME)
+    for index_name, key_columns, include_columns in DOCUMENT_METADATA_INDEXES:
+        if index_name not in existing_indexes:
+            _create_index(connection, SUBMISSION_TABLE_NAME, index_name, key_columns, include_columns)
+    for index_name in REPLACED_DOCUMENT_METADATA_INDEXES:
+        if index_name in existing_indexes:
+            _drop_index(connection, SUBMISSION_TABLE_NAME, index_name)
+
+
+def _migrate_major_shareholder_changes(connection):
+    """MajorShareholderChanges テーブルと、その更新に使う MajorShareholders の索引を作成する。"""
+    existing_tables = set(inspect(connection).get_table_names())
+    _create_tables_from_file(connection, os.path.join(SQL_DIR, 'create_table_major_shareholder_changes.sql'), existing_tables)
+    index_name, key_columns, include_columns = MAJOR_SHAREHOLDERS_INDEX
+    if 'MajorShareholders' in existing_tables and index_name not in _index_names(connection, 'MajorShareholders'):
+        _create_index(connection, 'MajorShareholders', index_name, key_columns, include_columns)
+
+
+def _migrate_large_holding_timeline(connection):
+    """LargeVolumeHoldingTimeline テーブルを作成する (既存の報告からの作成は large_holding_timeline.py --rebuild で行う)。"""
+    existing_tables = set(inspect(connection).get_table_names())
+    _create_tables_from_file(connection, os.path.join(SQL_DIR, 'create_table_large_volume_holding_timeline.sql'), existing_tables)
+
+
+def _migrate_text_block_store(connection):
+    """TextBlockStore テーブルを作成する (既存の行の本文の移行は text_blocks.py --convert で行う)。"""
+    existing_tables = set(inspect(connection).get_table_names())
+    _create_tables_from_file(connection, os.path.join(SQL_DIR, 'create_table_text_block_store.sql'), existing_tables)
+
+
+def _migrate_buyback_acquisition_detail(connection):
+    """BuybackAcquisitionDetail テーブルを作成する (保存済みの書類からの抽出は buyback_tables.py --rebuild で行う)。"""
+    existing_tables = set(inspect(connection).get_table_names())
+    _create_tables_from_file(connection, os.path.join(SQL_DIR, 'create_table_buyback_acquisition_detail.sql'), existing_tables)
+
+
+# (バージョン, 名前, 適用する関数)。バージョンの昇順に適用する
+MIGRATIONS = [
+    (1, 'baseline', _migrate_baseline),
+    (2, 'document_query_indexes', _migrate_document_query_indexes),
+    (3, 'major_shareholder_changes', _migrate_major_shareholder_changes),
+    (4, 'large_holding_timeline', _migrate_large_holding_timeline),
+    (5, 'text_block_store', _migrate_text_block_store),
+    (6, 'buyback_acquisition_detail', _migrate_buyback_acquisition_detail),
+]
+
+
+# --- バージョン管理 ---
+def current_version() -> int:
+    """適用済みの最新のバージョンを返す。未適用の場合は 0 を返す。"""
+    with database_manager.engine.connect() as connection:
+        if not inspect(connection).has_table(SCHEMA_VERSION_TABLE_NAME):
+            return 0
+        version = connection.execute(select(schema_version_table.c.version).order_by(schema_version_table.c.version.desc())).first()
+        return version[0] if version else 0
+
+
+def upgrade(target_version: int | None = None) -> list[int]:
+    """
+    target_version (省略時は最新) まで、未適用のマイグレーションを順に適用し、適用したバージョンのリストを返す。
+    各マイグレーションは、バージョンの記録とともに1つのトランザクションで実行する。
+    """
+    _metadata.create_all(database_manager.engine, checkfirst=True)
+    version = current_version()
+    applied = []
+    for migration_version, name, migrate in MIGRATIONS:
+        if migration_version <= version or (target_version is not None and migration_version > target_version):
+            continue
+        logger.info("Applying migration %s (%s)...", migration_version, name)
+        with database_manager.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(schema_version_table.insert().values(
+                version=migration_version, name=name, appliedAt=datetime.datetime.now()))
+        applied.append(migration_version)
+    if not applied:
+        logger.info("Schema is up to date (version %s).", version)
+    return applied
+
+
+# --- 検索関数の処理時間と実行計画 ---
+def _report_queries() -> dict:
+    """計測対象の database_manager の検索関数を、名前をキーとする辞書で返す。"""
+    codes = sorted({code for codes in DOCUMENT_TYPE_DEFINITIONS.values() for code in codes})
+    queries = {
+        'get_existing_dates': database_manager.get_existing_dates,
+        'get_documents_by_codes': lambda: database_manager.get_documents_by_codes(codes),
+        'get_documents_by_form_code': lambda: database_manager.get_documents_by_form_code('030000'),
+        'get_name_code_master_data': database_manager.get_name_code_master_data,
+    }
+    with database_manager.engine.connect() as connection:
+        if not inspect(connection).has_table(SUBMISSION_TABLE_NAME):
+            return queries
+        submission_table = table(SUBMISSION_TABLE_NAME, column('dateFile'), column('docID'))
+        sample = connection.execute(
+            select(submission_table.c.dateFile, submission_table.c.docID).order_by(submission_table.c.dateFile.desc()).limit(1)
+        ).first()
+    if sample:
+        date_file, doc_id = sample
+        date_str = str(date_file)[:10]
+        queries.update({
+            'get_documents_by_date': lambda: database_manager.get_documents_by_date(date_str),
+            'get_doc_ids_by_date': lambda: database_manager.get_doc_ids_by_date(date_str),
+            'get_documents_by_doc_ids': lambda: database_manager.get_documents_by_doc_ids([doc_id]),
+            'get_document_details_by_id': lambda: database_manager.get_document_details_by_id(doc_id),
+        })
+    return queries
+
+
+def _explain(connection, statement: str, parameters) -> list[str]:
+    """SQL文の実行計画を、1行1要素の文字列のリストで返す。"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        return [row[-1] for row in rows]
+    if dialect_name == 'mssql':
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute('SET SHOWPLAN_TEXT ON')
+            cursor.execute(statement, parameters)
+            plan = []
+            while True:
+                if cursor.description:
+                    plan.extend(str(row[0]).rstrip() for row in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+            return plan[1:]  # 先頭はSQL文そのもの
+        finally:
+            cursor.execute('SET SHOWPLAN_TEXT OFF')
+            cursor.close()
+    rows = connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()
+    return [str(row[0]) for row in rows]
+
+
+def report(repeat: int = REPORT_REPEAT) -> list[dict]:
+    """database_manager の主な検索関数について、処理時間 (中央値) と実行した SELECT 文の実行計画を返す。"""
+    results = []
+    for name, query in _report_queries().items():
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                statements.append((statement, parameters))
+
+        event.listen(database_manager.engine, 'before_cursor_execute', capture)
+        try:
+            query()
+        finally:
+            event.remove(database_manager.engine, 'before_cursor_execute', capture)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            timings.append(time.perf_counter() - start)
+
+        plans = []
+        with database_manager.engine.connect() as connection:
+            for statement, parameters in statements[:1]:
+                try:
+                    plans.append(_explain(connection, statement, parameters))
+                except Exception as e:
+                    plans.append([f'(failed to explain: {e})'])
+        results.append({
+            'query': name,
+            'median_ms': statistics.median(timings) * 1000,
+            'statements': len(statements),
+            'plan': plans[0] if plans else [],
+        })
+    return results
+
+
+def _print_report(results: list[dict], baseline: list[dict] | None = None):
+    before = {r['query']: r for r in baseline or []}
+    for r in results:
+        previous = before.get(r['query'])
+        if previous:
+            print(f"\n{r['query']}: {previous['median_ms']:.2f} ms -> {r['median_ms']:.2f} ms")
+            print("  before: " + '\n          '.join(previous['plan']))
+            print("  after:  " + '\n          '.join(r['plan']))
+        else:
+            print(f"\n{r['query']}: {r['median_ms']:.2f} ms")
+            print("  plan: " + '\n        '.join(r['plan']))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Create and upgrade the EDINET database schema.')
+    arg_parser.add_argument('--upgrade', action='store_true', help='未適用のマイグレーションを適用する')
+    arg_parser.add_argument('--target', type=int, help='適用するバージョンの上限')
+    arg_parser.add_argument('--report', action='store_true', help='主な検索関数の処理時間と実行計画を出力する (--upgrade と併用すると前後を比較する)')
+    arg_parser.add_argument('--repeat', type=int, default=REPORT_REPEAT, help='処理時間の計測回数')
+    arg_parser.add_argument('--output', help='--report の結果を保存するJSONファイルのパス')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    logger.info("Current schema version: %s (latest: %s)", current_version(), MIGRATIONS[-1][0])
+    before_report = report(args.repeat) if args.report and args.upgrade else None
+    if args.upgrade:
+        upgrade(args.target)
+        logger.info("Schema version after upgrade: %s", current_version())
+    if args.report:
+        after_report = report(args.repeat)
+        _print_report(after_report, before_report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'before': before_report, 'after': after_report, 'version': current_version()},
+                          f, ensure_ascii=False, indent=2)
+            logger.info("Report written to %s", args.output)
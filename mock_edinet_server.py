@@ -0,0 +1,432 @@
+"""
+EDINET API v2 のローカルモックサーバー
+
+本番の https://disclosure.edinet-fsa.go.jp/api/v2 の代わりに、synthetic_data.py で生成した合成書類を返す。
+パイプライン (collect_submission_data / process_documents) の処理性能を、APIキーやネットワークに依存せず
+再現可能な条件で計測するために使用する。
+
+対応するエンドポイント:
+    GET /api/v2/documents.json?date=YYYY-MM-DD&type=2   提出書類一覧 (メタデータ付き)
+    GET /api/v2/documents/{docID}?type=5                XBRL_TO_CSV を含むZIP
+    GET /_stats                                         リクエスト数などの統計 (?reset=1 でリセット)
+
+応答の遅延・エラー (500)・レート制限 (429) の発生率は起動時に指定できる。
+--release-interval-s を指定すると、最終日の書類を起動時から一定間隔で1件ずつ一覧に追加する
+(submitDateTime は追加した時刻になる)。watch_filings.py の動作確認に使用する。
+
+使い方:
+    python mock_edinet_server.py --port 8080 --start-date 2025-06-02 --days 5 --docs-per-day 40
+    python mock_edinet_server.py --latency-ms 80 --error-rate 0.02 --rate-limit-rate 0.05
+    python mock_edinet_server.py --days 1 --release-interval-s 20
+    # 別のターミナルで
+    EDINET_API_BASE_URL=http://127.0.0.1:8080/api/v2 python collect_submission_data.py
+"""
+import argparse
+import datetime
+import functools
+import io
+import json
+import random
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+import synthetic_data
+
+# --- 定数定義 ---
+# 書類種別ごとの生成設定。weight は1日あたりの書類に占める割合。
+# generator が None の書類はCSVを持たない (csvFlag=0) 書類として一覧にのみ含める。
+DOCUMENT_KINDS = {
+    'AnnualSecuritiesReport': {
+        'weight': 0.3,
+        'docTypeCode': '120', 'formCode': '030000', 'ordinanceCode': '010', 'ordinanceCodeShort': 'crp',
+        'fileForm': '030000-asr', 'docDescription': '有価証券報告書－第{n}期({start}－{end})',
+        'generator': synthetic_data.generate_annual_report_df, 'preset_key': 'annual',
+    },
+    'LargeVolumeHoldingReport': {
+        'weight': 0.3,
+        'docTypeCode': '350', 'formCode': '010002', 'ordinanceCode': '060', 'ordinanceCodeShort': 'lvh',
+        'fileForm': '010002-lvh', 'docDescription': '大量保有報告書',
+        'generator': synthetic_data.generate_large_volume_report_df, 'preset_key': 'large_volume',
+    },
+    'BuybackStatusReport': {
+        'weight': 0.15,
+        'docTypeCode': '220', 'formCode': '170000', 'ordinanceCode': '010', 'ordinanceCodeShort': 'crp',
+        'fileForm': '170000-sbr', 'docDescription': '自己株券買付状況報告書（法２４条の６第１項に基づくもの）',
+        'generator': synthetic_data.generate_buyback_report_df, 'preset_key': 'buyback',
+    },
+    'SecuritiesRegistrationStatement': {
+        'weight': 0.25,
+        'docTypeCode': '030', 'formCode': '020000', 'ordinanceCode': '010', 'ordinanceCodeShort': 'crp',
+        'fileForm': None, 'docDescription': '有価証券届出書（通常方式）',
+        'generator': None, 'preset_key': None,
+    },
+}
+
+API_PREFIX = '/api/v2'
+DEFAULT_PORT = 8080
+DEFAULT_DOCS_PER_DAY = 40
+
+
+def _doc_id(day_index: int, seq: int) -> str:
+    """日付の通し番号と提出順から、8桁の書類管理番号 (S1xxxxxx) を生成する。"""
+    n = day_index * 10000 + seq
+    chars = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    digits = ''
+    while True:
+        n, r = divmod(n, 36)
+        digits = chars[r] + digits
+        if n == 0:
+            break
+    return 'S1' + digits.rjust(6, '0')
+
+
+def build_submission_results(date: datetime.date, day_index: int, docs_per_day: int, seed: int = 0) -> list[dict]:
+    """
+    指定日の提出書類一覧 (documents.json の results) を生成する。同じ引数からは常に同じ一覧を返す。
+    """
+    rng = random.Random(f'{seed}-{date.isoformat()}')
+    kinds = list(DOCUMENT_KINDS.keys())
+    weights = [DOCUMENT_KINDS[k]['weight'] for k in kinds]
+    results = []
+    for seq in range(1, docs_per_day + 1):
+        kind = rng.choices(kinds, weights)[0]
+        spec = DOCUMENT_KINDS[kind]
+        edinet_code = f'E{rng.randint(1, 99999):05d}'
+        sec_code = f'{rng.randint(1300, 9999)}0' if kind != 'LargeVolumeHoldingReport' else None
+        period_end = datetime.date(date.year - (1 if date.month <= 3 else 0), 3, 31)
+        period_start = period_end - datetime.timedelta(days=364)
+        has_csv = spec['generator'] is not None
+        results.append({
+            'seqNumber': seq,
+            'docID': _doc_id(day_index, seq),
+            'edinetCode': edinet_code,
+            'secCode': sec_code,
+            'JCN': f'{rng.randint(10**12, 10**13 - 1)}',
+            'filerName': synthetic_data._company_name(rng),
+            'fundCode': None,
+            'ordinanceCode': spec['ordinanceCode'],
+            'formCode': spec['formCode'],
+            'docTypeCode': spec['docTypeCode'],
+            'periodStart': period_start.isoformat() if kind == 'AnnualSecuritiesReport' else None,
+            'periodEnd': period_end.isoformat() if kind == 'AnnualSecuritiesReport' else None,
+            'submitDateTime': f'{date.isoformat()} {9 + seq * 8 // max(docs_per_day, 1):02d}:{rng.randint(0, 59):02d}',
+            'docDescription': spec['docDescription'].format(n=rng.randint(10, 120), start=period_start.isoformat(), end=period_end.isoformat()),
+            'issuerEdinetCode': f'E{rng.randint(1, 99999):05d}' if kind == 'LargeVolumeHoldingReport' else None,
+            'subjectEdinetCode': None,
+            'subsidiaryEdinetCode': None,
+            'currentReportReason': None,
+            'parentDocID': None,
+            'opeDateTime': None,
+            'withdrawalStatus': '0',
+            'docInfoEditStatus': '0',
+            'disclosureStatus': '0',
+            'xbrlFlag': '1' if has_csv else '0',
+            'pdfFlag': '1',
+            'attachDocFlag': '0',
+            'englishDocFlag': '0',
+            'csvFlag': '1' if has_csv else '0',
+            'legalStatus': '1',
+        })
+    return results
+
+
+@functools.lru_cache(maxsize=1024)
+def build_document_zip(doc_id: str, kind: str, size: str, edinet_code: str, sec_code: str | None, date_str: str) -> bytes:
+    """
+    書類の type=5 レスポンス (XBRL_TO_CSV/ 以下に本文と監査報告書のCSVを含むZIP) を生成する。
+    """
+    spec = DOCUMENT_KINDS[kind]
+    params = dict(synthetic_data.SIZE_PRESETS[size][spec['preset_key']])
+    seed = sum(doc_id.encode())
+    if kind == 'AnnualSecuritiesReport':
+        df = spec['generator'](edinet_code=edinet_code, sec_code=sec_code, seed=seed, **params)
+    elif kind == 'LargeVolumeHoldingReport':
+        df = spec['generator'](edinet_code=edinet_code, seed=seed, **params)
+    else:
+        df = spec['generator'](sec_code=sec_code, seed=seed, **params)
+
+    short = spec['ordinanceCodeShort']
+    member = f"XBRL_TO_CSV/jp{short}{spec['fileForm']}-001_{edinet_code}-000_{date_str}_01_{date_str}.csv"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr(member, synthetic_data.to_xbrl_csv_bytes(df))
+        if kind == 'AnnualSecuritiesReport':
+            # 本文以外のCSV (監査報告書) も含まれることを再現する
+            audit_df = pd.DataFrame(
+                [['jpaud_cor:IndependentAuditorsReportTextBlock', '独立監査人の監査報告書', 'FilingDateInstant', '提出日時点',
+                  'その他', '時点', '', '', '<p>監査報告書</p>']],
+                columns=synthetic_data.XBRL_CSV_COLUMNS
+            )
+            z.writestr(f'XBRL_TO_CSV/jpaud-aar-cn-001_{edinet_code}-000_{date_str}_01_{date_str}.csv',
+                       synthetic_data.to_xbrl_csv_bytes(audit_df))
+    return buffer.getvalue()
+
+
+class MockEdinetServer:
+    """
+    EDINET API v2 のモックサーバー。start() で別スレッドにて待ち受けを開始し、stop() で停止する。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, start_date: datetime.date | None = None, days: int = 5,
+                 docs_per_day: int = DEFAULT_DOCS_PER_DAY, size: str = 'small', latency_ms: float = 0.0,
+                 latency_jitter_ms: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: int = 1, api_key: str | None = None, seed: int = 0, release_interval_s: float = 0.0):
+        self.start_date = start_date or (datetime.date.today() - datetime.timedelta(days=days - 1))
+        self.days = days
+        self.docs_per_day = docs_per_day
+        self.size = size
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self.seed = seed
+        self.release_interval_s = release_interval_s
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {}
+        self.reset_stats()
+
+        # 日付ごとの提出書類一覧と、docIDから書類情報への索引を事前に作成する
+        self.submissions = {}
+        self.documents = {}
+        for day_index in range(days):
+            date = self.start_date + datetime.timedelta(days=day_index)
+            results = build_submission_results(date, day_index, docs_per_day, seed)
+            self.submissions[date.isoformat()] = results
+            for item in results:
+                kind = next(k for k, v in DOCUMENT_KINDS.items()
+                            if (v['formCode'], v['ordinanceCode']) == (item['formCode'], item['ordinanceCode']))
+                self.documents[item['docID']] = (kind, item, date.isoformat())
+
+        # 最終日の書類を起動時から順に公開する場合の、書類ごとの公開時刻
+        self.last_date = (self.start_date + datetime.timedelta(days=days - 1)).isoformat()
+        self._release_times = {}
+        if release_interval_s > 0:
+            started_at = datetime.datetime.now()
+            for item in self.submissions.get(self.last_date, []):
+                released_at = started_at + datetime.timedelta(seconds=release_interval_s * (item['seqNumber'] - 1))
+                self._release_times[item['docID']] = released_at
+                item['submitDateTime'] = released_at.strftime('%Y-%m-%d %H:%M')
+
+        handler = type('BoundHandler', (_MockEdinetRequestHandler,), {'mock': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}{API_PREFIX}'
+
+    @property
+    def csv_documents(self) -> list[dict]:
+        """CSVを持つ (process_documents の対象となりうる) 書類のメタデータ一覧。"""
+        return [item for kind, item, _ in self.documents.values() if DOCUMENT_KINDS[kind]['generator'] is not None]
+
+    def visible_submissions(self, date_str: str) -> list[dict]:
+        """指定日の提出書類一覧のうち、公開時刻を過ぎた書類を返す。"""
+        results = self.submissions.get(date_str, [])
+        if date_str != self.last_date or not self._release_times:
+            return results
+        now = datetime.datetime.now()
+        return [item for item in results if self._release_times[item['docID']] <= now]
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'documents_json': 0, 'documents': 0, 'bytes_sent': 0,
+                          'status_200': 0, 'status_404': 0, 'status_429': 0, 'status_500': 0, 'status_other': 0}
+
+    def prebuild(self):
+        """全書類のZIPを事前に生成してキャッシュする (初回アクセス時の生成時間を計測から除外するため)。"""
+        for doc_id, (kind, item, date_str) in self.documents.items():
+            if DOCUMENT_KINDS[kind]['generator'] is not None:
+                build_document_zip(doc_id, kind, self.size, item['edinetCode'], item['secCode'], date_str)
+
+    def get_document_zip(self, doc_id: str) -> bytes | None:
+        entry = self.documents.get(doc_id)
+        if entry is None or DOCUMENT_KINDS[entry[0]]['generator'] is None:
+            return None
+        kind, item, date_str = entry
+        return build_document_zip(doc_id, kind, self.size, item['edinetCode'], item['secCode'], date_str)
+
+    def _draw_fault(self) -> tuple[float, int | None]:
+        """今回のリクエストに付与する遅延 (秒) と、注入するエラーのステータスコードを決める。"""
+        with self._lock:
+            delay = self.latency_ms + self._rng.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+            r = self._rng.random()
+        if r < self.rate_limit_rate:
+            return max(delay, 0) / 1000, 429
+        if r < self.rate_limit_rate + self.error_rate:
+            return max(delay, 0) / 1000, 500
+        return max(delay, 0) / 1000, None
+
+    def _count(self, key: str, status: int, n_bytes: int):
+        with self._lock:
+            self.stats['requests'] += 1
+            if key:
+                self.stats[key] += 1
+            status_key = f'status_{status}'
+            self.stats[status_key if status_key in self.stats else 'status_other'] += 1
+            self.stats['bytes_sent'] += n_bytes
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.httpd.server_close()
+
+
+class _MockEdinetRequestHandler(BaseHTTPRequestHandler):
+    """MockEdinetServer のリクエストハンドラ。クラス属性 mock にサーバーの状態を持つ。"""
+    mock: MockEdinetServer = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # アクセスログは出力しない (計測の妨げになるため)
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, stats_key: str | None = None, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if stats_key is not False:
+            self.mock._count(stats_key, status, len(body))
+
+    def _send_json(self, status: int, payload: dict, stats_key: str | None = None, headers: dict | None = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8', stats_key, headers)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+        if parsed.path == '/_stats':
+            if query.get('reset') == '1':
+                self.mock.reset_stats()
+            with self.mock._lock:
+                stats = dict(self.mock.stats)
+            self._send_json(200, stats, stats_key=False)
+            return
+
+        if parsed.path == f'{API_PREFIX}/documents.json':
+            stats_key = 'documents_json'
+        elif parsed.path.startswith(f'{API_PREFIX}/documents/'):
+            stats_key = 'documents'
+        else:
+            self._send_json(404, {'StatusCode': 404, 'message': 'Resource not found.'}, stats_key=None)
+            return
+
+        if self.mock.api_key is not None and query.get('Subscription-Key') != self.mock.api_key:
+            self._send_json(401, {'StatusCode': 401, 'message': 'Access denied due to invalid subscription key.'}, stats_key)
+            return
+
+        delay, fault = self.mock._draw_fault()
+        if delay:
+            time.sleep(delay)
+        if fault == 429:
+            self._send_json(429, {'StatusCode': 429, 'message': 'Rate limit is exceeded.'}, stats_key,
+                            headers={'Retry-After': str(self.mock.retry_after)})
+            return
+        if fault == 500:
+            self._send_json(500, {'StatusCode': 500, 'message': 'Internal Server Error.'}, stats_key)
+            return
+
+        if stats_key == 'documents_json':
+            self._handle_documents_json(query)
+        else:
+            self._handle_document(parsed.path.rsplit('/', 1)[-1], query)
+
+    def _handle_documents_json(self, query: dict):
+        date_str = query.get('date')
+        try:
+            datetime.date.fromisoformat(date_str or '')
+        except ValueError:
+            self._send_json(400, {'metadata': {'status': '400', 'message': 'Bad Request'}}, 'documents_json')
+            return
+        # 一覧のみ (type=1) の場合も、簡略化のためメタデータ付きの一覧を返す
+        results = self.mock.visible_submissions(date_str)
+        payload = {
+            'metadata': {
+                'title': '提出された書類を把握するためのAPI',
+                'parameter': {'date': date_str, 'type': query.get('type', '1')},
+                'resultset': {'count': len(results)},
+                'processDateTime': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'status': '200',
+                'message': 'OK',
+            },
+            'results': results,
+        }
+        self._send_json(200, payload, 'documents_json')
+
+    def _handle_document(self, doc_id: str, query: dict):
+        if query.get('type') != '5':
+            self._send_json(400, {'metadata': {'status': '400', 'message': 'Only type=5 is supported by the mock server.'}}, 'documents')
+            return
+        content = self.mock.get_document_zip(doc_id)
+        if content is None:
+            self._send_json(404, {'metadata': {'status': '404', 'message': 'Not Found'}}, 'documents')
+            return
+        self._send(200, content, 'application/octet-stream', 'documents',
+                   headers={'Content-Disposition': f'attachment; filename="{doc_id}.zip"'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local mock of the EDINET API v2 with synthetic documents.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--start-date', type=datetime.date.fromisoformat, help='提出書類を生成する期間の開始日 (省略時は days 日前)')
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--docs-per-day', type=int, default=DEFAULT_DOCS_PER_DAY)
+    parser.add_argument('--size', choices=list(synthetic_data.SIZE_PRESETS.keys()), default='small')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='各リクエストに付与する遅延 (ミリ秒)')
+    parser.add_argument('--latency-jitter-ms', type=float, default=0.0, help='遅延のゆらぎ幅 (ミリ秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500エラーを返す割合')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='429エラーを返す割合')
+    parser.add_argument('--retry-after', type=int, default=1, help='429エラー時の Retry-After (秒)')
+    parser.add_argument('--api-key', help='指定した場合、Subscription-Key が一致しないリクエストに401を返す')
+    parser.add_argument('--no-prebuild', action='store_true', help='起動時にZIPを事前生成しない')
+    parser.add_argument('--release-interval-s', type=float, default=0.0,
+                        help='最終日の書類を起動時からこの間隔 (秒) で1件ずつ一覧に追加する')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockEdinetServer(
+        host=args.host, port=args.port, start_date=args.start_date, days=args.days, docs_per_day=args.docs_per_day,
+        size=args.size, latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, api_key=args.api_key, seed=args.seed,
+        release_interval_s=args.release_interval_s,
+    )
+    if not args.no_prebuild:
+        print(f"Building {len(server.csv_documents)} synthetic documents...")
+        server.prebuild()
+    end_date = server.start_date + datetime.timedelta(days=args.days - 1)
+    print(f"Mock EDINET API serving {len(server.documents)} documents ({server.start_date} - {end_date}) at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
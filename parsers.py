@@ -1,54 +1,11 @@
+import logging
 import pandas as pd
-import numpy as np
 import re
 
-# --- 共通ヘルパー関数 ---
+import buyback_tables
+from extraction import _finalize_df, extract_product
 
-def _extract_metadata(df: pd.DataFrame) -> dict:
-    """XBRL CSVから基本的なメタデータ（提出日、決算期、証券コード）を抽出する"""
-    meta_map = {
-        'jpcrp_cor:FilingDateCoverPage': 'SubmissionDate',
-        'jpdei_cor:CurrentPeriodEndDateDEI': 'FiscalPeriodEnd',
-        'jpdei_cor:SecurityCodeDEI': 'SecuritiesCode'
-    }
-    metadata = {new_name: df.loc[df['要素ID'] == old_name, '値'].iloc[0] if not df[df['要素ID'] == old_name].empty else None
-                for old_name, new_name in meta_map.items()}
-    
-    # 証券コードの整形
-    if metadata.get('SecuritiesCode'):
-        match = re.search(r'\d{5}', str(metadata['SecuritiesCode']))
-        if match:
-            metadata['SecuritiesCode'] = match.group(0)
-            
-    return metadata
-
-def _finalize_df(df: pd.DataFrame, metadata: dict, ordered_columns: list, numeric_cols: list = [], date_cols: list = []) -> pd.DataFrame:
-    """メタデータの付与、データ型変換、カラム順序の整理を行う共通関数"""
-    if df.empty:
-        return pd.DataFrame(columns=ordered_columns)
-
-    # メタデータを結合
-    for key, value in metadata.items():
-        df[key] = value
-
-    # データ型を変換
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-    
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
-
-    # カラムの順序を整える
-    final_ordered_columns = [col for col in ordered_columns if col in df.columns]
-    # 存在しないカラムも追加
-    for col in ordered_columns:
-        if col not in final_ordered_columns:
-            df[col] = None
-    
-    return df[ordered_columns]
+logger = logging.getLogger(__name__)
 
 # --- 大量保有報告書パーサー ---
 
@@ -207,249 +164,29 @@ def parse_large_shareholding_report(df: pd.DataFrame, doc_id: str) -> pd.DataFra
     return final_df[ordered_columns]
 
 
-# --- 大株主パーサー ---
+# --- 有価証券報告書のパーサー ---
+# 抽出する要素・コンテキスト・カラムの型は extraction.PRODUCT_SPECS に定義している。
+# 複数のプロダクトを抽出する場合は、extraction.FactIndex を1回作成して extract_product に渡す方が速い。
 
 def extract_shareholder_data(df: pd.DataFrame) -> pd.DataFrame:
     """大株主の状況を抽出・整形して返す。"""
-    metadata = _extract_metadata(df)
-
-    shareholder_data = []
-    member_contexts = df[df['コンテキストID'].astype(str).str.contains("MajorShareholdersMember")]["コンテキストID"].unique()
-
-    for context in member_contexts:
-        ctx_df = df[df['コンテキストID'] == context]
-        
-        # shareholderIdをコンテキストから抽出
-        shareholder_id_match = re.search(r'No(\d+)MajorShareholdersMember', context)
-        shareholder_id = int(shareholder_id_match.group(1)) if shareholder_id_match else None
-
-        name = ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:NameMajorShareholders']['値'].iloc[0] if not ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:NameMajorShareholders'].empty else None
-        ratio = ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:ShareholdingRatio']['値'].iloc[0] if not ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:ShareholdingRatio'].empty else None
-        num_shares = ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:NumberOfSharesHeld']['値'].iloc[0] if not ctx_df[ctx_df['要素ID'] == 'jpcrp_cor:NumberOfSharesHeld'].empty else None
-
-        # '－'をNoneに変換
-        if str(name).strip() == '－': name = None
-        if str(ratio).strip() == '－': ratio = None
-        if str(num_shares).strip() == '－': num_shares = None
-
-        if name and shareholder_id is not None:
-            shareholder_data.append({
-                "shareholderId": shareholder_id,
-                "MajorShareholderName": name,
-                "VotingRightsRatio": ratio,
-                "NumberOfSharesHeld": num_shares
-            })
-
-    result_df = pd.DataFrame(shareholder_data)
-    
-    return _finalize_df(
-        result_df, metadata,
-        ordered_columns=['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode', 'shareholderId', 'MajorShareholderName', 'VotingRightsRatio', 'NumberOfSharesHeld'],
-        numeric_cols=['shareholderId', 'VotingRightsRatio', 'NumberOfSharesHeld']
-    )
-
-# --- 株主構成パーサー ---
+    return extract_product(df, 'MajorShareholders')
 
 def extract_shareholder_composition_data(df: pd.DataFrame) -> pd.DataFrame:
     """株主構成データを抽出・整形して返す。"""
-    metadata = _extract_metadata(df)
-    
-    categories = {
-        "NationalAndLocalGovernments": ("jpcrp_cor:NumberOfShareholdersNationalAndLocalGovernments", "jpcrp_cor:PercentageOfShareholdingsNationalAndLocalGovernments", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsNationalAndLocalGovernments"),
-        "FinancialInstitutions": ("jpcrp_cor:NumberOfShareholdersFinancialInstitutions", "jpcrp_cor:PercentageOfShareholdingsFinancialInstitutions", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsFinancialInstitutions"),
-        "FinancialServiceProviders": ("jpcrp_cor:NumberOfShareholdersFinancialServiceProviders", "jpcrp_cor:PercentageOfShareholdingsFinancialServiceProviders", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsFinancialServiceProviders"),
-        "OtherCorporations": ("jpcrp_cor:NumberOfShareholdersOtherCorporations", "jpcrp_cor:PercentageOfShareholdingsOtherCorporations", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsOtherCorporations"),
-        "ForeignInvestorsOtherThanIndividuals": ("jpcrp_cor:NumberOfShareholdersForeignInvestorsOtherThanIndividuals", "jpcrp_cor:PercentageOfShareholdingsForeignersOtherThanIndividuals", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsForeignInvestorsOtherThanIndividuals"),
-        "ForeignIndividualInvestors": ("jpcrp_cor:NumberOfShareholdersForeignIndividualInvestors", "jpcrp_cor:PercentageOfShareholdingsForeignIndividuals", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsForeignIndividualInvestors"),
-        "IndividualsAndOthers": ("jpcrp_cor:NumberOfShareholdersIndividualsAndOthers", "jpcrp_cor:PercentageOfShareholdingsIndividualsAndOthers", "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsIndividualsAndOthers"),
-        "Total": ("jpcrp_cor:NumberOfShareholdersTotal", None, "jpcrp_cor:NumberOfSharesHeldNumberOfUnitsTotal")
-    }
-
-    def get_clean_value(element_id):
-        """要素IDから値を取得し、無効な値をNoneに変換する"""
-        if not element_id or df[df['要素ID'] == element_id].empty:
-            return None
-        value = df[df['要素ID'] == element_id]['値'].iloc[0]
-        if pd.isna(value) or str(value).strip() in ['－', '-']:
-            return None
-        return value
-
-    composition_data = []
-    for category_name, (num_tag, pct_tag, unit_tag) in categories.items():
-        num_shareholders = get_clean_value(num_tag)
-        pct_shareholdings = get_clean_value(pct_tag)
-        num_units = get_clean_value(unit_tag)
-        
-        composition_data.append({
-            "Category": category_name,
-            "NumberOfShareholders": num_shareholders,
-            "PercentageOfShareholdings": pct_shareholdings if pct_shareholdings is not None else (1.0 if category_name == "Total" else None),
-            "NumberOfSharesHeldUnits": num_units
-        })
-
-    result_df = pd.DataFrame(composition_data)
-
-    return _finalize_df(
-        result_df, metadata,
-        ordered_columns=['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode', 'Category', 'NumberOfShareholders', 'PercentageOfShareholdings', 'NumberOfSharesHeldUnits'],
-        numeric_cols=['NumberOfShareholders', 'PercentageOfShareholdings', 'NumberOfSharesHeldUnits']
-    )
-
-# --- 役員情報パーサー ---
+    return extract_product(df, 'ShareholderComposition')
 
 def parse_officer_information(df: pd.DataFrame) -> pd.DataFrame:
     """役員の状況に関するデータを解析し、整形されたDataFrameを返す。"""
-    metadata = _extract_metadata(df)
-    
-    officer_df = df[df['要素ID'].str.contains('(?:InformationAboutDirectorsAndCorporateAuditors|RemunerationEtcPaidByGroupToEachDirectorOrOtherOfficer)', na=False, regex=True)].copy()
-    if officer_df.empty: return pd.DataFrame()
-
-    officer_df['normalized_element_id'] = officer_df['要素ID'].str.replace('Proposal', '', regex=False)
-    
-    item_type_map = {
-        'NameInformationAboutDirectorsAndCorporateAuditors': 'Name',
-        'DateOfBirthInformationAboutDirectorsAndCorporateAuditors': 'DateOfBirth',
-        'OfficialTitleOrPositionInformationAboutDirectorsAndCorporateAuditors': 'Title',
-        'CareerSummaryInformationAboutDirectorsAndCorporateAuditorsTextBlock': 'CareerSummary',
-        'NumberOfSharesHeldOrdinarySharesInformationAboutDirectorsAndCorporateAuditors': 'NumberOfSharesHeld',
-        'TermOfOfficeInformationAboutDirectorsAndCorporateAuditors': 'TermOfOffice',
-        'TotalAmountOfRemunerationEtcPaidByGroupRemunerationEtcPaidByGroupToEachDirectorOrOtherOfficer': 'TotalRemuneration'
-    }
-    conditions = [officer_df['normalized_element_id'].str.contains(k) for k in item_type_map.keys()]
-    officer_df['item_type'] = np.select(conditions, list(item_type_map.values()), default=None)
-    officer_df['IsNewAppointment'] = officer_df['要素ID'].str.contains('Proposal', na=False)
-    officer_df['officerId'] = officer_df['コンテキストID'].str.extract(r'(jpcrp.*Member)')
-    officer_df.dropna(subset=['officerId', 'item_type'], inplace=True)
-
-    if officer_df.empty: return pd.DataFrame()
-
-    pivot_df = officer_df.pivot_table(index='officerId', columns='item_type', values='値', aggfunc='first')
-    new_appointment_flags = officer_df.groupby('officerId')['IsNewAppointment'].any()
-    pivot_df = pivot_df.merge(new_appointment_flags, on='officerId', how='left').reset_index()
-
-    return _finalize_df(
-        pivot_df, metadata,
-        ordered_columns=['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode', 'officerId', 'Name', 'IsNewAppointment', 'DateOfBirth', 'Title', 'NumberOfSharesHeld', 'TotalRemuneration', 'TermOfOffice', 'CareerSummary'],
-        numeric_cols=['NumberOfSharesHeld', 'TotalRemuneration'],
-        date_cols=['DateOfBirth']
-    )
-
-# --- 政策保有株式パーサー ---
+    return extract_product(df, 'Officer')
 
 def parse_specified_investment(df: pd.DataFrame) -> pd.DataFrame:
     """特定投資有価証券のデータを解析し、整形されたDataFrameを返す。"""
-    original_df = df.copy()
-    metadata = _extract_metadata(df)
-    
-    investment_df = df[df['要素ID'].str.contains('SpecifiedInvestment', na=False)].copy()
-    if investment_df.empty: return pd.DataFrame()
-
-    def _get_single_value(df, element_id: str) -> str | None:
-        """DataFrameから単一の要素IDの値を取得する。"""
-        series = df.loc[df['要素ID'] == element_id, '値']
-        if not series.empty:
-            val = series.iloc[0]
-            return val if pd.notna(val) and str(val).strip() not in ['－', '-'] else None
-        return None
-
-
-    shareholdings_text = _get_single_value(original_df, 'jpcrp_cor:ShareholdingsTextBlock')
-    largest_holder_name = None
-    if shareholdings_text:
-        match = re.search(r'（最大保有会社）である(.+?)については', shareholdings_text)
-        if match:
-            largest_holder_name = match.group(1)
-
-    second_largest_holder_name = None # Placeholder for now, as the text block only mentions the largest.
-    
-    print(f"largest_holder_name: {largest_holder_name}")
-    print(f"second_largest_holder_name: {second_largest_holder_name}")
-
-    print("investment_df:")
-    print(investment_df.to_string())
-
-    def get_entity_and_type(item_name):
-        if not isinstance(item_name, str): return None, None
-        entity = 'ReportingCompany'
-        if 'SecondLargestHoldingCompany' in item_name: entity = 'SecondLargestHoldingCompany'
-        elif 'LargestHoldingCompany' in item_name: entity = 'LargestHoldingCompany'
-        
-        
-        item_type = None
-        if 'NameOfSecurities' in item_name: item_type = 'NameOfSecurities'
-        elif 'NumberOfSharesHeld' in item_name: item_type = 'NumberOfSharesHeld'
-        elif 'BookValue' in item_name: item_type = 'BookValue'
-        elif 'PurposeOfShareholding' in item_name: item_type = 'HoldingPurpose'
-        elif 'WhetherIssuerOfAforementionedSharesHoldsReportingCompanysShares' in item_name: item_type = 'CrossShareholdingStatus'
-        return entity, item_type
-
-    investment_df[['HoldingEntity', 'item_type']] = investment_df['要素ID'].apply(lambda x: pd.Series(get_entity_and_type(x)))
-    investment_df['rowId'] = investment_df['コンテキストID'].str.extract(r'_Row(\d+)')
-    investment_df.dropna(subset=['HoldingEntity', 'rowId', 'item_type'], inplace=True)
-    
-    pivot_df = investment_df.pivot_table(index=['HoldingEntity', 'rowId'], columns=['item_type', '相対年度'], values='値', aggfunc='first')
-    pivot_df.columns = ['_'.join(filter(None, col)).strip() for col in pivot_df.columns.values]
-    pivot_df.reset_index(inplace=True)
-
-    print("pivot_df:")
-    print(pivot_df.to_string())
-
-    column_mapping = {
-        'rowId': 'rowId', # 主キーのために追加
-        'HoldingEntity': 'HoldingEntity', 'NameOfSecurities_当期末': 'NameOfSecurities',
-        'NumberOfSharesHeld_当期末': 'NumberOfSharesHeldCurrentYear', 'BookValue_当期末': 'BookValueCurrentYear',
-        'NumberOfSharesHeld_前期末': 'NumberOfSharesHeldPriorYear', 'BookValue_前期末': 'BookValuePriorYear',
-        'HoldingPurpose_当期末': 'HoldingPurpose', 'CrossShareholdingStatus_当期末': 'CrossShareholdingStatus'
-    }
-    result_df = pd.DataFrame({new: pivot_df.get(original) for original, new in column_mapping.items()})
-    result_df.dropna(subset=['NameOfSecurities'], inplace=True)
-
-    print("result_df before name assignment:")
-    print(result_df.to_string())
-
-    # HoldingEntityName を条件に応じて設定
-    conditions = [
-        result_df['HoldingEntity'] == 'LargestHoldingCompany',
-        result_df['HoldingEntity'] == 'SecondLargestHoldingCompany'
-    ]
-    choices = [
-        largest_holder_name,
-        second_largest_holder_name
-    ]
-    result_df['HoldingEntityName'] = np.select(conditions, choices, default=_get_single_value(original_df, 'jpcrp_cor:FilerNameInJapaneseCoverPage'))
-
-    return _finalize_df(
-        result_df, metadata,
-        ordered_columns=['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode', 'HoldingEntity', 'HoldingEntityName', 'rowId', 'NameOfSecurities', 'NumberOfSharesHeldCurrentYear', 'BookValueCurrentYear', 'NumberOfSharesHeldPriorYear', 'BookValuePriorYear', 'HoldingPurpose', 'CrossShareholdingStatus'],
-        numeric_cols=['rowId', 'NumberOfSharesHeldCurrentYear', 'BookValueCurrentYear', 'NumberOfSharesHeldPriorYear', 'BookValuePriorYear']
-    )
-
-# --- 議決権パーサー ---
+    return extract_product(df, 'SpecifiedInvestment')
 
 def parse_voting_rights(df: pd.DataFrame) -> pd.DataFrame:
     """議決権の状況（株式数）に関するデータを解析し、整形されたDataFrameを返す。"""
-    metadata = _extract_metadata(df)
-    
-    shares_df = df[df['要素ID'] == 'jpcrp_cor:NumberOfSharesIssuedSharesVotingRights'].copy()
-    if shares_df.empty: return pd.DataFrame()
-
-    context_map = {
-        'CurrentYearInstant': 'TotalNumberOfIssuedShares',
-        'CurrentYearInstant_OrdinarySharesSharesWithFullVotingRightsOtherMember': 'NumberOfOtherSharesWithFullVotingRights',
-        'CurrentYearInstant_OrdinarySharesTreasurySharesSharesWithFullVotingRightsTreasurySharesEtcMember': 'NumberOfTreasurySharesWithFullVotingRights',
-        'CurrentYearInstant_OrdinarySharesSharesLessThanOneUnitMember': 'NumberOfSharesLessThanOneUnit'
-    }
-    
-    shares_data = {col_name: shares_df.loc[shares_df['コンテキストID'] == ctx_id, '値'].iloc[0] if not shares_df[shares_df['コンテキストID'] == ctx_id].empty else None
-                   for ctx_id, col_name in context_map.items()}
-    
-    result_df = pd.DataFrame([shares_data])
-
-    return _finalize_df(
-        result_df, metadata,
-        ordered_columns=['SubmissionDate', 'FiscalPeriodEnd', 'SecuritiesCode', 'TotalNumberOfIssuedShares', 'NumberOfOtherSharesWithFullVotingRights', 'NumberOfTreasurySharesWithFullVotingRights', 'NumberOfSharesLessThanOneUnit'],
-        numeric_cols=['TotalNumberOfIssuedShares', 'NumberOfOtherSharesWithFullVotingRights', 'NumberOfTreasurySharesWithFullVotingRights', 'NumberOfSharesLessThanOneUnit']
-    )
+    return extract_product(df, 'VotingRights')
 
 # --- 自己株券買付状況報告書パーサー ---
 
@@ -525,6 +262,33 @@ def parse_buyback_status_report(df: pd.DataFrame, ordinance_code: str = "crp") -
         ordered_columns=ordered_columns
     )
 
+def parse_buyback_acquisition_detail(df: pd.DataFrame, ordinance_code: str = "crp") -> pd.DataFrame:
+    """
+    自己株券買付状況報告書の取得状況・処理状況・保有状況の TextBlock の表から、行ごとの決議日・取得期間・取得日・
+    株式数・価額の総額・累計・進捗状況を抽出する (表の解析は buyback_tables.py)。
+
+    Args:
+        df (pd.DataFrame): CSVから読み込んだDataFrame。
+        ordinance_code (str): 府令コード ('crp' または 'sps')。
+
+    Returns:
+        pd.DataFrame: section (TextBlock の種類) と rowNumber をキーとする、抽出・整形されたデータを含むDataFrame。
+    """
+    report = parse_buyback_status_report(df, ordinance_code=ordinance_code)
+    ordered_columns = ['dateFile', 'secCode'] + buyback_tables.DETAIL_COLUMNS
+    if report.empty:
+        return pd.DataFrame(columns=ordered_columns)
+    report_row = report.iloc[0]
+    text_blocks = {section: report_row[column] for section, column in buyback_tables.SECTION_COLUMNS.items()}
+    result_df = buyback_tables.extract_buyback_details(text_blocks, filing_date=report_row['dateFile'])
+
+    return _finalize_df(
+        result_df, {'dateFile': report_row['dateFile'], 'secCode': report_row['secCode']},
+        ordered_columns=ordered_columns,
+        numeric_cols=buyback_tables.NUMERIC_COLUMNS,
+        date_cols=['dateFile'] + buyback_tables.DATE_COLUMNS,
+    )
+
 # --- 統合テスト ---
 
 if __name__ == "__main__":
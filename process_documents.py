@@ -1,92 +1,126 @@
+import datetime
+import logging
 import database_manager
 import document_processor
+import metrics
+import profiling
+import scheduler
+import supersession
 import pandas as pd
 import os
+import random
 import shutil
+import socket
+import threading
+import time
 
 from definitions import DOCUMENT_TYPE_DEFINITIONS, DATA_PRODUCT_DEFINITIONS
+from logging_config import setup_logging
 
+logger = logging.getLogger(__name__)
+
+
+# --- 再試行キューの設定 ---
+# この回数だけ失敗した書類は隔離 (quarantined) し、以降は自動で再試行しない
+MAX_RETRY_ATTEMPTS = 5
+# 再試行までの待機時間は RETRY_BASE_DELAY * 2^(失敗回数-1) とし、RETRY_MAX_DELAY を上限とする
+RETRY_BASE_DELAY = datetime.timedelta(minutes=15)
+RETRY_MAX_DELAY = datetime.timedelta(days=1)
+
+# --- 複数ワーカーでの分散処理 (リース) の設定 ---
+# ワーカーが一度に確保する書類数
+LEASE_BATCH_SIZE = 20
+# ハートビートが途絶えてからこの時間が経過したリースは、他のワーカーが確保し直す
+LEASE_DURATION = datetime.timedelta(minutes=10)
+HEARTBEAT_INTERVAL = datetime.timedelta(minutes=2)
+# 確保できる書類がなく、他のワーカーが処理中の書類が残っている場合の待機時間 (秒)
+WORKER_POLL_INTERVAL = 30
+# 未確保の書類が残っているのに、他のワーカーとの取り合いで確保できなかった場合の待機時間 (秒)。
+# 連続して確保できないたびに倍にし (WORKER_POLL_INTERVAL を上限)、ワーカー間で揃わないようにランダムに揺らす
+WORKER_CLAIM_BACKOFF = 1
 
-def process_documents(target_data_products: list[str]):
-    """
-    指定されたデータプロダクトに基づいてドキュメントを処理します。
-    ダウンロードはドキュメントごとに1回のみ実行されます。
-    """
-    print(f"Processing documents for data products: {', '.join(target_data_products)}")
 
-    # ステップ1: 必要な「書類種別」を特定
+def _get_codes_to_fetch(target_data_products: list[str]) -> set:
+    """データプロダクトのリストから、対象となる(form_code, ordinance_code)タプルのセットを作成する。"""
+    # 必要な「書類種別」を特定
     required_doc_types = set()
     for product in target_data_products:
         doc_type = DATA_PRODUCT_DEFINITIONS.get(product)
         if doc_type:
             required_doc_types.add(doc_type)
         else:
-            print(f"Warning: Data product '{product}' is not defined. Skipping.")
+            logger.warning("Data product '%s' is not defined. Skipping.", product)
 
-    if not required_doc_types:
-        print("No valid data products specified. Nothing to process.")
-        return
-
-    # ステップ2: 必要な(form_code, ordinance_code)タプルのセットを作成
     codes_to_fetch = set()
     for doc_type in required_doc_types:
         codes = DOCUMENT_TYPE_DEFINITIONS.get(doc_type)
         if codes:
             codes_to_fetch.update(codes)
+    return codes_to_fetch
 
-    if not codes_to_fetch:
-        print("Could not find any document codes for the specified data products.")
-        return
 
-    # ステップ3: 対象となるすべてのユニークな書類をDBから取得 (ここで重複ダウンロードが防止される)
-    documents_to_process = database_manager.get_documents_by_codes(list(codes_to_fetch))
+def _process_single_document(document: tuple, target_data_products: list[str]) -> str:
+    """
+    1件の書類をダウンロード・解析し、要求されたデータプロダクトをDBに保存する。
 
-    if not documents_to_process:
-        print(f"No target documents found for the specified data products.")
-        return
+    Args:
+        document (tuple): (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber)
+        target_data_products (list[str]): 保存対象のデータプロダクト名のリスト。
 
-    # ステップ4: 各書類について処理を実行
-    for date_file, doc_id, form_code, ordinance_code, ordinance_code_short, seq_number in documents_to_process:
-        print(f"\n--- Processing docID: {doc_id} (Date: {date_file}, Form: {form_code}, Ordinance: {ordinance_code}) ---")
-        
+    Returns:
+        str: 処理結果 ('processed' または 'no_data')。
+
+    Raises:
+        document_processor.DocumentProcessingError: いずれかのステージで処理に失敗した場合。
+    """
+    date_file, doc_id, form_code, ordinance_code, ordinance_code_short, seq_number = document
+
+    with metrics.timer('document', formCode=form_code):
         csv_path = None # クリーンアップ処理のためにスコープを広げる
         try:
-            # 4a. 書類をダウンロードしてファイルパスを取得
-            csv_path = document_processor.fetch_and_save_document(doc_id, ordinance_code_short)
-            
-            if not csv_path:
-                print(f"    Skipping docID {doc_id} due to download/save failure.")
-                continue
-                
-            # 4b. ファイルを解析して複数のデータタイプを抽出
-            extracted_data_map = document_processor.parse_document_file(
-                csv_path, 
-                form_code=form_code, 
-                ordinance_code=ordinance_code, 
-                ordinance_code_short=ordinance_code_short
-            )
-            
+            # a. 書類をダウンロードしてファイルパスを取得
+            with metrics.timer('fetch_and_save', formCode=form_code):
+                csv_path = document_processor.fetch_and_save_document(doc_id, ordinance_code_short, raise_errors=True)
+
+            # b. ファイルを解析して複数のデータタイプを抽出
+            # 一部のパーサーのみ失敗した場合は、成功した分を保存してから失敗として扱う
+            parse_error = None
+            try:
+                with metrics.timer('parse_document', formCode=form_code):
+                    extracted_data_map = document_processor.parse_document_file(
+                        csv_path,
+                        form_code=form_code,
+                        ordinance_code=ordinance_code,
+                        ordinance_code_short=ordinance_code_short,
+                        raise_errors=True,
+                        products=target_data_products
+                    )
+            except document_processor.DocumentProcessingError as e:
+                if not e.partial_results:
+                    raise
+                parse_error = e
+                extracted_data_map = e.partial_results
+
             if not extracted_data_map:
-                print(f"    No data extracted for docID: {doc_id}")
-                continue
+                logger.info("No data extracted for docID: %s", doc_id)
+                return 'no_data'
+
+            # c. 要求された各プロダクトについて、抽出結果を確認しDBに保存
+            current_doc_type = None
+            for dt, codes in DOCUMENT_TYPE_DEFINITIONS.items():
+                if (form_code, ordinance_code) in codes:
+                    current_doc_type = dt
+                    break
 
-            # 4c. 要求された各プロダクトについて、抽出結果を確認しDBに保存
             for product_name in target_data_products:
                 # この書類が対象としているプロダクトか確認
-                doc_type_of_product = DATA_PRODUCT_DEFINITIONS.get(product_name)
-                current_doc_type = None
-                for dt, codes in DOCUMENT_TYPE_DEFINITIONS.items():
-                    if (form_code, ordinance_code) in codes:
-                        current_doc_type = dt
-                        break
-                
-                if doc_type_of_product != current_doc_type:
+                if DATA_PRODUCT_DEFINITIONS.get(product_name) != current_doc_type:
                     continue # この書類は当該プロダクトの対象外
 
                 # データが抽出されたか確認
                 df = extracted_data_map.get(product_name)
                 if df is None or df.empty:
-                    print(f"    Info: No data found for '{product_name}' in docID: {doc_id}")
+                    logger.info("No data found for '%s' in docID: %s", product_name, doc_id)
                     continue
 
                 # 共通のメタデータをDataFrameに追加
@@ -99,24 +133,338 @@ def process_documents(target_data_products: list[str]):
                         df['dateFile'] = date_file
 
                 # 汎用保存関数を呼び出す
-                database_manager.save_data(df, product_name)
+                try:
+                    database_manager.save_data(df, product_name, raise_errors=True)
+                except Exception as e:
+                    raise document_processor.DocumentProcessingError(
+                        'db_save', f"Failed to save {product_name} for docID {doc_id}: {e}") from e
+            if parse_error:
+                raise parse_error
+            return 'processed'
         finally:
-            # 4d. 処理済みのCSVファイルとフォルダを削除
+            # d. 処理済みのCSVファイルとフォルダを削除
             if csv_path:
                 try:
                     doc_folder_path = os.path.dirname(csv_path)
                     if os.path.exists(doc_folder_path):
                         shutil.rmtree(doc_folder_path)
-                        print(f"    Cleaned up temporary folder: {doc_folder_path}")
+                        logger.debug("Cleaned up temporary folder: %s", doc_folder_path)
                 except Exception as e:
-                    print(f"    Warning: Failed to clean up temporary folder {doc_folder_path}: {e}")
+                    logger.warning("Failed to clean up temporary folder %s: %s", doc_folder_path, e)
 
-    print(f"\n--- Finished processing for all specified data products. ---")
+
+def _record_failure(document: tuple, error: document_processor.DocumentProcessingError, previous: dict | None) -> dict:
+    """
+    失敗した書類を再試行キューに記録する。失敗回数が MAX_RETRY_ATTEMPTS に達した書類は隔離する。
+    previous には、キューに既に登録されているエントリ (初回の失敗時は None) を渡す。
+    """
+    date_file, doc_id, form_code, ordinance_code, ordinance_code_short, seq_number = document
+    now = datetime.datetime.now()
+    attempts = int(previous['attempts']) + 1 if previous else 1
+    status = 'quarantined' if attempts >= MAX_RETRY_ATTEMPTS else 'pending'
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    entry = {
+        'docID': doc_id,
+        'dateFile': date_file,
+        'seqNumber': seq_number,
+        'formCode': form_code,
+        'ordinanceCode': ordinance_code,
+        'ordinanceCodeShort': ordinance_code_short,
+        'stage': error.stage,
+        'errorClass': error.error_class,
+        'errorMessage': str(error)[:1000],
+        'attempts': attempts,
+        'status': status,
+        'firstFailedAt': previous['firstFailedAt'] if previous else now,
+        'lastFailedAt': now,
+        'nextRetryAt': now + delay if status == 'pending' else None,
+    }
+    database_manager.save_retry_entry(entry)
+    if status == 'quarantined':
+        metrics.inc('documents', status='quarantined', formCode=form_code)
+        logger.error("Quarantined docID %s after %s failed attempts (last stage: %s, %s).", doc_id, attempts, error.stage, error.error_class)
+    else:
+        logger.warning("Queued docID %s for retry at %s (attempt %s, stage: %s, %s).", doc_id, entry['nextRetryAt'], attempts, error.stage, error.error_class)
+    return entry
+
+
+def _run_documents(documents: list[tuple], target_data_products: list[str], queue: dict):
+    """
+    書類のリスト (または scheduler.PriorityScheduler) を順に処理する。失敗した書類は再試行キューに記録し、
+    キューに登録済みの書類が成功した場合はキューから削除する。
+
+    Args:
+        queue (dict): docID をキー、再試行キューのエントリ (辞書) を値とする辞書。
+
+    Returns:
+        dict: docID をキー、処理結果 ('processed', 'no_data', 'failed') を値とする辞書。
+    """
+    results = {}
+    succeeded = []
+    for document in documents:
+        date_file, doc_id, form_code, ordinance_code = document[:4]
+        logger.info("--- Processing docID: %s (Date: %s, Form: %s, Ordinance: %s) ---", doc_id, date_file, form_code, ordinance_code)
+        try:
+            status = _process_single_document(document, target_data_products)
+        except document_processor.DocumentProcessingError as e:
+            metrics.inc('documents', status='failed', stage=e.stage, formCode=form_code)
+            logger.warning("Failed to process docID %s at stage '%s': %s", doc_id, e.stage, e)
+            queue[doc_id] = _record_failure(document, e, queue.get(doc_id))
+            results[doc_id] = 'failed'
+            continue
+        metrics.inc('documents', status=status, formCode=form_code)
+        results[doc_id] = status
+        if doc_id in queue:
+            succeeded.append(doc_id)
+            del queue[doc_id]
+    database_manager.delete_retry_entries(succeeded)
+    return results
+
+
+def _effective_document_filter(codes_to_fetch: set, include_superseded: bool = False):
+    """
+    書類のイテレーターから、訂正報告書に置き換えられた原本と取下げ・非開示の書類を除く関数を返す。
+    include_superseded が True の場合は、すべての書類をそのまま返す関数を返す。
+    """
+    if include_superseded:
+        return lambda documents: documents
+    index = supersession.SupersessionIndex.build(codes_to_fetch)
+    if index:
+        logger.info("Skipping up to %s superseded, withdrawn or undisclosed documents.", len(index))
+    return index.filter
+
+
+def _load_retry_queue() -> dict:
+    """再試行キューを docID をキーとする辞書として読み込む。"""
+    queue_df = database_manager.get_retry_queue()
+    if queue_df.empty:
+        return {}
+    return {row['docID']: row for row in queue_df.to_dict('records')}
+
+
+@profiling.profiled_run('process_documents')
+def process_documents(target_data_products: list[str], date_from=None, date_to=None, edinet_codes: list[str] | None = None,
+                      include_superseded: bool = False):
+    """
+    指定されたデータプロダクトに基づいてドキュメントを処理します。
+    ダウンロードはドキュメントごとに1回のみ実行され、scheduler.py の優先度の順に処理されます。
+    処理に失敗した書類は再試行キューに記録され、隔離済みの書類はスキップされます。
+    訂正報告書に置き換えられた原本と、取下げ・非開示の書類もスキップされます (supersession.py)。
+
+    Args:
+        date_from, date_to (optional): 対象とする書類の dateFile の範囲 (両端を含む)。
+        edinet_codes (list[str], optional): 対象とする提出者の edinetCode。
+        include_superseded (bool): True の場合、訂正前の原本や取下げ済みの書類も処理する。
+    """
+    logger.info("Processing documents for data products: %s", ', '.join(target_data_products))
+
+    # ステップ1: 必要な(form_code, ordinance_code)タプルのセットを作成
+    codes_to_fetch = _get_codes_to_fetch(target_data_products)
+    if not codes_to_fetch:
+        logger.info("Could not find any document codes for the specified data products.")
+        return
+
+    # ステップ2: 隔離済みの書類を確認
+    queue = _load_retry_queue()
+    quarantined = {doc_id for doc_id, entry in queue.items() if entry['status'] == 'quarantined'}
+    if quarantined:
+        logger.info("Skipping %s quarantined documents.", len(quarantined))
+    select_effective = _effective_document_filter(codes_to_fetch, include_superseded)
+
+    # ステップ3: 対象となるすべてのユニークな書類をDBから日付の新しい順に順次取得し (ここで重複ダウンロードが防止される)、
+    # 優先度の高い書類 (新しい書類・大量保有報告書など) から順に処理を実行
+    documents_to_process = (
+        d for d in select_effective(database_manager.iter_documents_by_codes(
+            list(codes_to_fetch), date_from=date_from, date_to=date_to, edinet_codes=edinet_codes, raise_errors=True))
+        if d[1] not in quarantined
+    )
+
+    # 実行中に提出された書類も、scheduler.REFRESH_INTERVAL ごとに取り込んで優先的に処理する
+    # (取得に失敗して一覧が途中までになっても、次回の取り込みで未登録の書類が追加されるため例外は送出しない)
+    def fetch_new_documents():
+        since = datetime.date.today() - datetime.timedelta(days=scheduler.LIVE_WINDOW_DAYS)
+        if date_from is not None:
+            since = max(since, pd.Timestamp(date_from).date())
+        return [
+            d for d in select_effective(
+                database_manager.iter_documents_by_codes(list(codes_to_fetch), date_from=since, edinet_codes=edinet_codes))
+            if d[1] not in quarantined
+        ]
+
+    schedule = scheduler.PriorityScheduler(stream=documents_to_process, refresh=fetch_new_documents if date_to is None else None)
+    results = _run_documents(schedule, target_data_products, queue)
+    if not results:
+        logger.info("No target documents found for the specified data products.")
+        return
+
+    logger.info("--- Finished processing for all specified data products. ---")
+    if metrics.is_enabled():
+        metrics.print_summary()
+        metrics.write_reports()
+
+
+@profiling.profiled_run('retry_failed_documents')
+def retry_failed_documents(target_data_products: list[str], limit: int | None = None):
+    """
+    再試行キューのうち、再試行時刻を過ぎた書類のみを処理する。
+    障害からの復旧時に、失敗した書類だけを対象に処理をやり直すために使用する。
+
+    Args:
+        target_data_products (list[str]): 保存対象のデータプロダクト名のリスト。
+        limit (int, optional): 1回の実行で再試行する書類数の上限。
+    """
+    codes_to_fetch = _get_codes_to_fetch(target_data_products)
+    due_documents = [
+        d for d in database_manager.get_due_retry_documents(datetime.datetime.now(), limit=limit)
+        if (d[2], d[3]) in codes_to_fetch
+    ]
+    if not due_documents:
+        logger.info("No documents are due for retry.")
+        return
+    logger.info("Retrying %s documents for data products: %s", len(due_documents), ', '.join(target_data_products))
+
+    _run_documents(due_documents, target_data_products, _load_retry_queue())
+
+    logger.info("--- Finished retrying failed documents. ---")
+    if metrics.is_enabled():
+        metrics.print_summary()
+        metrics.write_reports()
+
+class _LeaseHeartbeat:
+    """
+    with 文の間、バックグラウンドのスレッドで HEARTBEAT_INTERVAL ごとにリースの期限を延長する。
+    書類の処理に時間がかかっても、ワーカーが生きている限りリースが他のワーカーに奪われないようにする。
+    """
+
+    def __init__(self, token: str):
+        self.token = token
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='edinet-lease-heartbeat', daemon=True)
+
+    def _run(self):
+        while not self._stop_event.wait(HEARTBEAT_INTERVAL.total_seconds()):
+            if database_manager.renew_lease(self.token, LEASE_DURATION) == 0:
+                logger.warning("Lease %s could not be renewed. Its documents may be reclaimed by another worker.", self.token)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop_event.set()
+        self._thread.join()
+        return False
+
+
+def enqueue_documents(target_data_products: list[str], include_superseded: bool = False) -> int:
+    """
+    対象の書類をリーステーブルに登録し、新たに登録した件数を返す。隔離済みの書類と、
+    (include_superseded が False の場合) 訂正報告書に置き換えられた原本・取下げ・非開示の書類は登録しない。
+    登録済みの書類はそのまま残るため、書類一覧を更新した後に再実行すると新しい書類のみが追加される。
+    """
+    codes_to_fetch = _get_codes_to_fetch(target_data_products)
+    if not codes_to_fetch:
+        logger.info("Could not find any document codes for the specified data products.")
+        return 0
+    select_effective = _effective_document_filter(codes_to_fetch, include_superseded)
+    documents = list(select_effective(database_manager.iter_documents_by_codes(list(codes_to_fetch), raise_errors=True)))
+    quarantined = {doc_id for doc_id, entry in _load_retry_queue().items() if entry['status'] == 'quarantined'}
+    documents = [d for d in documents if d[1] not in quarantined]
+    return database_manager.enqueue_lease_documents(documents)
+
+
+@profiling.profiled_run('run_worker')
+def run_worker(target_data_products: list[str], worker_id: str | None = None, batch_size: int = LEASE_BATCH_SIZE,
+               enqueue: bool = True, include_superseded: bool = False):
+    """
+    リーステーブルから書類をバッチ単位で確保して処理するワーカー。
+    同じDBに接続した複数のプロセス・マシンで同時に実行でき、各書類は1つのワーカーだけが処理する。
+
+    - 確保した書類のリースは、処理中はハートビートで延長される。ワーカーが異常終了した場合、
+      LEASE_DURATION の経過後に他のワーカーが確保し直す。
+    - 処理を終えた書類は 'done' (失敗した場合は 'failed') となり、再び確保されることはない。
+      失敗した書類は通常の実行と同じく再試行キューに記録されるため、--retry で再処理する。
+    - 確保できる書類がなくなった時点で、他のワーカーが処理中の書類も残っていなければ終了する。
+
+    Args:
+        target_data_products (list[str]): 保存対象のデータプロダクト名のリスト。
+        worker_id (str, optional): ワーカーの識別子。省略時は "<ホスト名>-<プロセスID>"。
+        batch_size (int): 一度に確保する書類数。
+        enqueue (bool): 開始時に対象の書類をリーステーブルに登録するかどうか。
+        include_superseded (bool): 登録時に、訂正前の原本や取下げ済みの書類も含めるかどうか。
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    codes_to_fetch = list(_get_codes_to_fetch(target_data_products))
+    if not codes_to_fetch:
+        logger.info("Could not find any document codes for the specified data products.")
+        return
+    if enqueue:
+        enqueue_documents(target_data_products, include_superseded=include_superseded)
+    logger.info("Worker %s started for data products: %s", worker_id, ', '.join(target_data_products))
+
+    n_processed = 0
+    n_failed_claims = 0
+    while True:
+        token, documents = database_manager.claim_lease_documents(worker_id, batch_size, LEASE_DURATION, codes=codes_to_fetch)
+        if not documents:
+            counts = database_manager.get_lease_status_counts(codes=codes_to_fetch)
+            if counts.get('pending'):
+                # 取り合いに負け続けた場合に、全ワーカーが待機なしでDBに確保を繰り返さないようにする
+                n_failed_claims += 1
+                backoff = min(WORKER_CLAIM_BACKOFF * 2 ** (n_failed_claims - 1), WORKER_POLL_INTERVAL)
+                logger.debug("Could not claim any of %s pending documents. Retrying in up to %s s.", counts['pending'], backoff)
+                time.sleep(random.uniform(backoff / 2, backoff))
+                continue
+            if not counts.get('leased'):
+                break
+            # 他のワーカーが処理中の書類は、そのワーカーが終了するかリースが期限切れになるまで待つ
+            logger.info("Waiting for %s documents leased by other workers.", counts.get('leased', 0))
+            time.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        n_failed_claims = 0
+        logger.info("Worker %s claimed %s documents (lease %s).", worker_id, len(documents), token)
+        try:
+            with _LeaseHeartbeat(token):
+                results = _run_documents(documents, target_data_products, _load_retry_queue())
+        except BaseException:
+            database_manager.release_lease(token)
+            raise
+        database_manager.finish_lease_documents(
+            token, {doc_id: 'failed' if status == 'failed' else 'done' for doc_id, status in results.items()}
+        )
+        n_processed += len(results)
+
+    logger.info("--- Worker %s finished after processing %s documents. ---", worker_id, n_processed)
+    if metrics.is_enabled():
+        metrics.print_summary()
+        metrics.write_reports(run_id=f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{worker_id}")
 
 if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Download, parse and save EDINET documents for the target data products.')
+    arg_parser.add_argument('--retry', action='store_true', help='再試行キューのうち、再試行時刻を過ぎた書類のみを処理する')
+    arg_parser.add_argument('--retry-limit', type=int, help='再試行する書類数の上限')
+    arg_parser.add_argument('--enqueue', action='store_true', help='対象の書類をリーステーブルに登録するのみ (ワーカーは起動しない)')
+    arg_parser.add_argument('--worker', action='store_true', help='リーステーブルから書類を確保して処理するワーカーとして実行する')
+    arg_parser.add_argument('--worker-id', help='ワーカーの識別子 (省略時は <ホスト名>-<プロセスID>)')
+    arg_parser.add_argument('--batch-size', type=int, default=LEASE_BATCH_SIZE, help='ワーカーが一度に確保する書類数')
+    arg_parser.add_argument('--date-from', type=datetime.date.fromisoformat, help='対象とする書類の提出日の開始日 (YYYY-MM-DD)')
+    arg_parser.add_argument('--date-to', type=datetime.date.fromisoformat, help='対象とする書類の提出日の終了日 (YYYY-MM-DD)')
+    arg_parser.add_argument('--edinet-codes', nargs='+', help='対象とする提出者の edinetCode')
+    arg_parser.add_argument('--include-superseded', action='store_true',
+                            help='訂正報告書に置き換えられた原本や、取下げ・非開示の書類も処理する')
+    arg_parser.add_argument('--profile', action='store_true', help='プロファイルを profiles/ に出力する')
+    arg_parser.add_argument('--profile-memory', action='store_true', help='プロファイルにメモリ使用量を含める')
+    args = arg_parser.parse_args()
+    setup_logging()
+    if args.profile or args.profile_memory:
+        profiling.enable(memory=args.profile_memory)
+
     # 処理対象のデータプロダクトリスト
     # 'MajorShareholders', 'ShareholderComposition', 'Officer', 'SpecifiedInvestment', 'VotingRights'
-    # 'LargeVolumeHoldingReport', 'BuybackStatusReport' から選択
+    # 'LargeVolumeHoldingReport', 'BuybackStatusReport', 'BuybackAcquisitionDetail' から選択
     TARGET_DATA_PRODUCTS = [
         #'MajorShareholders',
         #'ShareholderComposition',
@@ -127,4 +475,13 @@ if __name__ == "__main__":
         'LargeVolumeHoldingReport'
     ]
 
-    process_documents(TARGET_DATA_PRODUCTS)
\ No newline at end of file
+    if args.retry:
+        retry_failed_documents(TARGET_DATA_PRODUCTS, limit=args.retry_limit)
+    elif args.enqueue:
+        enqueue_documents(TARGET_DATA_PRODUCTS, include_superseded=args.include_superseded)
+    elif args.worker:
+        run_worker(TARGET_DATA_PRODUCTS, worker_id=args.worker_id, batch_size=args.batch_size,
+                   include_superseded=args.include_superseded)
+    else:
+        process_documents(TARGET_DATA_PRODUCTS, date_from=args.date_from, date_to=args.date_to, edinet_codes=args.edinet_codes,
+                          include_superseded=args.include_superseded)
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+プロファイリング・モジュール
+
+metrics.timer() のステージ (document, parse, db_save など) にフックして、実際の書類を処理した際の
+ホットスポットを記録する。単一書類の処理 (document_processor.process_single_document) と
+process_documents の全体実行の両方で使える。
+
+有効化:
+    環境変数 EDINET_PROFILE=1 (メモリ計測は EDINET_PROFILE_MEMORY=1) または各スクリプトの --profile フラグ
+
+出力 (profiles/<run_id>/):
+    <stage>.prof      最も外側のステージごとの cProfile 統計 (pstats / snakeviz で閲覧)
+    run.prof          全ステージを合算した cProfile 統計
+    summary.txt       累積時間の上位関数の一覧
+    stacks.folded     サンプリングによる collapsed stack 形式。ステージ名がルートのフレームになるため、
+                      flamegraph.pl や speedscope でパーサー・DB呼び出しごとの時間を確認できる
+    memory.json       ステージごとのメモリ使用量 (メモリ計測時のみ。他のスレッドと同時に実行されたステージは回数のみ)
+    memory_top.txt    実行終了時点の確保量の上位行 (メモリ計測時のみ)
+    memory.snapshot   tracemalloc のスナップショット (メモリ計測時のみ)
+"""
+import collections
+import cProfile
+import datetime
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+DEFAULT_OUTPUT_DIR = os.getenv('EDINET_PROFILE_DIR', 'profiles')
+# スタックのサンプリング間隔 (秒)
+DEFAULT_SAMPLE_INTERVAL = float(os.getenv('EDINET_PROFILE_INTERVAL', '0.005'))
+SUMMARY_TOP_N = 40
+
+_enabled = os.getenv('EDINET_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+_memory = os.getenv('EDINET_PROFILE_MEMORY', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def enable(flag: bool = True, memory: bool | None = None):
+    """プロファイリングの有効/無効 (とメモリ計測の有無) を切り替える。"""
+    global _enabled, _memory
+    _enabled = flag
+    if memory is not None:
+        _memory = memory
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _stage_frame_name(stage: str, labels: dict) -> str:
+    """ステージを flamegraph 上の1フレームとして表す名前を返す (例: parse[030000,MajorShareholders])。"""
+    values = [str(v) for _, v in sorted(labels.items()) if v is not None]
+    return f"{stage}[{','.join(values)}]" if values else stage
+
+
+class RunProfiler:
+    """
+    1回の実行分のプロファイルを記録する。metrics のステージフックとして登録して使う。
+
+    - cProfile はスレッドごとに最も外側のステージでのみ有効化する (cProfile は入れ子にできないため)。
+      内側のステージ (各パーサーやDB保存) の時間は、統計上の関数名とサンプリング結果で確認する。
+    - サンプリング用のスレッドが一定間隔で各スレッドのスタックを取得し、collapsed stack 形式で集計する。
+    - tracemalloc の確保量・ピークはプロセス全体の値のため、メモリ使用量は他のスレッドのステージと重ならずに
+      実行されたステージについてのみ記録する。重なったステージは回数 (concurrent_count) のみ数える。
+    """
+
+    def __init__(self, run_id: str | None = None, output_dir: str = DEFAULT_OUTPUT_DIR, memory: bool = False,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.run_id = run_id or datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_path = os.path.join(output_dir, self.run_id)
+        self.memory = memory
+        self.sample_interval = sample_interval
+
+        self._stacks = {}  # thread_id -> [ステージのフレーム名, ...]
+        self._profiles = {}  # (stage, thread_id) -> cProfile.Profile
+        self._memory_marks = {}  # thread_id -> [(開始時の確保量, 開始時の _concurrency_epoch, 開始時に他のスレッドがステージ内か), ...]
+        self._memory_stats = {}  # ステージのフレーム名 -> {'count', 'concurrent_count', 'max_peak_mb', 'max_growth_mb'}
+        self._memory_threads = set()  # ステージを実行中のスレッド
+        self._concurrency_epoch = 0  # 他のスレッドのステージ実行中に、別のスレッドがステージを開始した回数
+        self._samples = collections.Counter()
+        self._root_thread = None
+        self._sampler = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._started_at = None
+
+    # --- metrics のステージフック ---
+    def on_stage_enter(self, stage: str, labels: dict):
+        thread_id = threading.get_ident()
+        stack = self._stacks.setdefault(thread_id, [])
+        stack.append(_stage_frame_name(stage, labels))
+        if self.memory:
+            with self._lock:
+                if len(stack) == 1:
+                    if self._memory_threads:
+                        self._concurrency_epoch += 1
+                    else:
+                        # reset_peak はプロセス全体に作用するため、他のスレッドのステージがない場合のみ行う
+                        tracemalloc.reset_peak()
+                    self._memory_threads.add(thread_id)
+                mark = (tracemalloc.get_traced_memory()[0], self._concurrency_epoch, len(self._memory_threads) > 1)
+            self._memory_marks.setdefault(thread_id, []).append(mark)
+        if len(stack) == 1:
+            with self._lock:
+                profile = self._profiles.setdefault((stage, thread_id), cProfile.Profile())
+            profile.enable()
+
+    def on_stage_exit(self, stage: str, labels: dict, seconds: float, failed: bool):
+        thread_id = threading.get_ident()
+        stack = self._stacks.get(thread_id)
+        if not stack:
+            return
+        if len(stack) == 1:
+            self._profiles[(stage, thread_id)].disable()
+        frame_name = stack.pop()
+        if self.memory:
+            start_bytes, epoch, concurrent = self._memory_marks[thread_id].pop()
+            current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                # 開始時・実行中に他のスレッドがステージを実行していた場合は、その確保量が含まれるため記録しない
+                concurrent = concurrent or epoch != self._concurrency_epoch or len(self._memory_threads) > 1
+                if not stack:
+                    self._memory_threads.discard(thread_id)
+                entry = self._memory_stats.setdefault(
+                    frame_name, {'count': 0, 'concurrent_count': 0, 'max_peak_mb': 0.0, 'max_growth_mb': 0.0})
+                entry['count'] += 1
+                if concurrent:
+                    entry['concurrent_count'] += 1
+                    return
+                entry['max_growth_mb'] = max(entry['max_growth_mb'], (current - start_bytes) / 1024 / 1024)
+                # ピークは最も外側のステージでのみ reset_peak しているため、そのステージについてのみ記録する
+                if not stack:
+                    entry['max_peak_mb'] = max(entry['max_peak_mb'], (peak - start_bytes) / 1024 / 1024)
+
+    # --- サンプリング ---
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.sample_interval):
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stage_stack = self._stacks.get(thread_id)
+                # ステージ外の処理は、プロファイラーを開始したスレッドのもののみ記録する
+                if not stage_stack and thread_id != self._root_thread:
+                    continue
+                code_frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    code_frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                code_frames.reverse()
+                key = ';'.join(['run'] + list(stage_stack or []) + code_frames)
+                self._samples[key] += 1
+
+    def start(self):
+        self._root_thread = threading.get_ident()
+        self._started_at = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        metrics.add_stage_hook(self)
+        self._sampler = threading.Thread(target=self._sample_loop, name='edinet-profile-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self) -> str:
+        """計測を終了し、結果をファイルに書き出して出力先ディレクトリを返す。"""
+        metrics.remove_stage_hook(self)
+        self._stop_event.set()
+        self._sampler.join()
+        for profile in self._profiles.values():
+            profile.disable()
+        elapsed = time.perf_counter() - self._started_at
+        os.makedirs(self.output_path, exist_ok=True)
+        self._write_profiles(elapsed)
+        self._write_folded()
+        if self.memory:
+            self._write_memory()
+        logger.info("Profile for run '%s' written to %s", self.run_id, os.path.abspath(self.output_path))
+        return self.output_path
+
+    # --- 出力 ---
+    def _write_profiles(self, elapsed: float):
+        by_stage = collections.defaultdict(list)
+        for (stage, _), profile in self._profiles.items():
+            by_stage[stage].append(profile)
+
+        buffer = io.StringIO()
+        buffer.write(f"Run: {self.run_id}  (wall time {elapsed:.3f} s, samples {sum(self._samples.values())})\n")
+        run_stats = None
+        for stage, profiles in sorted(by_stage.items()):
+            stats = pstats.Stats(profiles[0], stream=buffer)
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(self.output_path, f'{stage}.prof'))
+            if run_stats is None:
+                run_stats = pstats.Stats(profiles[0], stream=buffer)
+                for profile in profiles[1:]:
+                    run_stats.add(profile)
+            else:
+                run_stats.add(stats)
+            buffer.write(f"\n===== stage: {stage} =====\n")
+            stats.sort_stats('cumulative').print_stats(SUMMARY_TOP_N // 2)
+
+        if run_stats is not None:
+            run_stats.dump_stats(os.path.join(self.output_path, 'run.prof'))
+            buffer.write("\n===== all stages (top functions by total time) =====\n")
+            run_stats.sort_stats('tottime').print_stats(SUMMARY_TOP_N)
+        with open(os.path.join(self.output_path, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+
+    def _write_folded(self):
+        with open(os.path.join(self.output_path, 'stacks.folded'), 'w', encoding='utf-8') as f:
+            for key, count in self._samples.most_common():
+                f.write(f'{key} {count}\n')
+
+    def _write_memory(self):
+        with open(os.path.join(self.output_path, 'memory.json'), 'w', encoding='utf-8') as f:
+            json.dump(self._memory_stats, f, ensure_ascii=False, indent=2)
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(os.path.join(self.output_path, 'memory.snapshot'))
+        with open(os.path.join(self.output_path, 'memory_top.txt'), 'w', encoding='utf-8') as f:
+            for stat in snapshot.statistics('lineno')[:SUMMARY_TOP_N]:
+                f.write(f'{stat}\n')
+        tracemalloc.stop()
+
+
+def profiled_run(name: str):
+    """
+    関数の実行全体をプロファイル対象にするデコレーター。
+    プロファイリングが無効の場合は、元の関数をそのまま呼び出す。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            run_id = f"{name}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            profiler = RunProfiler(run_id=run_id, memory=_memory).start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.stop()
+        return wrapper
+    return decorator
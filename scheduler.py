@@ -0,0 +1,223 @@
+"""
+書類処理の優先度スケジューラー
+
+get_documents_by_codes の結果を日付順にそのまま処理すると、過去分のバックフィルの後ろに当日の書類が
+並んでしまう。このモジュールは、書類ごとに優先度を付けて処理順を決める。
+
+優先度 (値が小さいほど先に処理する):
+    提出日からの経過日数 + 書類種別のオフセット (DOCUMENT_TYPE_OFFSET_DAYS) + 訂正書類のオフセット (AMENDMENT_OFFSET_DAYS)
+    例えば当日の大量保有報告書は 0、当日の有価証券報告書は 3 となり、4日前の大量保有報告書より先に処理される。
+
+レーン:
+    経過日数が LIVE_WINDOW_DAYS 以下の書類は 'live'、それより古い書類は 'backfill' のレーンに入れる。
+    両方のレーンに書類がある場合、処理時間が LANE_WEIGHTS の比率 (デフォルトは live:backfill = 4:1) になるように
+    レーンを選ぶ (重み付き公平キューイング)。バックフィルの実行中でも、新しい書類は次の1件から処理が始まる。
+
+使い方:
+    schedule = scheduler.PriorityScheduler(documents, refresh=fetch_documents)
+    schedule = scheduler.PriorityScheduler(stream=database_manager.iter_documents_by_codes(codes))
+    for document in schedule:   # refresh を指定すると、REFRESH_INTERVAL ごとに新しい書類を取り込む
+        process(document)
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import time
+import pandas as pd
+
+import metrics
+from definitions import DOCUMENT_TYPE_DEFINITIONS, AMENDMENT_CODES
+
+logger = logging.getLogger(__name__)
+
+# --- 優先度の設定 ---
+# 書類種別ごとに、経過日数に加算するオフセット (日)
+DOCUMENT_TYPE_OFFSET_DAYS = {
+    'LargeVolumeHoldingReport': 0,
+    'TenderOfferDocuments': 0,
+    'BuybackStatusReport': 1,
+    'AnnualSecuritiesReport': 3,
+}
+DEFAULT_TYPE_OFFSET_DAYS = 3
+# 訂正書類は、同じ時期の原本より後に処理する
+AMENDMENT_OFFSET_DAYS = 1
+
+# --- レーンの設定 ---
+# 経過日数がこの日数以下の書類を 'live' レーンで処理する
+LIVE_WINDOW_DAYS = 2
+# 両方のレーンに書類がある場合の、処理時間の配分比率
+LANE_WEIGHTS = {'live': 4, 'backfill': 1}
+# 実行中に提出された書類を取り込む間隔
+REFRESH_INTERVAL = datetime.timedelta(minutes=5)
+
+# (form_code, ordinance_code) -> 書類種別
+_DOC_TYPE_BY_CODE = {code: doc_type for doc_type, codes in DOCUMENT_TYPE_DEFINITIONS.items() for code in codes}
+
+
+def _age_days(document: tuple, today: datetime.date) -> int | None:
+    """提出日からの経過日数を返す。提出日が不明な場合は None を返す。"""
+    date_file = document[0]
+    return max((today - pd.Timestamp(date_file).date()).days, 0) if pd.notna(date_file) else None
+
+
+def classify(document: tuple, today: datetime.date | None = None) -> tuple[str, int]:
+    """
+    書類の (レーン, 優先度) を返す。
+
+    Args:
+        document (tuple): (dateFile, docID, formCode, ordinanceCode, ordinanceCodeShort, seqNumber)
+        today (datetime.date, optional): 経過日数の基準日。省略時は当日。
+    """
+    _, _, form_code, ordinance_code = document[:4]
+    age_days = _age_days(document, today or datetime.date.today())
+    doc_type = _DOC_TYPE_BY_CODE.get((form_code, ordinance_code))
+
+    priority = DOCUMENT_TYPE_OFFSET_DAYS.get(doc_type, DEFAULT_TYPE_OFFSET_DAYS)
+    if (form_code, ordinance_code) in AMENDMENT_CODES:
+        priority += AMENDMENT_OFFSET_DAYS
+    if age_days is None:
+        # 提出日が不明な書類は最後に処理する
+        return 'backfill', priority + 36500
+    lane = 'live' if age_days <= LIVE_WINDOW_DAYS else 'backfill'
+    return lane, priority + age_days
+
+
+class PriorityScheduler:
+    """
+    書類をレーンごとの優先度付きキューで管理し、処理する順に取り出す。
+    イテレーターとして使うと、取り出した書類の処理時間 (次の書類を取り出すまでの時間) をそのレーンの使用量として記録する。
+    """
+
+    def __init__(self, documents=(), refresh=None, refresh_interval: datetime.timedelta = REFRESH_INTERVAL,
+                 lane_weights: dict | None = None, stream=None):
+        """
+        Args:
+            documents: 初期の書類のリスト。
+            refresh (callable, optional): 引数なしで呼び出し、最新の書類のリストを返す関数。
+                refresh_interval ごとに呼び出し、まだ登録されていない書類を追加する。
+            lane_weights (dict, optional): レーン名をキー、処理時間の配分比率を値とする辞書。
+            stream (iterable, optional): 日付の新しい順に並んだ書類のイテレーター (database_manager.iter_documents_by_codes など)。
+                全件を読み込まず、次に取り出す書類が確定するまでの分だけを順に取り込む。
+        """
+        self.lane_weights = lane_weights or LANE_WEIGHTS
+        self.refresh = refresh
+        self.refresh_interval = refresh_interval.total_seconds()
+        self._heaps = {lane: [] for lane in self.lane_weights}
+        self._used_seconds = dict.fromkeys(self.lane_weights, 0.0)
+        self._seen = set()
+        self._counter = itertools.count()
+        self._last_refresh = time.monotonic()
+        self._stream = iter(stream) if stream is not None else None
+        self._frontier_days = None  # stream から取り込んだ書類の最大の経過日数
+        self.push(documents)
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self._heaps.values())
+
+    def pending_counts(self) -> dict[str, int]:
+        """レーンごとの待ち件数を返す。"""
+        return {lane: len(heap) for lane, heap in self._heaps.items()}
+
+    def push(self, documents) -> int:
+        """まだ登録されていない書類を追加し、追加した件数を返す。"""
+        today = datetime.date.today()
+        added = 0
+        for document in documents:
+            doc_id = document[1]
+            if doc_id in self._seen:
+                continue
+            self._seen.add(doc_id)
+            lane, priority = classify(document, today)
+            # 同じ優先度の書類は、日付順に並んだ元のリストの順序を保つ
+            heapq.heappush(self._heaps[lane], (priority, next(self._counter), time.monotonic(), document))
+            metrics.inc('documents_scheduled', lane=lane)
+            added += 1
+        return added
+
+    def _is_settled(self) -> bool:
+        """
+        stream からまだ取り込んでいない書類の優先度は、最後に取り込んだ書類の経過日数 (_frontier_days) 以上になる。
+        書類が入っている各レーンの先頭の優先度がその値以下であれば (live レーンは新しい書類が入らなくなっていれば)、
+        後から取り込む書類が先頭を追い越すことはないため、次に取り出す書類が確定している。
+        """
+        if self._frontier_days is None:
+            return False
+        active = [(lane, heap) for lane, heap in self._heaps.items() if heap]
+        return bool(active) and all(
+            heap[0][0] <= self._frontier_days or (lane == 'live' and self._frontier_days > LIVE_WINDOW_DAYS)
+            for lane, heap in active
+        )
+
+    def _fill_from_stream(self):
+        """次に取り出す書類の順序が確定するまで、stream から書類を取り込む。"""
+        today = datetime.date.today()
+        while self._stream is not None and not self._is_settled():
+            document = next(self._stream, None)
+            if document is None:
+                self._stream = None
+                break
+            self.push([document])
+            age_days = _age_days(document, today)
+            if age_days is not None:
+                self._frontier_days = max(self._frontier_days or 0, age_days)
+
+    def _select_lane(self) -> str | None:
+        """処理時間を配分比率で割った値が最も小さいレーンを選ぶ。"""
+        active = [lane for lane, heap in self._heaps.items() if heap]
+        if not active:
+            return None
+        virtual_time = min(self._used_seconds[lane] / self.lane_weights[lane] for lane in active)
+        # 空のレーンの使用量は他のレーンに合わせて進めておく。長く空だったレーンに書類が入った際に、
+        # 溜まった未使用分で他のレーンを止めてしまわないようにするため
+        for lane, heap in self._heaps.items():
+            if not heap:
+                self._used_seconds[lane] = max(self._used_seconds[lane], virtual_time * self.lane_weights[lane])
+        return min(active, key=lambda lane: self._used_seconds[lane] / self.lane_weights[lane])
+
+    def pop(self) -> tuple[str, tuple] | None:
+        """次に処理する書類を (レーン, 書類) として取り出す。書類がなければ None を返す。"""
+        self._fill_from_stream()
+        lane = self._select_lane()
+        if lane is None:
+            return None
+        _, _, pushed_at, document = heapq.heappop(self._heaps[lane])
+        metrics.observe('schedule_wait', time.monotonic() - pushed_at, lane=lane)
+        return lane, document
+
+    def charge(self, lane: str, seconds: float):
+        """レーンの使用量に処理時間を加算する。"""
+        self._used_seconds[lane] += seconds
+
+    def _maybe_refresh(self):
+        if self.refresh is None or time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = time.monotonic()
+        added = self.push(self.refresh())
+        if added:
+            logger.info("Scheduled %s new documents (pending: %s).", added, self.pending_counts())
+
+    def __iter__(self):
+        while True:
+            self._maybe_refresh()
+            item = self.pop()
+            if item is None:
+                return
+            lane, document = item
+            start = time.perf_counter()
+            yield document
+            self.charge(lane, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    # 優先度とレーンの確認
+    today = datetime.date.today()
+    sample_documents = [
+        (today - datetime.timedelta(days=400), 'S1000001', '030000', '010', 'crp', 1),
+        (today - datetime.timedelta(days=5), 'S1000002', '010000', '060', 'lvh', 1),
+        (today, 'S1000003', '030000', '010', 'crp', 1),
+        (today, 'S1000004', '030002', '060', 'lvh', 1),
+        (today, 'S1000005', '010000', '060', 'lvh', 1),
+    ]
+    for lane, document in iter(PriorityScheduler(sample_documents).pop, None):
+        print(lane, classify(document)[1], document)
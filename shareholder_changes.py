@@ -0,0 +1,286 @@
+"""
+大株主の前期からの変化 (MajorShareholderChanges)
+
+MajorShareholders には有価証券報告書ごとの大株主の状況が保存されている。発行者ごとに決算期の大株主を直前の決算期と比較し、
+新たに大株主となった株主 ('entry')、大株主でなくなった株主 ('exit')、保有割合が増減した株主 ('increase' / 'decrease') を
+MajorShareholderChanges に保持する。
+
+MajorShareholders への保存時 (database_manager.save_data) に、保存された書類の発行者・決算期と、その直前・直後の決算期のみを
+読み込んで差分を更新するため、更新にかかる処理量は新たに保存した書類の数に比例する。
+
+- 同じ決算期の書類が複数ある場合 (訂正報告書など) は、最後に提出された書類の大株主を使う。
+- 大株主は、名寄せ済み (EnrichedMajorShareholders) の場合は matchedEdinetCode、それ以外は名称で同一とみなす。
+  名寄せの実行後に --rebuild を実行すると、名寄せの結果で比較し直す。
+- 直前の決算期がない (最初の) 決算期は比較しない。
+
+使い方:
+    python shareholder_changes.py --rebuild                  # MajorShareholders の全件から作成し直す
+    python shareholder_changes.py --sec-code 72030           # 発行者の変化を表示する
+"""
+import argparse
+import logging
+
+import pandas as pd
+from sqlalchemy import Column, Date, MetaData, Numeric, String, Table, Unicode, column, delete, func, insert, select, table
+
+import database_manager
+import metrics
+from config import SHAREHOLDER_CHANGES_TABLE_NAME
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+SOURCE_TABLE_NAME = 'MajorShareholders'
+ENRICHED_TABLE_NAME = 'EnrichedMajorShareholders'
+# 保有割合・株式数の比較に使う小数の桁数 (MajorShareholders の DECIMAL(8, 5) に合わせる)
+RATIO_DECIMALS = 5
+
+# sql/create_table_major_shareholder_changes.sql と同じ定義 (テーブルが存在しない場合はこの定義から作成する)
+_metadata = MetaData()
+changes_table = Table(
+    SHAREHOLDER_CHANGES_TABLE_NAME, _metadata,
+    Column('SecuritiesCode', String(5), primary_key=True),
+    Column('FiscalPeriodEnd', Date, primary_key=True),
+    Column('holderKey', Unicode(255), primary_key=True),
+    Column('SubmissionDate', Date),
+    Column('docId', String(8)),
+    Column('previousFiscalPeriodEnd', Date),
+    Column('previousDocId', String(8)),
+    Column('MajorShareholderName', Unicode(255)),
+    Column('matchedEdinetCode', Unicode(6)),
+    Column('changeType', String(10), nullable=False),
+    Column('VotingRightsRatio', Numeric(8, 5)),
+    Column('previousVotingRightsRatio', Numeric(8, 5)),
+    Column('ratioChange', Numeric(8, 5)),
+    Column('NumberOfSharesHeld', Numeric(20, 0)),
+    Column('previousNumberOfSharesHeld', Numeric(20, 0)),
+    Column('sharesChange', Numeric(20, 0)),
+)
+CHANGE_COLUMNS = [c.name for c in changes_table.columns]
+
+_source = table(
+    SOURCE_TABLE_NAME,
+    column('docId'), column('SubmissionDate', Date), column('FiscalPeriodEnd', Date), column('SecuritiesCode'),
+    column('MajorShareholderName'), column('VotingRightsRatio'), column('NumberOfSharesHeld'),
+)
+_enriched = table(ENRICHED_TABLE_NAME, column('MajorShareholderName'), column('matchedEdinetCode'))
+
+
+# --- 差分の計算 ---
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """日付・数値の列の型をそろえる。"""
+    df = df.copy()
+    for col in df.columns.intersection(['SubmissionDate', 'FiscalPeriodEnd']):
+        df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
+    for col in df.columns.intersection(['VotingRightsRatio', 'NumberOfSharesHeld']):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def _latest_snapshots(rows: pd.DataFrame) -> dict:
+    """決算期ごとに、最後に提出された書類の大株主を返す。{FiscalPeriodEnd: DataFrame}"""
+    if rows.empty:
+        return {}
+    latest_doc = (rows.sort_values(['SubmissionDate', 'docId'])
+                  .drop_duplicates('FiscalPeriodEnd', keep='last')
+                  .set_index('FiscalPeriodEnd')['docId'])
+    return {period: rows[rows['docId'] == doc_id] for period, doc_id in latest_doc.items()}
+
+
+def _holders(snapshot: pd.DataFrame, holder_codes: dict) -> pd.DataFrame:
+    """大株主を holderKey ごとにまとめる (同じ株主が複数行に記載されている場合は合計する)。"""
+    holders = snapshot.assign(
+        MajorShareholderName=snapshot['MajorShareholderName'].str.strip(),
+        matchedEdinetCode=snapshot['MajorShareholderName'].str.strip().map(holder_codes),
+    )
+    holders['holderKey'] = holders['matchedEdinetCode'].fillna(holders['MajorShareholderName'])
+    return holders.groupby('holderKey').agg(
+        MajorShareholderName=('MajorShareholderName', 'first'),
+        matchedEdinetCode=('matchedEdinetCode', 'first'),
+        VotingRightsRatio=('VotingRightsRatio', lambda x: x.sum(min_count=1)),
+        NumberOfSharesHeld=('NumberOfSharesHeld', lambda x: x.sum(min_count=1)),
+    )
+
+
+def compare_snapshots(previous: pd.DataFrame, current: pd.DataFrame, holder_codes: dict) -> pd.DataFrame:
+    """
+    同じ発行者の2つの決算期の大株主を比較し、変化のあった大株主を MajorShareholderChanges の形式で返す。
+
+    Args:
+        previous (pd.DataFrame): 直前の決算期の書類の大株主。
+        current (pd.DataFrame): 比較する決算期の書類の大株主。
+        holder_codes (dict): 大株主の名称 -> matchedEdinetCode。
+    """
+    current_holders = _holders(current, holder_codes)
+    previous_holders = _holders(previous, holder_codes).rename(columns={
+        'MajorShareholderName': 'previousName', 'matchedEdinetCode': 'previousMatchedEdinetCode',
+        'VotingRightsRatio': 'previousVotingRightsRatio', 'NumberOfSharesHeld': 'previousNumberOfSharesHeld',
+    })
+    merged = current_holders.join(previous_holders, how='outer')
+    is_entry = ~merged.index.isin(previous_holders.index)
+    is_exit = ~merged.index.isin(current_holders.index)
+    merged = merged.reset_index()
+    merged['MajorShareholderName'] = merged['MajorShareholderName'].fillna(merged['previousName'])
+    merged['matchedEdinetCode'] = merged['matchedEdinetCode'].fillna(merged['previousMatchedEdinetCode'])
+    merged['ratioChange'] = (merged['VotingRightsRatio'] - merged['previousVotingRightsRatio']).round(RATIO_DECIMALS)
+    merged['sharesChange'] = merged['NumberOfSharesHeld'] - merged['previousNumberOfSharesHeld']
+
+    # 保有割合が変わらない (比較できない) 場合は株式数の増減で判定する
+    direction = merged['ratioChange'].where(merged['ratioChange'].fillna(0) != 0, merged['sharesChange'])
+    merged['changeType'] = None
+    merged.loc[direction > 0, 'changeType'] = 'increase'
+    merged.loc[direction < 0, 'changeType'] = 'decrease'
+    merged.loc[is_entry, 'changeType'] = 'entry'
+    merged.loc[is_exit, 'changeType'] = 'exit'
+
+    changes = merged[merged['changeType'].notna()].copy()
+    changes['SecuritiesCode'] = current['SecuritiesCode'].iloc[0]
+    changes['FiscalPeriodEnd'] = current['FiscalPeriodEnd'].iloc[0]
+    changes['SubmissionDate'] = current['SubmissionDate'].iloc[0]
+    changes['docId'] = current['docId'].iloc[0]
+    changes['previousFiscalPeriodEnd'] = previous['FiscalPeriodEnd'].iloc[0]
+    changes['previousDocId'] = previous['docId'].iloc[0]
+    return changes[CHANGE_COLUMNS]
+
+
+def _compare_periods(snapshots: dict, periods: list, holder_codes: dict) -> list[pd.DataFrame]:
+    """periods (昇順) の各決算期を、snapshots のうち直前の決算期と比較する。"""
+    ordered = sorted(snapshots)
+    frames = []
+    for period in periods:
+        position = ordered.index(period)
+        if position > 0:
+            frames.append(compare_snapshots(snapshots[ordered[position - 1]], snapshots[period], holder_codes))
+    return frames
+
+
+# --- DBの読み書き ---
+def _holder_codes(connection, names) -> dict:
+    """名寄せ済みの大株主の名称 -> matchedEdinetCode を返す (名寄せを実行していない場合は空の辞書)。"""
+    if not database_manager.engine.dialect.has_table(connection, ENRICHED_TABLE_NAME):
+        return {}
+    stmt = (select(_enriched.c.MajorShareholderName, func.min(_enriched.c.matchedEdinetCode))
+            .where(_enriched.c.matchedEdinetCode.is_not(None))
+            .group_by(_enriched.c.MajorShareholderName))
+    names = sorted({name for name in names if isinstance(name, str)}) if names is not None else None
+    codes = {}
+    if names is None:
+        codes.update(connection.execute(stmt).all())
+    else:
+        for i in range(0, len(names), 1000):
+            codes.update(connection.execute(stmt.where(_enriched.c.MajorShareholderName.in_(names[i:i + 1000]))).all())
+    return {name.strip(): code for name, code in codes.items()}
+
+
+def _to_records(changes: pd.DataFrame) -> list[dict]:
+    return changes.astype(object).where(changes.notna(), None).to_dict('records')
+
+
+def update_issuer_periods(connection, sec_code: str, fiscal_period_ends) -> int:
+    """
+    発行者の指定した決算期と、それぞれの直後の決算期の変化を作成し直す。保存した件数を返す。
+    読み込むのは、指定した決算期と、その直前・直後の決算期の大株主のみとする。
+    """
+    fiscal_period_ends = set(fiscal_period_ends)
+    issuer = _source.c.SecuritiesCode == sec_code
+    previous_periods, next_periods = set(), set()
+    for period in fiscal_period_ends:
+        previous_periods.add(connection.execute(
+            select(func.max(_source.c.FiscalPeriodEnd)).where(issuer, _source.c.FiscalPeriodEnd < period)).scalar())
+        next_periods.add(connection.execute(
+            select(func.min(_source.c.FiscalPeriodEnd)).where(issuer, _source.c.FiscalPeriodEnd > period)).scalar())
+    loaded_periods = (fiscal_period_ends | previous_periods | next_periods) - {None}
+    rows = pd.DataFrame(
+        connection.execute(select(_source).where(issuer, _source.c.FiscalPeriodEnd.in_(sorted(loaded_periods)))).all(),
+        columns=[c.name for c in _source.columns],
+    )
+    snapshots = _latest_snapshots(_normalize(rows))
+
+    # 直後の決算期は比較の相手が変わるため、あわせて作成し直す
+    targets = sorted((fiscal_period_ends | next_periods) & set(snapshots))
+    frames = _compare_periods(snapshots, targets, _holder_codes(connection, rows['MajorShareholderName']))
+    connection.execute(delete(changes_table).where(
+        changes_table.c.SecuritiesCode == sec_code, changes_table.c.FiscalPeriodEnd.in_(targets)))
+    changes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CHANGE_COLUMNS)
+    if not changes.empty:
+        connection.execute(insert(changes_table), _to_records(changes))
+    return len(changes)
+
+
+def update_change_feed(connection, df: pd.DataFrame):
+    """
+    MajorShareholders の保存時フック。保存された書類の発行者・決算期の変化を更新する。
+    database_manager.save_data から、保存と同じトランザクションの中で呼び出される。
+    """
+    saved = _normalize(df[['SecuritiesCode', 'FiscalPeriodEnd', 'SubmissionDate']]).dropna(
+        subset=['SecuritiesCode', 'FiscalPeriodEnd'])
+    if saved.empty:
+        return
+    changes_table.create(connection, checkfirst=True)
+    count = 0
+    for sec_code, periods in saved.groupby('SecuritiesCode')['FiscalPeriodEnd']:
+        count += update_issuer_periods(connection, sec_code, periods)
+    metrics.inc('rows', count, stage='change_feed', product=SOURCE_TABLE_NAME)
+    logger.debug("Updated %s major shareholder changes for %s issuers.", count, saved['SecuritiesCode'].nunique())
+
+
+database_manager.add_post_save_hook(SOURCE_TABLE_NAME, update_change_feed)
+
+
+def rebuild(sec_codes: list[str] | None = None) -> int:
+    """
+    MajorShareholders の全件 (または指定した発行者) から変化を作成し直す。保存した件数を返す。
+    初回の作成時や、名寄せの実行後に大株主の holderKey を更新する場合に使用する。
+    """
+    stmt = select(_source)
+    if sec_codes:
+        stmt = stmt.where(_source.c.SecuritiesCode.in_(sec_codes))
+    with database_manager.engine.begin() as connection:
+        changes_table.create(connection, checkfirst=True)
+        rows = _normalize(pd.DataFrame(connection.execute(stmt).all(), columns=[c.name for c in _source.columns]))
+        holder_codes = _holder_codes(connection, None)
+        frames = []
+        for _, issuer_rows in rows.dropna(subset=['SecuritiesCode', 'FiscalPeriodEnd']).groupby('SecuritiesCode'):
+            snapshots = _latest_snapshots(issuer_rows)
+            frames.extend(_compare_periods(snapshots, sorted(snapshots), holder_codes))
+        changes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CHANGE_COLUMNS)
+
+        delete_stmt = delete(changes_table)
+        if sec_codes:
+            delete_stmt = delete_stmt.where(changes_table.c.SecuritiesCode.in_(sec_codes))
+        connection.execute(delete_stmt)
+        if not changes.empty:
+            connection.execute(insert(changes_table), _to_records(changes))
+    logger.info("Rebuilt %s major shareholder changes for %s issuers.", len(changes), rows['SecuritiesCode'].nunique())
+    return len(changes)
+
+
+def get_changes(sec_code: str | None = None, holder_key: str | None = None) -> pd.DataFrame:
+    """MajorShareholderChanges を発行者・大株主で絞り込んで取得する。"""
+    stmt = select(changes_table).order_by(changes_table.c.FiscalPeriodEnd.desc(), changes_table.c.SecuritiesCode,
+                                          changes_table.c.changeType, changes_table.c.holderKey)
+    if sec_code:
+        stmt = stmt.where(changes_table.c.SecuritiesCode == sec_code)
+    if holder_key:
+        stmt = stmt.where(changes_table.c.holderKey == holder_key)
+    with database_manager.engine.connect() as connection:
+        if not database_manager.engine.dialect.has_table(connection, SHAREHOLDER_CHANGES_TABLE_NAME):
+            return pd.DataFrame(columns=CHANGE_COLUMNS)
+        return pd.read_sql(stmt, connection)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Maintain the major shareholder change feed.')
+    arg_parser.add_argument('--rebuild', action='store_true', help='MajorShareholders から変化を作成し直す')
+    arg_parser.add_argument('--sec-code', action='append', help='対象の証券コード (複数指定可)')
+    arg_parser.add_argument('--holder', help='表示する大株主の holderKey (matchedEdinetCode または名称)')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    if args.rebuild:
+        rebuild(args.sec_code)
+    else:
+        result = pd.concat([get_changes(code, args.holder) for code in args.sec_code or [None]], ignore_index=True)
+        with pd.option_context('display.max_rows', 200, 'display.max_columns', None, 'display.width', 200):
+            print(result)
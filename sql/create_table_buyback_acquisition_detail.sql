@@ -0,0 +1,34 @@
+-- 自己株券買付状況報告書の取得状況・処理状況・保有状況の表の行 (parsers.parse_buyback_acquisition_detail / buyback_tables.py)
+-- section: 'acquisition' (取得状況) / 'disposal' (処理状況) / 'holding' (保有状況)。rowNumber は section ごとの連番
+-- rowType: 'resolution' (決議状況) / 'acquisition' (報告月における取得) / 'total' (計) / 'cumulative' (報告月末現在の累計)
+--          'progress' (進捗状況・未行使割合。sharesRatio / amountRatio に %) / 'disposal' (処分) / 'issued_shares' / 'treasury_shares'
+-- 取得状況の行の resolutionBody / resolutionDate は、その行が属する決議
+DROP TABLE IF EXISTS EDINET.dbo.BuybackAcquisitionDetail;
+
+CREATE TABLE EDINET.dbo.BuybackAcquisitionDetail(
+    docId CHAR(8) NOT NULL,
+    seqNumber INT NOT NULL,
+    dateFile DATE,
+    secCode CHAR(5),
+    section VARCHAR(12) NOT NULL,
+    rowNumber INT NOT NULL,
+    rowType VARCHAR(20) NOT NULL,
+    label NVARCHAR(MAX),
+    resolutionBody NVARCHAR(10),
+    resolutionDate DATE,
+    periodStart DATE,
+    periodEnd DATE,
+    transactionDate DATE,
+    shares DECIMAL(20, 0),
+    amount DECIMAL(20, 0),
+    sharesRatio DECIMAL(7, 2),
+    amountRatio DECIMAL(7, 2),
+    PRIMARY KEY (docId, section, rowNumber)
+);
+
+-- 発行者ごとの決議・累計の検索用
+CREATE NONCLUSTERED INDEX IX_BuybackAcquisitionDetail_secCode_resolution
+  ON EDINET.dbo.BuybackAcquisitionDetail(secCode, resolutionDate) INCLUDE (dateFile, rowType, shares, amount);
+
+-- 決議ごとの最新の累計取得株式数
+--SELECT * FROM EDINET.dbo.BuybackAcquisitionDetail WHERE secCode = '80580' AND rowType IN ('resolution', 'cumulative') ORDER BY dateFile DESC, rowNumber
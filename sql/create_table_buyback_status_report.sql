@@ -7,9 +7,9 @@ CREATE TABLE EDINET.dbo.BuybackStatusReport(
     secCode CHAR(5),
     ordinanceCode CHAR(3),
     formCode CHAR(6),
-    acquisitionStatus TEXT,
-    disposalStatus TEXT,
-    holdingStatus TEXT,
+    acquisitionStatus CHAR(64), -- TextBlockStore の contentHash
+    disposalStatus CHAR(64),
+    holdingStatus CHAR(64),
     PRIMARY KEY (docID, dateFile, seqNumber)
 );
 
@@ -0,0 +1,38 @@
+-- 複数ワーカーで書類の処理を分担するためのリーステーブル
+-- process_documents.py --worker が書類をバッチ単位で確保 (リース) し、処理中はハートビートでリース期限を延長する
+-- status: 'pending' (未処理) / 'leased' (ワーカーが処理中) / 'done' (処理済み) / 'failed' (失敗。再試行キューで再処理する)
+-- leaseExpiresAt を過ぎた 'leased' の書類は、他のワーカーが確保し直す
+-- (テーブルが存在しない場合は database_manager.ensure_lease_table() が同じ定義で作成する)
+DROP TABLE IF EXISTS EDINET.dbo.DocumentProcessingLease;
+
+CREATE TABLE EDINET.dbo.DocumentProcessingLease(
+    docID VARCHAR(8) NOT NULL,
+    dateFile DATE NULL,
+    seqNumber INT NULL,
+    formCode VARCHAR(6) NULL,
+    ordinanceCode VARCHAR(3) NULL,
+    ordinanceCodeShort VARCHAR(10) NULL,
+    status VARCHAR(10) NOT NULL,
+    workerId VARCHAR(100) NULL, -- 確保したワーカーの識別子 (<ホスト名>-<プロセスID> など)
+    leaseToken VARCHAR(32) NULL, -- 確保ごとに発行するトークン。リースを失ったワーカーによる更新を防ぐ
+    leaseExpiresAt DATETIME NULL,
+    heartbeatAt DATETIME NULL,
+    attempts INT NOT NULL, -- 確保された回数 (2以上はリースの期限切れによる確保し直しを示す)
+    enqueuedAt DATETIME NOT NULL,
+    finishedAt DATETIME NULL,
+    PRIMARY KEY (docID)
+);
+
+-- 確保可能な書類の検索用
+CREATE NONCLUSTERED INDEX IX_DocumentProcessingLease_status_dateFile
+  ON EDINET.dbo.DocumentProcessingLease(status, dateFile DESC);
+
+-- ハートビートと処理結果の記録用
+CREATE NONCLUSTERED INDEX IX_DocumentProcessingLease_leaseToken
+  ON EDINET.dbo.DocumentProcessingLease(leaseToken);
+
+-- 進捗の確認
+--SELECT status, workerId, COUNT(*) FROM EDINET.dbo.DocumentProcessingLease GROUP BY status, workerId
+
+-- 失敗した書類を再試行キューで処理した後、未処理に戻す
+--UPDATE EDINET.dbo.DocumentProcessingLease SET status = 'pending', leaseToken = NULL WHERE status = 'failed'
@@ -0,0 +1,32 @@
+-- 処理に失敗した書類の再試行キュー
+-- process_documents が失敗した書類を記録し、process_documents.py --retry で再試行時刻を過ぎた書類のみを処理する
+-- status: 'pending' (再試行待ち) / 'quarantined' (失敗回数が上限に達したため隔離)
+DROP TABLE IF EXISTS EDINET.dbo.DocumentRetryQueue;
+
+CREATE TABLE EDINET.dbo.DocumentRetryQueue(
+    docID CHAR(8) NOT NULL,
+    dateFile DATE NULL,
+    seqNumber INT NULL,
+    formCode CHAR(6) NULL,
+    ordinanceCode CHAR(3) NULL,
+    ordinanceCodeShort NVARCHAR(10) NULL,
+    stage NVARCHAR(20) NOT NULL, -- 失敗したステージ (fetch, unzip, read_csv, parse, db_save)
+    errorClass NVARCHAR(100) NULL,
+    errorMessage NVARCHAR(1000) NULL,
+    attempts INT NOT NULL,
+    status NVARCHAR(12) NOT NULL,
+    firstFailedAt DATETIME NOT NULL,
+    lastFailedAt DATETIME NOT NULL,
+    nextRetryAt DATETIME NULL,
+    PRIMARY KEY (docID)
+);
+
+-- 再試行対象の検索用
+CREATE NONCLUSTERED INDEX IX_DocumentRetryQueue_status_nextRetryAt
+  ON EDINET.dbo.DocumentRetryQueue(status, nextRetryAt);
+
+-- 隔離した書類の確認
+--SELECT * FROM EDINET.dbo.DocumentRetryQueue WHERE status = 'quarantined' ORDER BY lastFailedAt DESC
+
+-- 原因を修正した後、隔離した書類を再試行の対象に戻す
+--UPDATE EDINET.dbo.DocumentRetryQueue SET status = 'pending', attempts = 0, nextRetryAt = GETDATE() WHERE status = 'quarantined'
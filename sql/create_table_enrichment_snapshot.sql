@@ -0,0 +1,20 @@
+-- 名寄せ時に使用したマスター・手動マッピングのスナップショット
+-- enrich_data.reenrich_data で、前回からの変更差分を検出するために使用する
+DROP TABLE IF EXISTS EDINET.dbo.EnrichmentMasterSnapshot;
+
+CREATE TABLE EDINET.dbo.EnrichmentMasterSnapshot(
+    targetName NVARCHAR(50) NOT NULL,
+    normalizedName NVARCHAR(255) NOT NULL,
+    edinetCode NVARCHAR(6),
+    secCode NVARCHAR(5),
+    PRIMARY KEY (targetName, normalizedName)
+);
+
+DROP TABLE IF EXISTS EDINET.dbo.EnrichmentMappingSnapshot;
+
+CREATE TABLE EDINET.dbo.EnrichmentMappingSnapshot(
+    targetName NVARCHAR(50) NOT NULL,
+    normalized_name NVARCHAR(255) NOT NULL,
+    correct_name NVARCHAR(255),
+    PRIMARY KEY (targetName, normalized_name)
+);
@@ -0,0 +1,38 @@
+-- 発行者・保有者ごとの大量保有の推移 (large_holding_timeline.py が LargeVolumeHoldingReport の保存時に更新する)
+-- effectiveDate (報告義務発生日) から validTo (次の報告の報告義務発生日) の前日までの保有状況を1行とする。最新の報告は validTo が NULL
+-- 同じ発行者・保有者・報告義務発生日の報告が複数ある場合 (訂正報告書など) は、最後に提出されたものを保持する
+-- holderKey: holderEdinetCode (EDINETコードのない保有者は名称)
+-- (テーブルが存在しない場合は large_holding_timeline.py が同じ定義で作成する)
+DROP TABLE IF EXISTS EDINET.dbo.LargeVolumeHoldingTimeline;
+
+CREATE TABLE EDINET.dbo.LargeVolumeHoldingTimeline(
+    issuerSecurityCode CHAR(5) NOT NULL,
+    holderKey NVARCHAR(255) NOT NULL,
+    effectiveDate DATE NOT NULL,
+    validTo DATE NULL,
+    holderEdinetCode CHAR(6) NULL,
+    holderName NVARCHAR(MAX) NULL,
+    issuerName NVARCHAR(MAX) NULL,
+    docId CHAR(8) NOT NULL,
+    member INT NOT NULL,
+    dateFile DATE NULL,
+    submissionCount INT NULL,
+    isAmendment BIT NULL,
+    holdingRatio DECIMAL(8, 5) NULL,
+    previousHoldingRatio DECIMAL(8, 5) NULL,
+    totalSharesHeld DECIMAL(20, 0) NULL,
+    totalOutstandingShares DECIMAL(20, 0) NULL,
+    holdingPurpose NVARCHAR(MAX) NULL,
+    PRIMARY KEY (issuerSecurityCode, holderKey, effectiveDate)
+);
+
+-- 発行者の現在 (validTo IS NULL) または指定日時点の保有者の検索用
+CREATE NONCLUSTERED INDEX IX_LargeVolumeHoldingTimeline_issuer_validTo
+  ON EDINET.dbo.LargeVolumeHoldingTimeline(issuerSecurityCode, validTo) INCLUDE (holderKey, effectiveDate, holdingRatio);
+
+-- 保有者ごとの保有銘柄の検索用
+CREATE NONCLUSTERED INDEX IX_LargeVolumeHoldingTimeline_holderKey_validTo
+  ON EDINET.dbo.LargeVolumeHoldingTimeline(holderKey, validTo) INCLUDE (issuerSecurityCode, effectiveDate, holdingRatio);
+
+-- 現在の大量保有者
+--SELECT * FROM EDINET.dbo.LargeVolumeHoldingTimeline WHERE issuerSecurityCode = '72030' AND validTo IS NULL AND holdingRatio >= 0.05 ORDER BY holdingRatio DESC
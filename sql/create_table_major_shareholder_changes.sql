@@ -0,0 +1,34 @@
+-- 大株主の前期からの変化 (shareholder_changes.py が MajorShareholders の保存時に更新する)
+-- 発行者 (SecuritiesCode) ごとに、決算期 (FiscalPeriodEnd) の大株主を直前の決算期と比較した結果を保持する
+-- 同じ決算期の書類が複数ある場合 (訂正報告書など) は、最後に提出された書類の大株主を使う
+-- holderKey: 名寄せ済みの場合は matchedEdinetCode、それ以外は大株主の名称
+-- changeType: 'entry' (新たに大株主となった) / 'exit' (大株主でなくなった) / 'increase' / 'decrease' (保有割合の増減)
+-- (テーブルが存在しない場合は shareholder_changes.py が同じ定義で作成する)
+DROP TABLE IF EXISTS EDINET.dbo.MajorShareholderChanges;
+
+CREATE TABLE EDINET.dbo.MajorShareholderChanges(
+    SecuritiesCode CHAR(5) NOT NULL,
+    FiscalPeriodEnd DATE NOT NULL,
+    holderKey NVARCHAR(255) NOT NULL,
+    SubmissionDate DATE NULL,
+    docId CHAR(8) NULL,
+    previousFiscalPeriodEnd DATE NULL,
+    previousDocId CHAR(8) NULL,
+    MajorShareholderName NVARCHAR(255) NULL,
+    matchedEdinetCode NVARCHAR(6) NULL,
+    changeType VARCHAR(10) NOT NULL,
+    VotingRightsRatio DECIMAL(8, 5) NULL,
+    previousVotingRightsRatio DECIMAL(8, 5) NULL,
+    ratioChange DECIMAL(8, 5) NULL,
+    NumberOfSharesHeld DECIMAL(20, 0) NULL,
+    previousNumberOfSharesHeld DECIMAL(20, 0) NULL,
+    sharesChange DECIMAL(20, 0) NULL,
+    PRIMARY KEY (SecuritiesCode, FiscalPeriodEnd, holderKey)
+);
+
+-- 大株主ごとの変化の検索用
+CREATE NONCLUSTERED INDEX IX_MajorShareholderChanges_holderKey
+  ON EDINET.dbo.MajorShareholderChanges(holderKey, FiscalPeriodEnd);
+
+-- 大株主が入れ替わった発行者の一覧
+--SELECT * FROM EDINET.dbo.MajorShareholderChanges WHERE changeType IN ('entry', 'exit') ORDER BY SubmissionDate DESC
@@ -13,6 +13,10 @@ CREATE TABLE EDINET.dbo.MajorShareholders(
     PRIMARY KEY (docId, seqNumber, shareholderId)
 );
 
+-- 発行者の決算期ごとの検索用 (shareholder_changes.py)
+CREATE NONCLUSTERED INDEX IX_MajorShareholders_SecuritiesCode_FiscalPeriodEnd
+  ON EDINET.dbo.MajorShareholders(SecuritiesCode, FiscalPeriodEnd) INCLUDE (SubmissionDate, docId);
+
 
 SELECT
     *
@@ -14,7 +14,7 @@ CREATE TABLE EDINET.dbo.OfficerInformation(
     NumberOfSharesHeld DECIMAL(20, 0),
     TotalRemuneration DECIMAL(20, 0),
     TermOfOffice NVARCHAR(MAX),
-    CareerSummary NVARCHAR(MAX),
+    CareerSummary CHAR(64), -- TextBlockStore の contentHash
     PRIMARY KEY (docId, seqNumber, officerId)
 );
 
@@ -0,0 +1,17 @@
+-- 重複を除いて圧縮した TextBlock の本文 (text_blocks.py が OfficerInformation・BuybackStatusReport の保存時に追加する)
+-- contentHash: 本文 (UTF-8) の SHA-256 の16進文字列。データプロダクトのテーブルの TextBlock の列には contentHash を保存する
+-- compressedText: zlib で圧縮した本文 (UTF-8) / textLength: 圧縮前の本文の文字数
+-- (テーブルが存在しない場合は text_blocks.py が同じ定義で作成する)
+DROP TABLE IF EXISTS EDINET.dbo.TextBlockStore;
+
+CREATE TABLE EDINET.dbo.TextBlockStore(
+    contentHash CHAR(64) NOT NULL,
+    compressedText VARBINARY(MAX) NOT NULL,
+    textLength INT NOT NULL,
+    compressedLength INT NOT NULL,
+    createdAt DATETIME NOT NULL,
+    PRIMARY KEY (contentHash)
+);
+
+-- 本文の取得
+--SELECT o.docId, o.Name, t.compressedText FROM EDINET.dbo.OfficerInformation o JOIN EDINET.dbo.TextBlockStore t ON t.contentHash = o.CareerSummary WHERE o.SecuritiesCode = '86040'
@@ -0,0 +1,155 @@
+"""
+書類の置き換え関係 (訂正・取下げ) の索引
+
+DocumentMetadata には、後に訂正報告書が提出された原本や、取り下げられた書類も csvFlag = 1 のまま残っている。
+これらをすべてダウンロード・解析すると、訂正前の誤ったデータを保存したり、訂正報告書の処理で上書きされる書類を
+無駄に処理することになる。このモジュールは、parentDocID の連鎖と取下げ・開示の状態から、各書類が処理の対象
+(有効な最新版) かどうかを判定する。
+
+判定:
+    - 取り下げられた書類 (withdrawalStatus = '2') と、取下書 (withdrawalStatus = '1') の親書類は 'withdrawn' とする。
+    - 非開示の書類 (disclosureStatus = '1') は 'not_disclosed' とする。
+    - 親書類を同じくする書類 (原本と、parentDocID で連なる訂正報告書) のうち、処理できる最新の書類のみを有効とし、
+      それ以外は 'superseded' とする。処理できる書類とは、取下げ・非開示ではなく、CSVを持ち (csvFlag = 1)、
+      処理対象の (formCode, ordinanceCode) に含まれる書類。処理できる訂正報告書がなければ原本を有効とする。
+
+提出日の範囲 (--date-from, --date-to) とは関係なく判定するため、範囲外の訂正報告書に置き換えられた原本も処理しない。
+
+使い方:
+    index = supersession.SupersessionIndex.build(codes)
+    documents = index.filter(database_manager.iter_documents_by_codes(codes))
+"""
+import logging
+from collections import defaultdict
+
+import pandas as pd
+
+import database_manager
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- 提出書類一覧のステータス ---
+WITHDRAWAL_NOTICE = '1'     # 取下書
+WITHDRAWN = '2'             # 取り下げられた書類
+NOT_DISCLOSED = '1'         # 非開示
+
+
+def _flag(value) -> str:
+    """DBの値 ('1', 1, True, 1.0 など) を '0' / '1' などの文字列にそろえる。"""
+    if value is None or pd.isna(value):
+        return ''
+    if isinstance(value, (bool, int, float)):
+        return str(int(value))
+    return str(value).strip()
+
+
+class SupersessionIndex:
+    """docID ごとに、処理の対象外とする理由 ('superseded', 'withdrawn', 'not_disclosed') を保持する。"""
+
+    def __init__(self, excluded: dict[str, str], superseded_by: dict[str, str]):
+        """
+        Args:
+            excluded (dict): docID をキー、対象外とする理由を値とする辞書。
+            superseded_by (dict): 'superseded' の docID をキー、置き換える有効な書類の docID を値とする辞書。
+        """
+        self.excluded = excluded
+        self.superseded_by = superseded_by
+
+    @classmethod
+    def build(cls, codes=None, records: pd.DataFrame | None = None) -> 'SupersessionIndex':
+        """
+        DocumentMetadata から索引を作成する。
+
+        Args:
+            codes (optional): 処理対象の (formCode, ordinanceCode) のコレクション。省略時はすべての書類を処理できるとみなす。
+            records (pd.DataFrame, optional): database_manager.get_supersession_records() の結果 (省略時はDBから取得する)。
+        """
+        if records is None:
+            records = database_manager.get_supersession_records()
+        codes = {tuple(code) for code in codes} if codes is not None else None
+        excluded = {}
+        if records.empty:
+            return cls(excluded, {})
+
+        parent_of = {}
+        eligible = {}
+        sort_key = {}
+        for row in records.itertuples(index=False):
+            doc_id = row.docID
+            parent_doc_id = row.parentDocID if isinstance(row.parentDocID, str) and row.parentDocID.strip() else None
+            withdrawal_status = _flag(row.withdrawalStatus)
+            if withdrawal_status == WITHDRAWAL_NOTICE:
+                # 取下書そのものは処理せず、親書類を取下げ済みとする
+                excluded[doc_id] = 'withdrawn'
+                if parent_doc_id:
+                    excluded[parent_doc_id] = 'withdrawn'
+                continue
+            if withdrawal_status == WITHDRAWN:
+                excluded.setdefault(doc_id, 'withdrawn')
+            elif _flag(row.disclosureStatus) == NOT_DISCLOSED:
+                excluded.setdefault(doc_id, 'not_disclosed')
+            if parent_doc_id:
+                parent_of[doc_id] = parent_doc_id
+                eligible[doc_id] = (
+                    _flag(row.csvFlag) == '1'
+                    and (codes is None or (row.formCode, row.ordinanceCode) in codes)
+                )
+                sort_key[doc_id] = (str(row.submitDateTime or ''), str(row.dateFile or ''), row.seqNumber or 0, doc_id)
+
+        # parentDocID をたどって原本 (最上位の親書類) ごとに訂正報告書をまとめる
+        def root_of(doc_id: str) -> str:
+            seen = set()
+            while doc_id in parent_of and doc_id not in seen:
+                seen.add(doc_id)
+                doc_id = parent_of[doc_id]
+            return doc_id
+
+        amendments = defaultdict(list)
+        for doc_id in parent_of:
+            amendments[root_of(doc_id)].append(doc_id)
+
+        superseded_by = {}
+        for root, members in amendments.items():
+            candidates = [d for d in members if eligible[d] and d not in excluded]
+            if not candidates:
+                continue
+            effective = max(candidates, key=sort_key.__getitem__)
+            for doc_id in [root, *members]:
+                if doc_id != effective and doc_id not in excluded:
+                    superseded_by[doc_id] = effective
+        for doc_id in superseded_by:
+            excluded[doc_id] = 'superseded'
+        return cls(excluded, superseded_by)
+
+    def __len__(self) -> int:
+        return len(self.excluded)
+
+    def reason(self, doc_id: str) -> str | None:
+        """書類を処理の対象外とする理由を返す。有効な書類の場合は None を返す。"""
+        return self.excluded.get(doc_id)
+
+    def is_effective(self, doc_id: str) -> bool:
+        return doc_id not in self.excluded
+
+    def filter(self, documents):
+        """
+        書類のイテレーターから、有効な書類のみを順に返す。除外した書類は documents_skipped メトリクスに記録する。
+        書類は (dateFile, docID, ...) の形式とする。
+        """
+        for document in documents:
+            reason = self.excluded.get(document[1])
+            if reason is None:
+                yield document
+                continue
+            metrics.inc('documents_skipped', reason=reason, formCode=document[2])
+            logger.debug("Skipping docID %s (%s%s).", document[1], reason,
+                         f" by {self.superseded_by[document[1]]}" if reason == 'superseded' else '')
+
+
+if __name__ == "__main__":
+    from logging_config import setup_logging
+    setup_logging()
+    index = SupersessionIndex.build()
+    counts = pd.Series(index.excluded, dtype=object).value_counts()
+    print(counts.to_string() if not counts.empty else "No superseded, withdrawn or undisclosed documents.")
@@ -0,0 +1,520 @@
+"""
+ベンチマーク・ローカル検証用に、EDINETのXBRL→CSV変換結果を模した合成データを生成するモジュール
+"""
+import datetime
+import os
+import random
+import pandas as pd
+
+# XBRL CSVのカラム (EDINET APIの type=5 で取得できるCSVと同じ並び)
+XBRL_CSV_COLUMNS = ['要素ID', '項目名', 'コンテキストID', '相対年度', '連結・個別', '期間・時点', 'ユニットID', '単位', '値']
+
+_COMPANY_STEMS = [
+    'トヨタ自動車', '三菱商事', 'ソニーグループ', '日立製作所', '伊藤忠商事', '三井物産', 'キーエンス',
+    '東京エレクトロン', '信越化学工業', 'ＫＤＤＩ', '任天堂', 'ファーストリテイリング', '武田薬品工業',
+    '本田技研工業', '日本電信電話', 'ダイキン工業', '村田製作所', 'デンソー', 'オリエンタルランド', '髙島屋',
+]
+_TRUST_BANKS = [
+    '日本マスタートラスト信託銀行株式会社（信託口）',
+    '株式会社日本カストディ銀行（信託口）',
+    'ＳＴＡＴＥ ＳＴＲＥＥＴ ＢＡＮＫ ＡＮＤ ＴＲＵＳＴ ＣＯＭＰＡＮＹ ５０５００１（常任代理人　株式会社みずほ銀行決済営業部）',
+    'ＪＰ ＭＯＲＧＡＮ ＣＨＡＳＥ ＢＡＮＫ ３８５７８１（常任代理人　株式会社みずほ銀行決済営業部）',
+]
+_PERSON_NAMES = ['佐藤 太郎', '鈴木 一郎', '高橋 花子', '田中 健', '伊藤 誠', '渡辺 美咲', '山本 翔', '中村 恵']
+_COMPOSITION_CATEGORIES = [
+    ('NationalAndLocalGovernments', 'NationalAndLocalGovernments', 'NationalAndLocalGovernments'),
+    ('FinancialInstitutions', 'FinancialInstitutions', 'FinancialInstitutions'),
+    ('FinancialServiceProviders', 'FinancialServiceProviders', 'FinancialServiceProviders'),
+    ('OtherCorporations', 'OtherCorporations', 'OtherCorporations'),
+    ('ForeignInvestorsOtherThanIndividuals', 'ForeignersOtherThanIndividuals', 'ForeignInvestorsOtherThanIndividuals'),
+    ('ForeignIndividualInvestors', 'ForeignIndividuals', 'ForeignIndividualInvestors'),
+    ('IndividualsAndOthers', 'IndividualsAndOthers', 'IndividualsAndOthers'),
+]
+_SPECIFIED_INVESTMENT_ITEMS = {
+    'NameOfSecurities': 'jpcrp_cor:NameOfSecuritiesDetailsOfSpecifiedInvestmentEquitySecurities{entity}',
+    'NumberOfSharesHeld': 'jpcrp_cor:NumberOfSharesHeldDetailsOfSpecifiedInvestmentEquitySecurities{entity}',
+    'BookValue': 'jpcrp_cor:BookValueDetailsOfSpecifiedInvestmentEquitySecurities{entity}',
+    'PurposeOfShareholding': 'jpcrp_cor:PurposeOfShareholdingDetailsOfSpecifiedInvestmentEquitySecurities{entity}',
+    'CrossShareholding': 'jpcrp_cor:WhetherIssuerOfAforementionedSharesHoldsReportingCompanysSharesDetailsOfSpecifiedInvestmentEquitySecurities{entity}',
+}
+
+
+# サイズごとの合成データの生成パラメータ
+SIZE_PRESETS = {
+    'small': {
+        'annual': {'n_shareholders': 10, 'n_officers': 8, 'n_investments': 10, 'textblock_size': 500, 'n_filler': 300, 'n_textblocks': 5},
+        'large_volume': {'n_joint_holders': 1, 'textblock_size': 500, 'n_filler': 30},
+        'buyback': {'textblock_size': 1000},
+    },
+    'medium': {
+        'annual': {'n_shareholders': 10, 'n_officers': 15, 'n_investments': 60, 'textblock_size': 3000, 'n_filler': 2000, 'n_textblocks': 30},
+        'large_volume': {'n_joint_holders': 5, 'textblock_size': 2000, 'n_filler': 100},
+        'buyback': {'textblock_size': 5000},
+    },
+    'large': {
+        'annual': {'n_shareholders': 10, 'n_officers': 30, 'n_investments': 200, 'textblock_size': 20000, 'n_filler': 6000, 'n_textblocks': 80},
+        'large_volume': {'n_joint_holders': 20, 'textblock_size': 5000, 'n_filler': 300},
+        'buyback': {'textblock_size': 20000},
+    },
+}
+
+
+def _fact(element_id: str, value, context_id: str = 'FilingDateInstant', relative_year: str = '提出日時点',
+          item_name: str = '', unit_id: str = '', unit: str = '') -> list:
+    """XBRL CSVの1行を作成する。"""
+    return [element_id, item_name or element_id.split(':')[-1], context_id, relative_year, 'その他', '時点', unit_id, unit,
+            None if value is None else str(value)]
+
+
+def _textblock(rng: random.Random, size: int) -> str:
+    """指定した文字数程度のHTML TextBlockを生成する。"""
+    if size <= 0:
+        return ''
+    cell = '<td style="text-align:right"><p>{:,}</p></td>'
+    rows = []
+    length = 0
+    while length < size:
+        row = '<tr>' + ''.join(cell.format(rng.randint(1, 10**9)) for _ in range(4)) + '</tr>'
+        rows.append(row)
+        length += len(row)
+    return '<table>' + ''.join(rows) + '</table>'
+
+
+def _company_name(rng: random.Random) -> str:
+    """表記ゆれを含む会社名を生成する。"""
+    stem = rng.choice(_COMPANY_STEMS)
+    return rng.choice(['株式会社{}', '{}株式会社', '㈱{}', '{}㈱', '（株）{}', '{}ホールディングス株式会社']).format(stem)
+
+
+def _filler_facts(rng: random.Random, n_filler: int, textblock_size: int, n_textblocks: int) -> list:
+    """パーサーの抽出対象外となる財務数値・TextBlockの行を生成する。"""
+    rows = []
+    for i in range(n_filler):
+        rows.append(_fact(f'jppfs_cor:FillerItem{i}', rng.randint(-10**9, 10**11),
+                          context_id='CurrentYearDuration', relative_year='当期', unit_id='JPY', unit='円'))
+    for i in range(n_textblocks):
+        rows.append(_fact(f'jpcrp_cor:FillerDescriptionTextBlock{i}', _textblock(rng, textblock_size)))
+    return rows
+
+
+def generate_annual_report_df(n_shareholders: int = 10, n_officers: int = 12, n_investments: int = 30,
+                              textblock_size: int = 2000, n_filler: int = 1000, n_textblocks: int = 20,
+                              edinet_code: str = 'E00001', sec_code: str = '10010', seed: int = 0) -> pd.DataFrame:
+    """
+    有価証券報告書のXBRL CSVを模したDataFrameを生成する。
+
+    Args:
+        n_shareholders (int): 大株主の人数
+        n_officers (int): 役員の人数
+        n_investments (int): 特定投資株式の銘柄数 (提出会社分。最大保有会社分はその半数)
+        textblock_size (int): 各TextBlockのおおよその文字数
+        n_filler (int): 抽出対象外の数値項目の件数
+        n_textblocks (int): 抽出対象外のTextBlockの件数
+        edinet_code (str): 提出者のEDINETコード
+        sec_code (str): 提出者の証券コード (5桁)
+        seed (int): 乱数シード
+    """
+    rng = random.Random(seed)
+    rows = [
+        _fact('jpdei_cor:EDINETCodeDEI', edinet_code),
+        _fact('jpdei_cor:SecurityCodeDEI', sec_code),
+        _fact('jpdei_cor:CurrentPeriodEndDateDEI', '2025-03-31'),
+        _fact('jpcrp_cor:FilingDateCoverPage', '2025-06-20'),
+        _fact('jpcrp_cor:FilerNameInJapaneseCoverPage', f'{rng.choice(_COMPANY_STEMS)}株式会社'),
+        _fact('jpcrp_cor:ShareholdingsTextBlock',
+              f'<p>当社及び連結子会社のうち、投資株式の貸借対照表計上額が最も大きい会社（最大保有会社）である株式会社{rng.choice(_COMPANY_STEMS)}については以下のとおりです。</p>'
+              + _textblock(rng, textblock_size)),
+    ]
+
+    # 大株主の状況
+    for i in range(1, n_shareholders + 1):
+        context = f'CurrentYearInstant_No{i}MajorShareholdersMember'
+        name = rng.choice(_TRUST_BANKS) if rng.random() < 0.4 else _company_name(rng)
+        rows.append(_fact('jpcrp_cor:NameMajorShareholders', name, context, '当期末'))
+        rows.append(_fact('jpcrp_cor:AddressMajorShareholders', '東京都千代田区', context, '当期末'))
+        rows.append(_fact('jpcrp_cor:NumberOfSharesHeld', rng.randint(10**5, 10**8), context, '当期末', unit_id='shares', unit='株'))
+        rows.append(_fact('jpcrp_cor:ShareholdingRatio', round(rng.uniform(0.01, 0.2), 5), context, '当期末', unit_id='pure'))
+
+    # 所有者別状況
+    for category, pct_name, unit_name in _COMPOSITION_CATEGORIES:
+        rows.append(_fact(f'jpcrp_cor:NumberOfShareholders{category}', rng.randint(1, 50000), 'CurrentYearInstant_OrdinarySharesMember', '当期末'))
+        rows.append(_fact(f'jpcrp_cor:PercentageOfShareholdings{pct_name}', round(rng.uniform(0, 0.5), 5), 'CurrentYearInstant_OrdinarySharesMember', '当期末'))
+        rows.append(_fact(f'jpcrp_cor:NumberOfSharesHeldNumberOfUnits{unit_name}', rng.randint(0, 10**7), 'CurrentYearInstant_OrdinarySharesMember', '当期末'))
+    rows.append(_fact('jpcrp_cor:NumberOfShareholdersTotal', rng.randint(10**3, 10**6), 'CurrentYearInstant_OrdinarySharesMember', '当期末'))
+    rows.append(_fact('jpcrp_cor:NumberOfSharesHeldNumberOfUnitsTotal', rng.randint(10**6, 10**8), 'CurrentYearInstant_OrdinarySharesMember', '当期末'))
+
+    # 役員の状況
+    for i in range(1, n_officers + 1):
+        context = f'FilingDateInstant_jpcrp030000-asr_{edinet_code}-000Officer{i}Member'
+        suffix = 'Proposal' if i > n_officers * 0.8 else ''
+        rows.append(_fact(f'jpcrp_cor:NameInformationAboutDirectorsAndCorporateAuditors{suffix}', rng.choice(_PERSON_NAMES), context))
+        rows.append(_fact(f'jpcrp_cor:OfficialTitleOrPositionInformationAboutDirectorsAndCorporateAuditors{suffix}', '取締役', context))
+        rows.append(_fact(f'jpcrp_cor:DateOfBirthInformationAboutDirectorsAndCorporateAuditors{suffix}', f'19{rng.randint(40, 89)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}', context))
+        rows.append(_fact(f'jpcrp_cor:TermOfOfficeInformationAboutDirectorsAndCorporateAuditors{suffix}', '(注)3', context))
+        rows.append(_fact(f'jpcrp_cor:NumberOfSharesHeldOrdinarySharesInformationAboutDirectorsAndCorporateAuditors{suffix}', rng.randint(0, 10**6), context, unit_id='shares'))
+        rows.append(_fact(f'jpcrp_cor:CareerSummaryInformationAboutDirectorsAndCorporateAuditorsTextBlock{suffix}', _textblock(rng, textblock_size), context))
+    for i in range(1, max(n_officers // 4, 1) + 1):
+        context = f'CurrentYearDuration_jpcrp030000-asr_{edinet_code}-000Officer{i}Member'
+        rows.append(_fact('jpcrp_cor:TotalAmountOfRemunerationEtcPaidByGroupRemunerationEtcPaidByGroupToEachDirectorOrOtherOfficer',
+                          rng.randint(10**8, 10**9), context, '当期', unit_id='JPY'))
+
+    # 特定投資株式
+    for entity, n_rows in (('ReportingCompany', n_investments), ('LargestHoldingCompany', n_investments // 2)):
+        for i in range(1, n_rows + 1):
+            for context_prefix, relative_year in (('CurrentYearInstant', '当期末'), ('Prior1YearInstant', '前期末')):
+                context = f'{context_prefix}_{entity}Member_Row{i}Member'
+                for item_type, element_template in _SPECIFIED_INVESTMENT_ITEMS.items():
+                    element_id = element_template.format(entity='' if entity == 'ReportingCompany' else entity)
+                    if item_type == 'NameOfSecurities':
+                        value = _company_name(rng)
+                    elif item_type in ('NumberOfSharesHeld', 'BookValue'):
+                        value = rng.randint(10**3, 10**9)
+                    elif item_type == 'PurposeOfShareholding':
+                        value = '取引関係の維持・強化のため'
+                    else:
+                        value = rng.choice(['有', '無'])
+                    rows.append(_fact(element_id, value, context, relative_year))
+
+    # 議決権の状況
+    for context in ('CurrentYearInstant',
+                    'CurrentYearInstant_OrdinarySharesSharesWithFullVotingRightsOtherMember',
+                    'CurrentYearInstant_OrdinarySharesTreasurySharesSharesWithFullVotingRightsTreasurySharesEtcMember',
+                    'CurrentYearInstant_OrdinarySharesSharesLessThanOneUnitMember'):
+        rows.append(_fact('jpcrp_cor:NumberOfSharesIssuedSharesVotingRights', rng.randint(10**3, 10**9), context, '当期末', unit_id='shares'))
+
+    rows.extend(_filler_facts(rng, n_filler, textblock_size, n_textblocks))
+    return pd.DataFrame(rows, columns=XBRL_CSV_COLUMNS)
+
+
+def generate_large_volume_report_df(n_joint_holders: int = 3, textblock_size: int = 500, n_filler: int = 50,
+                                    edinet_code: str = 'E10001', issuer_sec_code: str = '10010', seed: int = 0) -> pd.DataFrame:
+    """
+    大量保有報告書のXBRL CSVを模したDataFrameを生成する。
+
+    Args:
+        n_joint_holders (int): 共同保有者の人数 (提出者本人を除く)
+        textblock_size (int): 各TextBlockのおおよその文字数
+        n_filler (int): 抽出対象外の項目の件数
+    """
+    rng = random.Random(seed)
+    rows = [
+        _fact('jplvh_cor:NameCoverPage', f'{rng.choice(_COMPANY_STEMS)}アセットマネジメント株式会社'),
+        _fact('jpdei_cor:EDINETCodeDEI', edinet_code),
+        _fact('jpdei_cor:SecurityCodeDEI', None),
+        _fact('jplvh_cor:FilingDateCoverPage', '2025-06-20'),
+        _fact('jplvh_cor:DateWhenFilingRequirementAroseCoverPage', '2025-06-13'),
+        _fact('jpdei_cor:AmendmentFlagDEI', 'false'),
+        _fact('jpdei_cor:NumberOfSubmissionDEI', 1),
+        _fact('jplvh_cor:SecurityCodeOfIssuer', issuer_sec_code),
+        _fact('jplvh_cor:NameOfIssuer', _company_name(rng)),
+    ]
+    members = ['FilerLargeVolumeHolder1Member'] + [f'JointHolder{i}Member' for i in range(2, n_joint_holders + 2)]
+    for member in members:
+        context = f'FilingDateInstant_{member}'
+        holder_code = f'E{rng.randint(10000, 99999)}'
+        rows.extend([
+            _fact('jplvh_cor:EDINETCodeDEI', holder_code, context),
+            _fact('jplvh_cor:Name', _company_name(rng), context),
+            _fact('jplvh_cor:ResidentialAddressOrAddressOfRegisteredHeadquarter', '東京都港区', context),
+            _fact('jplvh_cor:DescriptionOfBusiness', '投資運用業', context),
+            _fact('jplvh_cor:PurposeOfHolding', '純投資', context),
+            _fact('jplvh_cor:ActOfMakingImportantProposalEtcNA', '該当事項なし', context),
+            _fact('jplvh_cor:AmountOfOwnFund', rng.randint(10**6, 10**9), context),
+            _fact('jplvh_cor:TotalAmountOfFundingForAcquisition', rng.randint(10**6, 10**9), context),
+            _fact('jplvh_cor:BaseDate', '2025-06-13', f'FilingDateInstant_{member}'),
+            _fact('jplvh_cor:TotalNumberOfOutstandingStocksEtc', rng.randint(10**7, 10**9), f'FilingDateInstant_{member}'),
+            _fact('jplvh_cor:TotalNumberOfStocksEtcHeld', rng.randint(10**5, 10**7), f'FilingDateInstant_{member}'),
+            _fact('jplvh_cor:HoldingRatioOfShareCertificatesEtc', round(rng.uniform(0.001, 0.1), 4), f'FilingDateInstant_{member}'),
+            _fact('jplvh_cor:HoldingRatioOfShareCertificatesEtcPerLastReport', round(rng.uniform(0.001, 0.1), 4), f'FilingDateInstant_{member}'),
+            _fact('jplvh_cor:DetailsOfAcquisitionsAndDisposalsTextBlock', _textblock(rng, textblock_size), context),
+        ])
+    rows.extend(_filler_facts(rng, n_filler, textblock_size, 2))
+    return pd.DataFrame(rows, columns=XBRL_CSV_COLUMNS)
+
+
+_FULLWIDTH_DIGITS = str.maketrans('0123456789', '０１２３４５６７８９')
+_BUYBACK_DISPOSAL_LABELS = [
+    '引き受ける者の募集を行った取得自己株式',
+    '消却の処分を行った取得自己株式',
+    '合併、株式交換、株式交付、会社分割に係る移転を行った取得自己株式',
+    'その他（譲渡制限付株式報酬としての自己株式の処分）',
+]
+
+
+def _td(value, attrs: str = '') -> str:
+    return f'<td{attrs}><p>{value}</p></td>'
+
+
+def _jp_date(date, fullwidth: bool, with_year: bool = True) -> str:
+    text = f'{date.year}年{date.month}月{date.day}日' if with_year else f'{date.month}月{date.day}日'
+    return text.translate(_FULLWIDTH_DIGITS) if fullwidth else text
+
+
+def _buyback_acquisition_textblock(rng: random.Random, textblock_size: int, report_month) -> str:
+    """
+    取得状況の TextBlock (株主総会決議・取締役会決議による取得の状況) を生成する。
+    取締役会決議の表は、報告月の取得日ごとの行が textblock_size 程度の文字数となるまで続き、計・累計・進捗状況の行を持つ。
+    """
+    fullwidth = rng.random() < 0.5
+    n_rows = max(1, textblock_size // 150)
+    tables = []
+    # 1つの決議の取得日は報告月の営業日の範囲とし、それを超える場合は決議を分ける
+    for start in range(0, n_rows, 20):
+        count = min(20, n_rows - start)
+        resolution = report_month - datetime.timedelta(days=rng.randint(20, 90))
+        period_start = resolution + datetime.timedelta(days=rng.randint(1, 5))
+        period_end = period_start + datetime.timedelta(days=rng.randint(90, 360))
+        limit_shares = rng.randint(100, 20_000) * 1_000
+        limit_amount = limit_shares * rng.randint(500, 5_000)
+        days = sorted(rng.sample(range(1, 29), count))
+        acquisitions = [(report_month.replace(day=day), rng.randint(1, 200) * 100) for day in days]
+        prices = [shares * rng.randint(500, 5_000) for _, shares in acquisitions]
+        total_shares, total_amount = sum(shares for _, shares in acquisitions), sum(prices)
+        previous_shares = rng.randint(0, limit_shares // 2 // 100) * 100
+        previous_amount = previous_shares * rng.randint(500, 5_000)
+        cumulative_shares, cumulative_amount = previous_shares + total_shares, previous_amount + total_amount
+        period = f'{_jp_date(period_start, fullwidth)}～{_jp_date(period_end, fullwidth)}'
+        rows = [
+            '<tr>' + ''.join(_td(h) for h in ('区分', '取得日', '株式数(株)', '価額の総額(円)')) + '</tr>',
+            '<tr>' + _td(f'取締役会（{_jp_date(resolution, fullwidth)}）での決議状況<br/>（取得期間　{period}）')
+            + _td('－') + _td(f'{limit_shares:,}') + _td(f'{limit_amount:,}') + '</tr>',
+        ]
+        for i, ((date, shares), price) in enumerate(zip(acquisitions, prices)):
+            label = _td('報告月における取得自己株式', f' rowspan="{count}"') if i == 0 else ''
+            rows.append('<tr>' + label + _td(_jp_date(date, fullwidth, with_year=False)) + _td(f'{shares:,}') + _td(f'{price:,}') + '</tr>')
+        progress_label = rng.choice(['自己株式の未行使割合(%)', '自己株式取得の進捗状況(%)'])
+        progress = [cumulative_shares / limit_shares * 100, cumulative_amount / limit_amount * 100]
+        if progress_label.startswith('自己株式の未行使'):
+            progress = [100 - value for value in progress]
+        rows += [
+            '<tr>' + _td('計', ' colspan="2"') + _td(f'{total_shares:,}') + _td(f'{total_amount:,}') + '</tr>',
+            '<tr>' + _td('報告月末現在の累計取得自己株式', ' colspan="2"') + _td(f'{cumulative_shares:,}') + _td(f'{cumulative_amount:,}') + '</tr>',
+            '<tr>' + _td(progress_label, ' colspan="2"') + ''.join(_td(f'{value:.1f}') for value in progress) + '</tr>',
+        ]
+        tables.append('<table>' + ''.join(rows) + '</table>')
+    return ('<h3>(1)【株主総会決議による取得の状況】</h3><p>該当事項はありません。</p>'
+            '<h3>(2)【取締役会決議による取得の状況】</h3>' + ''.join(tables))
+
+
+def _buyback_disposal_textblock(rng: random.Random, report_month) -> str:
+    """処理状況の TextBlock を生成する。"""
+    rows = ['<tr>' + ''.join(_td(h) for h in ('区分', '処分日', '処分株式数(株)', '処分価額の総額(円)')) + '</tr>']
+    total_shares = total_amount = 0
+    for label in _BUYBACK_DISPOSAL_LABELS:
+        if rng.random() < 0.3:
+            shares = rng.randint(1, 500) * 100
+            amount = shares * rng.randint(500, 5_000)
+            total_shares, total_amount = total_shares + shares, total_amount + amount
+            date = _jp_date(report_month.replace(day=rng.randint(1, 28)), False, with_year=False)
+            rows.append('<tr>' + _td(label) + _td(date) + _td(f'{shares:,}') + _td(f'{amount:,}') + '</tr>')
+        else:
+            rows.append('<tr>' + _td(label) + _td('－') + _td('－') + _td('－') + '</tr>')
+    rows.append('<tr>' + _td('計', ' colspan="2"') + _td(f'{total_shares:,}' if total_shares else '－')
+                + _td(f'{total_amount:,}' if total_amount else '－') + '</tr>')
+    return '<table>' + ''.join(rows) + '</table>'
+
+
+def _buyback_holding_textblock(rng: random.Random) -> str:
+    """保有状況の TextBlock を生成する。"""
+    issued = rng.randint(10_000, 2_000_000) * 1_000
+    treasury = rng.randint(0, issued // 10 // 100) * 100
+    return ('<p>報告月末日における保有状況</p><table>'
+            + '<tr>' + _td('区分') + _td('株式数(株)') + '</tr>'
+            + '<tr>' + _td('発行済株式総数') + _td(f'{issued:,}') + '</tr>'
+            + '<tr>' + _td('保有自己株式数') + _td(f'{treasury:,}') + '</tr></table>')
+
+
+def generate_buyback_report_df(textblock_size: int = 2000, ordinance_code: str = 'crp',
+                               sec_code: str = '10010', seed: int = 0) -> pd.DataFrame:
+    """
+    自己株券買付状況報告書のXBRL CSVを模したDataFrameを生成する。
+    取得状況・処理状況・保有状況の TextBlock は、実際の報告書と同じ形式の表 (rowspan・colspan、全角数字の日付を含む) とする。
+
+    Args:
+        textblock_size (int): 取得状況のTextBlockのおおよその文字数
+        ordinance_code (str): 府令コードの略号 ('crp' or 'sps')
+    """
+    rng = random.Random(seed)
+    prefix = f'jp{ordinance_code}-sbr_cor'
+    acquisition_id = ('AcquisitionsByResolutionOfBoardOfDirectorsMeetingTextBlock' if ordinance_code == 'crp'
+                      else 'AcquisitionsOfTreasurySharesTextBlock')
+    # 報告月の翌月の15日までに提出する
+    report_month = datetime.date(2025, 5, 1)
+    rows = [
+        _fact('jpdei_cor:SecurityCodeDEI', sec_code),
+        _fact('jpdei_cor:CabinetOfficeOrdinanceDEI', '企業内容等の開示に関する内閣府令'),
+        _fact('jpdei_cor:DocumentTypeDEI', '第十七号様式'),
+        _fact(f'{prefix}:FilingDateCoverPage', '2025-06-13'),
+        _fact(f'{prefix}:{acquisition_id}', _buyback_acquisition_textblock(rng, textblock_size, report_month)),
+        _fact(f'{prefix}:DisposalsOfTreasurySharesTextBlock', _buyback_disposal_textblock(rng, report_month)),
+        _fact(f'{prefix}:HoldingOfTreasurySharesTextBlock', _buyback_holding_textblock(rng)),
+    ]
+    return pd.DataFrame(rows, columns=XBRL_CSV_COLUMNS)
+
+
+def write_xbrl_csv(df: pd.DataFrame, path: str):
+    """EDINETのCSVと同じ形式 (UTF-16, タブ区切り) でファイルに書き出す。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    df.to_csv(path, sep='\t', index=False, encoding='utf-16')
+
+
+def to_xbrl_csv_bytes(df: pd.DataFrame) -> bytes:
+    """EDINETのCSVと同じ形式 (UTF-16, タブ区切り) のバイト列を返す。"""
+    return df.to_csv(sep='\t', index=False).encode('utf-16')
+
+
+# --- 名寄せ用の合成名称 ---
+
+_NAME_PLACES = ['東京', '大阪', '北海道', '日本', '中央', '関西', '九州', '東海', '太平洋', '新日本', '名古屋', '横浜', '京都', '神戸', '四国']
+_NAME_INDUSTRIES = ['製鉄', '化学', '電機', '商事', '建設', '物産', '精機', '薬品', '食品', '証券', '不動産', '電力', '海運',
+                    '工業', '産業', 'システム', 'テクノロジー', 'エンジニアリング', 'フーズ', 'ファイナンス']
+_NAME_SYLLABLES = list('アイウカキクサシスタチツナニヌハヒフマミムヤユラリルレロワトコソノ')
+_NAME_LATIN = ['ABC', 'NEC', 'TDK', 'KDDI', 'IHI', 'JFE', 'SBI', 'GMO', 'NTT', 'DIC']
+_FOREIGN_FUNDS = ['STATE STREET BANK AND TRUST COMPANY {n}', 'THE BANK OF NEW YORK MELLON {n}', 'JP MORGAN CHASE BANK {n}',
+                  'GOLDMAN SACHS INTERNATIONAL {n}', 'NORTHERN TRUST CO. (AVFC) RE {n}']
+
+
+def _to_fullwidth(text: str) -> str:
+    """ASCII英数字を全角に変換する。"""
+    return ''.join(chr(ord(c) + 0xFEE0) if '!' <= c <= '~' else ('　' if c == ' ' else c) for c in text)
+
+
+def _name_core(rng: random.Random) -> str:
+    """社名の中核部分を生成する。"""
+    pattern = rng.random()
+    if pattern < 0.4:
+        return ''.join(rng.choice(_NAME_SYLLABLES) for _ in range(rng.randint(3, 6))) + rng.choice(_NAME_INDUSTRIES)
+    if pattern < 0.8:
+        return rng.choice(_NAME_PLACES) + ''.join(rng.choice(_NAME_SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(_NAME_INDUSTRIES)
+    return _to_fullwidth(rng.choice(_NAME_LATIN) + str(rng.randint(1, 999))) + rng.choice(_NAME_INDUSTRIES)
+
+
+def generate_master_names(n_companies: int, seed: int = 0) -> pd.DataFrame:
+    """
+    名寄せマスターの元データ (filerName, edinetCode, secCode) を模したDataFrameを生成する。
+    約15%の会社はホールディングス形式の社名を持ち、約60%が証券コードを持つ。
+    """
+    rng = random.Random(seed)
+    cores = set()
+    rows = []
+    while len(rows) < n_companies:
+        core = _name_core(rng)
+        if core in cores:
+            continue
+        cores.add(core)
+        if rng.random() < 0.15:
+            core = core + rng.choice(['ホールディングス', 'グループホールディングス'])
+        filer_name = rng.choice(['株式会社{}', '{}株式会社']).format(core)
+        edinet_code = f'E{len(rows) + 10000:05d}'
+        sec_code = f'{rng.randint(1000, 9999)}0' if rng.random() < 0.6 else None
+        rows.append({'filerName': filer_name, 'edinetCode': edinet_code, 'secCode': sec_code})
+    return pd.DataFrame(rows)
+
+
+def _vary_name(rng: random.Random, filer_name: str) -> tuple[str, str]:
+    """マスターの社名から、大株主・投資先として記載されうる表記ゆれを生成する。(名称, 生成パターン) を返す。"""
+    core = filer_name.replace('株式会社', '')
+    pattern = rng.random()
+    if pattern < 0.25:
+        return filer_name, 'exact'
+    if pattern < 0.45:
+        corp = rng.choice(['㈱', '（株）', '(株)'])
+        return (corp + core if filer_name.startswith('株式会社') else core + corp), 'abbreviation'
+    if pattern < 0.55:
+        halfwidth = ''.join(chr(ord(c) - 0xFEE0) if 'Ａ' <= c <= 'ｚ' or '０' <= c <= '９' else c for c in filer_name)
+        return halfwidth, 'width'
+    if pattern < 0.65:
+        fund = rng.choice(_FOREIGN_FUNDS).format(n=rng.randint(100000, 999999))
+        return f'{_to_fullwidth(fund)}（常任代理人　{filer_name}）', 'agent'
+    if pattern < 0.8 and 'ホールディングス' in core:
+        stem = core.replace('グループホールディングス', '').replace('ホールディングス', '')
+        return f'㈱{stem}', 'holdings'
+    if pattern < 0.9 and len(core) >= 8:
+        position = rng.randint(1, len(core) - 2)
+        return filer_name.replace(core, core[:position] + rng.choice(_NAME_SYLLABLES) + core[position + 1:]), 'typo'
+    return filer_name, 'exact'
+
+
+def generate_shareholder_names(master_raw_df: pd.DataFrame, n_records: int, distinct_ratio: float = 0.2,
+                               unmatched_ratio: float = 0.15, seed: int = 0) -> pd.DataFrame:
+    """
+    大株主名・投資先銘柄名を模した名称リストを生成する。
+
+    Args:
+        master_raw_df (pd.DataFrame): generate_master_names の戻り値
+        n_records (int): 生成するレコード数 (重複を含む)
+        distinct_ratio (float): ユニークな名称の割合
+        unmatched_ratio (float): マスターに存在しない名称 (個人名・信託口など) の割合
+        seed (int): 乱数シード
+
+    Returns:
+        pd.DataFrame: name (名称), expectedEdinetCode (正解のEDINETコード。対応なしはNone), pattern (表記ゆれの種類)
+    """
+    rng = random.Random(seed)
+    n_distinct = max(int(n_records * distinct_ratio), 1)
+    filer_names = master_raw_df['filerName'].tolist()
+    edinet_codes = master_raw_df['edinetCode'].tolist()
+
+    distinct_rows = []
+    for i in range(n_distinct):
+        if rng.random() < unmatched_ratio:
+            if rng.random() < 0.5:
+                name = f'{rng.choice(_PERSON_NAMES)}{i}'
+            else:
+                name = f'{rng.choice(_TRUST_BANKS[:2]).replace("（信託口）", "")}（信託口{i}）'
+            distinct_rows.append((name, None, 'unmatched'))
+            continue
+        index = rng.randrange(len(filer_names))
+        name, pattern = _vary_name(rng, filer_names[index])
+        distinct_rows.append((name, edinet_codes[index], pattern))
+
+    records = [distinct_rows[rng.randrange(n_distinct)] for _ in range(n_records)]
+    return pd.DataFrame(records, columns=['name', 'expectedEdinetCode', 'pattern'])
+
+
+def generate_cross_shareholdings(n_companies: int = 3900, mean_holdings: int = 30, n_years: int = 5,
+                                 first_year: int = 2020, reciprocity: float = 0.3, turnover: float = 0.1,
+                                 seed: int = 0) -> pd.DataFrame:
+    """
+    名寄せ後の特定投資株式 (EnrichedSpecifiedInvestment) を模したDataFrameを、上場会社全体の規模で生成する。
+    投資先は番号の小さい (規模の大きい) 会社に偏らせ、約 reciprocity の割合の保有を相互保有とする。
+    年度ごとに約 turnover の割合の保有銘柄を入れ替え、各社が毎年6月に有価証券報告書を提出したものとする。
+
+    Returns:
+        pd.DataFrame: SubmissionDate, SecuritiesCode, HoldingEntity, rowId, NameOfSecurities, BookValueCurrentYear,
+                      CrossShareholdingStatus, matchedEdinetCode, matchedSecCode
+    """
+    rng = random.Random(seed)
+    sec_codes = [f'{1300 + i}0' for i in range(n_companies)]
+    weights = [1 / (rank + 10) for rank in range(n_companies)]
+
+    def sample_investees(holder: int, k: int) -> set:
+        investees = set(rng.choices(range(n_companies), weights=weights, k=k))
+        investees.discard(holder)
+        return investees
+
+    holdings = {holder: sample_investees(holder, max(int(rng.expovariate(1 / mean_holdings)), 1)) for holder in range(n_companies)}
+    added = {holder: set(investees) for holder, investees in holdings.items()}
+    rows = []
+    for year in range(first_year, first_year + n_years):
+        if year > first_year:
+            for holder, investees in holdings.items():
+                dropped = {i for i in investees if rng.random() < turnover}
+                added[holder] = sample_investees(holder, len(dropped)) - investees
+                holdings[holder] = (investees - dropped) | added[holder]
+        # 相互保有: 新しく取得した保有の一部について、投資先からの逆向きの保有を加える
+        for holder in range(n_companies):
+            for investee in added[holder]:
+                if rng.random() < reciprocity:
+                    holdings[investee].add(holder)
+        for holder in range(n_companies):
+            submission_date = f'{year}-06-{rng.randint(18, 30)}'
+            for row_id, investee in enumerate(sorted(holdings[holder]), start=1):
+                rows.append({
+                    'SubmissionDate': submission_date, 'SecuritiesCode': sec_codes[holder],
+                    'HoldingEntity': 'ReportingCompany', 'rowId': row_id,
+                    'NameOfSecurities': f'会社{investee}', 'BookValueCurrentYear': float(rng.randint(1, 50_000) * 1_000_000),
+                    'CrossShareholdingStatus': '有' if holder in holdings[investee] else '無',
+                    'matchedEdinetCode': f'E{investee + 10000:05d}', 'matchedSecCode': sec_codes[investee],
+                })
+    return pd.DataFrame(rows)
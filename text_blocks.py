@@ -0,0 +1,314 @@
+"""
+TextBlock の重複排除・圧縮保存 (TextBlockStore)
+
+役員の略歴 (OfficerInformation.CareerSummary) や自己株券買付状況報告書の TextBlock (BuybackStatusReport の
+acquisitionStatus / disposalStatus / holdingStatus) は、行ごとに HTML の全文を保持すると、同じ役員の略歴が毎年の
+有価証券報告書で繰り返し保存され、テーブルの容量・to_sql の転送量・バックアップが膨らむ。
+
+このモジュールは、TextBlock の本文を SHA-256 のハッシュ (contentHash) をキーとして zlib で圧縮し、TextBlockStore に1回だけ保存する。
+データプロダクトのテーブルの列には本文の代わりに contentHash を保存する。
+
+- 保存時 (database_manager.save_data) に、TEXT_BLOCK_COLUMNS の列の本文を contentHash に置き換え、
+  TextBlockStore にない本文のみを同じトランザクションで追加する。前年と同じ本文の再提出では本文を書き込まない。
+- 本文の取得は TextBlockReader で行う。圧縮したデータは contentHash ごとにまとめて読み込み、本文が必要になった時点で展開する。
+- このモジュールの導入前に保存された行 (列に本文がそのまま入っている行) は、読み出し時にはそのまま返す。
+  --convert で既存の行の本文を contentHash に置き換える。
+
+使い方:
+    python text_blocks.py --convert                # 既存の行の本文を TextBlockStore に移す
+    python text_blocks.py --stats                  # 列ごとの本文の容量と、TextBlockStore に保存した容量を表示する
+
+    reader = text_blocks.TextBlockReader()
+    officers = text_blocks.expand_text_blocks(officers, 'OfficerInformation', reader)
+"""
+import argparse
+import datetime
+import functools
+import hashlib
+import logging
+import re
+import zlib
+
+import pandas as pd
+from sqlalchemy import (Column, DateTime, Integer, LargeBinary, MetaData, String, Table, bindparam, exc, insert, inspect,
+                        select, update)
+
+import database_manager
+import metrics
+from config import TEXT_BLOCK_TABLE_NAME
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+# テーブル名 -> contentHash で保存する TextBlock の列
+TEXT_BLOCK_COLUMNS = {
+    'OfficerInformation': ['CareerSummary'],
+    'BuybackStatusReport': ['acquisitionStatus', 'disposalStatus', 'holdingStatus'],
+}
+COMPRESSION_LEVEL = 6
+# contentHash の IN 句・--convert の1回あたりの件数
+CHUNK_SIZE = 1000
+# 他のワーカーが同じ本文を同時に保存して主キーが重複した場合に、保存済みのものを除いて再試行する回数
+INSERT_ATTEMPTS = 3
+# 展開した本文を保持する件数 (TextBlockReader)
+DEFAULT_CACHE_SIZE = 4096
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# sql/create_table_text_block_store.sql と同じ定義 (テーブルが存在しない場合はこの定義から作成する)
+_metadata = MetaData()
+store_table = Table(
+    TEXT_BLOCK_TABLE_NAME, _metadata,
+    Column('contentHash', String(64), primary_key=True),
+    Column('compressedText', LargeBinary, nullable=False),
+    Column('textLength', Integer, nullable=False),
+    Column('compressedLength', Integer, nullable=False),
+    Column('createdAt', DateTime, nullable=False),
+)
+
+
+# --- ハッシュ化と圧縮 ---
+def content_hash(text: str) -> str:
+    """本文の SHA-256 (UTF-8) の16進文字列を返す。"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def is_content_hash(value) -> bool:
+    """列の値が contentHash か (本文がそのまま保存された行でないか) を判定する。"""
+    return isinstance(value, str) and HASH_PATTERN.match(value) is not None
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8')
+
+
+def hash_text_blocks(df: pd.DataFrame, columns: list[str]) -> tuple[pd.DataFrame, dict[str, str]]:
+    """
+    df の columns の本文を contentHash に置き換えたコピーと、contentHash -> 本文 の辞書を返す。
+    空の値・contentHash に置き換え済みの値はそのままとする。
+    """
+    df = df.copy()
+    blocks = {}
+    for col in df.columns.intersection(columns):
+        values = df[col]
+        targets = values.map(lambda v: isinstance(v, str) and v != '' and not is_content_hash(v))
+        if not targets.any():
+            continue
+        # 同じ本文は1回だけハッシュを計算する
+        hashes = {text: content_hash(text) for text in values[targets].unique()}
+        blocks.update({h: text for text, h in hashes.items()})
+        df[col] = values.astype(object)
+        df.loc[targets, col] = values[targets].map(hashes)
+    return df, blocks
+
+
+# --- DBの読み書き ---
+def _chunks(items: list, size: int = CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _existing_hashes(connection, hashes) -> set[str]:
+    existing = set()
+    for chunk in _chunks(sorted(hashes)):
+        existing.update(connection.execute(
+            select(store_table.c.contentHash).where(store_table.c.contentHash.in_(chunk))).scalars())
+    return existing
+
+
+def store_blocks(connection, blocks: dict[str, str]) -> tuple[int, int]:
+    """TextBlockStore にない本文を圧縮して保存する。(保存した件数, 保存した圧縮後のバイト数) を返す。"""
+    if not blocks:
+        return 0, 0
+    store_table.create(connection, checkfirst=True)
+    for attempt in range(1, INSERT_ATTEMPTS + 1):
+        missing = sorted(blocks.keys() - _existing_hashes(connection, blocks))
+        if not missing:
+            return 0, 0
+        now = datetime.datetime.now()
+        rows = []
+        for h in missing:
+            compressed = compress(blocks[h])
+            rows.append({'contentHash': h, 'compressedText': compressed, 'textLength': len(blocks[h]),
+                         'compressedLength': len(compressed), 'createdAt': now})
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(store_table), rows)
+            return len(rows), sum(row['compressedLength'] for row in rows)
+        except exc.IntegrityError:
+            if attempt == INSERT_ATTEMPTS:
+                raise
+            logger.debug("Text blocks were stored concurrently. Retrying (%s/%s).", attempt, INSERT_ATTEMPTS)
+    return 0, 0
+
+
+def _make_pre_save_hook(table_name: str):
+    columns = TEXT_BLOCK_COLUMNS[table_name]
+
+    def store_text_blocks(connection, df: pd.DataFrame) -> pd.DataFrame:
+        """TEXT_BLOCK_COLUMNS の列の本文を TextBlockStore に保存し、列の値を contentHash に置き換えた df を返す。"""
+        hashed, blocks = hash_text_blocks(df, columns)
+        if not blocks:
+            return hashed
+        stored, stored_bytes = store_blocks(connection, blocks)
+        # 本文をそのまま保存した場合に書き込むバイト数 (同じ本文の行もそれぞれ数える)
+        text_bytes = sum(len(v.encode('utf-8')) for col in df.columns.intersection(columns) for v in df[col]
+                         if isinstance(v, str) and not is_content_hash(v))
+        metrics.inc('bytes', text_bytes, stage='text_blocks', product=table_name, status='received')
+        metrics.inc('bytes', stored_bytes, stage='text_blocks', product=table_name, status='written')
+        metrics.inc('text_blocks', stored, product=table_name, status='new')
+        metrics.inc('text_blocks', len(blocks) - stored, product=table_name, status='existing')
+        logger.debug("Stored %s of %s text blocks for %s (%s -> %s bytes).",
+                     stored, len(blocks), table_name, text_bytes, stored_bytes)
+        return hashed
+
+    return store_text_blocks
+
+
+for _table_name in TEXT_BLOCK_COLUMNS:
+    database_manager.add_pre_save_hook(_table_name, _make_pre_save_hook(_table_name))
+
+
+# --- 本文の取得 ---
+class TextBlockReader:
+    """
+    contentHash から本文を取得する。圧縮したデータは prefetch (または最初の get) でまとめて読み込み、
+    本文は get で必要になった時点で展開する (展開した本文は cache_size 件まで保持する)。
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._compressed = {}
+        self._text = functools.lru_cache(maxsize=cache_size)(self._decompress)
+
+    def prefetch(self, hashes):
+        """未読み込みの contentHash の圧縮したデータを読み込む (TextBlockStore にないものは None とする)。"""
+        missing = {h for h in hashes if is_content_hash(h)} - self._compressed.keys()
+        if not missing:
+            return
+        with database_manager.engine.connect() as connection:
+            if inspect(connection).has_table(TEXT_BLOCK_TABLE_NAME):
+                for chunk in _chunks(sorted(missing)):
+                    stmt = select(store_table.c.contentHash, store_table.c.compressedText).where(
+                        store_table.c.contentHash.in_(chunk))
+                    self._compressed.update(connection.execute(stmt).tuples().all())
+        for h in missing - self._compressed.keys():
+            self._compressed[h] = None
+
+    def compressed_size(self, value: str) -> int:
+        """読み込み済みの contentHash の圧縮後のバイト数を返す。"""
+        data = self._compressed.get(value)
+        return len(data) if data is not None else 0
+
+    def _decompress(self, value: str) -> str | None:
+        data = self._compressed.get(value)
+        return decompress(data) if data is not None else None
+
+    def get(self, value):
+        """
+        列の値を本文に変換する。contentHash でない値 (導入前に保存された本文や NULL) はそのまま返す。
+        TextBlockStore にない contentHash の場合は None を返す。
+        """
+        if not is_content_hash(value):
+            return value
+        if value not in self._compressed:
+            self.prefetch([value])
+        return self._text(value)
+
+
+def expand_text_blocks(df: pd.DataFrame, table_name: str, reader: TextBlockReader | None = None) -> pd.DataFrame:
+    """table_name の TEXT_BLOCK_COLUMNS の列の contentHash を本文に置き換えた df のコピーを返す。"""
+    reader = reader or TextBlockReader()
+    columns = list(df.columns.intersection(TEXT_BLOCK_COLUMNS.get(table_name, [])))
+    reader.prefetch(pd.unique(df[columns].to_numpy().ravel()) if columns else [])
+    df = df.copy()
+    for col in columns:
+        df[col] = df[col].map(reader.get)
+    return df
+
+
+# --- 既存の行の変換 ---
+def convert_table(table_name: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    導入前に保存された table_name の行の本文を TextBlockStore に移し、列の値を contentHash に置き換える。
+    変換した行数を返す。
+    """
+    columns = TEXT_BLOCK_COLUMNS[table_name]
+    with database_manager.engine.connect() as connection:
+        if not inspect(connection).has_table(table_name):
+            logger.info("Table %s does not exist. Skipping.", table_name)
+            return 0
+    source = Table(table_name, MetaData(), autoload_with=database_manager.engine)
+    key_columns = [c.name for c in source.primary_key.columns]
+    if not key_columns:
+        raise ValueError(f"Table {table_name} has no primary key.")
+    stmt = select(*[source.c[c] for c in key_columns + columns])
+    updates = update(source).where(*[source.c[c] == bindparam(f'key_{c}') for c in key_columns]).values(
+        {c: bindparam(f'value_{c}') for c in columns})
+
+    converted = 0
+    with database_manager.engine.connect() as reader:
+        for chunk in pd.read_sql(stmt, reader, chunksize=chunk_size):
+            hashed, blocks = hash_text_blocks(chunk, columns)
+            changed = (hashed[columns].fillna('') != chunk[columns].fillna('')).any(axis=1)
+            if not changed.any():
+                continue
+            params = [{**{f'key_{c}': row[c] for c in key_columns}, **{f'value_{c}': row[c] for c in columns}}
+                      for row in hashed[changed].astype(object).where(hashed[changed].notna(), None).to_dict('records')]
+            # 読み込み中の結果セットとは別の接続で、チャンクごとにコミットする
+            with database_manager.engine.begin() as connection:
+                store_blocks(connection, blocks)
+                connection.execute(updates, params)
+            converted += int(changed.sum())
+            logger.info("Converted %s rows of %s.", converted, table_name)
+    return converted
+
+
+def stats() -> pd.DataFrame:
+    """列ごとの行数・本文の種類数と、本文をそのまま保存した場合と TextBlockStore に保存した場合の容量 (バイト) を返す。"""
+    results = []
+    reader = TextBlockReader()
+    with database_manager.engine.connect() as connection:
+        tables = set(inspect(connection).get_table_names())
+    for table_name, columns in TEXT_BLOCK_COLUMNS.items():
+        if table_name not in tables:
+            continue
+        df = pd.read_sql_table(table_name, database_manager.engine, columns=columns)
+        reader.prefetch(pd.unique(df.to_numpy().ravel()))
+        for col in columns:
+            values = df[col].dropna()
+            hashed = values.map(is_content_hash).astype(bool)
+            unique_hashes = values[hashed].unique()
+            text_bytes = sum(len((reader.get(v) or '').encode('utf-8')) for v in values)
+            # 行に保存した contentHash と、TextBlockStore に保存した圧縮後の本文 (重複を除く)、導入前に保存された本文の合計
+            stored_bytes = (int(hashed.sum()) * 64 + sum(reader.compressed_size(h) for h in unique_hashes)
+                            + sum(len(v.encode('utf-8')) for v in values[~hashed]))
+            results.append({
+                'table': table_name, 'column': col, 'rows': len(values), 'hashedRows': int(hashed.sum()),
+                'uniqueBlocks': len(unique_hashes), 'textBytes': int(text_bytes), 'storedBytes': int(stored_bytes),
+            })
+    result = pd.DataFrame(results)
+    if not result.empty:
+        result['ratio'] = (result['storedBytes'] / result['textBytes'].where(result['textBytes'] > 0)).round(3)
+    return result
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Maintain the deduplicated, compressed TextBlock store.')
+    arg_parser.add_argument('--convert', action='store_true', help='既存の行の本文を TextBlockStore に移す')
+    arg_parser.add_argument('--table', action='append', choices=list(TEXT_BLOCK_COLUMNS), help='対象のテーブル (複数指定可)')
+    arg_parser.add_argument('--stats', action='store_true', help='列ごとの本文の容量と保存した容量を表示する')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    if not args.convert and not args.stats:
+        arg_parser.error('--convert or --stats is required.')
+    if args.convert:
+        for name in args.table or TEXT_BLOCK_COLUMNS:
+            logger.info("Converted %s rows of %s.", convert_table(name), name)
+    if args.stats:
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(stats())
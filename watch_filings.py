@@ -0,0 +1,151 @@
+"""
+提出書類の監視 (ウォッチモード)
+
+当日の提出書類一覧 (documents.json) を一定間隔で取得し、DBに保存済みの一覧と docID で比較して、
+新たに提出された書類のみを提出書類一覧に追加する。そのうち対象のデータプロダクトの書類は、
+その場でダウンロード・解析・保存まで行う。日付が変わった場合は、前日分の一覧を最後に1回取得してから当日分に移る。
+
+書類ごとに、提出日時 (submitDateTime) からの以下の時間をメトリクスに記録する (環境変数 EDINET_METRICS=1 で有効)。
+    watch_detection_latency    一覧で新しい書類を検知するまで
+    watch_end_to_end_latency   データプロダクトをDBに保存し終えるまで
+submitDateTime は分単位 (日本時間) のため、実行するマシンの時刻は日本時間である必要がある。
+計測が有効な場合、metrics/run_watch.json と metrics/run_watch.prom を各ポーリングの後に上書きする。
+
+使い方:
+    python watch_filings.py --interval 60 --products LargeVolumeHoldingReport
+"""
+import argparse
+import datetime
+import logging
+import time
+
+import collect_submission_data
+import database_manager
+import edinet_api
+import metrics
+import process_documents
+import scheduler
+from definitions import DATA_PRODUCT_DEFINITIONS
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# --- 定数定義 ---
+DEFAULT_POLL_INTERVAL = 60  # 秒
+DEFAULT_TARGET_DATA_PRODUCTS = ['LargeVolumeHoldingReport']
+METRICS_RUN_ID = 'watch'
+
+
+def _parse_submit_datetime(value: str | None) -> datetime.datetime | None:
+    """documents.json の submitDateTime ('YYYY-MM-DD HH:MM') を datetime に変換する。"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M')
+    except ValueError:
+        return None
+
+
+class FilingWatcher:
+    """当日の提出書類一覧を監視し、新しい書類を処理する。"""
+
+    def __init__(self, target_data_products: list[str]):
+        self.target_data_products = target_data_products
+        self.codes_to_fetch = process_documents._get_codes_to_fetch(target_data_products)
+        self.current_date = None
+        self.known_doc_ids = set()
+
+    def _switch_date(self, date_str: str):
+        """監視対象の日付を切り替え、その日付の保存済みの docID を読み込む。"""
+        self.current_date = date_str
+        self.known_doc_ids = database_manager.get_doc_ids_by_date(date_str)
+        logger.info("Watching submissions for %s (%s already stored).", date_str, len(self.known_doc_ids))
+
+    def poll(self, date_str: str) -> int:
+        """
+        指定日の提出書類一覧を1回取得し、新しい書類を保存・処理する。新しい書類の件数を返す。
+        """
+        json_data = edinet_api.fetch_submission_list(date_str)
+        if not json_data or not json_data.get('results'):
+            return 0
+        detected_at = datetime.datetime.now()
+        new_items = sorted(
+            (item for item in json_data['results'] if item.get('docID') and item['docID'] not in self.known_doc_ids),
+            key=lambda item: item.get('seqNumber') or 0
+        )
+        if not new_items:
+            return 0
+
+        df = collect_submission_data._format_submission_data(new_items, date_str)
+        # 保存に失敗した場合は例外で poll を中断し、docID を既知としないことで次回の取得時に再び保存する
+        database_manager.save_submission_list(df, date_str, raise_errors=True)
+        self.known_doc_ids.update(item['docID'] for item in new_items)
+        metrics.inc('documents', len(new_items), stage='watch')
+        logger.info("Detected %s new submissions for %s.", len(new_items), date_str)
+
+        submitted_at = {item['docID']: _parse_submit_datetime(item.get('submitDateTime')) for item in new_items}
+        target_doc_ids = [
+            item['docID'] for item in new_items
+            if (item.get('formCode'), item.get('ordinanceCode')) in self.codes_to_fetch
+        ]
+        documents = database_manager.get_documents_by_doc_ids(target_doc_ids)
+        if not documents:
+            return len(new_items)
+
+        queue = process_documents._load_retry_queue()
+        for document in scheduler.PriorityScheduler(documents):
+            doc_id, form_code = document[1], document[2]
+            submit_time = submitted_at.get(doc_id)
+            if submit_time is not None:
+                metrics.observe('watch_detection_latency', (detected_at - submit_time).total_seconds(), formCode=form_code)
+            status = process_documents._run_documents([document], self.target_data_products, queue).get(doc_id)
+            if submit_time is not None:
+                latency = (datetime.datetime.now() - submit_time).total_seconds()
+                metrics.observe('watch_end_to_end_latency', latency, formCode=form_code, status=status)
+                logger.info("docID %s finished (%s) %.0f s after submission.", doc_id, status, latency)
+        return len(new_items)
+
+    def run(self, interval: float = DEFAULT_POLL_INTERVAL, max_polls: int | None = None):
+        """
+        interval 秒ごとに提出書類一覧を取得する。Ctrl+C で終了する。
+
+        Args:
+            max_polls (int, optional): 指定した回数だけ取得して終了する (動作確認用)。
+        """
+        logger.info("Watching filings every %s s for data products: %s", interval, ', '.join(self.target_data_products))
+        n_polls = 0
+        try:
+            while max_polls is None or n_polls < max_polls:
+                started = time.monotonic()
+                today = datetime.date.today().isoformat()
+                try:
+                    if self.current_date != today:
+                        # 日付が変わった場合は、前日の残りの書類を取り込んでから当日分に移る
+                        if self.current_date is not None:
+                            self.poll(self.current_date)
+                        self._switch_date(today)
+                    self.poll(today)
+                except Exception as e:
+                    logger.exception("Failed to poll submissions for %s: %s", today, e)
+                n_polls += 1
+                if metrics.is_enabled():
+                    metrics.write_reports(run_id=METRICS_RUN_ID)
+                if max_polls is not None and n_polls >= max_polls:
+                    break
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            logger.info("Stopped watching filings.")
+        if metrics.is_enabled():
+            metrics.print_summary()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description='Poll today\'s EDINET submissions and process new filings as they appear.')
+    arg_parser.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL, help='提出書類一覧を取得する間隔 (秒)')
+    arg_parser.add_argument('--products', nargs='+', choices=list(DATA_PRODUCT_DEFINITIONS.keys()),
+                            default=DEFAULT_TARGET_DATA_PRODUCTS, help='処理対象のデータプロダクト')
+    arg_parser.add_argument('--max-polls', type=int, help='指定した回数だけ取得して終了する')
+    args = arg_parser.parse_args()
+    setup_logging()
+
+    FilingWatcher(args.products).run(interval=args.interval, max_polls=args.max_polls)